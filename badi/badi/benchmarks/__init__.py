@@ -0,0 +1,3 @@
+"""
+    Benchmarks of the compute, persist and lookup paths (see .suite), on synthetic cities (see .generator).
+"""
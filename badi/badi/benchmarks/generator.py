@@ -0,0 +1,83 @@
+#!/bin/python3
+
+"""
+    Seeded generator of synthetic cities, following the format of the /init API endpoint (as described in the Code
+    Challenge description). The same seed always gives the same city.
+"""
+
+from random import Random
+
+
+# City kinds
+REALISTIC = "realistic"      # Mixed heights and distances
+LONG_STREET = "long_street"  # A single neighbourhood with all the buildings in a row
+SPIKES = "spikes"            # Low buildings with a few skyscrapers
+MONOTONE_UP = "monotone_up"  # Heights growing from east to west (every building on the west is a candidate shadow)
+MONOTONE_DOWN = "monotone_down"  # Heights decreasing from east to west
+
+KINDS = (REALISTIC, LONG_STREET, SPIKES, MONOTONE_UP, MONOTONE_DOWN)
+
+
+def get_building_list(rnd, kind, size, max_floors, prefix=""):
+    """
+        Returns a synthetic street.
+
+    :param rnd: (random.Random) Random number generator.
+    :param kind: (str) City kind (one of KINDS).
+    :param size: (int) Number of buildings.
+    :param max_floors: (int) Maximum number of floors per building.
+    :param prefix: (str) Prefix of the building names.
+    :return: (list of dict) Buildings, sorted from east to west. Follows the format:
+
+            [{name:<name_string>, apartments_count: <number>, distance: <number>}]
+    """
+    building_list = []
+
+    for index in range(size):
+        if kind == SPIKES:
+            floors = max_floors if rnd.random() < 0.02 else rnd.randint(1, max(1, max_floors // 10))
+        elif kind == MONOTONE_UP:
+            floors = 1 + (index * (max_floors - 1)) // max(1, size - 1)
+        elif kind == MONOTONE_DOWN:
+            floors = max_floors - (index * (max_floors - 1)) // max(1, size - 1)
+        else:
+            # Most buildings are low or medium, a few are tall
+            floors = min(max_floors, max(1, int(rnd.expovariate(1.0 / max(1, max_floors // 4)))))
+
+        distance = rnd.randint(1, 3) if kind in (MONOTONE_UP, MONOTONE_DOWN) else rnd.randint(1, 30)
+
+        building_list.append({"name": "{}{}".format(prefix, index), "apartments_count": floors,
+                              "distance": distance})
+
+    if building_list:
+        building_list[-1]["distance"] = -1
+
+    return building_list
+
+
+def generate_city(kind=REALISTIC, neighbourhoods=5, buildings=200, max_floors=30, seed=2019):
+    """
+        Returns a synthetic city.
+
+    :param kind: (str) City kind (one of KINDS).
+    :param neighbourhoods: (int) Number of neighbourhoods. LONG_STREET cities have a single one, with all the buildings.
+    :param buildings: (int) Number of buildings per neighbourhood.
+    :param max_floors: (int) Maximum number of floors per building.
+    :param seed: (int) Seed of the random number generator.
+    :return: (list of dict) City info. Follows the format:
+
+            [{ neighborhood: <name_string>, apartments_height: <number>, buildings: [{name:<name_string>,
+               apartments_count: <number>, distance: <number>}]}]
+    """
+    if kind not in KINDS:
+        raise ValueError("Unknown city kind: {}".format(kind))
+
+    rnd = Random("{}-{}".format(kind, seed))
+
+    if kind == LONG_STREET:
+        buildings *= neighbourhoods
+        neighbourhoods = 1
+
+    return [{"neighborhood": "N{}".format(index), "apartments_height": rnd.randint(1, 4),
+             "buildings": get_building_list(rnd, kind, buildings, max_floors, prefix="N{}-B".format(index))}
+            for index in range(neighbourhoods)]
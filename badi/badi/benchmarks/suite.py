@@ -0,0 +1,354 @@
+#!/bin/python3
+
+"""
+    Benchmark suite. Measures how the compute, persist and lookup paths scale, both function by function
+    (microbenchmarks) and end to end, through the Django test client.
+
+    IMPLEMENTATION NOTE: It writes to the database of the current connection, so it must be run on a test database
+    (see the benchmark management command).
+"""
+
+import json
+import platform
+import sqlite3
+from copy import deepcopy
+from datetime import datetime, timezone
+from statistics import mean, median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import django
+from django.test import Client, override_settings
+
+from ..cache import apartment_cache, horizon_cache
+from ..city import City
+from ..clock import MINUTES_PER_DAY
+from ..constants import DEFAULT_CITY, DEFAULT_CITY_VALUES, PYTHON_BACKEND, NUMPY_BACKEND, LAZY_MODE, COMPRESSED_MODE, \
+    QUERY_PAGE_SIZE, TOP_SIZE
+from ..controller import Controller
+from ..horizon import WestHorizon
+from ..models import City as CityModel
+from ..snapshot import SnapshotStore
+from ..sunlight_hours import get_neighbourhood_sunlight_hours, compute_city_sunlight_hours, get_floor_ranges
+from .. import vectorized
+from .generator import generate_city, KINDS, REALISTIC
+
+# Size of the generated cities: number of neighbourhoods, buildings per neighbourhood and maximum number of floors
+SCALES = {
+    "tiny": {"neighbourhoods": 2, "buildings": 20, "max_floors": 10},
+    "small": {"neighbourhoods": 5, "buildings": 200, "max_floors": 30},
+    "medium": {"neighbourhoods": 10, "buildings": 2000, "max_floors": 60},
+    "large": {"neighbourhoods": 20, "buildings": 10000, "max_floors": 100},
+}
+
+# Number of apartments looked up by the lookup benchmarks
+LOOKUPS = 200
+
+
+def measure(function, setup=None, repeat=5):
+    """
+        Measures the running time of the specified function.
+
+    :param function: (callable) Function to be measured. Receives the value returned by setup.
+    :param setup: (callable) Function called before each run, whose time is not measured.
+    :param repeat: (int) Number of runs.
+    :return: (dict) Seconds per run. Follows the format:
+
+            {"min": <min>, "median": <median>, "mean": <mean>, "max": <max>, "repeat": <repeat>}
+    """
+    times = []
+
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+
+        start_time = perf_counter()
+        function(argument)
+        times.append(perf_counter() - start_time)
+
+    return {"min": min(times), "median": median(times), "mean": mean(times), "max": max(times), "repeat": repeat}
+
+
+def get_apartment_sample(city_info, size, seed):
+    """
+        Returns a deterministic sample of the apartments of a city.
+
+    :param city_info: (list of dict) City info.
+    :param size: (int) Maximum number of apartments.
+    :param seed: (int) Sample seed.
+    :return: (list of dict) Apartments, following the format of the /sunlight_hours API endpoint body.
+    """
+    apartments = [{"neighbourhood": neighbourhood["neighborhood"], "building": building["name"], "apartment": floor}
+                  for neighbourhood in city_info for building in neighbourhood["buildings"]
+                  for floor in range(building["apartments_count"])]
+
+    step = max(1, len(apartments) // size)
+    offset = seed % step
+
+    return apartments[offset::step][:size]
+
+
+def get_benchmarks(scale, seed):
+    """
+        Returns the benchmarks of the suite.
+
+    :param scale: (str) Size of the generated cities (one of SCALES).
+    :param seed: (int) Seed of the generated cities.
+    :return: (list of tuple) Follows the format:
+
+                [(<name>, <function>, <setup>, <items>)]
+
+            with
+                <name>: (str) Benchmark name. Prefixed by the path it measures: "compute.", "persist.", "lookup." or
+                    "http.".
+                <function>, <setup>: (callable) See measure.
+                <items>: (int) Number of items processed per run (e.g., apartments), to report the throughput.
+    """
+    size = SCALES[scale]
+    dawn = DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"]
+    sunset = DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"]
+    cities = {kind: generate_city(kind, seed=seed, **size) for kind in KINDS}
+    benchmarks = []
+
+    def count_apartments(city_info):
+        return sum(building["apartments_count"] for neighbourhood in city_info
+                   for building in neighbourhood["buildings"])
+
+    #
+    # COMPUTE
+    #
+
+    for kind, city_info in cities.items():
+        largest = max(city_info, key=lambda neighbourhood: len(neighbourhood["buildings"]))
+
+        benchmarks.append(("compute.neighbourhood.{}".format(kind),
+                           lambda buildings: get_neighbourhood_sunlight_hours(buildings, dawn, sunset, 1),
+                           lambda largest=largest: deepcopy(largest["buildings"]), count_apartments([largest])))
+
+        benchmarks.append(("compute.west_horizon.{}".format(kind), WestHorizon,
+                           lambda largest=largest: largest["buildings"], len(largest["buildings"])))
+
+    backends = [PYTHON_BACKEND] + ([NUMPY_BACKEND] if vectorized.is_available() else [])
+    for backend in backends:
+        benchmarks.append(("compute.city.{}".format(backend),
+                           lambda city_info, backend=backend: compute_city_sunlight_hours(city_info, dawn, sunset,
+                                                                                          backend),
+                           lambda: deepcopy(cities[REALISTIC]), count_apartments(cities[REALISTIC])))
+
+    #
+    # PERSIST
+    #
+
+    computed = City(deepcopy(cities[REALISTIC]), backend=PYTHON_BACKEND, workers=1).info
+    rows = count_apartments(computed) + sum(len(neighbourhood["buildings"]) + 1 for neighbourhood in computed)
+
+    benchmarks.append(("persist.save_city.{}".format(REALISTIC), lambda _: Controller.save_city(computed), None,
+                       rows))
+
+    def save_cached_city(_):
+        with override_settings(RESULT_CACHE=True):
+            Controller.save_city(computed)
+
+    # The same city again: every neighbourhood is reused, so nothing is written (see ..content_hash)
+    benchmarks.append(("persist.save_city.cached.{}".format(REALISTIC), save_cached_city,
+                       lambda: Controller.save_city(computed), len(computed)))
+
+    # Lazy mode only stores the buildings (see .constants.LAZY_MODE)
+    benchmarks.append(("persist.save_city_lazy.{}".format(REALISTIC),
+                       lambda _: Controller.save_city(cities[REALISTIC], mode=LAZY_MODE), None,
+                       rows - count_apartments(computed)))
+
+    # Compressed mode stores runs of floors instead of apartments (see .constants.COMPRESSED_MODE)
+    floor_ranges = sum(len(get_floor_ranges(building["dawn"], building["sunset"])) for neighbourhood in computed
+                       for building in neighbourhood["buildings"])
+    benchmarks.append(("persist.save_city_compressed.{}".format(REALISTIC),
+                       lambda _: Controller.save_city(computed, mode=COMPRESSED_MODE), None,
+                       rows - count_apartments(computed) + floor_ranges))
+
+    # Snapshots are written to a throwaway directory, removed when the benchmarks are discarded
+    snapshot_directory = TemporaryDirectory()
+
+    def publish_snapshot():
+        snapshots = SnapshotStore(directory=snapshot_directory.name)
+        version = CityModel.objects.filter(name=DEFAULT_CITY).values_list("version", flat=True).get()
+        snapshots.publish(DEFAULT_CITY, version, Controller.iter_snapshot_neighbourhoods(DEFAULT_CITY, version))
+        return snapshots.get(DEFAULT_CITY)
+
+    benchmarks.append(("persist.snapshot.{}".format(REALISTIC), lambda _: publish_snapshot(), None,
+                       count_apartments(computed)))
+
+    # Every apartment changes, rescaled from the stored angles of the shadows
+    benchmarks.append(("persist.update_city_daylight.{}".format(REALISTIC),
+                       lambda _: Controller.update_city_daylight("06:45", "20:10"),
+                       lambda: Controller.save_city(computed), count_apartments(computed)))
+
+    #
+    # LOOKUP
+    #
+
+    sample = get_apartment_sample(computed, LOOKUPS, seed)
+
+    def lookup_in_snapshot(snapshot):
+        for apartment_info in sample:
+            snapshot.get_apartment(apartment_info["neighbourhood"], apartment_info["building"],
+                                   apartment_info["apartment"])
+
+    def lookup_one_by_one(_):
+        for apartment_info in sample:
+            Controller.get_apartment_info(apartment_info)
+
+    benchmarks.append(("lookup.get_apartment_info.cold", lookup_one_by_one, apartment_cache.clear, len(sample)))
+    benchmarks.append(("lookup.get_apartment_info.warm", lookup_one_by_one, None, len(sample)))
+    benchmarks.append(("lookup.snapshot", lookup_in_snapshot, publish_snapshot, len(sample)))
+    benchmarks.append(("lookup.get_apartments_info.cold", lambda _: Controller.get_apartments_info(sample),
+                       apartment_cache.clear, len(sample)))
+
+    def find_pages(_):
+        # The first pages of the apartments with at least 6 hours of sunlight
+        cursor = None
+        for _ in range(5):
+            _, cursor = Controller.find_apartments(min_minutes=6 * 60, limit=QUERY_PAGE_SIZE, after=cursor)
+
+    benchmarks.append(("lookup.find_apartments", find_pages, None, 5 * QUERY_PAGE_SIZE))
+
+    def find_top(_):
+        # The sunniest apartments of the city, and of each neighbourhood
+        Controller.get_top_apartments(k=TOP_SIZE)
+        Controller.get_neighbourhood_rankings(k=TOP_SIZE)
+
+    benchmarks.append(("lookup.get_top_apartments", find_top, None, 2))
+
+    def count_sunlit(_):
+        # The sunlit apartments of the city, and of each neighbourhood, every half an hour (cold: read once)
+        for minutes in range(0, MINUTES_PER_DAY, 30):
+            Controller.count_sunlit_apartments(minutes)
+            Controller.count_neighbourhood_sunlit_apartments(minutes)
+
+    benchmarks.append(("lookup.count_sunlit_apartments.cold", count_sunlit, apartment_cache.clear,
+                       MINUTES_PER_DAY // 30))
+
+    def save_lazy_city():
+        Controller.save_city(cities[REALISTIC], mode=LAZY_MODE)
+        horizon_cache.clear()
+
+    # The horizon of each neighbourhood is built by the first lookup in it (the city is saved eagerly again below)
+    benchmarks.append(("lookup.get_apartment_info.lazy.cold", lookup_one_by_one, save_lazy_city, len(sample)))
+
+    def save_compressed_city():
+        Controller.save_city(computed, mode=COMPRESSED_MODE)
+
+    benchmarks.append(("lookup.get_apartment_info.compressed.cold", lookup_one_by_one, save_compressed_city,
+                       len(sample)))
+
+    #
+    # END TO END
+    #
+
+    client = Client()
+    body = json.dumps(cities[REALISTIC])
+
+    benchmarks.append(("http.init.{}".format(REALISTIC),
+                       lambda _: client.post('/init', body, content_type="application/json"), None, rows))
+
+    def init_cached_city(_):
+        with override_settings(RESULT_CACHE=True):
+            client.post('/init', body, content_type="application/json")
+
+    benchmarks.append(("http.init.cached.{}".format(REALISTIC), init_cached_city,
+                       lambda: client.post('/init', body, content_type="application/json"), len(computed)))
+
+    def put_one_by_one(_):
+        for apartment_info in sample:
+            client.put('/sunlight_hours', json.dumps(apartment_info), content_type="application/json")
+
+    benchmarks.append(("http.sunlight_hours.cold", put_one_by_one, apartment_cache.clear, len(sample)))
+    benchmarks.append(("http.sunlight_hours.warm", put_one_by_one, None, len(sample)))
+    benchmarks.append(("http.sunlight_hours_batch.cold",
+                       lambda _: client.put('/sunlight_hours/batch', json.dumps(sample),
+                                            content_type="application/json"),
+                       apartment_cache.clear, len(sample)))
+
+    return benchmarks
+
+
+def run_benchmarks(scale="small", seed=2019, repeat=5, only=None, log=None):
+    """
+        Runs the benchmark suite.
+
+    :param scale: (str) Size of the generated cities (one of SCALES).
+    :param seed: (int) Seed of the generated cities.
+    :param repeat: (int) Number of runs of each benchmark.
+    :param only: (str) If specified, only the benchmarks whose name contains it are run.
+    :param log: (callable) If specified, it is called with a line of text after each benchmark.
+    :return: (dict) Machine-readable results. Follows the format:
+
+            {
+                "meta": {"scale": <scale>, "seed": <seed>, "repeat": <repeat>, "date": <date>, "python": <version>,
+                         "django": <version>, "sqlite": <version>, "numpy": <bool>, "machine": <machine>},
+                "results": {<name>: {"min": <min>, "median": <median>, "mean": <mean>, "max": <max>,
+                                     "repeat": <repeat>, "items": <items>, "items_per_second": <items_per_second>}}
+            }
+
+            with times in seconds per run.
+    """
+    if scale not in SCALES:
+        raise ValueError("Unknown scale: {}".format(scale))
+
+    results = {}
+
+    for name, function, setup, items in get_benchmarks(scale, seed):
+        if only and only not in name:
+            continue
+
+        # The benchmarks save the same cities again and again, so the result cache would skip them (the ".cached."
+        # ones enable it)
+        with override_settings(RESULT_CACHE=False):
+            result = measure(function, setup, repeat)
+        result["items"] = items
+        result["items_per_second"] = items / result["median"] if result["median"] > 0 else 0.0
+        results[name] = result
+
+        if log is not None:
+            log("{:<45} median {:>10.6f} s  ({:,.0f} items/s)".format(name, result["median"],
+                                                                     result["items_per_second"]))
+
+    return {
+        "meta": {"scale": scale, "seed": seed, "repeat": repeat,
+                 "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "django": django.get_version(),
+                 "sqlite": sqlite3.sqlite_version, "numpy": vectorized.is_available(),
+                 "machine": platform.machine()},
+        "results": results
+    }
+
+
+def compare_results(results, baseline, threshold=0.2):
+    """
+        Compares the results of a run against a stored baseline, by the median time of each benchmark.
+
+    :param results: (dict) Results of the run (see run_benchmarks).
+    :param baseline: (dict) Baseline results (same format).
+    :param threshold: (float) Relative change considered significant (e.g., 0.2 means 20% slower or faster).
+    :return: (list of dict) One item per benchmark in both of them, sorted by name. Follows the format:
+
+                {"name": <name>, "baseline": <baseline_median>, "current": <current_median>, "ratio": <ratio>,
+                 "status": <status>}
+
+            with <ratio> being current / baseline, and <status> one of "regression", "improvement" or "same".
+    """
+    comparison = []
+
+    for name in sorted(set(results["results"]) & set(baseline["results"])):
+        current = results["results"][name]["median"]
+        prior = baseline["results"][name]["median"]
+        ratio = current / prior if prior > 0 else float("inf")
+
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "same"
+
+        comparison.append({"name": name, "baseline": prior, "current": current, "ratio": ratio, "status": status})
+
+    return comparison
@@ -0,0 +1,158 @@
+#!/bin/python3
+
+"""
+    In-process cache for the apartment lookups.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+
+from .constants import APARTMENT_CACHE_SIZE, APARTMENT_CACHE_TTL, HORIZON_CACHE_SIZE
+
+
+class ApartmentCache():
+    """
+        Bounded LRU cache of apartments, keyed by (city, neighbourhood, building, floor).
+
+        Each entry is tagged with the cache version at the time its value was read from the data base. Bumping the
+        version (see invalidate) makes every existing entry stale at once, in O(1); stale entries are dropped lazily,
+        when they are found.
+
+        Entries can also carry a tag given by the caller: the (<version>, <revision>) of the city they were read from
+        (see .controller.Controller.get_city_state). A lookup with a different tag is a miss.
+
+        IMPLEMENTATION NOTE: The cache lives in the memory of each process. A new /init only bumps the version of the
+        process that served it. The other processes see the new city once their cached state of the city expires
+        (after a TTL): from then on, the entries tagged with the prior state are misses.
+
+        It is safe to use from several threads at once.
+    """
+
+    def __init__(self, max_size=None, ttl=None, clock=monotonic):
+        """
+            Initializes an empty cache.
+
+        :param max_size: (int) Maximum number of entries. 0 disables the cache. If not specified, the one in the
+            APARTMENT_CACHE_SIZE setting is used.
+        :param ttl: (float) Seconds an entry is valid. If not specified, the one in the APARTMENT_CACHE_TTL setting
+            is used (None there means forever).
+        :param clock: (callable) Returns the current time in seconds.
+        """
+        self.max_size = max_size if max_size is not None else getattr(settings, "APARTMENT_CACHE_SIZE",
+                                                                      APARTMENT_CACHE_SIZE)
+        self.ttl = ttl if ttl is not None else getattr(settings, "APARTMENT_CACHE_TTL", APARTMENT_CACHE_TTL)
+        self.clock = clock
+
+        self.version = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, tag=None):
+        """
+            Returns the cached value of the specified key.
+
+        :param key: (tuple) (<city>, <neighbourhood>, <building>, <floor>)
+        :param tag: Tag the value must have been cached with (see put).
+        :return: The cached value; None if it is not cached (or it is stale).
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None:
+                version, entry_tag, expires_at, value = entry
+
+                if version == self.version and entry_tag == tag and (expires_at is None or self.clock() < expires_at):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                del self.entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value, version, tag=None):
+        """
+            Caches the value of the specified key.
+
+        :param key: (tuple) (<city>, <neighbourhood>, <building>, <floor>)
+        :param value: The value to be cached.
+        :param version: (int) Cache version when the value was read from the data base (see get_version). If the cache
+            has been invalidated since then, the value is discarded.
+        :param tag: Tag of the value (e.g., the state of the city it was read from). It is only returned by the lookups
+            with the same tag (see get).
+        :return: None
+        """
+        if self.max_size <= 0:
+            return
+
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+
+        with self.lock:
+            if version != self.version:
+                return
+
+            self.entries[key] = (version, tag, expires_at, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_version(self):
+        """
+            Returns the current cache version. It must be read before querying the data base (see put).
+
+        :return: (int) Current version.
+        """
+        return self.version
+
+    def invalidate(self):
+        """
+            Invalidates all the entries, bumping the cache version.
+
+        :return: None
+        """
+        with self.lock:
+            self.version += 1
+
+    def clear(self):
+        """
+            Removes all the entries and resets the counters.
+
+        :return: None
+        """
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get_stats(self):
+        """
+            Returns the cache counters.
+
+        :return: (dict) Follows the format:
+
+                {"size": <size>, "max_size": <max_size>, "version": <version>, "hits": <hits>, "misses": <misses>,
+                 "evictions": <evictions>}
+        """
+        with self.lock:
+            return {"size": len(self.entries), "max_size": self.max_size, "version": self.version, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+# Apartment cache shared by all the requests of this process
+apartment_cache = ApartmentCache()
+
+# Horizons of the neighbourhoods of the cities stored in lazy mode, keyed by (<neighbourhood_id>, <city_revision>) (see
+# .controller.Controller.get_neighbourhood_horizon)
+horizon_cache = ApartmentCache(max_size=getattr(settings, "HORIZON_CACHE_SIZE", HORIZON_CACHE_SIZE))
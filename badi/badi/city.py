@@ -4,11 +4,22 @@
     City module. Contains all information regarding with a full city
 """
 
+from json import JSONDecodeError
 from logging import getLogger
+from time import perf_counter
 
-from .constants import DEFAULT_CITY, DEFAULT_CITY_VALUES
-from .sunlight_hours import compute_city_sunlight_hours
+from django.conf import settings
+from django.db import DatabaseError
+
+from .clock import parse_time
+from .constants import DEFAULT_CITY, DEFAULT_CITY_VALUES, PYTHON_BACKEND, STREAM_CHUNK_SIZE, SUNLIGHT_WORKERS, \
+    EAGER_MODE, LAZY_MODE, SUNLIGHT_CALENDAR, RESULT_CACHE
+from .content_hash import get_city_hash, get_neighbourhood_hash, find_stored_neighbourhood
+from .sunlight_hours import compute_city_sunlight_hours, iter_city_sunlight_hours, check_neighbourhood_geometry
 from .controller import Controller
+from .metrics import apartments_computed, iter_timed, phase_seconds
+from .stream import iter_json_array, NotAJSONArrayError
+from .yearly import load_calendar, parse_calendar
 
 # Get an instance of a logger
 logger = getLogger(__name__)
@@ -18,13 +29,40 @@ class CityInitializationError(Exception):
     pass
 
 
+def get_calendar(calendar):
+    """
+        Returns the calendar of the city, parsed (see .yearly.parse_calendar).
+
+    :param calendar: (list of list) Calendar (see .yearly.parse_calendar). If None, the one in the file of the
+        SUNLIGHT_CALENDAR setting is loaded (if any).
+    :return: (tuple) Parsed calendar. None if the city has no calendar.
+    :raises CityInitializationError: If the calendar is not valid.
+    """
+    try:
+        if calendar is not None:
+            return parse_calendar(calendar)
+
+        path = getattr(settings, "SUNLIGHT_CALENDAR", SUNLIGHT_CALENDAR)
+        return load_calendar(path) if path is not None else None
+
+    except ValueError:
+        raise CityInitializationError()
+
+
+# Progress events of a city ingestion (see ingest_city)
+NEIGHBOURHOOD_PARSED = "parsed"
+NEIGHBOURHOOD_COMPUTED = "computed"
+NEIGHBOURHOOD_PERSISTED = "persisted"
+
+
 class City():
     """
         Manages all the city information.
     """
 
     def __init__(self, city_info, name=DEFAULT_CITY, dawn=DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
-                 sunset=DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], logger=logger):
+                 sunset=DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], logger=logger, backend=None, workers=None,
+                 mode=None, calendar=None):
         """
             Initializes the city with the specified info.
 
@@ -33,6 +71,16 @@ class City():
         :param name: (str) Name of the city.
         :param dawn: (str) Dawn time. Local time at which starts the sunlight.
         :param sunset: (str) Sunset time. Local time at which ends the sunlight
+        :param backend: (str) Backend used to compute the sunlight hours (see .sunlight_hours). If not specified, the
+            one in the SUNLIGHT_BACKEND setting is used.
+        :param workers: (int) Number of processes used to compute the sunlight hours. If not specified, the one in the
+            SUNLIGHT_WORKERS setting is used.
+        :param mode: (str) How the sunlight hours are stored (see .models.City.mode): computed now, for each apartment
+            (EAGER_MODE) or for each floor range (COMPRESSED_MODE), or when each apartment is looked up (LAZY_MODE). If
+            not specified, the one in the SUNLIGHT_MODE setting is used.
+        :param calendar: (list of list) Dawn and sunset of the city on each day of the year (see
+            .yearly.parse_calendar), so the sunlight hours of every apartment are also computed for each day. If not
+            specified, the one in the SUNLIGHT_CALENDAR setting is used (if any).
         """
         # City name
         self.name = name
@@ -45,10 +93,36 @@ class City():
         # Logger
         self.logger = logger
 
+        if backend is None:
+            backend = getattr(settings, "SUNLIGHT_BACKEND", PYTHON_BACKEND)
+
+        if workers is None:
+            workers = getattr(settings, "SUNLIGHT_WORKERS", SUNLIGHT_WORKERS)
+
+        if mode is None:
+            mode = getattr(settings, "SUNLIGHT_MODE", EAGER_MODE)
+
+        # How the sunlight hours are stored
+        self.mode = mode
+        # Dawn and sunset on each day of the year (parsed)
+        self.calendar = get_calendar(calendar)
+
+        if mode == LAZY_MODE:
+            if not isinstance(self.info, list) or \
+                    not all(isinstance(neighbourhood, dict) and "neighborhood" in neighbourhood and
+                            check_neighbourhood_geometry(neighbourhood) for neighbourhood in self.info):
+                raise CityInitializationError()
+
+            logger.debug("{} city created.".format(self.name))
+            return
+
         # Update City info, including per apartment sunlight hours info
-        if not compute_city_sunlight_hours(self.info, dawn, sunset):
+        if not compute_city_sunlight_hours(self.info, dawn, sunset, backend, workers):
             raise CityInitializationError()
 
+        apartments_computed.inc(sum(building["apartments_count"] for neighbourhood in self.info
+                                    for building in neighbourhood["buildings"]))
+
         logger.debug("{} city created.".format(self.name))
 
     def save(self):
@@ -57,7 +131,8 @@ class City():
 
         :return: (bool) True if successfully saved; False otherwise.
         """
-        result = Controller.save_city(self.info)
+        result = Controller.save_city(self.info, mode=self.mode, calendar=self.calendar, dawn=self.dawn,
+                                      sunset=self.sunset)
 
         if result:
             self.logger.info("{} city updated".format(self.name))
@@ -66,3 +141,188 @@ class City():
 
         return result
 
+
+def ingest_city(stream, name=DEFAULT_CITY, dawn=DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                sunset=DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], logger=logger, backend=None, workers=None,
+                chunk_size=None, progress=None, mode=None, calendar=None):
+    """
+        Initializes the city with the info contained in the specified stream, and saves it to permanent storage.
+
+        Same result as City(json.load(stream)).save(), but the neighbourhood list is parsed one neighbourhood at a
+        time: each one is parsed, computed, handed to the database and released before parsing the next one. Therefore
+        the memory used is bounded by the size of the largest neighbourhood, not by the size of the whole city.
+
+        IMPLEMENTATION NOTE: The city is built as a new version, only published once complete (see
+        Controller.save_city), so an invalid neighbourhood found at the end of the stream leaves the prior city
+        untouched.
+
+        If the RESULT_CACHE setting is enabled, the neighbourhoods that are the same as the stored ones (see
+        .content_hash) are neither computed nor written again: the stored ones are reused.
+
+    :param stream: (file-like object) Stream that contains the city info (as described in the Code Challenge
+        description), e.g. the /init HTTP request.
+    :param name: (str) Name of the city.
+    :param dawn: (str) Dawn time. Local time at which starts the sunlight.
+    :param sunset: (str) Sunset time. Local time at which ends the sunlight
+    :param backend: (str) Backend used to compute the sunlight hours (see .sunlight_hours). If not specified, the
+        one in the SUNLIGHT_BACKEND setting is used.
+    :param workers: (int) Number of processes used to compute the sunlight hours. If not specified, the one in the
+        SUNLIGHT_WORKERS setting is used.
+    :param chunk_size: (int) Minimum number of bytes read at a time. If not specified, the one in the
+        STREAM_CHUNK_SIZE setting is used.
+    :param progress: (callable) If specified, it is called as progress(<event>, <neighbourhood>) each time a
+        neighbourhood is parsed (NEIGHBOURHOOD_PARSED), computed (NEIGHBOURHOOD_COMPUTED) and handed to the database
+        (NEIGHBOURHOOD_PERSISTED).
+    :param mode: (str) How the sunlight hours are stored (see City). If not specified, the one in the SUNLIGHT_MODE
+        setting is used. In LAZY_MODE, the neighbourhoods are validated instead of computed.
+    :param calendar: (list of list) Dawn and sunset of the city on each day of the year (see City).
+    :return: (bool) True if successfully saved; False otherwise.
+    :raises json.JSONDecodeError: If the stream does not contain a valid JSON document.
+    :raises CityInitializationError: If the city description is not valid.
+    """
+    if backend is None:
+        backend = getattr(settings, "SUNLIGHT_BACKEND", PYTHON_BACKEND)
+
+    if workers is None:
+        workers = getattr(settings, "SUNLIGHT_WORKERS", SUNLIGHT_WORKERS)
+
+    if chunk_size is None:
+        chunk_size = getattr(settings, "STREAM_CHUNK_SIZE", STREAM_CHUNK_SIZE)
+
+    if mode is None:
+        mode = getattr(settings, "SUNLIGHT_MODE", EAGER_MODE)
+
+    calendar = get_calendar(calendar)
+
+    # Published neighbourhoods that are reused if they did not change (see Controller.save_city)
+    stored_hashes = None
+    if getattr(settings, "RESULT_CACHE", RESULT_CACHE):
+        try:
+            stored_hashes = Controller.get_neighbourhood_hashes(DEFAULT_CITY)
+
+        except DatabaseError as e:
+            logger.warning("While trying to read the neighbourhoods of city {}: {}".format(name, e))
+
+    city_hash = get_city_hash(parse_time(dawn), parse_time(sunset), mode, calendar)
+    reused = set()
+
+    def is_stored(neighbourhood):
+        # Same as .controller.CityWriter.reuse_neighbourhood (only the first neighbourhood with each name)
+        if stored_hashes is None or find_stored_neighbourhood(
+                stored_hashes, neighbourhood, get_neighbourhood_hash(neighbourhood, city_hash)) is None or \
+                neighbourhood["neighborhood"] in reused:
+            return False
+
+        reused.add(neighbourhood["neighborhood"])
+        return True
+
+    # Seconds spent parsing, and parsing plus computing (neighbourhoods are parsed while they are computed)
+    times = {}
+
+    def get_parsed_neighbourhoods():
+        try:
+            for neighbourhood in iter_timed(iter_json_array(stream, chunk_size), times, "parse"):
+                if not isinstance(neighbourhood, dict) or "neighborhood" not in neighbourhood:
+                    raise CityInitializationError()
+
+                if progress is not None:
+                    progress(NEIGHBOURHOOD_PARSED, neighbourhood)
+
+                yield neighbourhood
+
+        except NotAJSONArrayError:
+            raise CityInitializationError()
+
+    def get_lazy_neighbourhoods():
+        # Only the geometry is stored, so it is only validated
+        for neighbourhood in iter_timed(get_parsed_neighbourhoods(), times, "parse+compute"):
+            if not check_neighbourhood_geometry(neighbourhood):
+                raise CityInitializationError()
+
+            if progress is not None:
+                progress(NEIGHBOURHOOD_COMPUTED, neighbourhood)
+
+            yield neighbourhood
+
+            if progress is not None:
+                progress(NEIGHBOURHOOD_PERSISTED, neighbourhood)
+
+    def get_neighbourhoods():
+        # Update neighbourhood info, including per apartment sunlight hours info
+        for neighbourhood, computed in iter_timed(iter_city_sunlight_hours(get_parsed_neighbourhoods(), dawn, sunset,
+                                                                           backend, workers, is_stored),
+                                                  times, "parse+compute"):
+            if computed is False:
+                raise CityInitializationError()
+
+            if computed:
+                apartments_computed.inc(sum(building["apartments_count"] for building in neighbourhood["buildings"]))
+
+            if progress is not None:
+                progress(NEIGHBOURHOOD_COMPUTED, neighbourhood)
+
+            yield neighbourhood
+
+            if progress is not None:
+                progress(NEIGHBOURHOOD_PERSISTED, neighbourhood)
+
+    start_time = perf_counter()
+
+    try:
+        if mode == LAZY_MODE:
+            result = Controller.save_city(get_lazy_neighbourhoods(), mode=mode, calendar=calendar, dawn=dawn,
+                                          sunset=sunset, stored_hashes=stored_hashes)
+        else:
+            result = Controller.save_city(get_neighbourhoods(), mode=mode, calendar=calendar, dawn=dawn,
+                                          sunset=sunset, stored_hashes=stored_hashes)
+
+    finally:
+        elapsed_seconds = perf_counter() - start_time
+
+        phase_seconds.observe(times.get("parse", 0.0), "init", "parse")
+        phase_seconds.observe(times.get("parse+compute", 0.0) - times.get("parse", 0.0), "init", "compute")
+        phase_seconds.observe(elapsed_seconds - times.get("parse+compute", 0.0), "init", "persist")
+        phase_seconds.observe(elapsed_seconds, "init", "total")
+
+    if result:
+        logger.info("{} city updated".format(name))
+    else:
+        logger.error("Impossible to update city {}".format(name))
+
+    return result
+
+
+def init_city(stream, progress=None):
+    """
+        Initializes the default city with the info contained in the specified stream (see ingest_city), and tells the
+        outcome as expected by the /init API endpoint.
+
+    :param stream: (file-like object) Stream that contains the city info (as described in the Code Challenge
+        description).
+    :param progress: (callable) Progress callback (see ingest_city).
+    :return: (tuple) Follows the format:
+
+                    (<result>, <message>)
+
+                with
+                    <result>: (bool) True if successfully initialized; False otherwise.
+                    <message>: (str) Outcome message.
+    """
+    result = True
+    try:
+        if ingest_city(stream, progress=progress):
+            message = "{} city updated".format(DEFAULT_CITY)
+        else:
+            # It could not be stored (e.g., duplicated names)
+            result = False
+            message = "Impossible to update {} city".format(DEFAULT_CITY)
+
+    except CityInitializationError:
+        result = False
+        message = "Invalid city description"
+
+    except JSONDecodeError:
+        result = False
+        message = "Bad Body. It must be a JSON"
+
+    return result, message
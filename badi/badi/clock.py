@@ -0,0 +1,99 @@
+#!/bin/python3
+
+"""
+    Module that gathers tools to handle local times. Internally, a local time is an int: the number of minutes elapsed
+    since midnight. It is only converted from/to the HH:MM format at the boundaries (i.e., when a city is received and
+    when a response is sent).
+"""
+
+from functools import lru_cache
+
+
+MINUTES_PER_HOUR = 60
+
+MINUTES_PER_DAY = 24 * MINUTES_PER_HOUR
+
+SECONDS_PER_MINUTE = 60
+
+
+@lru_cache(maxsize=4096)
+def parse_time(local_time):
+    """
+        Returns the number of minutes since midnight of the specified local time. Results are cached, so each distinct
+        string is only parsed once.
+
+    :param local_time: (str) Local time. Follows the format:
+
+                                            HH:MM
+                with
+                        HH: Hour   (from '00' to '23')
+                        MM: Minute (from '00' to '59')
+
+                Examples: '08:14', '17:25'
+
+    :return: (int) Minutes since midnight.
+    """
+    hours, minutes = local_time.split(':')
+
+    return int(hours) * MINUTES_PER_HOUR + int(minutes)
+
+
+@lru_cache(maxsize=4096)
+def format_time(minutes):
+    """
+        Returns the specified local time following the format HH:MM. Results are cached, so each distinct time is only
+        formatted once.
+
+    :param minutes: (int) Minutes since midnight.
+    :return: (str) Local time. Follows the format:
+
+                                            HH:MM
+                with
+                        HH: Hour   (from '00' to '23')
+                        MM: Minute (from '00' to '59')
+
+                Examples: '08:14', '17:25'
+    """
+    hours, minutes = divmod(minutes, MINUTES_PER_HOUR)
+
+    return "{}:{}".format(str(hours).rjust(2, '0'), str(minutes).rjust(2, '0'))
+
+
+def get_shadow_minutes(angle, city_seconds_per_grade):
+    """
+        Returns the number of whole minutes that the shadow of an obstacle takes from the city sunlight. An obstacle
+        lower than the apartment (i.e., a negative angle) casts no shadow on it, so it takes no sunlight: the apartment
+        dawn is never before the city dawn (nor its sunset after the city sunset).
+
+    :param angle: (float) The angle of the shadow (and the soil) of the obstacle (in grades).
+    :param city_seconds_per_grade: (float) The number of elapsed seconds for each unitary increment in the angle that
+        between the sunlight and the soil.
+    :return: (int) Number of minutes (truncated towards zero). 0 if the angle is negative.
+    """
+    return int(int(max(angle, 0) * city_seconds_per_grade) / SECONDS_PER_MINUTE)
+
+
+def get_seconds_per_grade(dawn_minutes, sunset_minutes):
+    """
+        Returns the number of elapsed seconds for each unitary increment in the angle that between the sunlight and the
+        soil.
+
+        RECALL that, following the Code Challenge definition, the total number of seconds elapsed from the city dawn
+        to the city sunset are equally distributed between the 180 grades that cover the full dawn-sunset range.
+
+    :param dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+    :param sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+    :return: (float) Seconds per grade.
+    """
+    return float((sunset_minutes - dawn_minutes) * SECONDS_PER_MINUTE) / float(180)
+
+
+def get_sunlight_minutes(dawn_minutes, sunset_minutes):
+    """
+        Returns the number of minutes of sunlight between the specified dawn and sunset.
+
+    :param dawn_minutes: (int) The local time when starts the sunlight (minutes since midnight).
+    :param sunset_minutes: (int) The local time when ends the sunlight (minutes since midnight).
+    :return: (int) Minutes of sunlight. 0 if the sunset is not after the dawn (i.e., there is no sunlight at all).
+    """
+    return max(sunset_minutes - dawn_minutes, 0)
@@ -0,0 +1,81 @@
+#!/bin/python3
+
+"""
+    Background removal of the city versions that are no longer published.
+"""
+
+from logging import getLogger
+from queue import Queue
+from threading import Lock, Thread
+
+from django.conf import settings
+from django.db import connection
+
+# Get an instance of a logger
+logger = getLogger(__name__)
+
+
+class CityVersionCollector():
+    """
+        Removes the prior versions of a city (see .models.City.version) on a background thread, so the request that
+        published the new version does not wait for it.
+
+        IMPLEMENTATION NOTE: If the new version was published within an outer transaction (e.g., on tests), the prior
+        versions are removed right away, within the same transaction: other connections could not see the new version
+        until it is committed.
+    """
+
+    def __init__(self, collect, in_background=None):
+        """
+            Initializes the collector.
+
+        :param collect: (callable) Function that removes the prior versions of the city whose name receives.
+        :param in_background: (bool) Whether the prior versions are removed on a background thread. If not specified,
+            the one in the CITY_GC_IN_BACKGROUND setting is used.
+        """
+        self.collect = collect
+        self.in_background = in_background if in_background is not None else getattr(settings,
+                                                                                      "CITY_GC_IN_BACKGROUND", True)
+
+        self.queue = Queue()
+        self.lock = Lock()
+        self.thread = None
+
+    def schedule(self, city_name):
+        """
+            Schedules the removal of the prior versions of the specified city.
+
+        :param city_name: (str) City name.
+        :return: None
+        """
+        if not self.in_background or connection.in_atomic_block:
+            self.collect(city_name)
+            return
+
+        self.queue.put(city_name)
+
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name="badi-city-gc", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """
+            Background thread loop.
+
+        :return: None
+        """
+        while True:
+            city_name = self.queue.get()
+
+            try:
+                self.collect(city_name)
+
+            except Exception as e:
+                # They will be removed after the next publication
+                logger.exception("While removing prior versions of city {}: {}".format(city_name, e))
+
+            finally:
+                # It runs on its own thread, so do not keep its connection open
+                connection.close()
+                self.queue.task_done()
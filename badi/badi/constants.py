@@ -14,3 +14,86 @@ DEFAULT_CITY_VALUES = {
 }
 
 FLOOR_HEIGHT = 1  # Measured in the same unit than the distance between buildings
+
+# Backends available to compute the sunlight hours of a city
+PYTHON_BACKEND = "python"
+NUMPY_BACKEND = "numpy"
+
+# Modes of storing the sunlight hours of a city
+EAGER_MODE = "eager"  # Computed and stored for every apartment on /init
+LAZY_MODE = "lazy"    # Only the buildings are stored on /init. Each apartment is computed when it is looked up
+COMPRESSED_MODE = "compressed"  # Computed on /init, and stored as runs of floors with the same sunlight hours
+
+# Number of days of the calendar of a city (see .yearly)
+DAYS_PER_YEAR = 365
+
+# Maximum number of days per request of the sunlight hours calendar API endpoint
+CALENDAR_MAX_DAYS = 366
+
+# JSON file with the dawn and sunset of the city on each day of the year (None means that only the ones of
+# DEFAULT_CITY_VALUES are computed)
+SUNLIGHT_CALENDAR = None
+
+# Whether the neighbourhoods that did not change are reused when a city is initialized again (see .content_hash)
+RESULT_CACHE = True
+
+# Maximum number of rows inserted per statement when saving a city
+SAVE_BATCH_SIZE = 2000
+
+# Minimum number of primary keys of a table reserved at a time when saving a city (see .models.IdBlock)
+ID_BLOCK_SIZE = 10000
+
+# Seconds between background checks of the data base liveness
+DB_HEALTH_CHECK_INTERVAL = 5
+
+# Number of consecutive failed queries that mark the data base as not available
+DB_CIRCUIT_FAILURE_THRESHOLD = 3
+
+# Seconds the data base is marked as not available before letting requests try again
+DB_CIRCUIT_COOLDOWN = 30
+
+# Maximum number of apartments kept in the in-process lookup cache (0 disables it)
+APARTMENT_CACHE_SIZE = 100000
+
+# Seconds an apartment (and the state of its city) is kept in the in-process lookup cache, so a city published by
+# another process is seen after it at the latest (None means until the next /init in the same process)
+APARTMENT_CACHE_TTL = 60
+
+# Maximum number of buildings resolved per query on batch lookups
+LOOKUP_CHUNK_SIZE = 300
+
+# Maximum number of apartments per batch lookup request
+BATCH_MAX_SIZE = 5000
+
+# Number of apartments per page of the /apartments API endpoint, by default and at most
+QUERY_PAGE_SIZE = 100
+QUERY_MAX_PAGE_SIZE = 1000
+
+# Number of apartments of the /apartments/top API endpoint by default, and positions ranked per neighbourhood (the most
+# it can return)
+TOP_SIZE = 10
+RANKING_SIZE = 100
+
+# Minimum number of bytes read at a time from the /init request body
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Number of processes used to compute the sunlight hours of a city (1 means no process pool)
+SUNLIGHT_WORKERS = 1
+
+# Maximum number of asynchronous /init jobs waiting to be run
+INIT_QUEUE_SIZE = 4
+
+# Maximum number of asynchronous /init jobs whose status is kept
+INIT_JOBS_KEPT = 100
+
+# Directory of the city snapshots used to answer the lookups without the data base (None disables them)
+SNAPSHOT_DIR = None
+
+# Seconds between checks for a new snapshot of a city published by another process
+SNAPSHOT_RELOAD_INTERVAL = 1
+
+# Seconds the responses of the GET sunlight hours lookups can be cached by HTTP caches (see the Cache-Control header)
+SUNLIGHT_HOURS_MAX_AGE = 60
+
+# Maximum number of neighbourhood horizons kept in memory to compute the apartments of lazy cities
+HORIZON_CACHE_SIZE = 1000
@@ -0,0 +1,72 @@
+#!/bin/python3
+
+"""
+    Content hashes of the neighbourhoods of a city. When a city is initialized again, the stored neighbourhoods whose
+    hash did not change are reused, instead of being computed and written again (see .controller.Controller.save_city).
+
+    The hash of a neighbourhood covers its geometry (the values that the computation uses, in order) and the values of
+    the city its stored rows depend on: dawn, sunset, mode and calendar (see get_city_hash). Any other value (e.g., an
+    unknown key of the /init body) is ignored.
+"""
+
+import json
+from hashlib import sha256
+
+
+def get_city_hash(dawn_minutes, sunset_minutes, mode, calendar=None):
+    """
+        Returns the hash of the values of a city the stored neighbourhoods depend on.
+
+    :param dawn_minutes: (int) The time when the sunlight starts in the city (minutes since midnight).
+    :param sunset_minutes: (int) The time when the sunlight ends in the city (minutes since midnight).
+    :param mode: (str) How the sunlight hours are stored (see .models.City.mode).
+    :param calendar: (tuple) Calendar of the city (see .yearly.parse_calendar). None if it has no calendar.
+    :return: (str) Hash (hexadecimal).
+    """
+    content = [dawn_minutes, sunset_minutes, mode, None if calendar is None else [list(days) for days in calendar]]
+
+    return sha256(json.dumps(content, separators=(",", ":")).encode()).hexdigest()
+
+
+def get_neighbourhood_hash(neighbourhood_info, city_hash):
+    """
+        Returns the content hash of the specified neighbourhood.
+
+    :param neighbourhood_info: (dict) Neighbourhood info (as described in the Code Challenge).
+    :param city_hash: (str) Hash of the city (see get_city_hash).
+    :return: (str) Hash (hexadecimal). None if the neighbourhood is not valid.
+    """
+    try:
+        content = [city_hash, neighbourhood_info["neighborhood"], neighbourhood_info["apartments_height"],
+                   [[building["name"], building["apartments_count"], building["distance"]]
+                    for building in neighbourhood_info["buildings"]]]
+
+        return sha256(json.dumps(content, separators=(",", ":")).encode()).hexdigest()
+
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def find_stored_neighbourhood(stored_hashes, neighbourhood_info, content_hash):
+    """
+        Finds the stored neighbourhood that can be reused instead of the specified one: the one with the same name and
+        content hash.
+
+    :param stored_hashes: (dict) Stored neighbourhoods (see .controller.Controller.get_neighbourhood_hashes).
+    :param neighbourhood_info: (dict) Neighbourhood info (as described in the Code Challenge).
+    :param content_hash: (str) Its content hash (see get_neighbourhood_hash).
+    :return: (int) Id of the stored neighbourhood. None if there is none.
+    """
+    if content_hash is None:
+        return None
+
+    try:
+        stored = stored_hashes.get(neighbourhood_info["neighborhood"])
+
+    except (TypeError, KeyError):
+        return None
+
+    if stored is None or stored[1] != content_hash:
+        return None
+
+    return stored[0]
@@ -3,8 +3,31 @@
 import logging
 logger = logging.getLogger(__name__) #TODO: Replace logger with Dependency Injected global logger
 
-from .constants import DEFAULT_CITY, DEFAULT_CITY_VALUES
-from .models import Apartment, Building, Neighbourhood, City
+from heapq import nsmallest
+from itertools import chain
+from struct import error as StructError
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Exists, F, Max, OuterRef, Q
+
+from .cache import apartment_cache, horizon_cache
+from .clock import MINUTES_PER_DAY, parse_time, format_time, get_sunlight_minutes
+from .collector import CityVersionCollector
+from .constants import DEFAULT_CITY, DEFAULT_CITY_VALUES, SAVE_BATCH_SIZE, LOOKUP_CHUNK_SIZE, EAGER_MODE, LAZY_MODE, \
+    COMPRESSED_MODE, ID_BLOCK_SIZE, QUERY_PAGE_SIZE, TOP_SIZE, RANKING_SIZE, PYTHON_BACKEND, RESULT_CACHE
+from .content_hash import get_city_hash, get_neighbourhood_hash, find_stored_neighbourhood
+from .health import database_health
+from .metrics import apartments_computed, rows_written, result_cache_lookups
+from .models import Apartment, Building, FloorRange, Neighbourhood, City, YearlySunlight, IdBlock
+from .snapshot import snapshot_store
+from .sunlight_hours import get_buildings_shadow_angles, get_changed_buildings, rescale_neighbourhood_minutes, \
+    NeighbourhoodHorizon, get_floor_ranges, find_floor_range, get_ranking, get_sunlit_counts, get_backend, \
+    pack_angles, unpack_angles, pack_counts, unpack_counts
+from .yearly import get_neighbourhood_yearly_minutes, get_yearly_minutes, rescale_yearly_minutes, pack_minutes, \
+    unpack_minutes
 
 
 class Controller():
@@ -13,34 +36,23 @@ class Controller():
         required data.
     """
 
+    # Throughput of the last city save. Follows the format:
+    #
+    #   {"rows": <inserted_rows>, "seconds": <elapsed_seconds>, "rows_per_second": <rows_per_second>,
+    #    "reused": <reused_neighbourhoods>, "neighbourhoods": <neighbourhoods>}
+    save_stats = None
+
     @staticmethod
     def is_running_db():
         """
             Tells if the underlying data base system is up and running
 
         :return: (bool) True if the underlying data base system is up and running; False otherwise.
-        """
-        result = False
-        try:
-            #
-            # NOTE: Check here any condition that could turn temporary unavailable the DB
-            #
-            aqs = Apartment.objects.filter(id=1)
-            bqs = Building.objects.filter(id=1)
-            nqs = Neighbourhood.objects.filter(id=1)
-
-            if len(aqs) > 1 or len(bqs) > 1 or len(nqs) > 1:
-                # Force real execution of lazy querysets (and enforce data consistency)
-                logger.exception("Data inconsistency detected - The DB is in an uncertain state. Check it out")
-                raise Exception("Inconsistent Data")
-
-            result = True
-
-        except Exception as e:
-            # If anything wrong happens, assume the underlying data base system is not available right now.
-            logger.exception("While trying to check DB activity: {}".format(e))
 
-        return result
+        IMPLEMENTATION NOTE: It does not query the data base. It reads the state kept by .health.database_health,
+        that is updated by a background liveness check and by the outcome of the lookups (circuit breaker).
+        """
+        return database_health.is_available()
 
     @staticmethod
     def get_apartment_info(apartment_info):
@@ -62,77 +74,2273 @@ class Controller():
                     <building_name>: (str) Building name.
                     <apartment> (int) Apartment floor. Assumption: There is only 1 apartment per floor.
 
-        :return: (.models.Apartment) Information of the apartment.
+        :return: (.models.Apartment) Information of the apartment. None if it does not exist.
+        :raise: (django.db.DatabaseError) If the query fails.
+
+        IMPLEMENTATION NOTE: If there is a snapshot of the city (see .snapshot.SnapshotStore), the apartment is looked
+        up there, without querying the data base. Otherwise, apartments are cached (see .cache.ApartmentCache). On a
+        miss, the apartment is resolved with a single query, joining the apartment with its building, neighbourhood and
+        city (only the neighbourhoods of the published version of the city are visible). The unique indexes on (city,
+        name, version), (neighbourhood, name) and (building, floor) keep each step of the join an index lookup, so the
+        latency does not grow with the size of the city. If the city is stored in lazy mode, the apartment is computed
+        instead (see get_computed_apartment_info). If it is stored in compressed mode, its floor range is looked up
+        instead (see get_compressed_apartment_info).
         """
         try:
-            try:
-                cqs = City.objects.filter(name=apartment_info["city"])
-            except KeyError:
-                # Use default city
-                cqs = City.objects.filter(name=DEFAULT_CITY)
+            city = apartment_info.get("city", DEFAULT_CITY)
+            key = (city, apartment_info["neighbourhood"], apartment_info["building"], apartment_info["apartment"])
+
+        except KeyError:
+            return None
+
+        snapshot = snapshot_store.get(city)
+        if snapshot is not None:
+            return snapshot.get_apartment(key[1], key[2], key[3])
+
+        # Read the cache version before querying, so the result is discarded if the city changes meanwhile
+        cache_version = apartment_cache.get_version()
+
+        try:
+            state = Controller.get_city_state(city)
+
+            # Only the apartments read from the same state of the city as its tag are valid (see get_city_tag)
+            cached = None if state is None else apartment_cache.get(key, state[:2])
+            if cached is not None:
+                return cached
+
+            if state is None:
+                # Unknown city
+                result = None
+
+            elif state[2] == LAZY_MODE:
+                result = Controller.get_computed_apartment_info(city, apartment_info["neighbourhood"],
+                                                                apartment_info["building"], apartment_info["apartment"])
 
-            nqs = Neighbourhood.objects.filter(city=cqs[0]).filter(name=apartment_info["neighbourhood"])
-            bqs = Building.objects.filter(name=apartment_info["building"]).filter(neighbourhood=nqs[0])
-            aqs = Apartment.objects.filter(building=bqs[0]).filter(floor=apartment_info["apartment"])
+            elif state[2] == COMPRESSED_MODE:
+                result = Controller.get_compressed_apartment_info(city, apartment_info["neighbourhood"],
+                                                                  apartment_info["building"],
+                                                                  apartment_info["apartment"])
 
-            return aqs[0]
+            else:
+                aqs = Apartment.objects.select_related("building__neighbourhood").filter(
+                    building__neighbourhood__city_id=city,
+                    building__neighbourhood__version=F("building__neighbourhood__city__version"),
+                    building__neighbourhood__name=apartment_info["neighbourhood"],
+                    building__name=apartment_info["building"],
+                    floor=apartment_info["apartment"])
 
-        except (IndexError, KeyError):
+                result = aqs[0]
+
+        except IndexError:
             result = None
 
+        except DatabaseError as e:
+            # Let the circuit breaker know that the data base is failing
+            database_health.record_error(e)
+            raise
+
+        database_health.record_success()
+
+        if result is not None:
+            apartment_cache.put(key, result, cache_version, state[:2])
+
+        return result
+
+    @staticmethod
+    def get_apartments_info(apartment_info_list, chunk_size=LOOKUP_CHUNK_SIZE):
+        """
+            Retrieves the information of several apartments at once.
+
+            IMPLEMENTATION NOTE: Apartments of cities with a snapshot are looked up there (see .snapshot.SnapshotStore).
+            Cached apartments are taken from the cache, if they were read from the current state of their city (see
+            get_city_state). The rest are grouped by building and resolved with set-based queries: one query per chunk
+            of requested buildings, to get their ids, and one query per chunk of building ids, to get their requested
+            floors. So the number of queries is bounded by the number of distinct buildings, not by the number of
+            apartments. The apartments of cities stored in lazy mode are computed instead of queried (see
+            compute_apartment). For cities stored in compressed mode, the floor ranges of each chunk of building ids are
+            queried instead, and each requested floor is found with a binary search.
+
+        :param apartment_info_list: (list of dict) Requested apartments. Each one follows the same format as in
+            get_apartment_info.
+        :param chunk_size: (int) Maximum number of buildings resolved per query.
+        :return: (list of .models.Apartment) Information of each apartment, in the same order as requested. None for
+            the apartments that do not exist.
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        result = [None] * len(apartment_info_list)
+
+        # Requested apartments that are not cached, grouped by building: {(city, neighbourhood, building): {floor: [
+        # positions]}}
+        pending = {}
+        states = {}
+
+        for position, apartment_info in enumerate(apartment_info_list):
+            city = apartment_info.get("city", DEFAULT_CITY)
+            key = (city, apartment_info["neighbourhood"], apartment_info["building"], apartment_info["apartment"])
+
+            snapshot = snapshot_store.get(city)
+            if snapshot is not None:
+                result[position] = snapshot.get_apartment(key[1], key[2], key[3])
+                continue
+
+            if city not in states:
+                try:
+                    states[city] = Controller.get_city_state(city)
+
+                except DatabaseError as e:
+                    # Let the circuit breaker know that the data base is failing
+                    database_health.record_error(e)
+                    raise
+
+            if states[city] is None:
+                # Unknown city
+                continue
+
+            # Only the apartments read from the same state of the city as its tag are valid (see get_city_tag)
+            apartment = apartment_cache.get(key, states[city][:2])
+            if apartment is not None:
+                result[position] = apartment
+            else:
+                pending.setdefault(key[:3], {}).setdefault(key[3], []).append(position)
+
+        if not pending:
+            return result
+
+        # Read the cache version before querying, so the results are discarded if the city changes meanwhile
+        cache_version = apartment_cache.get_version()
+
+        try:
+            building_keys = list(pending)
+            buildings = {}
+
+            for start in range(0, len(building_keys), chunk_size):
+                chunk = building_keys[start:start + chunk_size]
+
+                # Superset of the requested buildings; the exact (city, neighbourhood, building) match is made here
+                bqs = Building.objects.select_related("neighbourhood__city").filter(
+                    neighbourhood__city_id__in={key[0] for key in chunk},
+                    neighbourhood__version=F("neighbourhood__city__version"),
+                    neighbourhood__name__in={key[1] for key in chunk},
+                    name__in={key[2] for key in chunk})
+
+                for building in bqs:
+                    key = (building.neighbourhood.city_id, building.neighbourhood.name, building.name)
+                    if key in pending:
+                        buildings[building.id] = (key, building)
+
+            building_ids = []
+            compressed_building_ids = []
+            tags = {}
+
+            for building_id, (key, building) in buildings.items():
+                mode = building.neighbourhood.city.mode
+                # State of the city the building was read from
+                tags[building_id] = (building.neighbourhood.city.version, building.neighbourhood.city.revision)
+
+                if mode == EAGER_MODE:
+                    building_ids.append(building_id)
+                    continue
+
+                if mode == COMPRESSED_MODE:
+                    compressed_building_ids.append(building_id)
+                    continue
+
+                # The city is stored in lazy mode: compute the requested floors
+                for floor, positions in pending[key].items():
+                    apartment = Controller.compute_apartment(building, floor)
+
+                    if apartment is not None:
+                        apartment_cache.put(key + (floor,), apartment, cache_version, tags[building_id])
+
+                        for position in positions:
+                            result[position] = apartment
+
+            for start in range(0, len(building_ids), chunk_size):
+                chunk = building_ids[start:start + chunk_size]
+                floors = [floor for building_id in chunk for floor in pending[buildings[building_id][0]]]
+
+                for apartment in Apartment.objects.filter(building_id__in=chunk, floor__gte=min(floors),
+                                                          floor__lte=max(floors)):
+                    key, building = buildings[apartment.building_id]
+                    positions = pending[key].get(apartment.floor)
+
+                    if positions is not None:
+                        apartment.building = building
+                        apartment_cache.put(key + (apartment.floor,), apartment, cache_version,
+                                            tags[apartment.building_id])
+
+                        for position in positions:
+                            result[position] = apartment
+
+            for start in range(0, len(compressed_building_ids), chunk_size):
+                chunk = compressed_building_ids[start:start + chunk_size]
+                floor_ranges = {}
+
+                for building_id, *floor_range in FloorRange.objects.filter(building_id__in=chunk).order_by(
+                        "building_id", "floor_from").values_list("building_id", "floor_from", "floor_to",
+                                                                 "dawn_minutes", "sunset_minutes"):
+                    floor_ranges.setdefault(building_id, []).append(tuple(floor_range))
+
+                for building_id in chunk:
+                    key, building = buildings[building_id]
+
+                    for floor, positions in pending[key].items():
+                        floor_range = find_floor_range(floor_ranges.get(building_id, []), floor)
+
+                        if floor_range is not None:
+                            apartment = Controller.make_apartment(building, floor, floor_range[2], floor_range[3])
+                            apartment_cache.put(key + (floor,), apartment, cache_version, tags[building_id])
+
+                            for position in positions:
+                                result[position] = apartment
+
+        except DatabaseError as e:
+            # Let the circuit breaker know that the data base is failing
+            database_health.record_error(e)
+            raise
+
+        database_health.record_success()
+
+        return result
+
+    @staticmethod
+    def find_apartments(city=DEFAULT_CITY, min_minutes=None, max_minutes=None, sunlit_from=None, sunlit_until=None,
+                        neighbourhood_name=None, building_name=None, limit=QUERY_PAGE_SIZE, after=None):
+        """
+            Finds the apartments of the specified city that match all the given filters, from the most to the least
+            sunlight, one page at a time.
+
+            IMPLEMENTATION NOTE: Apartments (or floor ranges, in compressed mode) are read in the order of the index on
+            their sunlight minutes, starting from the cursor (keyset pagination). So the first row of a page is found
+            with an index seek, and a page costs its own size (plus the rows skipped by the other filters), no matter
+            how deep it is. The city, version and neighbourhood are checked with a correlated subquery on each row, so
+            the data base does not drive the query from the city instead (which would read and sort all its
+            apartments). A single building is small enough to be read and sorted, though.
+
+        :param city: (str) City name.
+        :param min_minutes: (int) Minimum minutes of sunlight. Not filtered if None.
+        :param max_minutes: (int) Maximum minutes of sunlight. Not filtered if None.
+        :param sunlit_from: (int) The apartment must be sunlit since this time, at the latest (minutes since midnight).
+            Not filtered if None.
+        :param sunlit_until: (int) The apartment must be sunlit until this time, at least (minutes since midnight). Not
+            filtered if None.
+        :param neighbourhood_name: (str) Neighbourhood name. Not filtered if None.
+        :param building_name: (str) Building name. Not filtered if None.
+        :param limit: (int) Maximum number of apartments.
+        :param after: (tuple) Cursor returned along with the prior page. The first page if None.
+        :return: (tuple) Follows the format:
+
+                    (<apartments>, <next>)
+
+                with
+                    <apartments>: (list of .models.Apartment) Apartments, with their building and neighbourhood.
+                    <next>: (tuple) Cursor of the next page: (<sunlight_minutes>, <row_id>, <floor>) of the last
+                        apartment. None if there are no more apartments.
+        :raise: (ValueError) If the city is stored in lazy mode (apartments are not stored, so they can not be queried).
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        try:
+            state = Controller.get_city_state(city)
+
+            if state is None:
+                return [], None
+
+            if state[2] == LAZY_MODE:
+                raise ValueError("City {} is stored in lazy mode".format(city))
+
+            model = FloorRange if state[2] == COMPRESSED_MODE else Apartment
+            qs = model.objects.select_related("building__neighbourhood")
+
+            if building_name is None:
+                buildings = Building.objects.filter(id=OuterRef("building_id"), neighbourhood__city_id=city,
+                                                    neighbourhood__version=F("neighbourhood__city__version"))
+                if neighbourhood_name is not None:
+                    buildings = buildings.filter(neighbourhood__name=neighbourhood_name)
+
+                qs = qs.annotate(published=Exists(buildings)).filter(published=True)
+
+            else:
+                qs = qs.filter(building__neighbourhood__city_id=city,
+                               building__neighbourhood__version=F("building__neighbourhood__city__version"),
+                               building__name=building_name)
+                if neighbourhood_name is not None:
+                    qs = qs.filter(building__neighbourhood__name=neighbourhood_name)
+
+            if min_minutes is not None:
+                qs = qs.filter(sunlight_minutes__gte=min_minutes)
+            if max_minutes is not None:
+                qs = qs.filter(sunlight_minutes__lte=max_minutes)
+            if sunlit_from is not None:
+                qs = qs.filter(dawn_minutes__lte=sunlit_from)
+            if sunlit_until is not None:
+                qs = qs.filter(sunset_minutes__gte=sunlit_until)
+            if after is not None:
+                # The row of the cursor is read again, since its floors above the cursor could still be pending
+                qs = qs.filter(Q(sunlight_minutes__lt=after[0]) | Q(sunlight_minutes=after[0], id__lte=after[1]))
+
+            # Each row has at least one floor, but the one of the cursor could have none left
+            rows = list(qs.order_by("-sunlight_minutes", "-id")[:limit + 2])
+
+        except DatabaseError as e:
+            # Let the circuit breaker know that the data base is failing
+            database_health.record_error(e)
+            raise
+
+        database_health.record_success()
+
+        result = []
+        cursors = []
+
+        for row in rows:
+            if model is FloorRange:
+                floors = range(row.floor_from, row.floor_to + 1)
+            else:
+                floors = (row.floor,)
+
+            for floor in floors:
+                if after is not None and (row.sunlight_minutes, row.id) == tuple(after[:2]) and floor <= after[2]:
+                    continue
+
+                if len(result) == limit:
+                    return result, cursors[-1]
+
+                if model is FloorRange:
+                    result.append(Controller.make_apartment(row.building, floor, row.dawn_minutes,
+                                                            row.sunset_minutes))
+                else:
+                    result.append(row)
+                cursors.append((row.sunlight_minutes, row.id, floor))
+
+        # Otherwise, all the matching rows were read
+        return result, None
+
+    @staticmethod
+    def get_top_apartments(city=DEFAULT_CITY, k=TOP_SIZE, neighbourhood_name=None, building_name=None):
+        """
+            Returns the k apartments with the most sunlight of the specified city, neighbourhood or building. Ties are
+            broken by neighbourhood name, then by building position (from east to west) and then by floor (from lower
+            to higher), so the result does not depend on the order in which the rows were stored.
+
+            IMPLEMENTATION NOTE: The k apartments with the most sunlight of a city (or a neighbourhood) are among the
+            first k ones of the ranking of their neighbourhood (see .models.Apartment.neighbourhood_rank). So they are
+            read from the index on the rank (k rows per neighbourhood at most) and merged, instead of sorting the
+            apartments. A single building is small enough to be read and sorted, though.
+
+        :param city: (str) City name.
+        :param k: (int) Maximum number of apartments (from 1 to .constants.RANKING_SIZE).
+        :param neighbourhood_name: (str) Neighbourhood name. The whole city if None.
+        :param building_name: (str) Building name. The whole neighbourhood (or city) if None.
+        :return: (list of .models.Apartment) Apartments, with their building and neighbourhood, from the most to the
+            least sunlight.
+        :raise: (ValueError) If the city is stored in lazy mode (apartments are not stored, so they can not be ranked).
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        if building_name is None:
+            ranking = Controller.get_neighbourhood_rankings(city, k, neighbourhood_name)
+
+            return [apartment for _, _, _, apartment in nsmallest(
+                k, ((-apartment.sunlight_minutes, name, position, apartment)
+                    for name, apartments in ranking.items() for position, apartment in enumerate(apartments)),
+                key=lambda item: item[:3])]
+
+        try:
+            state = Controller.get_city_state(city)
+
+            if state is None:
+                return []
+
+            if state[2] == LAZY_MODE:
+                raise ValueError("City {} is stored in lazy mode".format(city))
+
+            model = FloorRange if state[2] == COMPRESSED_MODE else Apartment
+            qs = model.objects.select_related("building__neighbourhood").filter(
+                building__neighbourhood__city_id=city,
+                building__neighbourhood__version=F("building__neighbourhood__city__version"),
+                building__name=building_name)
+            if neighbourhood_name is not None:
+                qs = qs.filter(building__neighbourhood__name=neighbourhood_name)
+
+            # Each row has at least one floor
+            rows = list(qs.order_by("-sunlight_minutes", "building__neighbourhood__name",
+                                    "floor_from" if model is FloorRange else "floor")[:k])
+
+        except DatabaseError as e:
+            # Let the circuit breaker know that the data base is failing
+            database_health.record_error(e)
+            raise
+
+        database_health.record_success()
+
+        return [apartment for row in rows for apartment in Controller.get_row_apartments(row)][:k]
+
+    @staticmethod
+    def get_neighbourhood_rankings(city=DEFAULT_CITY, k=TOP_SIZE, neighbourhood_name=None):
+        """
+            Returns the k apartments with the most sunlight of each neighbourhood of the specified city, read from the
+            index on their rank (see .models.Apartment.neighbourhood_rank).
+
+        :param city: (str) City name.
+        :param k: (int) Maximum number of apartments per neighbourhood (from 1 to .constants.RANKING_SIZE).
+        :param neighbourhood_name: (str) Neighbourhood name. All of them if None.
+        :return: (dict) Apartments of each neighbourhood (list of .models.Apartment, with their building and
+            neighbourhood, in ranking order), keyed by neighbourhood name. Neighbourhoods with no apartments are not
+            included.
+        :raise: (ValueError) If the city is stored in lazy mode (apartments are not stored, so they can not be ranked).
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        try:
+            state = Controller.get_city_state(city)
+
+            if state is None:
+                return {}
+
+            if state[2] == LAZY_MODE:
+                raise ValueError("City {} is stored in lazy mode".format(city))
+
+            # The city, version and neighbourhood are checked with a correlated subquery (see find_apartments)
+            model = FloorRange if state[2] == COMPRESSED_MODE else Apartment
+            buildings = Building.objects.filter(id=OuterRef("building_id"), neighbourhood__city_id=city,
+                                                neighbourhood__version=F("neighbourhood__city__version"))
+            if neighbourhood_name is not None:
+                buildings = buildings.filter(neighbourhood__name=neighbourhood_name)
+
+            rows = list(model.objects.select_related("building__neighbourhood").annotate(
+                published=Exists(buildings)).filter(published=True, neighbourhood_rank__lte=k))
+
+        except DatabaseError as e:
+            # Let the circuit breaker know that the data base is failing
+            database_health.record_error(e)
+            raise
+
+        database_health.record_success()
+
+        result = {}
+
+        for row in sorted(rows, key=lambda row: row.neighbourhood_rank):
+            apartments = result.setdefault(row.building.neighbourhood.name, [])
+            apartments.extend(Controller.get_row_apartments(row)[:k - len(apartments)])
+
+        return result
+
+    @staticmethod
+    def count_sunlit_apartments(minutes, city=DEFAULT_CITY, neighbourhood_name=None):
+        """
+            Counts the apartments of the specified city (or neighbourhood) that are sunlit at the specified time: from
+            their dawn to their sunset, both included (same as the sunlit_from and sunlit_until filters of
+            find_apartments).
+
+            IMPLEMENTATION NOTE: It is read from the sunlit counts of the neighbourhoods (see get_sunlit_counts), so no
+            apartment is read. Once they are cached, it is a single list read, no matter the size of the city.
+
+        :param minutes: (int) Local time (minutes since midnight, from 0 to MINUTES_PER_DAY - 1).
+        :param city: (str) City name.
+        :param neighbourhood_name: (str) Neighbourhood name. The whole city if None.
+        :return: (int) Number of sunlit apartments. 0 if the city (or the neighbourhood) does not exist.
+        :raise: (ValueError) If the city is stored in lazy mode (apartments are not stored, so they are not counted).
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        counts = Controller.get_sunlit_counts(city)
+
+        if counts is None:
+            return 0
+
+        if neighbourhood_name is None:
+            return counts[0][minutes]
+
+        return counts[1][neighbourhood_name][minutes] if neighbourhood_name in counts[1] else 0
+
+    @staticmethod
+    def count_neighbourhood_sunlit_apartments(minutes, city=DEFAULT_CITY):
+        """
+            Counts the apartments of each neighbourhood of the specified city that are sunlit at the specified time (see
+            count_sunlit_apartments).
+
+        :param minutes: (int) Local time (minutes since midnight, from 0 to MINUTES_PER_DAY - 1).
+        :param city: (str) City name.
+        :return: (dict) Number of sunlit apartments, keyed by neighbourhood name. Empty if the city does not exist.
+        :raise: (ValueError) If the city is stored in lazy mode (apartments are not stored, so they are not counted).
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        counts = Controller.get_sunlit_counts(city)
+
+        if counts is None:
+            return {}
+
+        return {name: neighbourhood_counts[minutes] for name, neighbourhood_counts in counts[1].items()}
+
+    @staticmethod
+    def get_sunlit_counts(city):
+        """
+            Returns the number of sunlit apartments at each minute of the day of the published version of the specified
+            city, and of each one of its neighbourhoods, as stored along with them (see .models.Neighbourhood
+            .sunlit_counts). They are kept in the apartment cache, under the (<city>, "sunlit_counts") key, so they are
+            invalidated along with the apartments (see .cache.ApartmentCache).
+
+        :param city: (str) City name.
+        :return: (tuple) Follows the format:
+
+                    (<city_counts>, <neighbourhood_counts>)
+
+                with
+                    <city_counts>: (list of int) Number of sunlit apartments of the city at each minute of the day (see
+                        .sunlight_hours.get_sunlit_counts).
+                    <neighbourhood_counts>: (dict) Same as <city_counts> for each neighbourhood, keyed by its name.
+
+            None if the city does not exist.
+        :raise: (ValueError) If the city is stored in lazy mode.
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        try:
+            state = Controller.get_city_state(city)
+
+            if state is None:
+                return None
+
+            if state[2] == LAZY_MODE:
+                raise ValueError("City {} is stored in lazy mode".format(city))
+
+            key = (city, "sunlit_counts")
+            result = apartment_cache.get(key, state[:2])
+            if result is not None:
+                return result
+
+            # Read the cache version before querying, so the result is discarded if the city changes meanwhile
+            cache_version = apartment_cache.get_version()
+
+            rows = Neighbourhood.objects.filter(city_id=city, version=F("city__version")).exclude(
+                sunlit_counts=None).values_list("name", "sunlit_counts")
+            neighbourhood_counts = {name: unpack_counts(sunlit_counts) for name, sunlit_counts in rows}
+
+        except DatabaseError as e:
+            # Let the circuit breaker know that the data base is failing
+            database_health.record_error(e)
+            raise
+
+        database_health.record_success()
+
+        city_counts = [sum(counts) for counts in zip(*neighbourhood_counts.values())] or [0] * MINUTES_PER_DAY
+
+        result = (city_counts, neighbourhood_counts)
+        apartment_cache.put(key, result, cache_version, state[:2])
+
+        return result
+
+    @staticmethod
+    def get_row_apartments(row):
+        """
+            Returns the apartments stored in the specified row.
+
+        :param row: (.models.Apartment/.models.FloorRange) Apartment, or floor range (see .constants.COMPRESSED_MODE).
+        :return: (list of .models.Apartment) Apartments (from lower to higher floor).
+        """
+        if isinstance(row, FloorRange):
+            return [Controller.make_apartment(row.building, floor, row.dawn_minutes, row.sunset_minutes)
+                    for floor in range(row.floor_from, row.floor_to + 1)]
+
+        return [row]
+
+    @staticmethod
+    def get_yearly_sunlight(neighbourhood_name, building_name, floor, city=DEFAULT_CITY):
+        """
+            Retrieves the dawn and sunset of the specified apartment on each day of the year (see .yearly). In lazy
+            mode, they are computed from the horizon of its neighbourhood (see get_neighbourhood_horizon).
+
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :param building_name: (str) Building name.
+        :param floor: (int) Apartment floor.
+        :param city: (str) City name.
+        :return: (tuple) Follows the format:
+
+                    (<dawn_minutes>, <sunset_minutes>)
+
+                with
+                    <dawn_minutes>: (list of int) Dawn of the apartment on each day (minutes since midnight), from
+                        January 1st (see .yearly.parse_calendar).
+                    <sunset_minutes>: (list of int) Sunset of the apartment on each day (minutes since midnight).
+
+            None if the apartment does not exist.
+        :raise: (ValueError) If the city has no calendar.
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        try:
+            try:
+                mode, calendar_dawn, calendar_sunset = City.objects.filter(name=city).values_list(
+                    "mode", "calendar_dawn", "calendar_sunset").get()
+
+            except City.DoesNotExist:
+                return None
+
+            if calendar_dawn is None:
+                raise ValueError("City {} has no calendar".format(city))
+
+            if mode == LAZY_MODE:
+                building = Building.objects.select_related("neighbourhood__city").filter(
+                    neighbourhood__city_id=city, neighbourhood__version=F("neighbourhood__city__version"),
+                    neighbourhood__name=neighbourhood_name, name=building_name).first()
+
+                if building is None or not 0 <= floor < building.floors:
+                    result = None
+                else:
+                    horizon = Controller.get_neighbourhood_horizon(building.neighbourhood)
+                    result = get_yearly_minutes(*horizon.get_apartment_angles(building.east_position, floor),
+                                                (unpack_minutes(calendar_dawn), unpack_minutes(calendar_sunset)))
+                    apartments_computed.inc()
+
+            else:
+                yearly = YearlySunlight.objects.filter(
+                    building__neighbourhood__city_id=city,
+                    building__neighbourhood__version=F("building__neighbourhood__city__version"),
+                    building__neighbourhood__name=neighbourhood_name, building__name=building_name,
+                    floor=floor).values_list("dawn", "sunset").first()
+
+                result = None if yearly is None else (unpack_minutes(yearly[0]), unpack_minutes(yearly[1]))
+
+        except DatabaseError as e:
+            # Let the circuit breaker know that the data base is failing
+            database_health.record_error(e)
+            raise
+
+        database_health.record_success()
+
         return result
 
     @staticmethod
-    def save_city(city_info):
+    def save_city(city_info, batch_size=None, mode=EAGER_MODE, calendar=None, dawn=None, sunset=None,
+                  stored_hashes=None):
         """
             Saves the whole city to database. If the city already exists in the database it is updated.
 
+            The new content is built as a new version of the city (see .models.City.version), alongside the published
+            one, with batched bulk inserts (see CityWriter). Each batch is committed on its own, so the database is not
+            locked for the whole build. Then the new version is published with a single UPDATE of the city row: readers
+            see either the whole prior city or the whole new one, never a half-built one. Prior versions are removed
+            afterwards, on a background thread (see .collector.CityVersionCollector).
+
+            If anything fails while building, the new version is discarded and the published one is untouched.
+
+            The neighbourhoods that are the same as the published ones (see .content_hash) are not written again: the
+            published rows are moved to the new version along with its publication, in the same transaction. If every
+            published neighbourhood is reused and there is nothing new, the new version is not published at all.
+
         :param city_info: (list of dict) The city info to be saved. Follows the format specified in the Code Challenge.
+            Any iterable of neighbourhoods is accepted (e.g., a generator that parses them while they are saved).
+        :param batch_size: (int) Maximum number of rows inserted per statement. If not specified, the one in the
+            SAVE_BATCH_SIZE setting is used.
+        :param mode: (str) How the sunlight hours are stored (see .models.City.mode). In LAZY_MODE, city_info does not
+            need the dawn and sunset of each apartment.
+        :param calendar: (tuple) Dawn and sunset of the city on each day of the year (see .yearly.parse_calendar). If
+            specified, the sunlight hours of every apartment on each day are stored too (except in LAZY_MODE, where
+            they are computed when looked up). None means that the city has no calendar.
+        :param dawn: (str) The time when the sunlight starts in the city (HH:MM), the one city_info was computed with.
+            If not specified, the one of DEFAULT_CITY_VALUES.
+        :param sunset: (str) The time when the sunlight ends in the city (HH:MM). Same as dawn.
+        :param stored_hashes: (dict) Published neighbourhoods that can be reused (see get_neighbourhood_hashes). If not
+            specified, they are read now if the RESULT_CACHE setting is enabled. The reused neighbourhoods of city_info
+            do not need the dawn and sunset of each apartment.
         :return: (bool) True if successfully saved; False otherwise.
         """
-        result = True
+        if batch_size is None:
+            batch_size = getattr(settings, "SAVE_BATCH_SIZE", SAVE_BATCH_SIZE)
 
         #
         # USE DEFAULT CITY
         #
+        name = DEFAULT_CITY
+        if dawn is None:
+            dawn = DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"]
+        if sunset is None:
+            sunset = DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"]
 
-        # Delete prior city content if exists
-        cqs = City.objects.filter(name=DEFAULT_CITY)
-        if cqs:
-            nqs = Neighbourhood.objects.filter(city=DEFAULT_CITY)
-            for neighbourhood in nqs:
-                neighbourhood.delete()
+        start_time = perf_counter()
 
-        #
-        # Now update the city with the new content
-        #
-        city = City.objects.create(name=DEFAULT_CITY, dawn=DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
-                    sunset=DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"])
+        # Builds of this process must not overlap (e.g., their snapshots)
+        with build_lock:
+            version = None
+
+            try:
+                if stored_hashes is None and getattr(settings, "RESULT_CACHE", RESULT_CACHE):
+                    stored_hashes = Controller.get_neighbourhood_hashes(name)
+
+                city, version = Controller.allocate_city_version(name, dawn, sunset)
 
-        for neighbourhood_info in city_info:
-            neighbourhood = Neighbourhood.objects.create(name=neighbourhood_info["neighborhood"],
-                                          apartments_height=neighbourhood_info["apartments_height"], city=city)
+                writer = CityWriter(city, batch_size, version, mode, calendar,
+                                    get_city_hash(parse_time(dawn), parse_time(sunset), mode, calendar), stored_hashes)
+                for neighbourhood_info in city_info:
+                    writer.add_neighbourhood(neighbourhood_info)
+                writer.flush()
 
-            # Force save (recall that Django is Lazy)
-            neighbourhood = Neighbourhood.objects.filter(name=neighbourhood_info["neighborhood"]).filter(city=city)[0]
-            acc_building_east_distance = 0
+                # Nothing new, and every published neighbourhood reused: the published version is kept as it is
+                unchanged = writer.rows == 0 and writer.reused and Controller.is_published_content(
+                    name, writer.reused.values())
 
-            for b_index, building_info in enumerate(neighbourhood_info["buildings"]):
-                building = Building.objects.create(name=building_info["name"], floors=building_info["apartments_count"],
-                                    neighbourhood=neighbourhood, east_position=b_index,
-                                    prev_distance=acc_building_east_distance,
-                                    next_distance=building_info["distance"])
+                if not unchanged:
+                    published = Controller.publish_city_version(name, version, dawn, sunset, mode, calendar,
+                                                                writer.reused.values())
 
-                # Force save (recall that Django is Lazy)
-                building = Building.objects.filter(neighbourhood=neighbourhood).filter(name=building_info["name"])[0]
-                acc_building_east_distance += building_info["distance"]
+            except DatabaseError as e:
+                logger.exception("While trying to save city {}: {}".format(name, e))
+                Controller.discard_city_version(name, version)
+                return False
 
-                for floor in range(building_info["apartments_count"]):
-                    apartment = Apartment.objects.create(building=building, floor=floor,
-                                                         dawn=building_info["dawn"][floor],
-                                                         sunset=building_info["sunset"][floor])
+            except BaseException:
+                # E.g., an invalid neighbourhood found while parsing city_info
+                Controller.discard_city_version(name, version)
+                raise
+
+            if unchanged:
+                Controller.report_save_stats(0, perf_counter() - start_time, writer.hits, writer.hits + writer.misses)
+                return True
+
+            if published:
+                Controller.save_city_snapshot(name)
+
+        if not published:
+            logger.warning("Version {} of city {} was superseded by a newer one".format(version, name))
+            Controller.discard_city_version(name, version)
+
+        # Cached apartments (and horizons) belong to the prior version. The ids of its neighbourhoods may be given again
+        # (e.g., to the ones of a discarded version), so horizons are not told apart by their key alone
+        apartment_cache.invalidate()
+        horizon_cache.invalidate()
+        Controller.warm_city_state(name)
+
+        Controller.report_save_stats(writer.rows, perf_counter() - start_time, writer.hits,
+                                     writer.hits + writer.misses)
+
+        version_collector.schedule(name)
+
+        return True
+
+    @staticmethod
+    def has_snapshot(city=DEFAULT_CITY):
+        """
+            Tells if the lookups of the specified city are answered from its snapshot, so they do not need the data
+            base (see .snapshot.SnapshotStore).
+
+        :param city: (str) City name.
+        :return: (bool) True if there is a snapshot of the city; False otherwise.
+        """
+        return snapshot_store.get(city) is not None
+
+    @staticmethod
+    def get_city_tag(city=DEFAULT_CITY):
+        """
+            Returns a tag that identifies the current content of the specified city: it changes whenever a new version
+            is published or the published one is changed (see .models.City.revision). Used as the ETag of the lookups.
+
+            IMPLEMENTATION NOTE: It is read from the snapshot of the city, if any (see .snapshot.SnapshotStore).
+            Otherwise, it is read from the state of the city (see get_city_state).
+
+        :param city: (str) City name.
+        :return: (str) Tag. None if the city does not exist or the data base is not available.
+        """
+        snapshot = snapshot_store.get(city)
+        if snapshot is not None:
+            return Controller.format_city_tag(snapshot.version, snapshot.revision)
+
+        if not database_health.is_available():
+            return None
+
+        try:
+            state = Controller.get_city_state(city)
+
+        except DatabaseError as e:
+            # Let the circuit breaker know that the data base is failing
+            database_health.record_error(e)
+            return None
+
+        database_health.record_success()
+
+        return Controller.format_city_tag(state[0], state[1]) if state is not None else None
+
+    @staticmethod
+    def get_city_state(city):
+        """
+            Returns the state of the published version of the specified city. It is kept in the apartment cache, under
+            the (<city>,) key, so it is invalidated along with the apartments (see .cache.ApartmentCache). The cached
+            apartments are tagged with the (<version>, <revision>) they were read from, and only the ones with the
+            current state are valid: once the cached state expires, a city published by another process is seen.
+
+        :param city: (str) City name.
+        :return: (tuple) Follows the format:
+
+                    (<version>, <revision>, <mode>)
+
+                with the values of the same fields of .models.City. None if the city does not exist.
+        :raise: (django.db.DatabaseError) If the query fails.
+        """
+        key = (city,)
+        result = apartment_cache.get(key)
+        if result is not None:
+            return result
+
+        # Read the cache version before querying, so the result is discarded if the city changes meanwhile
+        cache_version = apartment_cache.get_version()
+
+        try:
+            result = City.objects.filter(name=city).values_list("version", "revision", "mode").get()
+
+        except City.DoesNotExist:
+            return None
+
+        apartment_cache.put(key, result, cache_version)
 
         return result
 
+    @staticmethod
+    def warm_city_state(city):
+        """
+            Reads the state of the specified city into the apartment cache (see get_city_state), right after it
+            changes, so the next lookup does not need to. Errors are ignored: the next lookup will read it.
+
+        :param city: (str) City name.
+        :return: None
+        """
+        try:
+            Controller.get_city_state(city)
+
+        except DatabaseError:
+            pass
+
+    @staticmethod
+    def get_computed_apartment_info(city, neighbourhood_name, building_name, floor):
+        """
+            Computes the information of the specified apartment of a city stored in lazy mode (see
+            .constants.LAZY_MODE).
+
+        :param city: (str) City name.
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :param building_name: (str) Building name.
+        :param floor: (int) Apartment floor.
+        :return: (.models.Apartment) Information of the apartment (not bound to any data base row). None if it does not
+            exist.
+        :raise: (django.db.DatabaseError) If any query fails.
+        """
+        bqs = Building.objects.select_related("neighbourhood__city").filter(
+            neighbourhood__city_id=city, neighbourhood__version=F("neighbourhood__city__version"),
+            neighbourhood__name=neighbourhood_name, name=building_name)
+
+        try:
+            building = bqs[0]
+
+        except IndexError:
+            return None
+
+        return Controller.compute_apartment(building, floor)
+
+    @staticmethod
+    def compute_apartment(building, floor):
+        """
+            Computes the dawn and sunset of the specified floor of a building.
+
+        :param building: (.models.Building) Building (with its neighbourhood and city).
+        :param floor: (int) Apartment floor.
+        :return: (.models.Apartment) Information of the apartment (not bound to any data base row). None if the
+            building has no such floor.
+        :raise: (django.db.DatabaseError) If the buildings of the neighbourhood can not be read.
+        """
+        if not 0 <= floor < building.floors:
+            return None
+
+        horizon = Controller.get_neighbourhood_horizon(building.neighbourhood)
+        dawn_minutes, sunset_minutes = horizon.get_apartment_minutes(building.east_position, floor)
+        apartments_computed.inc()
+
+        return Controller.make_apartment(building, floor, dawn_minutes, sunset_minutes)
+
+    @staticmethod
+    def get_compressed_apartment_info(city, neighbourhood_name, building_name, floor):
+        """
+            Retrieves the information of the specified apartment of a city stored in compressed mode (see
+            .constants.COMPRESSED_MODE).
+
+            IMPLEMENTATION NOTE: The floor range of the apartment is the last one of the building that starts at or
+            below the floor. The unique index on (building, floor_from) makes it a single index lookup (a binary search
+            on the B-tree), no matter how many floor ranges the building has.
+
+        :param city: (str) City name.
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :param building_name: (str) Building name.
+        :param floor: (int) Apartment floor.
+        :return: (.models.Apartment) Information of the apartment (not bound to any data base row). None if it does not
+            exist.
+        :raise: (django.db.DatabaseError) If the query fails.
+        """
+        rqs = FloorRange.objects.select_related("building__neighbourhood").filter(
+            building__neighbourhood__city_id=city,
+            building__neighbourhood__version=F("building__neighbourhood__city__version"),
+            building__neighbourhood__name=neighbourhood_name, building__name=building_name,
+            floor_from__lte=floor).order_by("-floor_from")
+
+        try:
+            floor_range = rqs[0]
+
+        except IndexError:
+            return None
+
+        if floor_range.floor_to < floor:
+            return None
+
+        return Controller.make_apartment(floor_range.building, floor, floor_range.dawn_minutes,
+                                         floor_range.sunset_minutes)
+
+    @staticmethod
+    def make_apartment(building, floor, dawn_minutes, sunset_minutes):
+        """
+            Returns the information of an apartment that is not stored in its own row.
+
+        :param building: (.models.Building) Building.
+        :param floor: (int) Apartment floor.
+        :param dawn_minutes: (int) The time when the sunlight starts in the apartment (minutes since midnight).
+        :param sunset_minutes: (int) The time when the sunlight ends in the apartment (minutes since midnight).
+        :return: (.models.Apartment) Information of the apartment (not bound to any data base row).
+        """
+        return Apartment(building=building, floor=floor, dawn=format_time(dawn_minutes),
+                         sunset=format_time(sunset_minutes), dawn_minutes=dawn_minutes, sunset_minutes=sunset_minutes,
+                         sunlight_minutes=get_sunlight_minutes(dawn_minutes, sunset_minutes))
+
+    @staticmethod
+    def get_neighbourhood_horizon(neighbourhood):
+        """
+            Returns the horizon of the specified neighbourhood (see .sunlight_hours.NeighbourhoodHorizon), built from
+            its stored buildings. Horizons are cached, keyed by the neighbourhood and the revision of its city, so
+            building changes are seen right away (see .cache.horizon_cache).
+
+        :param neighbourhood: (.models.Neighbourhood) Neighbourhood (with its city).
+        :return: (.sunlight_hours.NeighbourhoodHorizon) Horizon.
+        :raise: (django.db.DatabaseError) If the buildings can not be read.
+        """
+        key = (neighbourhood.id, neighbourhood.city.revision)
+        result = horizon_cache.get(key)
+        if result is not None:
+            return result
+
+        cache_version = horizon_cache.get_version()
+
+        building_list = [{"name": name, "apartments_count": floors, "distance": next_distance}
+                         for name, floors, next_distance in Building.objects.filter(
+                             neighbourhood_id=neighbourhood.id).order_by("east_position").values_list(
+                             "name", "floors", "next_distance")]
+
+        result = NeighbourhoodHorizon(building_list, neighbourhood.city.dawn_minutes,
+                                      neighbourhood.city.sunset_minutes, neighbourhood.apartments_height)
+        horizon_cache.put(key, result, cache_version)
+
+        return result
+
+    @staticmethod
+    def format_city_tag(version, revision):
+        """
+            Returns the tag of the specified content of a city (see get_city_tag).
+
+        :param version: (int) City version.
+        :param revision: (int) City revision.
+        :return: (str) Tag.
+        """
+        return "{}.{}".format(version, revision)
+
+    @staticmethod
+    def save_city_snapshot(name, neighbourhood_name=None):
+        """
+            Writes a snapshot of the published version of the specified city and makes it the current one (see
+            .snapshot.SnapshotStore), if snapshots are enabled. Must be called while holding build_lock, once the
+            changes are committed.
+
+            If only a neighbourhood changed since the current snapshot (i.e., a single building change), only that one
+            is read from the data base: the others are copied from the current snapshot, as they are stored. The file
+            is still written whole (it costs a copy of the floors of the city, i.e., 4 bytes per apartment), but the
+            data base is not read again. Otherwise (or if the current snapshot is not the prior revision of the same
+            version), the whole city is read.
+
+            If it fails, the prior snapshot is withdrawn too, so lookups go to the data base instead of answering with
+            stale data. The error is only logged: the data base is still up to date.
+
+        :param name: (str) City name.
+        :param neighbourhood_name: (str) Name of the only neighbourhood that changed since the current snapshot (with a
+            single revision of the city, see .models.City.revision). The whole city is read if None.
+        :return: None
+        """
+        if not snapshot_store.is_enabled():
+            return
+
+        try:
+            version, revision, mode = City.objects.filter(name=name).values_list("version", "revision", "mode").get()
+
+            if mode == LAZY_MODE:
+                # Apartments are not stored, so lookups compute them (see get_computed_apartment_info)
+                snapshot_store.unpublish(name)
+                return
+
+            current = snapshot_store.get(name) if neighbourhood_name is not None else None
+
+            if current is not None and (current.version, current.revision) == (version, revision - 1):
+                neighbourhoods = chain(current.iter_neighbourhoods(skip={neighbourhood_name}),
+                                       Controller.iter_snapshot_neighbourhoods(name, version, mode,
+                                                                               [neighbourhood_name]))
+            else:
+                neighbourhoods = Controller.iter_snapshot_neighbourhoods(name, version, mode)
+
+            snapshot_store.publish(name, version, neighbourhoods, revision)
+
+        except (City.DoesNotExist, DatabaseError, OSError, StructError) as e:
+            # E.g., minutes that do not fit in the snapshot (see .snapshot.FLOOR)
+            logger.exception("While trying to save the snapshot of city {}: {}".format(name, e))
+
+            try:
+                snapshot_store.unpublish(name)
+
+            except OSError as e:
+                logger.exception("While trying to withdraw the snapshot of city {}: {}".format(name, e))
+
+    @staticmethod
+    def iter_snapshot_neighbourhoods(name, version, mode=EAGER_MODE, neighbourhood_names=None):
+        """
+            Reads the content of the specified version of a city, one neighbourhood at a time.
+
+        :param name: (str) City name.
+        :param version: (int) City version.
+        :param mode: (str) How the sunlight hours of the version are stored (see .models.City.mode). Either EAGER_MODE
+            or COMPRESSED_MODE.
+        :param neighbourhood_names: (list of str) Only these neighbourhoods are read. All of them if None.
+        :return: (generator) Neighbourhoods, following the format of .snapshot.write_snapshot.
+        """
+        neighbourhoods = Neighbourhood.objects.filter(city_id=name, version=version)
+        if neighbourhood_names is not None:
+            neighbourhoods = neighbourhoods.filter(name__in=neighbourhood_names)
+        neighbourhoods = neighbourhoods.values_list("id", "name")
+
+        for neighbourhood_id, neighbourhood_name in neighbourhoods:
+            buildings = list(Building.objects.filter(neighbourhood_id=neighbourhood_id).values_list("id", "name",
+                                                                                                    "floors"))
+            floors = {building_id: [None] * count for building_id, _, count in buildings}
+
+            if mode == COMPRESSED_MODE:
+                for building_id, floor_from, floor_to, dawn_minutes, sunset_minutes in FloorRange.objects.filter(
+                        building__neighbourhood_id=neighbourhood_id).values_list(
+                        "building_id", "floor_from", "floor_to", "dawn_minutes", "sunset_minutes"):
+                    for floor in range(max(floor_from, 0), min(floor_to + 1, len(floors[building_id]))):
+                        floors[building_id][floor] = (dawn_minutes, sunset_minutes)
+
+            else:
+                for building_id, floor, dawn_minutes, sunset_minutes in Apartment.objects.filter(
+                        building__neighbourhood_id=neighbourhood_id).values_list("building_id", "floor", "dawn_minutes",
+                                                                                 "sunset_minutes"):
+                    if 0 <= floor < len(floors[building_id]):
+                        floors[building_id][floor] = (dawn_minutes, sunset_minutes)
+
+            yield neighbourhood_name, [(building_name, floors[building_id]) for building_id, building_name, _ in
+                                       buildings]
+
+    @staticmethod
+    def allocate_city_version(name, dawn, sunset):
+        """
+            Allocates a new version of the specified city, creating the city if it does not exist yet.
+
+        :param name: (str) City name.
+        :param dawn: (str) The time when the sunlight starts in this city (HH:MM). Only used if the city is created.
+        :param sunset: (str) The time when the sunlight ends in this city (HH:MM). Only used if the city is created.
+        :return: (tuple) Follows the format:
+
+                    (<city>, <version>)
+
+                with
+                    <city>: (.models.City) The city.
+                    <version>: (int) The new version. It is not published yet (see publish_city_version).
+        """
+        with transaction.atomic():
+            city, _ = City.objects.get_or_create(name=name, defaults={"dawn": dawn, "sunset": sunset,
+                                                                      "dawn_minutes": parse_time(dawn),
+                                                                      "sunset_minutes": parse_time(sunset)})
+            City.objects.filter(name=name).update(last_version=F("last_version") + 1)
+            version = City.objects.filter(name=name).values_list("last_version", flat=True).get()
+
+        return city, version
+
+    @staticmethod
+    def get_neighbourhood_hashes(name):
+        """
+            Returns the content hashes of the neighbourhoods of the published version of the specified city (see
+            .content_hash).
+
+        :param name: (str) City name.
+        :return: (dict) Follows the format:
+
+                    {<neighbourhood_name>: (<neighbourhood_id>, <content_hash>)}
+
+                with <content_hash> being None if it is not known. Empty if the city does not exist.
+        """
+        return {neighbourhood_name: (neighbourhood_id, content_hash)
+                for neighbourhood_id, neighbourhood_name, content_hash in Neighbourhood.objects.filter(
+                    city_id=name, version=F("city__version")).values_list("id", "name", "content_hash")}
+
+    @staticmethod
+    def is_published_content(name, neighbourhood_ids):
+        """
+            Tells if the published version of the specified city is made of the specified neighbourhoods, and no other.
+
+        :param name: (str) City name.
+        :param neighbourhood_ids: (iterable of int) Neighbourhood ids.
+        :return: (bool) True if it is; False otherwise.
+        """
+        return set(Neighbourhood.objects.filter(city_id=name, version=F("city__version")).values_list(
+            "id", flat=True)) == set(neighbourhood_ids)
+
+    @staticmethod
+    def publish_city_version(name, version, dawn, sunset, mode=EAGER_MODE, calendar=None, reused=()):
+        """
+            Publishes the specified version of the city, with a single UPDATE. Versions older than the published one are
+            never published.
+
+            The reused neighbourhoods are moved from the published version to the new one within the same transaction,
+            so readers see them in both. If any of them is no longer published (e.g., another process published a new
+            version meanwhile), nothing is published.
+
+        :param name: (str) City name.
+        :param version: (int) Version to be published.
+        :param dawn: (str) The time when the sunlight starts in this city (HH:MM).
+        :param sunset: (str) The time when the sunlight ends in this city (HH:MM).
+        :param mode: (str) How the sunlight hours of the version are stored (see .models.City.mode).
+        :param calendar: (tuple) Calendar of the version (see .yearly.parse_calendar). None if it has no calendar.
+        :param reused: (iterable of int) Ids of the published neighbourhoods that belong to the new version too.
+        :return: (bool) True if published; False if a newer version was already published.
+        """
+        calendar_dawn, calendar_sunset = (None, None) if calendar is None else map(pack_minutes, calendar)
+        reused = list(reused)
+
+        with transaction.atomic():
+            moved = Neighbourhood.objects.filter(id__in=reused, city_id=name, version=F("city__version")).update(
+                version=version) if reused else 0
+
+            published = City.objects.filter(name=name, version__lt=version).update(
+                version=version, dawn=dawn, sunset=sunset, dawn_minutes=parse_time(dawn),
+                sunset_minutes=parse_time(sunset), mode=mode, calendar_dawn=calendar_dawn,
+                calendar_sunset=calendar_sunset)
+
+            if published != 1 or moved != len(reused):
+                transaction.set_rollback(True)
+                return False
+
+        return True
+
+    @staticmethod
+    def discard_city_version(name, version):
+        """
+            Removes the content of an unpublished version of the city. Errors are only logged: the content of the
+            unpublished versions is removed anyway after the next publication (see collect_city_versions).
+
+        :param name: (str) City name.
+        :param version: (int) Version to be removed. None means that no version was allocated.
+        :return: None
+        """
+        if version is None:
+            return
+
+        try:
+            Controller.delete_neighbourhoods_content(Neighbourhood.objects.filter(city_id=name, version=version))
+
+        except DatabaseError as e:
+            logger.exception("While trying to discard version {} of city {}: {}".format(version, name, e))
+
+    @staticmethod
+    def collect_city_versions(name):
+        """
+            Removes the content of the versions of the city that are older than the published one.
+
+        :param name: (str) City name.
+        :return: None
+        """
+        Controller.delete_neighbourhoods_content(Neighbourhood.objects.filter(city_id=name,
+                                                                              version__lt=F("city__version")))
+
+    @staticmethod
+    def delete_neighbourhoods_content(neighbourhoods, chunk_size=LOOKUP_CHUNK_SIZE):
+        """
+            Deletes the specified neighbourhoods, with all the content of their buildings, using set-based
+            DELETE statements (instead of loading and deleting each row). Neighbourhoods are deleted in chunks, each
+            one within its own transaction, so the database is not locked for long.
+
+        :param neighbourhoods: (django.db.models.QuerySet) Neighbourhoods to be deleted.
+        :param chunk_size: (int) Maximum number of neighbourhoods deleted per transaction.
+        :return: None
+        """
+        neighbourhood_ids = list(neighbourhoods.values_list("id", flat=True))
+
+        for start in range(0, len(neighbourhood_ids), chunk_size):
+            chunk = neighbourhood_ids[start:start + chunk_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                for model in (Apartment, FloorRange, YearlySunlight):
+                    cursor.execute("DELETE FROM {} WHERE building_id IN (SELECT id FROM {} WHERE neighbourhood_id IN "
+                                   "({}))".format(model._meta.db_table, Building._meta.db_table, placeholders), chunk)
+                cursor.execute("DELETE FROM {} WHERE neighbourhood_id IN ({})".format(Building._meta.db_table,
+                                                                                     placeholders), chunk)
+                cursor.execute("DELETE FROM {} WHERE id IN ({})".format(Neighbourhood._meta.db_table, placeholders),
+                               chunk)
+
+    @staticmethod
+    def report_save_stats(rows, elapsed_seconds, reused=0, neighbourhoods=0):
+        """
+            Reports the throughput of the last city save.
+
+        :param rows: (int) Number of inserted rows.
+        :param elapsed_seconds: (float) Time spent saving the city.
+        :param reused: (int) Number of neighbourhoods reused (see .content_hash).
+        :param neighbourhoods: (int) Number of neighbourhoods looked up in the published ones (0 if the RESULT_CACHE
+            setting is disabled).
+        :return: None
+        """
+        rows_per_second = rows / elapsed_seconds if elapsed_seconds > 0 else 0.0
+
+        Controller.save_stats = {"rows": rows, "seconds": elapsed_seconds, "rows_per_second": rows_per_second,
+                                 "reused": reused, "neighbourhoods": neighbourhoods}
+        logger.info("Saved {} rows in {:.3f} s ({:.0f} rows/s), {} of {} neighbourhoods reused".format(
+            rows, elapsed_seconds, rows_per_second, reused, neighbourhoods))
+
+    #
+    # BUILDING CHANGES
+    #
+
+    @staticmethod
+    def insert_building(neighbourhood_name, building_name, apartments_count, distance=None, position=None,
+                        east_distance=None):
+        """
+            Adds a new building to the specified neighbourhood, and updates the sunlight hours of its apartments (see
+            update_neighbourhood).
+
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :param building_name: (str) Name of the new building.
+        :param apartments_count: (int) Number of floors of the new building.
+        :param distance: (int) Distance to the next building on the west. Required unless it is the last one from the
+            east.
+        :param position: (int) Position of the new building from east to west (from 0 to N). If not specified, it is
+            the last one from the east.
+        :param east_distance: (int) Distance from the prior building on the east to the new one. Ignored if it is the
+            first one from the east. If not specified, the prior building keeps its distance (it is required if the
+            new building is the last one from the east, since the prior one had no building on the west).
+        :return: (dict) Changed rows (see update_neighbourhood).
+        :raises Neighbourhood.DoesNotExist: If the neighbourhood does not exist.
+        :raises ValueError: If there is already a building with the same name, or the values are not valid.
+        """
+        Controller.check_building_values(apartments_count, distance)
+        Controller.check_building_values(distance=east_distance)
+
+        with build_lock:
+            with transaction.atomic():
+                neighbourhood, building_list = Controller.get_neighbourhood_buildings(neighbourhood_name)
+                prior_building_list = [dict(building) for building in building_list]
+
+                if any(building["name"] == building_name for building in building_list):
+                    raise ValueError("Duplicated building {}".format(building_name))
+
+                if position is None:
+                    position = len(building_list)
+
+                if not 0 <= position <= len(building_list):
+                    raise ValueError("Position must be from 0 to {}".format(len(building_list)))
+
+                if position > 0:
+                    if east_distance is not None:
+                        building_list[position - 1]["distance"] = east_distance
+                    elif position == len(building_list):
+                        raise ValueError("Distance from the prior building on the east is required")
+
+                if position == len(building_list):
+                    distance = -1
+                elif distance is None:
+                    raise ValueError("Distance to the next building on the west is required")
+
+                building_list.insert(position, {"name": building_name, "apartments_count": apartments_count,
+                                                "distance": distance, "model": None})
+
+                result = Controller.update_neighbourhood(neighbourhood, building_list,
+                                                         prior_building_list=prior_building_list)
+
+            Controller.save_city_snapshot(DEFAULT_CITY, neighbourhood_name)
+
+        apartment_cache.invalidate()
+        Controller.warm_city_state(DEFAULT_CITY)
+
+        return result
+
+    @staticmethod
+    def update_building(neighbourhood_name, building_name, apartments_count=None, distance=None):
+        """
+            Changes the height and/or the distance to the next building of the specified building, and updates the
+            sunlight hours of its neighbourhood (see update_neighbourhood).
+
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :param building_name: (str) Building name.
+        :param apartments_count: (int) New number of floors. If not specified, it is not changed.
+        :param distance: (int) New distance to the next building on the west. If not specified, it is not changed.
+        :return: (dict) Changed rows (see update_neighbourhood).
+        :raises Neighbourhood.DoesNotExist: If the neighbourhood does not exist.
+        :raises Building.DoesNotExist: If the building does not exist.
+        :raises ValueError: If the values are not valid.
+        """
+        Controller.check_building_values(apartments_count, distance)
+
+        with build_lock:
+            with transaction.atomic():
+                neighbourhood, building_list = Controller.get_neighbourhood_buildings(neighbourhood_name)
+                prior_building_list = [dict(building) for building in building_list]
+                position = Controller.get_building_position(building_list, building_name)
+
+                if apartments_count is not None:
+                    building_list[position]["apartments_count"] = apartments_count
+
+                if distance is not None:
+                    if position == len(building_list) - 1:
+                        raise ValueError("The last building from the east has no building on the west")
+
+                    building_list[position]["distance"] = distance
+
+                result = Controller.update_neighbourhood(neighbourhood, building_list,
+                                                         prior_building_list=prior_building_list)
+
+            Controller.save_city_snapshot(DEFAULT_CITY, neighbourhood_name)
+
+        apartment_cache.invalidate()
+        Controller.warm_city_state(DEFAULT_CITY)
+
+        return result
+
+    @staticmethod
+    def delete_building(neighbourhood_name, building_name):
+        """
+            Removes the specified building (and its apartments), and updates the sunlight hours of its neighbourhood
+            (see update_neighbourhood). The other buildings keep their place, so the distance from the prior building
+            on the east grows up to the next building on the west.
+
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :param building_name: (str) Building name.
+        :return: (dict) Changed rows (see update_neighbourhood).
+        :raises Neighbourhood.DoesNotExist: If the neighbourhood does not exist.
+        :raises Building.DoesNotExist: If the building does not exist.
+        """
+        with build_lock:
+            with transaction.atomic():
+                neighbourhood, building_list = Controller.get_neighbourhood_buildings(neighbourhood_name)
+                prior_building_list = [dict(building) for building in building_list]
+                position = Controller.get_building_position(building_list, building_name)
+
+                deleted = building_list.pop(position)
+
+                if position > 0:
+                    if position == len(building_list):
+                        building_list[position - 1]["distance"] = -1
+                    else:
+                        building_list[position - 1]["distance"] += deleted["distance"]
+
+                result = Controller.update_neighbourhood(neighbourhood, building_list, [deleted["model"]],
+                                                         prior_building_list=prior_building_list)
+
+            Controller.save_city_snapshot(DEFAULT_CITY, neighbourhood_name)
+
+        apartment_cache.invalidate()
+        Controller.warm_city_state(DEFAULT_CITY)
+
+        return result
+
+    @staticmethod
+    def check_building_values(apartments_count=None, distance=None):
+        """
+            Checks the values of a building that is inserted or changed. Only the values of that building are checked:
+            the other ones of its neighbourhood were accepted by /init, and they are kept as they are.
+
+        :param apartments_count: (int) Number of floors. As in /init, a building can have no floors (see
+            .sunlight_hours.check_neighbourhood_geometry). Not checked if None.
+        :param distance: (int) Distance to the next building on the west. Not checked if None.
+        :return: None
+        :raises ValueError: If the values are not valid.
+        """
+        if apartments_count is not None and (type(apartments_count) is not int or apartments_count < 0):
+            raise ValueError("Number of floors must be a non negative integer")
+
+        if distance is not None and (type(distance) is not int or distance < 1):
+            raise ValueError("Distance must be a positive integer")
+
+    @staticmethod
+    def update_city_daylight(dawn, sunset):
+        """
+            Changes the dawn and sunset of the default city (e.g., on another season), and updates the sunlight hours
+            of all its neighbourhoods. They are rescaled from the angles of the shadows stored along with each building
+            (see update_neighbourhood), so no horizon is searched again.
+
+        :param dawn: (str) The time when the sunlight starts in the city (HH:MM).
+        :param sunset: (str) The time when the sunlight ends in the city (HH:MM).
+        :return: (dict) Changed rows of all the neighbourhoods (see update_neighbourhood).
+        :raises City.DoesNotExist: If the city does not exist.
+        :raises ValueError: If the times are not valid, or the dawn is not before the sunset.
+        """
+        dawn_minutes = parse_time(dawn)
+        sunset_minutes = parse_time(sunset)
+
+        if not 0 <= dawn_minutes < sunset_minutes < MINUTES_PER_DAY:
+            raise ValueError("The dawn must be before the sunset")
+
+        result = {name: {"created": 0, "updated": 0, "deleted": 0}
+                  for name in ("buildings", "apartments", "floor_ranges", "yearly")}
+
+        with build_lock:
+            with transaction.atomic():
+                city = City.objects.select_for_update().get(name=DEFAULT_CITY)
+                City.objects.filter(name=DEFAULT_CITY).update(dawn=format_time(dawn_minutes),
+                                                              sunset=format_time(sunset_minutes),
+                                                              dawn_minutes=dawn_minutes, sunset_minutes=sunset_minutes,
+                                                              revision=F("revision") + 1)
+
+                for neighbourhood_name in Neighbourhood.objects.filter(city=city, version=city.version).order_by(
+                        "id").values_list("name", flat=True):
+                    neighbourhood, building_list = Controller.get_neighbourhood_buildings(neighbourhood_name)
+                    changes = Controller.update_neighbourhood(neighbourhood, building_list, rescale=True)
+
+                    for name, rows in changes.items():
+                        for change, count in rows.items():
+                            result[name][change] += count
+
+            Controller.save_city_snapshot(DEFAULT_CITY)
+
+        apartment_cache.invalidate()
+        Controller.warm_city_state(DEFAULT_CITY)
+
+        return result
+
+    @staticmethod
+    def get_neighbourhood_buildings(neighbourhood_name):
+        """
+            Returns the specified neighbourhood (of the published version of the default city) and its buildings. The
+            neighbourhood row is locked until the end of the transaction, so concurrent changes to the same
+            neighbourhood are serialized.
+
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :return: (tuple) Follows the format:
+
+                    (<neighbourhood>, <building_list>)
+
+                with
+                    <neighbourhood>: (.models.Neighbourhood) The neighbourhood (with its city).
+                    <building_list>: (list of dict) Its buildings, sorted from east to west. Same format as in the Code
+                        Challenge, plus the row of each building in "model".
+        :raises Neighbourhood.DoesNotExist: If the neighbourhood does not exist.
+        """
+        neighbourhood = Neighbourhood.objects.select_for_update().select_related("city").get(
+            city_id=DEFAULT_CITY, name=neighbourhood_name, version=F("city__version"))
+
+        building_list = [{"name": building.name, "apartments_count": building.floors,
+                          "distance": building.next_distance, "model": building}
+                         for building in Building.objects.filter(neighbourhood=neighbourhood).order_by("east_position")]
+
+        return neighbourhood, building_list
+
+    @staticmethod
+    def get_building_position(building_list, building_name):
+        """
+            Returns the position of the specified building.
+
+        :param building_list: (list of dict) Buildings (see get_neighbourhood_buildings).
+        :param building_name: (str) Building name.
+        :return: (int) Position from east to west.
+        :raises Building.DoesNotExist: If the building does not exist.
+        """
+        for position, building in enumerate(building_list):
+            if building["name"] == building_name:
+                return position
+
+        raise Building.DoesNotExist("Unknown building {}".format(building_name))
+
+    @staticmethod
+    def update_neighbourhood(neighbourhood, building_list, deleted_buildings=(), rescale=False,
+                             prior_building_list=None):
+        """
+            Stores the specified buildings of a neighbourhood, recomputing the sunlight hours of its apartments and
+            writing only the rows that changed. Must be called within a transaction.
+
+            Neighbourhoods are independent (see .sunlight_hours.get_neighbourhood_sunlight_hours), so only the
+            apartments of this one can be affected. Within it, a change in a building may move the shadows on both
+            sides, but only up to the next building that is, at least, as tall (and when a distance changes, every
+            building on the west moves, but only the ones whose obstacle changed are affected). So, if the buildings
+            before the change are specified, only the buildings whose shadows may have changed are computed (see
+            .sunlight_hours.get_changed_buildings), and only their rows are read and compared with the new ones. The
+            other ones keep their stored rows (and angles). Otherwise, every building is computed, in O(N log N).
+
+            The revision of the city is bumped (see .models.City.revision). If the city is stored in lazy mode (see
+            .models.City.mode), only the buildings are written. If it is stored in compressed mode, the floor ranges
+            are written instead of the apartments.
+
+            If the city has a calendar, the yearly sunlight hours of the apartments are computed again too (see
+            .yearly), and only the changed ones are written.
+
+            The angles of the shadows on each floor are stored along with each building (see
+            .models.Building.east_angles). If rescale is True, the buildings did not change (only the dawn and sunset
+            of the city did), so the sunlight hours are rescaled from the stored angles instead (see
+            .sunlight_hours.rescale_neighbourhood_minutes), in O(N), and the yearly ones are left as they are.
+
+            The sunlight ranking of the neighbourhood is computed again (see .sunlight_hours.get_ranking) from the
+            computed rows and the first stored ones of the other buildings (see get_kept_ranking), and the rows whose
+            rank moved are written too (only the ones ranked before or after the change). So are the sunlit counts
+            (see .sunlight_hours.get_sunlit_counts), which are updated with the replaced and the computed rows, and the
+            content hash (see .content_hash) of the neighbourhood.
+
+        :param neighbourhood: (.models.Neighbourhood) The neighbourhood (with its city).
+        :param building_list: (list of dict) New buildings (see get_neighbourhood_buildings). New buildings have None
+            in "model".
+        :param deleted_buildings: (list of .models.Building) Buildings to be removed.
+        :param rescale: (bool) Whether only the dawn and sunset of the city changed (see above).
+        :param prior_building_list: (list of dict) Buildings before the change, in the same format as building_list.
+            If None, every building is computed.
+        :return: (dict) Number of changed rows. Follows the format:
+
+                {"buildings": {"created": <created>, "updated": <updated>, "deleted": <deleted>},
+                 "apartments": {"created": <created>, "updated": <updated>, "deleted": <deleted>},
+                 "floor_ranges": {"created": <created>, "updated": <updated>, "deleted": <deleted>},
+                 "yearly": {"created": <created>, "updated": <updated>, "deleted": <deleted>}}
+
+        """
+        mode = neighbourhood.city.mode
+        ranking_size = getattr(settings, "RANKING_SIZE", RANKING_SIZE)
+
+        # Positions of the buildings whose sunlight hours are computed
+        if mode == LAZY_MODE:
+            # Only the buildings are stored (see .constants.LAZY_MODE)
+            changed = []
+        elif prior_building_list is None:
+            changed = list(range(len(building_list)))
+        else:
+            changed = get_changed_buildings(prior_building_list, building_list)
+
+            computed_buildings = set(changed)
+            if neighbourhood.sunlit_counts is None or any(
+                    building["model"].east_angles is None
+                    for b_index, building in enumerate(building_list) if b_index not in computed_buildings):
+                # Stored without the angles or the sunlit counts, so they cannot be kept
+                changed = list(range(len(building_list)))
+
+        kept = set(range(len(building_list))).difference(changed) if mode != LAZY_MODE else set()
+        # Ids of the stored buildings whose rows are read and compared with the computed ones (all of them if None)
+        changed_ids = None
+        if kept:
+            changed_ids = [building_list[b_index]["model"].id for b_index in changed
+                           if building_list[b_index]["model"] is not None]
+
+        east_angles = [None for _ in building_list]
+        west_angles = [None for _ in building_list]
+
+        if rescale and all(building["model"].east_angles is not None for building in building_list):
+            for b_index in changed:
+                east_angles[b_index] = unpack_angles(building_list[b_index]["model"].east_angles)
+                west_angles[b_index] = unpack_angles(building_list[b_index]["model"].west_angles)
+        elif changed:
+            for b_index, building_east_angles, building_west_angles in zip(changed, *get_buildings_shadow_angles(
+                    building_list, neighbourhood.apartments_height, changed)):
+                east_angles[b_index] = building_east_angles
+                west_angles[b_index] = building_west_angles
+
+        dawn = [[] for _ in building_list]
+        sunset = [[] for _ in building_list]
+        floor_ranges = [[] for _ in building_list]
+
+        for b_index, building_dawn, building_sunset in zip(changed, *rescale_neighbourhood_minutes(
+                [east_angles[b_index] for b_index in changed], [west_angles[b_index] for b_index in changed],
+                neighbourhood.city.dawn_minutes, neighbourhood.city.sunset_minutes)):
+            if mode == COMPRESSED_MODE:
+                # Floor ranges are stored instead of apartments (see .constants.COMPRESSED_MODE)
+                floor_ranges[b_index] = get_floor_ranges(building_dawn, building_sunset)
+            else:
+                dawn[b_index] = building_dawn
+                sunset[b_index] = building_sunset
+
+        # Computed rows: (<b_index>, <floor_from>, <floor_count>, <dawn_minutes>, <sunset_minutes>)
+        computed = [(b_index, floor, 1, dawn_minutes, sunset_minutes)
+                    for b_index in changed
+                    for floor, (dawn_minutes, sunset_minutes) in enumerate(zip(dawn[b_index], sunset[b_index]))]
+        computed.extend((b_index, floor_from, floor_to - floor_from + 1, dawn_minutes, sunset_minutes)
+                        for b_index in changed
+                        for floor_from, floor_to, dawn_minutes, sunset_minutes in floor_ranges[b_index])
+
+        # Stored rows of the other buildings that can be ranked
+        kept_rows = []
+        if kept:
+            kept_rows = Controller.get_kept_ranking(
+                neighbourhood, FloorRange if mode == COMPRESSED_MODE else Apartment,
+                {building_list[b_index]["model"].id: b_index for b_index in kept}, ranking_size)
+
+        ranking = {}
+        if mode != LAZY_MODE:
+            ranking = get_ranking(chain(
+                ((get_sunlight_minutes(dawn_minutes, sunset_minutes), b_index, floor_from, floor_count)
+                 for b_index, floor_from, floor_count, dawn_minutes, sunset_minutes in computed),
+                ((sunlight_minutes, b_index, floor_from, floor_count)
+                 for _, b_index, floor_from, floor_count, sunlight_minutes, _ in kept_rows)), ranking_size)
+
+        if rescale:
+            # They do not depend on the dawn and sunset of the city (but on its calendar)
+            yearly = None
+        elif changed and neighbourhood.city.calendar_dawn is not None:
+            calendar = (unpack_minutes(neighbourhood.city.calendar_dawn),
+                        unpack_minutes(neighbourhood.city.calendar_sunset))
+            yearly = rescale_yearly_minutes([east_angles[b_index] for b_index in changed],
+                                            [west_angles[b_index] for b_index in changed], calendar,
+                                            get_backend(getattr(settings, "SUNLIGHT_BACKEND", PYTHON_BACKEND)))
+        else:
+            yearly = [[] for _ in changed]
+
+        def get_stored_rows(model, *fields):
+            # Stored rows of the computed buildings (and of the deleted ones)
+            if changed_ids is None:
+                return model.objects.filter(building__neighbourhood=neighbourhood).values_list(*fields)
+
+            return chain.from_iterable(
+                model.objects.filter(building_id__in=changed_ids[start:start + LOOKUP_CHUNK_SIZE]).values_list(*fields)
+                for start in range(0, len(changed_ids), LOOKUP_CHUNK_SIZE))
+
+        # Sunlight of the stored rows that are replaced: (<dawn_minutes>, <sunset_minutes>, <floor_count>)
+        replaced = []
+
+        #
+        # BUILDINGS
+        #
+
+        deleted_ids = [building.id for building in deleted_buildings]
+        deleted_apartments = 0
+        deleted_floor_ranges = 0
+        deleted_yearly = 0
+        if deleted_ids:
+            if kept:
+                replaced.extend((dawn_minutes, sunset_minutes, 1)
+                                for dawn_minutes, sunset_minutes in Apartment.objects.filter(
+                                    building_id__in=deleted_ids).values_list("dawn_minutes", "sunset_minutes"))
+                replaced.extend((dawn_minutes, sunset_minutes, floor_to - floor_from + 1)
+                                for floor_from, floor_to, dawn_minutes, sunset_minutes in FloorRange.objects.filter(
+                                    building_id__in=deleted_ids).values_list("floor_from", "floor_to",
+                                                                             "dawn_minutes", "sunset_minutes"))
+
+            deleted_apartments, _ = Apartment.objects.filter(building_id__in=deleted_ids).delete()
+            deleted_floor_ranges, _ = FloorRange.objects.filter(building_id__in=deleted_ids).delete()
+            deleted_yearly, _ = YearlySunlight.objects.filter(building_id__in=deleted_ids).delete()
+            Building.objects.filter(id__in=deleted_ids).delete()
+
+        def get_bytes(value):
+            # Binary values could be read as memoryview (depending on the database)
+            return None if value is None else bytes(value)
+
+        created_buildings = []
+        updated_buildings = []
+        acc_building_east_distance = 0
+
+        for b_index, (building_info, building_east_angles, building_west_angles) in enumerate(zip(
+                building_list, east_angles, west_angles)):
+            building = building_info["model"]
+            if building_east_angles is not None:
+                building_east_angles = pack_angles(building_east_angles)
+                building_west_angles = pack_angles(building_west_angles)
+            elif b_index in kept:
+                # Its shadows did not change
+                building_east_angles = get_bytes(building.east_angles)
+                building_west_angles = get_bytes(building.west_angles)
+
+            if building is None:
+                building = Building(name=building_info["name"], neighbourhood=neighbourhood)
+                building_info["model"] = building
+                created_buildings.append(building)
+
+            elif (building.floors, building.east_position, building.prev_distance, building.next_distance,
+                  get_bytes(building.east_angles), get_bytes(building.west_angles)) != \
+                    (building_info["apartments_count"], b_index, acc_building_east_distance, building_info["distance"],
+                     building_east_angles, building_west_angles):
+                updated_buildings.append(building)
+
+            building.floors = building_info["apartments_count"]
+            building.east_position = b_index
+            building.prev_distance = acc_building_east_distance
+            building.next_distance = building_info["distance"]
+            building.east_angles = building_east_angles
+            building.west_angles = building_west_angles
+
+            acc_building_east_distance += building_info["distance"]
+
+        CityWriter.set_ids(Building, created_buildings)
+        Building.objects.bulk_create(created_buildings)
+        CityWriter.update_rows(Building, updated_buildings, ["floors", "east_position", "prev_distance",
+                                                             "next_distance", "east_angles", "west_angles"])
+
+        # Stored rows of the other buildings whose rank moved
+        reranked = []
+        for row_id, b_index, floor_from, _, _, neighbourhood_rank in kept_rows:
+            if ranking.get((b_index, floor_from)) != neighbourhood_rank:
+                reranked.append((row_id, ranking.get((b_index, floor_from))))
+
+        #
+        # APARTMENTS
+        #
+
+        stored = {(building_id, floor): (apartment_id, dawn_minutes, sunset_minutes, neighbourhood_rank)
+                  for apartment_id, building_id, floor, dawn_minutes, sunset_minutes, neighbourhood_rank in
+                  get_stored_rows(Apartment, "id", "building_id", "floor", "dawn_minutes", "sunset_minutes",
+                                  "neighbourhood_rank")}
+        replaced.extend((dawn_minutes, sunset_minutes, 1) for _, dawn_minutes, sunset_minutes, _ in stored.values())
+
+        created_apartments = []
+        updated_apartments = []
+
+        for b_index in changed:
+            building = building_list[b_index]["model"]
+
+            for floor, (dawn_minutes, sunset_minutes) in enumerate(zip(dawn[b_index], sunset[b_index])):
+                current = stored.pop((building.id, floor), None)
+                neighbourhood_rank = ranking.get((b_index, floor))
+
+                if current is None:
+                    created_apartments.append(Apartment(building=building, floor=floor,
+                                                        dawn=format_time(dawn_minutes),
+                                                        sunset=format_time(sunset_minutes),
+                                                        dawn_minutes=dawn_minutes, sunset_minutes=sunset_minutes,
+                                                        sunlight_minutes=get_sunlight_minutes(dawn_minutes,
+                                                                                              sunset_minutes),
+                                                        neighbourhood_rank=neighbourhood_rank))
+
+                elif current[1:] != (dawn_minutes, sunset_minutes, neighbourhood_rank):
+                    updated_apartments.append(Apartment(id=current[0], building=building, floor=floor,
+                                                        dawn=format_time(dawn_minutes),
+                                                        sunset=format_time(sunset_minutes),
+                                                        dawn_minutes=dawn_minutes, sunset_minutes=sunset_minutes,
+                                                        sunlight_minutes=get_sunlight_minutes(dawn_minutes,
+                                                                                              sunset_minutes),
+                                                        neighbourhood_rank=neighbourhood_rank))
+
+        # Remaining ones are floors that no longer exist
+        deleted_apartment_ids = [apartment_id for apartment_id, _, _, _ in stored.values()]
+        for start in range(0, len(deleted_apartment_ids), LOOKUP_CHUNK_SIZE):
+            Apartment.objects.filter(id__in=deleted_apartment_ids[start:start + LOOKUP_CHUNK_SIZE]).delete()
+
+        if created_apartments:
+            CityWriter.set_ids(Apartment, created_apartments)
+            # The database could limit the number of parameters per statement (e.g., SQLite)
+            batch_size = connection.ops.bulk_batch_size(Apartment._meta.concrete_fields, created_apartments)
+            Apartment.objects.bulk_create(created_apartments, batch_size=max(batch_size, 1))
+
+        CityWriter.update_rows(Apartment, updated_apartments, ["dawn", "sunset", "dawn_minutes", "sunset_minutes",
+                                                               "sunlight_minutes", "neighbourhood_rank"])
+
+        if mode != COMPRESSED_MODE:
+            reranked_apartments = [Apartment(id=apartment_id, neighbourhood_rank=neighbourhood_rank)
+                                   for apartment_id, neighbourhood_rank in reranked]
+            CityWriter.update_rows(Apartment, reranked_apartments, ["neighbourhood_rank"])
+            updated_apartments.extend(reranked_apartments)
+
+        #
+        # FLOOR RANGES
+        #
+
+        stored = {(building_id, floor_from): (floor_range_id, floor_to, dawn_minutes, sunset_minutes,
+                                              neighbourhood_rank)
+                  for floor_range_id, building_id, floor_from, floor_to, dawn_minutes, sunset_minutes,
+                  neighbourhood_rank in get_stored_rows(FloorRange, "id", "building_id", "floor_from", "floor_to",
+                                                        "dawn_minutes", "sunset_minutes", "neighbourhood_rank")}
+        replaced.extend((dawn_minutes, sunset_minutes, floor_to - floor_from + 1)
+                        for (_, floor_from), (_, floor_to, dawn_minutes, sunset_minutes, _) in stored.items())
+
+        created_floor_ranges = []
+        updated_floor_ranges = []
+
+        for b_index in changed:
+            building = building_list[b_index]["model"]
+
+            for floor_from, floor_to, dawn_minutes, sunset_minutes in floor_ranges[b_index]:
+                current = stored.pop((building.id, floor_from), None)
+                neighbourhood_rank = ranking.get((b_index, floor_from))
+
+                if current is None:
+                    created_floor_ranges.append(FloorRange(building=building, floor_from=floor_from, floor_to=floor_to,
+                                                           dawn_minutes=dawn_minutes, sunset_minutes=sunset_minutes,
+                                                           sunlight_minutes=get_sunlight_minutes(dawn_minutes,
+                                                                                                 sunset_minutes),
+                                                           neighbourhood_rank=neighbourhood_rank))
+
+                elif current[1:] != (floor_to, dawn_minutes, sunset_minutes, neighbourhood_rank):
+                    updated_floor_ranges.append(FloorRange(id=current[0], building=building, floor_from=floor_from,
+                                                           floor_to=floor_to, dawn_minutes=dawn_minutes,
+                                                           sunset_minutes=sunset_minutes,
+                                                           sunlight_minutes=get_sunlight_minutes(dawn_minutes,
+                                                                                                 sunset_minutes),
+                                                           neighbourhood_rank=neighbourhood_rank))
+
+        # Remaining ones are floor ranges that no longer start at the same floor
+        deleted_floor_range_ids = [floor_range_id for floor_range_id, _, _, _, _ in stored.values()]
+        for start in range(0, len(deleted_floor_range_ids), LOOKUP_CHUNK_SIZE):
+            FloorRange.objects.filter(id__in=deleted_floor_range_ids[start:start + LOOKUP_CHUNK_SIZE]).delete()
+
+        if created_floor_ranges:
+            CityWriter.set_ids(FloorRange, created_floor_ranges)
+            batch_size = connection.ops.bulk_batch_size(FloorRange._meta.concrete_fields, created_floor_ranges)
+            FloorRange.objects.bulk_create(created_floor_ranges, batch_size=max(batch_size, 1))
+
+        CityWriter.update_rows(FloorRange, updated_floor_ranges, ["floor_to", "dawn_minutes", "sunset_minutes",
+                                                                  "sunlight_minutes", "neighbourhood_rank"])
+
+        if mode == COMPRESSED_MODE:
+            reranked_floor_ranges = [FloorRange(id=floor_range_id, neighbourhood_rank=neighbourhood_rank)
+                                     for floor_range_id, neighbourhood_rank in reranked]
+            CityWriter.update_rows(FloorRange, reranked_floor_ranges, ["neighbourhood_rank"])
+            updated_floor_ranges.extend(reranked_floor_ranges)
+
+        #
+        # YEARLY SUNLIGHT
+        #
+
+        if yearly is None:
+            # They are left as they are (see rescale)
+            stored = {}
+            yearly = []
+        else:
+            stored = {(building_id, floor): (yearly_id, bytes(dawn), bytes(sunset))
+                      for yearly_id, building_id, floor, dawn, sunset in
+                      get_stored_rows(YearlySunlight, "id", "building_id", "floor", "dawn", "sunset")}
+
+        created_yearly = []
+        updated_yearly = []
+
+        for b_index, building_yearly in zip(changed, yearly):
+            building = building_list[b_index]["model"]
+
+            for floor, (dawn, sunset) in enumerate(building_yearly):
+                current = stored.pop((building.id, floor), None)
+
+                if current is None:
+                    created_yearly.append(YearlySunlight(building=building, floor=floor, dawn=dawn, sunset=sunset))
+
+                elif current[1:] != (dawn, sunset):
+                    updated_yearly.append(YearlySunlight(id=current[0], building=building, floor=floor, dawn=dawn,
+                                                         sunset=sunset))
+
+        # Remaining ones are floors that no longer exist
+        deleted_yearly_ids = [yearly_id for yearly_id, _, _ in stored.values()]
+        for start in range(0, len(deleted_yearly_ids), LOOKUP_CHUNK_SIZE):
+            YearlySunlight.objects.filter(id__in=deleted_yearly_ids[start:start + LOOKUP_CHUNK_SIZE]).delete()
+
+        if created_yearly:
+            CityWriter.set_ids(YearlySunlight, created_yearly)
+            batch_size = connection.ops.bulk_batch_size(YearlySunlight._meta.concrete_fields, created_yearly)
+            YearlySunlight.objects.bulk_create(created_yearly, batch_size=max(batch_size, 1))
+
+        CityWriter.update_rows(YearlySunlight, updated_yearly, ["dawn", "sunset"])
+
+        #
+        # NEIGHBOURHOOD
+        #
+
+        sunlit_counts = None
+        if kept:
+            # The other buildings keep their rows
+            sunlit_counts = [count - replaced_count + computed_count for count, replaced_count, computed_count in zip(
+                unpack_counts(neighbourhood.sunlit_counts), get_sunlit_counts(replaced),
+                get_sunlit_counts((dawn_minutes, sunset_minutes, floor_count)
+                                  for _, _, floor_count, dawn_minutes, sunset_minutes in computed))]
+        elif mode != LAZY_MODE:
+            sunlit_counts = get_sunlit_counts((dawn_minutes, sunset_minutes, floor_count)
+                                              for _, _, floor_count, dawn_minutes, sunset_minutes in computed)
+
+        # So an /init with the new buildings (and the current dawn, sunset, mode and calendar) reuses it
+        city = neighbourhood.city
+        calendar = None
+        if city.calendar_dawn is not None:
+            calendar = (unpack_minutes(city.calendar_dawn), unpack_minutes(city.calendar_sunset))
+        content_hash = get_neighbourhood_hash({"neighborhood": neighbourhood.name,
+                                               "apartments_height": neighbourhood.apartments_height,
+                                               "buildings": building_list},
+                                              get_city_hash(city.dawn_minutes, city.sunset_minutes, mode, calendar))
+        Neighbourhood.objects.filter(id=neighbourhood.id).update(
+            content_hash=content_hash, sunlit_counts=None if sunlit_counts is None else pack_counts(sunlit_counts))
+
+        # The published version changed in place
+        City.objects.filter(name=neighbourhood.city_id).update(revision=F("revision") + 1)
+
+        apartments_computed.inc(sum(building_list[b_index]["apartments_count"] for b_index in changed))
+        rows_written.inc(len(created_buildings) + len(created_apartments) + len(created_floor_ranges) +
+                         len(created_yearly), "insert")
+        rows_written.inc(len(updated_buildings) + len(updated_apartments) + len(updated_floor_ranges) +
+                         len(updated_yearly), "update")
+        rows_written.inc(len(deleted_ids) + deleted_apartments + len(deleted_apartment_ids) + deleted_floor_ranges +
+                         len(deleted_floor_range_ids) + deleted_yearly + len(deleted_yearly_ids), "delete")
+
+        return {"buildings": {"created": len(created_buildings), "updated": len(updated_buildings),
+                              "deleted": len(deleted_ids)},
+                "apartments": {"created": len(created_apartments), "updated": len(updated_apartments),
+                               "deleted": deleted_apartments + len(deleted_apartment_ids)},
+                "floor_ranges": {"created": len(created_floor_ranges), "updated": len(updated_floor_ranges),
+                                 "deleted": deleted_floor_ranges + len(deleted_floor_range_ids)},
+                "yearly": {"created": len(created_yearly), "updated": len(updated_yearly),
+                           "deleted": deleted_yearly + len(deleted_yearly_ids)}}
+
+    @staticmethod
+    def get_kept_ranking(neighbourhood, model, positions, size):
+        """
+            Returns the stored rows of the specified buildings of a neighbourhood that can be ranked along with the
+            computed ones (see update_neighbourhood): the ranked ones, and then the next ones up to size apartments.
+            Their sunlight hours, and the order of their buildings, did not change, so neither did their order (see
+            .sunlight_hours.get_ranking): any other row of those buildings is ranked after them.
+
+        :param neighbourhood: (.models.Neighbourhood) The neighbourhood.
+        :param model: (django.db.models.Model) Apartment, or FloorRange in compressed mode.
+        :param positions: (dict) New position (from east to west) of each building, by its id.
+        :param size: (int) Number of apartments in the ranking (see .constants.RANKING_SIZE).
+        :return: (list of tuple) Rows, sorted by rank. Each one follows the format:
+
+                    (<id>, <b_index>, <floor_from>, <floor_count>, <sunlight_minutes>, <neighbourhood_rank>)
+
+        """
+        floor_from = "floor_from" if model is FloorRange else "floor"
+        floor_to = "floor_to" if model is FloorRange else "floor"
+        rows = model.objects.filter(building__neighbourhood=neighbourhood)
+
+        result = []
+        count = 0
+
+        for row_id, building_id, row_floor_from, row_floor_to, sunlight_minutes, neighbourhood_rank in chain(
+                rows.filter(neighbourhood_rank__isnull=False).order_by("neighbourhood_rank").values_list(
+                    "id", "building_id", floor_from, floor_to, "sunlight_minutes", "neighbourhood_rank"),
+                rows.filter(neighbourhood_rank=None).order_by(
+                    "-sunlight_minutes", "building__east_position", floor_from).values_list(
+                    "id", "building_id", floor_from, floor_to, "sunlight_minutes", "neighbourhood_rank").iterator()):
+            if neighbourhood_rank is None and count >= size:
+                break
+
+            if building_id in positions:
+                result.append((row_id, positions[building_id], row_floor_from, row_floor_to - row_floor_from + 1,
+                               sunlight_minutes, neighbourhood_rank))
+                count += row_floor_to - row_floor_from + 1
+
+        return result
+
+class CityWriter():
+    """
+        Inserts the content of a city in the database using batched bulk inserts.
+
+        Primary keys are assigned in memory, from blocks reserved in the data base (see reserve_ids), so there is no
+        need to read back any row after inserting it, and writers of different processes never get the same keys.
+
+        IMPLEMENTATION NOTE: Rows are inserted in batches, each one within its own transaction. So the content must be
+        written to an unpublished version of the city (see Controller.save_city).
+    """
+
+    def __init__(self, city, batch_size=SAVE_BATCH_SIZE, version=0, mode=EAGER_MODE, calendar=None, city_hash=None,
+                 stored_hashes=None):
+        """
+            Initializes the writer.
+
+        :param city: (.models.City) The city where the neighbourhoods are added.
+        :param batch_size: (int) Maximum number of rows inserted per statement.
+        :param version: (int) Version of the city the neighbourhoods are added to (see .models.City.version).
+        :param mode: (str) How the sunlight hours are inserted (see .models.City.mode).
+        :param calendar: (tuple) Calendar of the city (see .yearly.parse_calendar). If specified (and not in lazy
+            mode), the yearly sunlight hours of every apartment are inserted too.
+        :param city_hash: (str) Hash of the dawn, sunset, mode and calendar the neighbourhoods were computed with (see
+            .content_hash.get_city_hash). If specified, the content hash of each neighbourhood is stored too.
+        :param stored_hashes: (dict) Published neighbourhoods that can be reused instead of being inserted (see
+            Controller.get_neighbourhood_hashes). None if they must not be reused. Requires city_hash.
+        """
+        self.city = city
+        self.batch_size = batch_size
+        self.version = version
+        self.mode = mode
+        self.ranking_size = getattr(settings, "RANKING_SIZE", RANKING_SIZE)
+        self.calendar = calendar if mode != LAZY_MODE else None
+        self.backend = get_backend(getattr(settings, "SUNLIGHT_BACKEND", PYTHON_BACKEND))
+        self.city_hash = city_hash
+        self.stored_hashes = stored_hashes
+
+        # Ids of the reused neighbourhoods, by name
+        self.reused = {}
+        # Number of neighbourhoods reused, and looked up but not found, in stored_hashes
+        self.hits = 0
+        self.misses = 0
+
+        # Primary keys reserved for each model and not used yet: (<next_id>, <end_id>) (see get_ids)
+        self.id_blocks = {}
+        self.id_block_size = getattr(settings, "ID_BLOCK_SIZE", ID_BLOCK_SIZE)
+
+        # Rows pending to be inserted
+        self.neighbourhoods = []
+        self.buildings = []
+        self.apartments = []
+        self.floor_ranges = []
+        self.yearly = []
+
+        # Total number of inserted rows
+        self.rows = 0
+
+    @staticmethod
+    def get_next_id(model):
+        """
+            Returns the next free primary key of the specified model.
+
+        :param model: (django.db.models.Model) Model class.
+        :return: (int) Next free primary key.
+        """
+        max_id = model.objects.aggregate(max_id=Max("id"))["max_id"]
+
+        return 1 if max_id is None else max_id + 1
+
+    @staticmethod
+    def reserve_ids(model, count):
+        """
+            Reserves a block of consecutive primary keys of the specified model, which no other writer (of this process
+            or any other) gets. The next key that has not been reserved is kept in the data base (see .models.IdBlock),
+            and it is moved forward within a transaction (as versions are, see Controller.allocate_city_version): the
+            UPDATE locks its row until the end of it.
+
+        :param model: (django.db.models.Model) Model class.
+        :param count: (int) Number of keys.
+        :return: (int) First key of the block.
+        """
+        table = model._meta.db_table
+
+        with transaction.atomic():
+            # The first time, it starts after the highest key already in use
+            IdBlock.objects.get_or_create(table=table, defaults={"next_id": lambda: CityWriter.get_next_id(model)})
+            # Moved forward before reading it, so no other writer reads the same value (even in data bases where rows
+            # cannot be locked for update, e.g., SQLite)
+            IdBlock.objects.filter(table=table).update(next_id=F("next_id") + count)
+            next_id = IdBlock.objects.filter(table=table).values_list("next_id", flat=True).get()
+
+        return next_id - count
+
+    @staticmethod
+    def set_ids(model, rows):
+        """
+            Sets the primary keys of the specified new rows, from a block reserved for them (see reserve_ids).
+
+        :param model: (django.db.models.Model) Model class.
+        :param rows: (list of django.db.models.Model) Rows.
+        :return: None
+        """
+        if rows:
+            for row_id, row in enumerate(rows, CityWriter.reserve_ids(model, len(rows))):
+                row.id = row_id
+
+    def get_ids(self, model, count):
+        """
+            Returns consecutive primary keys of the specified model, from the block reserved by this writer. When it
+            runs out, a new block of, at least, the ID_BLOCK_SIZE setting is reserved (see reserve_ids), and the rest
+            of the prior one is left unused.
+
+        :param model: (django.db.models.Model) Model class.
+        :param count: (int) Number of keys.
+        :return: (int) First key.
+        """
+        next_id, end_id = self.id_blocks.get(model, (0, 0))
+
+        if end_id - next_id < count:
+            size = max(count, self.id_block_size)
+            next_id = CityWriter.reserve_ids(model, size)
+            end_id = next_id + size
+
+        self.id_blocks[model] = (next_id + count, end_id)
+
+        return next_id
+
+    @staticmethod
+    def update_rows(model, rows, fields):
+        """
+            Updates the specified fields of the specified rows, by their primary key, with a single prepared UPDATE
+            statement run once per row (executemany).
+
+            IMPLEMENTATION NOTE: Django's bulk_update builds a CASE WHEN per field with a branch per row, which the
+            database evaluates for every row of the batch (quadratic). When every row changes (e.g., on a daylight
+            change), that took most of the time. A prepared UPDATE by primary key costs the same for every row.
+
+        :param model: (django.db.models.Model) Model class.
+        :param rows: (list of django.db.models.Model) Rows, with their primary key and the new values.
+        :param fields: (list of str) Names of the fields to be updated.
+        :return: None
+        """
+        if not rows:
+            return
+
+        fields = [model._meta.get_field(name) for name in fields]
+        statement = "UPDATE {} SET {} WHERE {} = %s".format(
+            connection.ops.quote_name(model._meta.db_table),
+            ", ".join("{} = %s".format(connection.ops.quote_name(field.column)) for field in fields),
+            connection.ops.quote_name(model._meta.pk.column))
+
+        with connection.cursor() as cursor:
+            cursor.executemany(statement, [[field.get_db_prep_save(getattr(row, field.attname), connection)
+                                            for field in fields] + [row.pk] for row in rows])
+
+    def add_neighbourhood(self, neighbourhood_info):
+        """
+            Adds the specified neighbourhood (with all its buildings, and its apartments or floor ranges, and their
+            yearly sunlight hours if there is a calendar). The sunlight ranking of the neighbourhood is computed before
+            adding them (see .sunlight_hours.get_ranking), and so are its sunlit counts (see
+            .sunlight_hours.get_sunlit_counts).
+
+        :param neighbourhood_info: (dict) Neighbourhood info, including the dawn and sunset of each apartment (minutes
+            since midnight). Follows the same format as each neighbourhood within the city info (see
+            .sunlight_hours.compute_city_sunlight_hours). The dawn and sunset are not needed in lazy mode. The angles
+            of the shadows are stored too, if given (see .models.Building.east_angles).
+        :return: (.models.Neighbourhood) The neighbourhood (it could still be pending to be inserted). None if the
+            stored one is reused instead (see reuse_neighbourhood).
+        """
+        content_hash = None
+        if self.city_hash is not None:
+            content_hash = get_neighbourhood_hash(neighbourhood_info, self.city_hash)
+
+        if self.stored_hashes is not None and self.reuse_neighbourhood(neighbourhood_info, content_hash):
+            return None
+
+        neighbourhood = Neighbourhood(id=self.get_ids(Neighbourhood, 1), name=neighbourhood_info["neighborhood"],
+                                      apartments_height=neighbourhood_info["apartments_height"], city=self.city,
+                                      version=self.version, content_hash=content_hash)
+        self.neighbourhoods.append(neighbourhood)
+
+        building_list = neighbourhood_info["buildings"]
+        floor_ranges = [[] for _ in building_list]
+        ranking = {}
+
+        if self.mode == COMPRESSED_MODE:
+            floor_ranges = [get_floor_ranges(building_info["dawn"], building_info["sunset"])
+                            for building_info in building_list]
+            ranking = get_ranking(((get_sunlight_minutes(dawn, sunset), b_index, floor_from, floor_to - floor_from + 1)
+                                   for b_index, building_floor_ranges in enumerate(floor_ranges)
+                                   for floor_from, floor_to, dawn, sunset in building_floor_ranges),
+                                  self.ranking_size)
+            neighbourhood.sunlit_counts = pack_counts(get_sunlit_counts(
+                (dawn, sunset, floor_to - floor_from + 1) for building_floor_ranges in floor_ranges
+                for floor_from, floor_to, dawn, sunset in building_floor_ranges))
+
+        elif self.mode != LAZY_MODE:
+            ranking = get_ranking(((get_sunlight_minutes(dawn, sunset), b_index, floor, 1)
+                                   for b_index, building_info in enumerate(building_list)
+                                   for floor, (dawn, sunset) in enumerate(zip(building_info["dawn"],
+                                                                              building_info["sunset"]))),
+                                  self.ranking_size)
+            neighbourhood.sunlit_counts = pack_counts(get_sunlit_counts(
+                (dawn, sunset, 1) for building_info in building_list
+                for dawn, sunset in zip(building_info["dawn"], building_info["sunset"])))
+
+        # The angles of the shadows, if they were computed along with the sunlight hours (not in lazy mode)
+        with_angles = self.mode != LAZY_MODE and all("east_angles" in building_info for building_info in building_list)
+
+        if self.calendar is not None and with_angles:
+            yearly = rescale_yearly_minutes([building_info["east_angles"] for building_info in building_list],
+                                            [building_info["west_angles"] for building_info in building_list],
+                                            self.calendar, self.backend)
+        elif self.calendar is not None:
+            yearly = get_neighbourhood_yearly_minutes(building_list, self.calendar,
+                                                      neighbourhood_info["apartments_height"], self.backend)
+        else:
+            yearly = [[] for _ in building_list]
+
+        # Primary keys of all the rows of the neighbourhood
+        next_building_id = self.get_ids(Building, len(building_list))
+        next_yearly_id = self.get_ids(YearlySunlight, sum(len(building_yearly) for building_yearly in yearly))
+        next_floor_range_id = self.get_ids(FloorRange, sum(len(building_floor_ranges)
+                                                           for building_floor_ranges in floor_ranges))
+        next_apartment_id = 0
+        if self.mode == EAGER_MODE:
+            next_apartment_id = self.get_ids(Apartment, sum(building_info["apartments_count"]
+                                                            for building_info in building_list))
+
+        acc_building_east_distance = 0
+
+        for b_index, building_info in enumerate(building_list):
+            building = Building(id=next_building_id, name=building_info["name"],
+                                floors=building_info["apartments_count"], neighbourhood=neighbourhood,
+                                east_position=b_index, prev_distance=acc_building_east_distance,
+                                next_distance=building_info["distance"],
+                                east_angles=pack_angles(building_info["east_angles"]) if with_angles else None,
+                                west_angles=pack_angles(building_info["west_angles"]) if with_angles else None)
+            next_building_id += 1
+            self.buildings.append(building)
+
+            acc_building_east_distance += building_info["distance"]
+
+            for floor, (dawn, sunset) in enumerate(yearly[b_index]):
+                self.yearly.append(YearlySunlight(id=next_yearly_id, building=building, floor=floor, dawn=dawn,
+                                                  sunset=sunset))
+                next_yearly_id += 1
+
+            if len(self.yearly) >= self.batch_size:
+                self.flush()
+
+            if self.mode == LAZY_MODE:
+                if len(self.buildings) >= self.batch_size:
+                    self.flush()
+                continue
+
+            if self.mode == COMPRESSED_MODE:
+                for floor_from, floor_to, dawn_minutes, sunset_minutes in floor_ranges[b_index]:
+                    self.floor_ranges.append(FloorRange(id=next_floor_range_id, building=building,
+                                                        floor_from=floor_from, floor_to=floor_to,
+                                                        dawn_minutes=dawn_minutes, sunset_minutes=sunset_minutes,
+                                                        sunlight_minutes=get_sunlight_minutes(dawn_minutes,
+                                                                                              sunset_minutes),
+                                                        neighbourhood_rank=ranking.get((b_index, floor_from))))
+                    next_floor_range_id += 1
+
+                if len(self.floor_ranges) >= self.batch_size:
+                    self.flush()
+                continue
+
+            for floor in range(building_info["apartments_count"]):
+                dawn_minutes = building_info["dawn"][floor]
+                sunset_minutes = building_info["sunset"][floor]
+                self.apartments.append(Apartment(id=next_apartment_id, building=building, floor=floor,
+                                                 dawn=format_time(dawn_minutes), sunset=format_time(sunset_minutes),
+                                                 dawn_minutes=dawn_minutes, sunset_minutes=sunset_minutes,
+                                                 sunlight_minutes=get_sunlight_minutes(dawn_minutes, sunset_minutes),
+                                                 neighbourhood_rank=ranking.get((b_index, floor))))
+                next_apartment_id += 1
+
+            if len(self.apartments) >= self.batch_size:
+                self.flush()
+
+        return neighbourhood
+
+    def reuse_neighbourhood(self, neighbourhood_info, content_hash):
+        """
+            Reuses the published neighbourhood with the same name and content hash as the specified one, if any (see
+            .content_hash.find_stored_neighbourhood). Only the first neighbourhood with each name can be reused.
+
+        :param neighbourhood_info: (dict) Neighbourhood info.
+        :param content_hash: (str) Its content hash.
+        :return: (bool) True if reused; False otherwise.
+        """
+        neighbourhood_id = find_stored_neighbourhood(self.stored_hashes, neighbourhood_info, content_hash)
+
+        if neighbourhood_id is None or neighbourhood_info["neighborhood"] in self.reused:
+            self.misses += 1
+            result_cache_lookups.inc(1, "miss")
+            return False
+
+        self.reused[neighbourhood_info["neighborhood"]] = neighbourhood_id
+        self.hits += 1
+        result_cache_lookups.inc(1, "hit")
+
+        return True
+
+    def flush(self):
+        """
+            Inserts all the pending rows (parents first).
+
+        :return: None
+        """
+        with transaction.atomic():
+            for model, rows in ((Neighbourhood, self.neighbourhoods), (Building, self.buildings),
+                                (Apartment, self.apartments), (FloorRange, self.floor_ranges),
+                                (YearlySunlight, self.yearly)):
+                if rows:
+                    # The database could limit the number of parameters per statement (e.g., SQLite)
+                    batch_size = min(self.batch_size, connection.ops.bulk_batch_size(model._meta.concrete_fields,
+                                                                                     rows))
+                    model.objects.bulk_create(rows, batch_size=max(batch_size, 1))
+                    self.rows += len(rows)
+                    rows_written.inc(len(rows), "insert")
+                    rows.clear()
+
 
+# Serializes the city builds and building changes of this process (and the snapshots they save)
+build_lock = Lock()
 
+# Removes the prior versions of the cities of this process (see Controller.save_city)
+version_collector = CityVersionCollector(Controller.collect_city_versions)
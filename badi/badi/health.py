@@ -0,0 +1,262 @@
+#!/bin/python3
+
+"""
+    Module that keeps track of the health of the underlying data base system.
+"""
+
+from logging import getLogger
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from django.conf import settings
+from django.db import connection, OperationalError
+
+from .constants import DB_HEALTH_CHECK_INTERVAL, DB_CIRCUIT_FAILURE_THRESHOLD, DB_CIRCUIT_COOLDOWN
+from .models import City
+
+# Get an instance of a logger
+logger = getLogger(__name__)
+
+
+# Circuit breaker states
+CLOSED = "closed"        # The data base is available
+OPEN = "open"            # The data base is not available. Requests are rejected until the cooldown ends
+HALF_OPEN = "half-open"  # The cooldown ended. The next request decides whether to close or to open again
+
+
+def is_locked_error(error):
+    """
+        Tells if the specified data base error only means that the data base is busy: SQLite locks the whole data base
+        (or table) while it is being written, so it is up and running.
+
+    :param error: (Exception) Data base error.
+    :return: (bool) True if the data base is locked; False otherwise.
+    """
+    return isinstance(error, OperationalError) and "locked" in str(error)
+
+
+def probe_db():
+    """
+        Checks whether the underlying data base system is up and running, with a single lightweight query.
+
+    :return: (bool) True if the underlying data base system is up and running; False otherwise.
+    """
+    result = False
+
+    try:
+        City.objects.exists()
+        result = True
+
+    except OperationalError as e:
+        result = is_locked_error(e)
+
+        if not result:
+            logger.exception("While trying to check DB activity: {}".format(e))
+
+    except Exception as e:
+        # If anything wrong happens, assume the underlying data base system is not available right now.
+        logger.exception("While trying to check DB activity: {}".format(e))
+
+    finally:
+        # Probes run on their own thread, so do not keep its connection open between probes
+        connection.close()
+
+    return result
+
+
+class DatabaseHealth():
+    """
+        Health of the underlying data base system. Combines:
+
+            - A liveness check, run periodically by a background thread.
+            - A circuit breaker, that opens (i.e., marks the data base as not available) when several consecutive
+              queries fail, and half-opens after a cooldown to let the next request try again.
+
+        IMPLEMENTATION NOTE: All the work is done either by the background thread or when a query fails, so asking
+        whether the data base is available is just a flag read.
+    """
+
+    def __init__(self, probe=probe_db, interval=None, failure_threshold=None, cooldown=None, clock=monotonic):
+        """
+            Initializes the health of the data base. The data base is assumed to be available until proven otherwise.
+
+        :param probe: (callable) Function that checks the data base. Returns True if it is available.
+        :param interval: (float) Seconds between liveness checks. If not specified, the one in the
+            DB_HEALTH_CHECK_INTERVAL setting is used.
+        :param failure_threshold: (int) Number of consecutive failed queries that open the circuit. If not specified,
+            the one in the DB_CIRCUIT_FAILURE_THRESHOLD setting is used.
+        :param cooldown: (float) Seconds the circuit stays open before half-opening. If not specified, the one in the
+            DB_CIRCUIT_COOLDOWN setting is used.
+        :param clock: (callable) Returns the current time in seconds.
+        """
+        self.probe = probe
+        self.interval = interval if interval is not None else getattr(settings, "DB_HEALTH_CHECK_INTERVAL",
+                                                                      DB_HEALTH_CHECK_INTERVAL)
+        self.failure_threshold = failure_threshold if failure_threshold is not None else \
+            getattr(settings, "DB_CIRCUIT_FAILURE_THRESHOLD", DB_CIRCUIT_FAILURE_THRESHOLD)
+        self.cooldown = cooldown if cooldown is not None else getattr(settings, "DB_CIRCUIT_COOLDOWN",
+                                                                      DB_CIRCUIT_COOLDOWN)
+        self.clock = clock
+
+        # Whether the data base is available. The only attribute read on the hot path
+        self.available = True
+
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+        self.last_check = None
+        self.last_check_ok = None
+
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+
+    def is_available(self):
+        """
+            Tells if the underlying data base system is available. Starts the background liveness check on first use.
+
+        :return: (bool) True if the underlying data base system is available; False otherwise.
+        """
+        if self.thread is None:
+            self.start()
+
+        return self.available
+
+    def start(self):
+        """
+            Starts the background liveness check (if not started yet).
+
+        :return: None
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name="badi-db-health", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """
+            Stops the background liveness check.
+
+        :return: None
+        """
+        self.stop_event.set()
+
+    def run(self):
+        """
+            Background thread loop.
+
+        :return: None
+        """
+        while not self.stop_event.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """
+            Runs the liveness check (if proceeds) and updates the state accordingly.
+
+        :return: None
+        """
+        if self.state == OPEN and self.clock() - self.opened_at < self.cooldown:
+            # Still cooling down
+            return
+
+        ok = self.probe()
+
+        with self.lock:
+            self.last_check = self.clock()
+            self.last_check_ok = ok
+
+            if not ok:
+                self._trip()
+            elif self.state == OPEN:
+                # Let the next request try again
+                self.state = HALF_OPEN
+                self.available = True
+
+    def record_success(self):
+        """
+            Records that a query succeeded.
+
+        :return: None
+        """
+        if self.state != CLOSED or self.failures:
+            with self.lock:
+                self.state = CLOSED
+                self.failures = 0
+                self.available = True
+
+    def record_failure(self):
+        """
+            Records that a query failed. Opens the circuit if there are too many consecutive failures (or if it was
+            half-open).
+
+        :return: None
+        """
+        with self.lock:
+            self.failures += 1
+
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._trip()
+
+    def record_error(self, error):
+        """
+            Records that a query raised the specified error. It counts as a failure (see record_failure), unless the
+            data base is just locked (see is_locked_error).
+
+        :param error: (django.db.DatabaseError) Error raised by the query.
+        :return: None
+        """
+        if not is_locked_error(error):
+            self.record_failure()
+
+    def _trip(self):
+        """
+            Opens the circuit. Must be called with the lock held.
+
+        :return: None
+        """
+        if self.state != OPEN:
+            self.trips += 1
+            logger.error("Data base is not available. Rejecting requests for {} seconds".format(self.cooldown))
+
+        self.state = OPEN
+        self.available = False
+        self.opened_at = self.clock()
+
+    def get_state(self):
+        """
+            Returns the current state.
+
+        :return: (dict) Follows the format:
+
+                {
+                    "available": <available>,
+                    "state": <state>,
+                    "consecutive_failures": <failures>,
+                    "trips": <trips>,
+                    "last_check_ok": <last_check_ok>,
+                    "seconds_since_last_check": <seconds_since_last_check>
+                }
+
+                with:
+                    <available>: (bool) Whether requests are sent to the data base.
+                    <state>: (str) Circuit breaker state: "closed", "open" or "half-open".
+                    <failures>: (int) Number of consecutive failed queries.
+                    <trips>: (int) Number of times the circuit has been opened.
+                    <last_check_ok>: (bool/None) Result of the last liveness check (None if not checked yet).
+                    <seconds_since_last_check>: (float/None) Seconds elapsed since the last liveness check.
+        """
+        with self.lock:
+            return {
+                "available": self.available,
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "trips": self.trips,
+                "last_check_ok": self.last_check_ok,
+                "seconds_since_last_check": None if self.last_check is None else self.clock() - self.last_check
+            }
+
+
+# Health of the default data base, shared by all the requests of this process
+database_health = DatabaseHealth()
@@ -0,0 +1,192 @@
+#!/bin/python3
+
+"""
+    Module that gathers tools to compute, at once, the obstacles that project their shadow from the west on every
+    apartment of a neighbourhood.
+"""
+
+
+class WestHorizon():
+    """
+        West horizon of a neighbourhood. Answers the same question as sunlight_hours.get_max_west_shadow_details, but
+        for every floor of every building, without rescanning all the buildings on the west for each floor.
+
+        IMPLEMENTATION NOTE: The neighbourhood is swept once from west to east (right to left). Given a building and a
+        floor, the only candidates to project the highest shadow from the west are the buildings of the chain of
+        "next strictly taller building" that starts at the first building on the west that reaches that floor (any
+        other building is hidden behind a nearer one that is, at least, as tall). Moreover, the winner is always a
+        vertex of the upper envelope (upper convex hull) of that chain, so each building stores the next vertex of
+        the envelope that starts on it. Both chains are walked with binary lifting, so each floor is answered in
+        O(log N) and the whole neighbourhood in O(N log N + A log N), being N the number of buildings and A the number
+        of apartments.
+
+        As in get_max_west_shadow_details, angles are never computed: they are compared as slopes, using integer
+        cross multiplication, so ties are solved exactly as there (the nearest building wins).
+    """
+
+    def __init__(self, building_list):
+        """
+            Builds the west horizon of the specified neighbourhood.
+
+        :param building_list: (list of dict) Follows the same format as the field "buildings" within each
+            neighbourhood specified in the init API endpoint described in the Code Challenge. That is:
+
+                [{name:<name_string>, apartments_count: <number>, distance: <number>}]
+
+                As specified in the Code Challenge, it is assumed that the building list is ordered from east to west.
+        """
+        size = len(building_list)
+
+        # Number of floors of each building
+        self.heights = [building["apartments_count"] for building in building_list]
+
+        # Accumulated distance from the first building on the east to each building
+        self.positions = [0] * size
+        for index in range(1, size):
+            self.positions[index] = self.positions[index - 1] + building_list[index - 1]["distance"]
+
+        # Number of binary lifting levels
+        self.levels = max(1, size.bit_length())
+
+        # next_taller[k][i]: Position of the 2^k-th next strictly taller building on the west of building i (-1 if
+        # there is none).
+        self.next_taller = [[-1] * size for _ in range(self.levels)]
+
+        # next_vertex[k][i]: Position of the 2^k-th next vertex of the upper envelope that starts on building i (-1 if
+        # there is none).
+        self.next_vertex = [[-1] * size for _ in range(self.levels)]
+
+        # Sweep from west to east keeping a monotonic stack of strictly increasing heights (from top to bottom)
+        stack = []
+        for index in range(size - 1, -1, -1):
+            while stack and self.heights[stack[-1]] <= self.heights[index]:
+                stack.pop()
+
+            if stack:
+                self.next_taller[0][index] = stack[-1]
+                self.next_vertex[0][index] = self._get_tangent(stack[-1], self.positions[index], self.heights[index])
+
+            for level in range(1, self.levels):
+                taller = self.next_taller[level - 1][index]
+                if taller != -1:
+                    self.next_taller[level][index] = self.next_taller[level - 1][taller]
+
+                vertex = self.next_vertex[level - 1][index]
+                if vertex != -1:
+                    self.next_vertex[level][index] = self.next_vertex[level - 1][vertex]
+
+            stack.append(index)
+
+    def _is_steeper(self, x, y, index, other_index):
+        """
+            Tells whether the slope from the point (x, y) to the top of the building other_index is strictly higher
+            than the slope to the top of the building index. Both buildings must be on the west of x.
+
+        :return: (bool) True if it is strictly higher; False otherwise.
+        """
+        return (self.heights[other_index] - y) * (self.positions[index] - x) > \
+            (self.heights[index] - y) * (self.positions[other_index] - x)
+
+    def _get_tangent(self, start, x, y):
+        """
+            Returns the vertex of the upper envelope that starts on the building start that is seen with the highest
+            slope from the point (x, y). If several vertex have the same slope, the nearest one is returned.
+
+        :param start: (int) Position of the first building of the upper envelope.
+        :param x: (int) Distance from the first building on the east to the point.
+        :param y: (int) Height of the point.
+        :return: (int) Position of the building.
+        """
+        vertex = self.next_vertex[0][start]
+        if vertex == -1 or not self._is_steeper(x, y, start, vertex):
+            return start
+
+        # Slopes grow along the envelope until the tangent vertex, and decrease afterwards
+        current = start
+        for level in range(self.levels - 1, -1, -1):
+            candidate = self.next_vertex[level][current]
+            if candidate == -1:
+                continue
+
+            vertex = self.next_vertex[0][candidate]
+            if vertex != -1 and self._is_steeper(x, y, candidate, vertex):
+                current = candidate
+
+        return self.next_vertex[0][current]
+
+    def _get_details(self, index, first, floor):
+        """
+            Returns the details of the highest shadow from the west on the specified floor, given the first building
+            on the west that reaches that floor.
+
+        :return: (tuple) Follows the same format as get_max_west_shadow_details.
+        """
+        if first == -1:
+            return -1, 0
+
+        max_west_shadow_index = self._get_tangent(first, self.positions[index], floor - 1)
+
+        return max_west_shadow_index, self.positions[max_west_shadow_index] - self.positions[index]
+
+    def get_max_west_shadow_details(self, index, floor):
+        """
+            Returns the position of the building on the west of the specified one, that creates the highest shadow
+            from the west on the specified floor. Same result as sunlight_hours.get_max_west_shadow_details, in
+            O(log N).
+
+        :param index: (int) Position of the building in the list of buildings (0 to N-1).
+        :param floor: (int) Floor of the building to make the measurement from (0 to N-1).
+        :return: (tuple) Following the format:
+
+                    (<max_west_shadow_index>, <max_west_shadow_distance>)
+
+                with:
+
+                    <max_west_shadow_index> : (int) Position of the building that creates the highest shadow on the
+                        west in the list of buildings (0 to N-1). -1 if there is no shadow.
+                    <max_west_shadow_distance> : (int) Distance between the specified building and the building that
+                        creates the highest shadow on the west. 0 if there is no shadow.
+        """
+        first = index + 1
+        if first >= len(self.heights):
+            return -1, 0
+
+        # Heights grow along the chain of next taller buildings, so look for the first one that reaches the floor
+        if self.heights[first] < floor + 1:
+            for level in range(self.levels - 1, -1, -1):
+                candidate = self.next_taller[level][first]
+                if candidate != -1 and self.heights[candidate] < floor + 1:
+                    first = candidate
+
+            first = self.next_taller[0][first]
+
+        return self._get_details(index, first, floor)
+
+    def get_west_shadow_details(self):
+        """
+            Returns the details of the highest shadow from the west for every floor of every building.
+
+        :return: (list of list of tuple) For each building (sorted from east to west), the list of details of each
+            floor (sorted from 0 to N-1). Each detail follows the same format as get_max_west_shadow_details.
+        """
+        return [self.get_building_west_shadow_details(index) for index in range(len(self.heights))]
+
+    def get_building_west_shadow_details(self, index):
+        """
+            Returns the details of the highest shadow from the west for every floor of the specified building.
+
+        :param index: (int) Position of the building in the list of buildings (0 to N-1).
+        :return: (list of tuple) Details of each floor (sorted from 0 to N-1). Each detail follows the same format as
+            get_max_west_shadow_details.
+        """
+        details = []
+        # First building on the west that reaches the current floor
+        first = index + 1 if index + 1 < len(self.heights) else -1
+
+        for floor in range(self.heights[index]):
+            while first != -1 and self.heights[first] < floor + 1:
+                first = self.next_taller[0][first]
+
+            details.append(self._get_details(index, first, floor))
+
+        return details
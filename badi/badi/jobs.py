@@ -0,0 +1,261 @@
+#!/bin/python3
+
+"""
+    Asynchronous /init jobs, run one at a time by a background thread of this process (no external broker).
+"""
+
+from collections import OrderedDict
+from io import BytesIO
+from logging import getLogger
+from queue import Full, Queue
+from threading import Event, Lock, Thread
+from time import monotonic, time
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection
+
+from .city import init_city, NEIGHBOURHOOD_PARSED, NEIGHBOURHOOD_COMPUTED, NEIGHBOURHOOD_PERSISTED
+from .constants import INIT_QUEUE_SIZE, INIT_JOBS_KEPT
+
+# Get an instance of a logger
+logger = getLogger(__name__)
+
+
+# Job phases
+QUEUED = "queued"          # Waiting for the background worker
+PARSING = "parsing"        # Reading the next neighbourhood from the body
+COMPUTING = "computing"    # Computing the sunlight hours of the last parsed neighbourhood
+PERSISTING = "persisting"  # Saving the last computed neighbourhood
+SUCCEEDED = "succeeded"    # Done. The city was updated
+FAILED = "failed"          # Done. The city was not updated (the prior one is untouched)
+
+# Phase of the job after each progress event (see .city.ingest_city)
+NEXT_PHASE = {NEIGHBOURHOOD_PARSED: COMPUTING, NEIGHBOURHOOD_COMPUTED: PERSISTING, NEIGHBOURHOOD_PERSISTED: PARSING}
+
+
+class InitJob():
+    """
+        Initialization of a city requested through the /init API endpoint.
+    """
+
+    def __init__(self, body, clock=time):
+        """
+            Initializes a queued job.
+
+        :param body: (bytes) Body of the /init request.
+        :param clock: (callable) Returns the current time (seconds since the Epoch).
+        """
+        self.id = uuid4().hex
+        self.body = body
+        self.body_size = len(body)
+        self.clock = clock
+
+        self.phase = QUEUED
+        self.result = None
+        self.message = None
+
+        # Progress counters
+        self.parsed = 0
+        self.computed = 0
+        self.persisted = 0
+        self.apartments = 0
+
+        # Timing
+        self.created_at = clock()
+        self.started_at = None
+        self.finished_at = None
+        self.start_time = None
+        self.elapsed_seconds = None
+
+        self.done = Event()
+
+    def update(self, event, neighbourhood):
+        """
+            Updates the progress of the job (see .city.ingest_city).
+
+        :param event: (str) Progress event.
+        :param neighbourhood: (dict) Neighbourhood info.
+        :return: None
+        """
+        if event == NEIGHBOURHOOD_PARSED:
+            self.parsed += 1
+        elif event == NEIGHBOURHOOD_COMPUTED:
+            self.computed += 1
+        elif event == NEIGHBOURHOOD_PERSISTED:
+            self.persisted += 1
+            self.apartments += sum(building["apartments_count"] for building in neighbourhood["buildings"])
+
+        self.phase = NEXT_PHASE[event]
+
+    def run(self):
+        """
+            Runs the job, initializing the city with its body.
+
+        :return: None
+        """
+        self.started_at = self.clock()
+        self.start_time = monotonic()
+        self.phase = PARSING
+
+        try:
+            self.result, self.message = init_city(BytesIO(self.body), progress=self.update)
+
+        except Exception as e:
+            logger.exception("While running init job {}: {}".format(self.id, e))
+            self.result, self.message = False, "Internal error"
+
+        finally:
+            # The body is no longer needed
+            self.body = None
+
+            self.elapsed_seconds = monotonic() - self.start_time
+            self.finished_at = self.clock()
+            self.phase = SUCCEEDED if self.result else FAILED
+            self.done.set()
+
+    def wait(self, timeout=None):
+        """
+            Waits until the job is done.
+
+        :param timeout: (float) Maximum number of seconds to wait. None means forever.
+        :return: (bool) True if the job is done; False otherwise.
+        """
+        return self.done.wait(timeout)
+
+    def get_status(self):
+        """
+            Returns the status of the job.
+
+        :return: (dict) Follows the format:
+
+                {
+                    "id": <id>,
+                    "phase": <phase>,
+                    "result": <result>,
+                    "message": <message>,
+                    "progress": {"body_bytes": <body_bytes>, "parsed_neighbourhoods": <parsed>,
+                                 "computed_neighbourhoods": <computed>, "persisted_neighbourhoods": <persisted>,
+                                 "persisted_apartments": <apartments>},
+                    "timing": {"created_at": <created_at>, "started_at": <started_at>, "finished_at": <finished_at>,
+                               "elapsed_seconds": <elapsed_seconds>}
+                }
+
+                with:
+                    <phase>: (str) One of "queued", "parsing", "computing", "persisting", "succeeded" or "failed".
+                    <result>: (bool/None) Whether the city was updated. None until the job is done.
+                    <message>: (str/None) Same message as a synchronous /init would return. None until the job is done.
+                    <created_at>, <started_at>, <finished_at>: (float/None) Seconds since the Epoch.
+                    <elapsed_seconds>: (float/None) Running time so far (or total running time if done).
+        """
+        elapsed_seconds = self.elapsed_seconds
+        if elapsed_seconds is None and self.start_time is not None:
+            elapsed_seconds = monotonic() - self.start_time
+
+        return {
+            "id": self.id,
+            "phase": self.phase,
+            "result": self.result,
+            "message": self.message,
+            "progress": {"body_bytes": self.body_size, "parsed_neighbourhoods": self.parsed,
+                         "computed_neighbourhoods": self.computed, "persisted_neighbourhoods": self.persisted,
+                         "persisted_apartments": self.apartments},
+            "timing": {"created_at": self.created_at, "started_at": self.started_at,
+                       "finished_at": self.finished_at, "elapsed_seconds": elapsed_seconds}
+        }
+
+
+class InitJobQueue():
+    """
+        Queue of /init jobs, run one at a time (in arrival order) by a background thread.
+
+        IMPLEMENTATION NOTE: Jobs live in the memory of this process. Their status can only be asked to the process
+        that accepted them, and they are lost if it is restarted.
+    """
+
+    def __init__(self, max_queued=None, max_kept=None, autostart=True):
+        """
+            Initializes an empty queue.
+
+        :param max_queued: (int) Maximum number of jobs waiting to be run (each one keeps its body in memory). If not
+            specified, the one in the INIT_QUEUE_SIZE setting is used.
+        :param max_kept: (int) Maximum number of jobs whose status is kept. Oldest ones are forgotten first. If not
+            specified, the one in the INIT_JOBS_KEPT setting is used.
+        :param autostart: (bool) Whether the background thread is started on the first submitted job. Otherwise,
+            queued jobs are not run until start is called.
+        """
+        self.max_queued = max_queued if max_queued is not None else getattr(settings, "INIT_QUEUE_SIZE",
+                                                                            INIT_QUEUE_SIZE)
+        self.max_kept = max_kept if max_kept is not None else getattr(settings, "INIT_JOBS_KEPT", INIT_JOBS_KEPT)
+
+        self.queue = Queue(self.max_queued)
+        self.jobs = OrderedDict()
+        self.lock = Lock()
+        self.autostart = autostart
+        self.thread = None
+
+    def submit(self, body):
+        """
+            Queues a new job.
+
+        :param body: (bytes) Body of the /init request.
+        :return: (InitJob/None) The queued job; None if the queue is full.
+        """
+        job = InitJob(body)
+
+        try:
+            self.queue.put_nowait(job)
+        except Full:
+            return None
+
+        with self.lock:
+            self.jobs[job.id] = job
+
+            while len(self.jobs) > self.max_kept:
+                self.jobs.popitem(last=False)
+
+        if self.autostart:
+            self.start()
+
+        return job
+
+    def start(self):
+        """
+            Starts the background thread (if not started yet).
+
+        :return: None
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name="badi-init-jobs", daemon=True)
+                self.thread.start()
+
+    def get(self, job_id):
+        """
+            Returns the specified job.
+
+        :param job_id: (str) Job id.
+        :return: (InitJob/None) The job; None if it is not known.
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def run(self):
+        """
+            Background thread loop.
+
+        :return: None
+        """
+        while True:
+            job = self.queue.get()
+
+            try:
+                job.run()
+            finally:
+                # Jobs run on their own thread, so do not keep its connection open between jobs
+                connection.close()
+                self.queue.task_done()
+
+
+# Queue of /init jobs of this process
+init_jobs = InitJobQueue()
@@ -0,0 +1,73 @@
+#!/bin/python3
+
+"""
+    Runs the benchmark suite on a throwaway SQLite test database:
+
+        python manage.py benchmark --scale small --output results.json
+        python manage.py benchmark --scale small --baseline results.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from ...benchmarks.suite import SCALES, run_benchmarks, compare_results
+from ...controller import version_collector
+
+
+class Command(BaseCommand):
+    help = "Runs the benchmark suite (compute, persist, lookup and end to end) on synthetic cities."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=sorted(SCALES), default="small",
+                            help="Size of the generated cities.")
+        parser.add_argument("--seed", type=int, default=2019, help="Seed of the generated cities.")
+        parser.add_argument("--repeat", type=int, default=5, help="Number of runs of each benchmark.")
+        parser.add_argument("--only", help="Only run the benchmarks whose name contains this text.")
+        parser.add_argument("--output", help="Write the results (JSON) to this file.")
+        parser.add_argument("--baseline", help="Compare the results against the ones stored in this file.")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Relative change of the median considered a regression (e.g., 0.2 is 20%%).")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        # The test database lives in memory, so the prior versions of the city can not be removed from another
+        # connection while the next one is being saved (SQLite locks the whole table)
+        in_background = version_collector.in_background
+        version_collector.in_background = False
+
+        try:
+            results = run_benchmarks(options["scale"], options["seed"], options["repeat"], options["only"],
+                                     log=self.stderr.write)
+
+        finally:
+            version_collector.in_background = in_background
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+        else:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+
+        if baseline is not None:
+            comparison = compare_results(results, baseline, options["threshold"])
+
+            for item in comparison:
+                self.stderr.write("{:<45} {:>10.6f} s -> {:>10.6f} s  x{:.2f}  {}".format(
+                    item["name"], item["baseline"], item["current"], item["ratio"], item["status"]))
+
+            regressions = [item["name"] for item in comparison if item["status"] == "regression"]
+            if regressions:
+                raise CommandError("Regressions: {}".format(", ".join(regressions)))
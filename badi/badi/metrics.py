@@ -0,0 +1,379 @@
+#!/bin/python3
+
+"""
+    Built-in instrumentation: counters and histograms kept in the memory of this process, exposed in the Prometheus
+    text format (see the /metrics API endpoint).
+
+    IMPLEMENTATION NOTE: Recording a value is a dict lookup and a few additions under a lock, so it can be used on the
+    lookup hot path. Values of other components (e.g., the apartment cache) are only read when the metrics are
+    exposed.
+"""
+
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+
+from django.db import connection
+
+
+# Upper bounds of the buckets of the time histograms (in seconds)
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Upper bounds of the buckets of the DB queries per request histogram
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+
+
+def format_labels(labels):
+    """
+        Formats the specified labels following the Prometheus text format.
+
+    :param labels: (tuple) Pairs (<name>, <value>).
+    :return: (str) Labels (e.g., '{view="init",phase="parse"}'). Empty if there are no labels.
+    """
+    if not labels:
+        return ""
+
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+                                           .replace("\n", "\\n")) for name, value in labels) + "}"
+
+
+def format_value(value):
+    """
+        Formats a sample value following the Prometheus text format.
+
+    :param value: (int/float/bool) Value.
+    :return: (str) Formatted value.
+    """
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Counter():
+    """
+        Monotonically increasing value, per set of labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        """
+            Initializes the counter.
+
+        :param name: (str) Metric name.
+        :param help: (str) Metric description.
+        :param labelnames: (tuple of str) Label names. Values are given in the same order.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        """
+            Increments the counter.
+
+        :param amount: (int/float) Increment.
+        :param labelvalues: Label values (one per label name).
+        :return: None
+        """
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        """
+            Returns the current value.
+
+        :param labelvalues: Label values (one per label name).
+        :return: (int/float) Value.
+        """
+        return self.values.get(labelvalues, 0)
+
+    def get_samples(self):
+        """
+            Returns the samples of the metric.
+
+        :return: (list of tuple) Follows the format: [(<name>, <labels>, <value>)]
+        """
+        with self.lock:
+            return [(self.name, tuple(zip(self.labelnames, labelvalues)), value)
+                    for labelvalues, value in sorted(self.values.items())]
+
+
+class Histogram():
+    """
+        Distribution of values, per set of labels, counted in cumulative buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=TIME_BUCKETS):
+        """
+            Initializes the histogram.
+
+        :param name: (str) Metric name.
+        :param help: (str) Metric description.
+        :param labelnames: (tuple of str) Label names. Values are given in the same order.
+        :param buckets: (tuple of float) Upper bounds of the buckets, in ascending order (+Inf is added).
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # {<labelvalues>: [<bucket_counts>, <sum>, <count>]}
+        self.values = {}
+        self.lock = Lock()
+
+    def observe(self, value, *labelvalues):
+        """
+            Records a value.
+
+        :param value: (int/float) Value.
+        :param labelvalues: Label values (one per label name).
+        :return: None
+        """
+        bucket = bisect_left(self.buckets, value)
+
+        with self.lock:
+            entry = self.values.get(labelvalues)
+            if entry is None:
+                entry = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0, 0]
+
+            entry[0][bucket] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def get_count(self, *labelvalues):
+        """
+            Returns the number of recorded values.
+
+        :param labelvalues: Label values (one per label name).
+        :return: (int) Number of values.
+        """
+        entry = self.values.get(labelvalues)
+
+        return 0 if entry is None else entry[2]
+
+    def get_samples(self):
+        """
+            Returns the samples of the metric.
+
+        :return: (list of tuple) Follows the format: [(<name>, <labels>, <value>)]
+        """
+        samples = []
+
+        with self.lock:
+            for labelvalues, (counts, total, count) in sorted(self.values.items()):
+                labels = tuple(zip(self.labelnames, labelvalues))
+                cumulative = 0
+
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    samples.append((self.name + "_bucket", labels + (("le", format_value(bound)),), cumulative))
+
+                samples.append((self.name + "_sum", labels, total))
+                samples.append((self.name + "_count", labels, count))
+
+        return samples
+
+
+class Timer():
+    """
+        Measures the time spent on each phase of a request, and records it in a histogram once finished.
+
+        Example:
+
+            timer = Timer(phase_seconds, "sunlight_hours")
+            ...
+            timer.lap("lookup")
+            ...
+            timer.finish()
+    """
+
+    def __init__(self, histogram, *labelvalues):
+        """
+            Starts the timer.
+
+        :param histogram: (Histogram) Histogram labelled with the given label values plus the phase.
+        :param labelvalues: Label values, other than the phase.
+        """
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+        self.start_time = self.last_time = perf_counter()
+
+    def lap(self, phase):
+        """
+            Records the time since the prior lap as the specified phase.
+
+        :param phase: (str) Phase name.
+        :return: None
+        """
+        now = perf_counter()
+        self.histogram.observe(now - self.last_time, *(self.labelvalues + (phase,)))
+        self.last_time = now
+
+    def finish(self, phase="total"):
+        """
+            Records the time since the timer was started as the specified phase.
+
+        :param phase: (str) Phase name.
+        :return: None
+        """
+        self.histogram.observe(perf_counter() - self.start_time, *(self.labelvalues + (phase,)))
+
+
+def iter_timed(iterable, times, phase):
+    """
+        Iterates over the specified iterable, adding the time spent producing its items to times[phase]. Useful to
+        tell apart the phases of a pipeline of generators.
+
+    :param iterable: (iterable) Items.
+    :param times: (dict) Seconds spent per phase. IT IS AN INPUT/OUTPUT PARAMETER.
+    :param phase: (str) Phase name.
+    :return: (generator) The same items.
+    """
+    iterator = iter(iterable)
+
+    while True:
+        start_time = perf_counter()
+
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            times[phase] = times.get(phase, 0.0) + perf_counter() - start_time
+
+        yield item
+
+
+class Registry():
+    """
+        Set of metrics exposed together.
+    """
+
+    def __init__(self):
+        """
+            Initializes an empty registry.
+        """
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        """
+            Adds a metric.
+
+        :param metric: (Counter/Histogram) Metric.
+        :return: The metric.
+        """
+        self.metrics.append(metric)
+
+        return metric
+
+    def register_collector(self, collector):
+        """
+            Adds a function that returns the current values of other components, when the metrics are exposed.
+
+        :param collector: (callable) Returns a list of tuples (<name>, <type>, <help>, [(<labels>, <value>)]), with
+            <type> being "counter" or "gauge".
+        :return: The collector.
+        """
+        self.collectors.append(collector)
+
+        return collector
+
+    def render(self):
+        """
+            Returns all the metrics following the Prometheus text format (version 0.0.4).
+
+        :return: (str) Metrics.
+        """
+        lines = []
+
+        for metric in self.metrics:
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.type))
+            for name, labels, value in metric.get_samples():
+                lines.append("{}{} {}".format(name, format_labels(labels), format_value(value)))
+
+        for collector in self.collectors:
+            for name, metric_type, help, samples in collector():
+                lines.append("# HELP {} {}".format(name, help))
+                lines.append("# TYPE {} {}".format(name, metric_type))
+                for labels, value in samples:
+                    lines.append("{}{} {}".format(name, format_labels(labels), format_value(value)))
+
+        return "\n".join(lines) + "\n"
+
+
+class QueryCounter():
+    """
+        Counts the queries run on the default database connection (see django.db.connection.execute_wrapper).
+    """
+
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+
+        return execute(sql, params, many, context)
+
+
+#
+# METRICS OF THIS PROCESS
+#
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    "badi_requests_total", "Number of HTTP requests.", ("route", "method", "status")))
+
+request_seconds = registry.register(Histogram(
+    "badi_request_duration_seconds", "Time spent serving each HTTP request.", ("route", "method")))
+
+request_queries = registry.register(Histogram(
+    "badi_request_db_queries", "Number of DB queries run by each HTTP request.", ("route",), QUERY_BUCKETS))
+
+phase_seconds = registry.register(Histogram(
+    "badi_phase_duration_seconds", "Time spent on each phase of a request.", ("view", "phase")))
+
+apartments_computed = registry.register(Counter(
+    "badi_apartments_computed_total", "Number of apartments whose sunlight hours were computed."))
+
+rows_written = registry.register(Counter(
+    "badi_db_rows_written_total", "Number of rows written when saving cities and buildings.", ("operation",)))
+
+result_cache_lookups = registry.register(Counter(
+    "badi_result_cache_lookups_total", "Number of neighbourhoods of a saved city looked up in the stored ones.",
+    ("result",)))
+
+
+class MetricsMiddleware():
+    """
+        Records the duration, status and number of DB queries of each HTTP request. Requests are labelled by their
+        route (not by their path), so the number of series is bounded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_counter = QueryCounter()
+        start_time = perf_counter()
+
+        with connection.execute_wrapper(query_counter):
+            response = self.get_response(request)
+
+        elapsed_seconds = perf_counter() - start_time
+
+        resolver_match = getattr(request, "resolver_match", None)
+        route = resolver_match.route if resolver_match is not None else "unknown"
+
+        requests_total.inc(1, route, request.method, str(response.status_code))
+        request_seconds.observe(elapsed_seconds, route, request.method)
+        request_queries.observe(query_counter.queries, route)
+
+        return response
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.3 on 2026-10-18 17:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('name', models.CharField(max_length=128, primary_key=True, serialize=False)),
+                ('dawn', models.CharField(max_length=5)),
+                ('sunset', models.CharField(max_length=5)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Neighbourhood',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=128)),
+                ('apartments_height', models.IntegerField()),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='badi.City')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Building',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=128)),
+                ('floors', models.IntegerField()),
+                ('east_position', models.IntegerField()),
+                ('prev_distance', models.IntegerField()),
+                ('next_distance', models.IntegerField()),
+                ('neighbourhood', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='badi.Neighbourhood')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Apartment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('floor', models.IntegerField()),
+                ('dawn', models.CharField(max_length=5)),
+                ('sunset', models.CharField(max_length=5)),
+                ('building', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='badi.Building')),
+            ],
+        ),
+    ]
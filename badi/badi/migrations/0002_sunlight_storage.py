@@ -0,0 +1,160 @@
+# Generated by Django 2.2.3 on 2026-10-18 17:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from ..clock import parse_time, get_sunlight_minutes
+
+
+def set_minutes(apps, schema_editor):
+    """
+        Fills the dawn and sunset of the stored cities and apartments in minutes since midnight, from their times
+        (HH:MM).
+    """
+    for city in apps.get_model('badi', 'City').objects.all():
+        city.dawn_minutes = parse_time(city.dawn)
+        city.sunset_minutes = parse_time(city.sunset)
+        city.save(update_fields=['dawn_minutes', 'sunset_minutes'])
+
+    for apartment in apps.get_model('badi', 'Apartment').objects.all().iterator():
+        apartment.dawn_minutes = parse_time(apartment.dawn)
+        apartment.sunset_minutes = parse_time(apartment.sunset)
+        apartment.sunlight_minutes = get_sunlight_minutes(apartment.dawn_minutes, apartment.sunset_minutes)
+        apartment.save(update_fields=['dawn_minutes', 'sunset_minutes', 'sunlight_minutes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('badi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apartment',
+            name='dawn_minutes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='apartment',
+            name='neighbourhood_rank',
+            field=models.IntegerField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='apartment',
+            name='sunlight_minutes',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='apartment',
+            name='sunset_minutes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='east_angles',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='west_angles',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='calendar_dawn',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='calendar_sunset',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='dawn_minutes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='last_version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='mode',
+            field=models.CharField(default='eager', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='revision',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='sunset_minutes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='neighbourhood',
+            name='content_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='neighbourhood',
+            name='sunlit_counts',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='neighbourhood',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='apartment',
+            unique_together={('building', 'floor')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='building',
+            unique_together={('neighbourhood', 'name')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='neighbourhood',
+            unique_together={('city', 'name', 'version')},
+        ),
+        migrations.CreateModel(
+            name='YearlySunlight',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('floor', models.IntegerField()),
+                ('dawn', models.BinaryField()),
+                ('sunset', models.BinaryField()),
+                ('building', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='badi.Building')),
+            ],
+            options={
+                'unique_together': {('building', 'floor')},
+            },
+        ),
+        migrations.CreateModel(
+            name='FloorRange',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('floor_from', models.IntegerField()),
+                ('floor_to', models.IntegerField()),
+                ('dawn_minutes', models.IntegerField()),
+                ('sunset_minutes', models.IntegerField()),
+                ('sunlight_minutes', models.IntegerField(db_index=True, default=0)),
+                ('neighbourhood_rank', models.IntegerField(db_index=True, null=True)),
+                ('building', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='badi.Building')),
+            ],
+            options={
+                'unique_together': {('building', 'floor_from')},
+            },
+        ),
+        migrations.RunPython(set_minutes, migrations.RunPython.noop),
+    ]
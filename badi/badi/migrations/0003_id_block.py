@@ -0,0 +1,20 @@
+# Generated by Django 2.2.3 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('badi', '0002_sunlight_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdBlock',
+            fields=[
+                ('table', models.CharField(max_length=128, primary_key=True, serialize=False)),
+                ('next_id', models.IntegerField()),
+            ],
+        ),
+    ]
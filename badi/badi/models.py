@@ -6,6 +6,8 @@
 
 from django.db import models
 
+from .constants import EAGER_MODE
+
 
 class City(models.Model):
     """
@@ -19,6 +21,26 @@ class City(models.Model):
     dawn = models.CharField(max_length=5)
     # The time when the sunlight ends in this city
     sunset = models.CharField(max_length=5)
+    # Same as dawn, in minutes since midnight
+    dawn_minutes = models.IntegerField(default=0)
+    # Same as sunset, in minutes since midnight
+    sunset_minutes = models.IntegerField(default=0)
+    # Published version of the city content. Only the neighbourhoods of this version are visible
+    version = models.IntegerField(default=0)
+    # Last allocated version. Versions above the published one are being built (or were abandoned)
+    last_version = models.IntegerField(default=0)
+    # Bumped on each change of the published version in place (e.g., a building change). Along with the version, it
+    # identifies the content of the city (e.g., for HTTP caching)
+    revision = models.IntegerField(default=0)
+    # How the sunlight hours of the published version are stored: one row per apartment (.constants.EAGER_MODE), not at
+    # all, so they are computed when looked up (.constants.LAZY_MODE), or one row per floor range
+    # (.constants.COMPRESSED_MODE)
+    mode = models.CharField(max_length=16, default=EAGER_MODE)
+    # The time when the sunlight starts in this city on each day of the year (see .yearly.pack_minutes). None if the
+    # city has no calendar
+    calendar_dawn = models.BinaryField(null=True)
+    # The time when the sunlight ends in this city on each day of the year (see calendar_dawn)
+    calendar_sunset = models.BinaryField(null=True)
 
     def __str__(self):
 
@@ -36,6 +58,19 @@ class Neighbourhood(models.Model):
     apartments_height = models.IntegerField()
     # The city in which is located this neighbourhood
     city = models.ForeignKey(City, on_delete=models.CASCADE)
+    # Version of the city content this neighbourhood belongs to (see City.version)
+    version = models.IntegerField(default=0)
+    # Hash of the content this neighbourhood was stored from (see .content_hash). When the city is initialized again,
+    # a neighbourhood with the same hash is moved to the new version instead of being computed and written again. None
+    # if it is not known
+    content_hash = models.CharField(max_length=64, null=True)
+    # Number of sunlit apartments at each minute of the day (see .sunlight_hours.get_sunlit_counts), packed (see
+    # .sunlight_hours.pack_counts). None in lazy mode
+    sunlit_counts = models.BinaryField(null=True)
+
+    class Meta:
+        # Neighbourhoods are looked up by name within a city version
+        unique_together = (("city", "name", "version"),)
 
     def __str__(self):
 
@@ -60,6 +95,16 @@ class Building(models.Model):
     prev_distance = models.IntegerField()
     # Distance to the next building in the same Neighbourhood. -1 means that this is the last from the East.
     next_distance = models.IntegerField()
+    # Angle of the highest shadow from the east on each floor (see .sunlight_hours.pack_angles), so the sunlight hours
+    # of its apartments are rescaled to other dawn and sunset times without computing the shadows again. None if the
+    # city is stored in lazy mode (see City.mode)
+    east_angles = models.BinaryField(null=True)
+    # Same as east_angles, but with the shadows from the west
+    west_angles = models.BinaryField(null=True)
+
+    class Meta:
+        # Buildings are looked up by name within a neighbourhood
+        unique_together = (("neighbourhood", "name"),)
 
     def __str__(self):
 
@@ -81,8 +126,94 @@ class Apartment(models.Model):
     dawn = models.CharField(max_length=5)
     # The time when the sunlight ends in this apartment
     sunset = models.CharField(max_length=5)
+    # Same as dawn, in minutes since midnight
+    dawn_minutes = models.IntegerField(default=0)
+    # Same as sunset, in minutes since midnight
+    sunset_minutes = models.IntegerField(default=0)
+    # Minutes of sunlight (see .clock.get_sunlight_minutes). Indexed, so apartments can be queried by sunlight duration
+    sunlight_minutes = models.IntegerField(default=0, db_index=True)
+    # Position (from 1) in the sunlight ranking of its neighbourhood (see .sunlight_hours.get_ranking). None if it is
+    # not among the first .constants.RANKING_SIZE ones. Indexed, so the top apartments are read without sorting
+    neighbourhood_rank = models.IntegerField(null=True, db_index=True)
+
+    class Meta:
+        # Apartments are looked up by floor within a building
+        unique_together = (("building", "floor"),)
 
     def __str__(self):
 
         return "< id={}, building={}, floor={}, dawn={}, sunset={} >".format(self.id, self.building.name, self.floor,
                                                                              self.dawn, self.sunset)
+
+
+class FloorRange(models.Model):
+    """
+        Floor Range Entity. There will be a row in this table for each run of consecutive floors of a building with the
+        same sunlight hours, instead of one Apartment row per floor (see .constants.COMPRESSED_MODE).
+    """
+    id = models.IntegerField(primary_key=True)
+    # The building where is located
+    building = models.ForeignKey(Building, on_delete=models.CASCADE)
+    # The lowest floor of the run (from 0 to N-1)
+    floor_from = models.IntegerField()
+    # The highest floor of the run (from floor_from to N-1)
+    floor_to = models.IntegerField()
+    # The time when the sunlight starts in these apartments, in minutes since midnight
+    dawn_minutes = models.IntegerField()
+    # The time when the sunlight ends in these apartments, in minutes since midnight
+    sunset_minutes = models.IntegerField()
+    # Minutes of sunlight of these apartments (see Apartment.sunlight_minutes)
+    sunlight_minutes = models.IntegerField(default=0, db_index=True)
+    # Position of floor_from in the sunlight ranking of its neighbourhood (see Apartment.neighbourhood_rank). The
+    # other floors of the run take the next positions
+    neighbourhood_rank = models.IntegerField(null=True, db_index=True)
+
+    class Meta:
+        # The run of a floor is the last one that starts at or below it
+        unique_together = (("building", "floor_from"),)
+
+    def __str__(self):
+
+        return "< id={}, building={}, floor_from={}, floor_to={}, dawn_minutes={}, sunset_minutes={} >".format(
+            self.id, self.building.name, self.floor_from, self.floor_to, self.dawn_minutes, self.sunset_minutes)
+
+
+class YearlySunlight(models.Model):
+    """
+        Yearly Sunlight Entity. There will be a row in this table for each apartment of a city with a calendar (see
+        City.calendar_dawn), with its sunlight hours on each day of the year (see .yearly).
+    """
+    id = models.IntegerField(primary_key=True)
+    # The building where is located
+    building = models.ForeignKey(Building, on_delete=models.CASCADE)
+    # The building floor that occupies (from 0 to N-1)
+    floor = models.IntegerField()
+    # The time when the sunlight starts in this apartment on each day of the year (see .yearly.pack_minutes)
+    dawn = models.BinaryField()
+    # The time when the sunlight ends in this apartment on each day of the year (see .yearly.pack_minutes)
+    sunset = models.BinaryField()
+
+    class Meta:
+        # Apartments are looked up by floor within a building
+        unique_together = (("building", "floor"),)
+
+    def __str__(self):
+
+        return "< id={}, building={}, floor={} >".format(self.id, self.building.name, self.floor)
+
+
+class IdBlock(models.Model):
+    """
+        Id Block Entity. There will be a row in this table for each table whose primary keys are assigned by the app
+        (see .controller.CityWriter.reserve_ids), with the next one that has not been reserved yet. Blocks of keys are
+        reserved by moving it forward within a transaction, so writers of different processes never get the same
+        keys.
+    """
+    # Name of the table (e.g., badi_apartment)
+    table = models.CharField(max_length=128, primary_key=True)
+    # Next primary key of the table that has not been reserved yet
+    next_id = models.IntegerField()
+
+    def __str__(self):
+
+        return "< table={}, next_id={} >".format(self.table, self.next_id)
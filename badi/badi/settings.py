@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'badi.metrics.MetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'badi.urls'
@@ -152,3 +153,77 @@ LOGGING = {
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Badi
+
+# Backend used to compute the sunlight hours on /init: "python" or "numpy" (requires NumPy to be installed)
+SUNLIGHT_BACKEND = "python"
+
+# Mode of storing the sunlight hours on /init: "eager" (computed and stored for every apartment), "lazy" (only the
+# buildings are stored, and each apartment is computed, and cached, when it is looked up) or "compressed" (computed, and
+# stored as runs of consecutive floors with the same sunlight hours). Results are the same
+SUNLIGHT_MODE = "eager"
+
+# JSON file with the dawn and sunset of the city on each day of the year: 365 [dawn, sunset] pairs (HH:MM), from
+# January 1st. If set, the sunlight hours of every apartment are also computed, and stored, for each day on /init (see
+# the /sunlight_hours/<neighbourhood>/<building>/<apartment>/calendar API endpoint). None disables it
+SUNLIGHT_CALENDAR = None
+
+# Number of processes used to compute the sunlight hours on /init. Neighbourhoods are shared out among them (1 means
+# no process pool)
+SUNLIGHT_WORKERS = 1
+
+# Whether the neighbourhoods of an /init that are the same as the stored ones (same buildings, dawn, sunset, mode and
+# calendar) are reused instead of being computed and written again. An /init that changes nothing does not write at all
+RESULT_CACHE = True
+
+# Maximum number of rows inserted per statement when saving a city
+SAVE_BATCH_SIZE = 2000
+
+# Data base health: seconds between liveness checks, consecutive failed queries that open the circuit breaker, and
+# seconds the circuit stays open before letting requests try again
+DB_HEALTH_CHECK_INTERVAL = 5
+DB_CIRCUIT_FAILURE_THRESHOLD = 3
+DB_CIRCUIT_COOLDOWN = 30
+
+# In-process apartment lookup cache: maximum number of apartments (0 disables it) and seconds each one is kept
+APARTMENT_CACHE_SIZE = 100000
+APARTMENT_CACHE_TTL = 60
+
+# Maximum number of apartments per batch sunlight hours request
+BATCH_MAX_SIZE = 5000
+
+# Number of apartments per page of the /apartments API endpoint, by default and at most
+QUERY_PAGE_SIZE = 100
+QUERY_MAX_PAGE_SIZE = 1000
+
+# Number of apartments of the /apartments/top API endpoint by default, and positions of the sunlight ranking stored
+# per neighbourhood on /init (the most it can return; a change needs a new /init)
+TOP_SIZE = 10
+RANKING_SIZE = 100
+
+# Minimum number of bytes read at a time from the /init request body, that is parsed one neighbourhood at a time
+STREAM_CHUNK_SIZE = 65536
+
+# Asynchronous /init: whether it is the default mode (it can also be requested per call with ?async=true), maximum
+# number of jobs waiting to be run and maximum number of jobs whose status is kept
+INIT_ASYNC = False
+INIT_QUEUE_SIZE = 4
+INIT_JOBS_KEPT = 100
+
+# Whether the prior versions of a city are removed on a background thread after publishing a new one on /init
+CITY_GC_IN_BACKGROUND = True
+
+# City snapshots: directory where /init writes a memory-mapped snapshot of each city, used to answer the lookups without
+# the data base (None disables them; it must be shared by all the processes, e.g. os.path.join(BASE_DIR, "snapshots")),
+# and seconds between checks for a snapshot published by another process
+SNAPSHOT_DIR = None
+SNAPSHOT_RELOAD_INTERVAL = 1
+
+# Seconds the responses of the GET sunlight hours lookups can be cached by HTTP caches (Cache-Control max-age). After
+# that, they are revalidated with their ETag
+SUNLIGHT_HOURS_MAX_AGE = 60
+
+# Maximum number of neighbourhood horizons kept in memory to compute the apartments of cities stored in lazy mode
+HORIZON_CACHE_SIZE = 1000
@@ -0,0 +1,454 @@
+#!/bin/python3
+
+"""
+    Read-optimised binary snapshots of the published version of a city, so apartment lookups can be answered without
+    querying the data base.
+
+    A snapshot file holds (all the integers are little-endian):
+
+        - Header (see HEADER).
+        - Floors: (<dawn_minutes>, <sunset_minutes>) of each apartment, as unsigned 16-bit integers. The floors of a
+          building are contiguous, from 0 to N-1. MISSING_MINUTES marks a floor without apartment.
+        - Neighbourhoods: one RECORD per neighbourhood, sorted by name (UTF-8 bytes): (<name_offset>, <name_length>,
+          <first_building>, <building_count>).
+        - Buildings: one RECORD per building, sorted by name (UTF-8 bytes) within each neighbourhood: (<name_offset>,
+          <name_length>, <first_floor>, <floor_count>).
+        - Names: UTF-8 names, referred by offset (from the start of this section) and length.
+
+    IMPLEMENTATION NOTE: Snapshots are memory-mapped and looked up in place (a binary search over the sorted records),
+    so nothing is loaded into the memory of the process: several processes (e.g., gunicorn workers) share the same
+    pages through the OS page cache. A snapshot is never modified: each publication writes a new file and then
+    atomically replaces the pointer file of the city, which the processes check periodically (see SnapshotStore).
+"""
+
+import mmap
+import os
+from logging import getLogger
+from struct import Struct
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import monotonic, time_ns
+from urllib.parse import quote
+
+from django.conf import settings
+
+from .clock import format_time, get_sunlight_minutes
+from .constants import SNAPSHOT_DIR, SNAPSHOT_RELOAD_INTERVAL
+from .models import Apartment
+
+# Get an instance of a logger
+logger = getLogger(__name__)
+
+MAGIC = b"BADISNAP"
+FORMAT_VERSION = 2
+
+# (<magic>, <format_version>, <city_version>, <city_revision>, <neighbourhood_count>, <building_count>, <floor_count>,
+#  <neighbourhoods_offset>, <buildings_offset>, <names_offset>, <names_length>)
+HEADER = Struct("<8sIQQIIIQQQQ")
+RECORD = Struct("<IIII")
+FLOOR = Struct("<HH")
+
+MISSING_MINUTES = 0xFFFF
+
+
+class CitySnapshot():
+    """
+        Memory-mapped snapshot of a city (see module documentation).
+    """
+
+    def __init__(self, path):
+        """
+            Maps the specified snapshot file.
+
+        :param path: (str) Snapshot file path.
+        :raise: (ValueError) If it is not a valid snapshot file.
+        :raise: (OSError) If it can not be read.
+        """
+        self.path = path
+
+        with open(path, "rb") as snapshot_file:
+            size = os.fstat(snapshot_file.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError("Invalid snapshot file: {}".format(path))
+
+            # The mapping stays valid after closing the file (or even after removing it)
+            self.data = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, self.version, self.revision, self.neighbourhood_count, self.building_count, \
+            self.floor_count, self.neighbourhoods_offset, self.buildings_offset, self.names_offset, names_length = \
+            HEADER.unpack_from(self.data)
+
+        if magic != MAGIC or format_version != FORMAT_VERSION or \
+                HEADER.size + self.floor_count * FLOOR.size > self.neighbourhoods_offset or \
+                self.neighbourhoods_offset + self.neighbourhood_count * RECORD.size > self.buildings_offset or \
+                self.buildings_offset + self.building_count * RECORD.size > self.names_offset or \
+                self.names_offset + names_length > size:
+            self.data.close()
+            raise ValueError("Invalid snapshot file: {}".format(path))
+
+    def find(self, records_offset, start, count, name):
+        """
+            Binary search of a name over sorted records.
+
+        :param records_offset: (int) Offset of the records section.
+        :param start: (int) Index of the first record to search.
+        :param count: (int) Number of records to search.
+        :param name: (bytes) UTF-8 name.
+        :return: (tuple) The record (see RECORD). None if not found.
+        """
+        data = self.data
+        names_offset = self.names_offset
+        low = start
+        high = start + count
+
+        while low < high:
+            middle = (low + high) // 2
+            record = RECORD.unpack_from(data, records_offset + middle * RECORD.size)
+            offset = names_offset + record[0]
+            current = data[offset:offset + record[1]]
+
+            if current < name:
+                low = middle + 1
+            elif current > name:
+                high = middle
+            else:
+                return record
+
+        return None
+
+    def get_minutes(self, neighbourhood_name, building_name, floor):
+        """
+            Looks up the minutes of the specified apartment.
+
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :param building_name: (str) Building name.
+        :param floor: (int) Apartment floor.
+        :return: (tuple) (<dawn_minutes>, <sunset_minutes>). None if the apartment does not exist.
+        """
+        neighbourhood = self.find(self.neighbourhoods_offset, 0, self.neighbourhood_count,
+                                  neighbourhood_name.encode())
+        if neighbourhood is None:
+            return None
+
+        building = self.find(self.buildings_offset, neighbourhood[2], neighbourhood[3], building_name.encode())
+        if building is None or not 0 <= floor < building[3]:
+            return None
+
+        minutes = FLOOR.unpack_from(self.data, HEADER.size + (building[2] + floor) * FLOOR.size)
+
+        return None if minutes[0] == MISSING_MINUTES else minutes
+
+    def get_apartment(self, neighbourhood_name, building_name, floor):
+        """
+            Looks up the specified apartment.
+
+        :param neighbourhood_name: (str) Neighbourhood name.
+        :param building_name: (str) Building name.
+        :param floor: (int) Apartment floor.
+        :return: (.models.Apartment) Information of the apartment (not bound to any data base row). None if it does not
+            exist.
+        """
+        minutes = self.get_minutes(neighbourhood_name, building_name, floor)
+        if minutes is None:
+            return None
+
+        return Apartment(floor=floor, dawn=format_time(minutes[0]), sunset=format_time(minutes[1]),
+                         dawn_minutes=minutes[0], sunset_minutes=minutes[1],
+                         sunlight_minutes=get_sunlight_minutes(minutes[0], minutes[1]))
+
+    def iter_neighbourhoods(self, skip=()):
+        """
+            Reads the content of the snapshot, one neighbourhood at a time, so it can be written again (e.g., along
+            with a changed neighbourhood, see .controller.Controller.save_city_snapshot). The floors of each building
+            are returned packed, as they are stored.
+
+        :param skip: (collection of str) Names of the neighbourhoods that are not returned.
+        :return: (generator) Neighbourhoods, following the format of write_snapshot.
+        """
+        data = self.data
+        names_offset = self.names_offset
+
+        def get_name(record):
+            offset = names_offset + record[0]
+            return data[offset:offset + record[1]].decode()
+
+        for index in range(self.neighbourhood_count):
+            neighbourhood = RECORD.unpack_from(data, self.neighbourhoods_offset + index * RECORD.size)
+            neighbourhood_name = get_name(neighbourhood)
+            if neighbourhood_name in skip:
+                continue
+
+            buildings = []
+            for building_index in range(neighbourhood[2], neighbourhood[2] + neighbourhood[3]):
+                building = RECORD.unpack_from(data, self.buildings_offset + building_index * RECORD.size)
+                first_floor = HEADER.size + building[2] * FLOOR.size
+                buildings.append((get_name(building), data[first_floor:first_floor + building[3] * FLOOR.size]))
+
+            yield neighbourhood_name, buildings
+
+    def close(self):
+        """
+            Unmaps the snapshot. Lookups still running on it would fail, so it is only called when discarding it.
+
+        :return: None
+        """
+        self.data.close()
+
+
+def write_snapshot(snapshot_file, version, neighbourhoods, revision=0):
+    """
+        Writes a snapshot of a city.
+
+    :param snapshot_file: (file) Binary file, opened for writing and seeking.
+    :param version: (int) City version.
+    :param neighbourhoods: (iterable) Neighbourhoods, in any order. Each one follows the format:
+
+                (<neighbourhood_name>, [(<building_name>, [(<dawn_minutes>, <sunset_minutes>)])])
+
+            with the minutes of each floor, from 0 to N-1 (None for a floor without apartment). The floors of a
+            building can also be given already packed (bytes), as read from another snapshot (see
+            CitySnapshot.iter_neighbourhoods).
+
+    :param revision: (int) City revision (see .models.City.revision).
+    :return: None
+    :raise: (struct.error) If any minutes do not fit in the floor format (see FLOOR).
+
+    IMPLEMENTATION NOTE: Floors are written while the neighbourhoods are received, so only the names are kept in
+    memory.
+    """
+    names = bytearray()
+    neighbourhood_records = []
+    building_records = []
+    floor_count = 0
+
+    def add_name(name):
+        encoded = name.encode()
+        names.extend(encoded)
+        return encoded, len(names) - len(encoded), len(encoded)
+
+    snapshot_file.seek(HEADER.size)
+
+    for neighbourhood_name, building_list in neighbourhoods:
+        buildings = []
+
+        for building_name, floors in building_list:
+            if isinstance(floors, bytes):
+                snapshot_file.write(floors)
+                count = len(floors) // FLOOR.size
+            else:
+                for minutes in floors:
+                    snapshot_file.write(FLOOR.pack(*minutes) if minutes is not None else
+                                        FLOOR.pack(MISSING_MINUTES, MISSING_MINUTES))
+                count = len(floors)
+
+            buildings.append((add_name(building_name), floor_count, count))
+            floor_count += count
+
+        encoded, offset, length = add_name(neighbourhood_name)
+        neighbourhood_records.append((encoded, offset, length, len(building_records), len(buildings)))
+
+        buildings.sort(key=lambda building: building[0][0])
+        building_records.extend((offset, length, first_floor, count)
+                                for (_, offset, length), first_floor, count in buildings)
+
+    neighbourhood_records.sort(key=lambda record: record[0])
+
+    neighbourhoods_offset = HEADER.size + floor_count * FLOOR.size
+    buildings_offset = neighbourhoods_offset + len(neighbourhood_records) * RECORD.size
+    names_offset = buildings_offset + len(building_records) * RECORD.size
+
+    for _, offset, length, first_building, count in neighbourhood_records:
+        snapshot_file.write(RECORD.pack(offset, length, first_building, count))
+
+    for record in building_records:
+        snapshot_file.write(RECORD.pack(*record))
+
+    snapshot_file.write(names)
+
+    snapshot_file.seek(0)
+    snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, revision, len(neighbourhood_records),
+                                    len(building_records), floor_count, neighbourhoods_offset, buildings_offset,
+                                    names_offset, len(names)))
+
+
+class SnapshotStore():
+    """
+        Directory of city snapshots, shared by all the processes that serve the lookups.
+
+        Each city has a pointer file (<city>.current) with the name of its current snapshot file. Publishing a snapshot
+        writes a new file and then replaces the pointer file with an atomic rename. Each process checks the pointer
+        file of a city at most once per reload interval, and maps the new snapshot when it changes, so a new /init
+        served by another process is seen within that interval.
+
+        It is safe to use from several threads at once.
+    """
+
+    def __init__(self, directory=None, reload_interval=None, clock=monotonic):
+        """
+            Initializes the store.
+
+        :param directory: (str) Directory of the snapshot files. If not specified, the one in the SNAPSHOT_DIR
+            setting is used (None there disables the snapshots).
+        :param reload_interval: (float) Seconds between checks of the pointer file of a city. If not specified, the
+            one in the SNAPSHOT_RELOAD_INTERVAL setting is used.
+        :param clock: (callable) Returns the current time in seconds.
+        """
+        self.directory = directory if directory is not None else getattr(settings, "SNAPSHOT_DIR", SNAPSHOT_DIR)
+        self.reload_interval = reload_interval if reload_interval is not None else \
+            getattr(settings, "SNAPSHOT_RELOAD_INTERVAL", SNAPSHOT_RELOAD_INTERVAL)
+        self.clock = clock
+
+        # {<city>: (<snapshot_file_name>, <snapshot>)}
+        self.snapshots = {}
+        # {<city>: <time of the last check of its pointer file>}
+        self.checked_at = {}
+        self.lock = Lock()
+
+    def is_enabled(self):
+        """
+            Tells if the snapshots are enabled.
+
+        :return: (bool) True if they are enabled; False otherwise.
+        """
+        return self.directory is not None
+
+    def get_pointer_path(self, city):
+        """
+            Returns the path of the pointer file of the specified city.
+
+        :param city: (str) City name.
+        :return: (str) Path.
+        """
+        return os.path.join(self.directory, "{}.current".format(quote(city, safe="")))
+
+    def get(self, city):
+        """
+            Returns the current snapshot of the specified city, reloading it if another one was published.
+
+        :param city: (str) City name.
+        :return: (CitySnapshot) Snapshot. None if there is no snapshot of the city (or they are disabled).
+        """
+        if self.directory is None:
+            return None
+
+        now = self.clock()
+        if now - self.checked_at.get(city, float("-inf")) >= self.reload_interval:
+            self.checked_at[city] = now
+            self.reload(city)
+
+        current = self.snapshots.get(city)
+
+        return current[1] if current is not None else None
+
+    def reload(self, city):
+        """
+            Maps the snapshot named by the pointer file of the specified city, if it changed.
+
+        :param city: (str) City name.
+        :return: None
+        """
+        try:
+            with open(self.get_pointer_path(city)) as pointer_file:
+                file_name = pointer_file.read().strip()
+
+        except FileNotFoundError:
+            file_name = None
+
+        except OSError as e:
+            logger.warning("While reading the snapshot pointer of city {}: {}".format(city, e))
+            return
+
+        with self.lock:
+            current = self.snapshots.get(city)
+
+            if current is not None and current[0] == file_name:
+                return
+
+            if file_name is None:
+                self.snapshots.pop(city, None)
+                return
+
+            try:
+                self.snapshots[city] = (file_name, CitySnapshot(os.path.join(self.directory, file_name)))
+
+            except (OSError, ValueError) as e:
+                # Lookups go to the data base meanwhile
+                logger.warning("While loading snapshot {} of city {}: {}".format(file_name, city, e))
+                self.snapshots.pop(city, None)
+
+    def publish(self, city, version, neighbourhoods, revision=0):
+        """
+            Writes a new snapshot of the specified city and makes it the current one. Prior snapshot files of the city
+            are removed (processes that still map them keep reading them until they reload).
+
+        :param city: (str) City name.
+        :param version: (int) City version.
+        :param neighbourhoods: (iterable) Neighbourhoods (see write_snapshot).
+        :param revision: (int) City revision (see .models.City.revision).
+        :return: None
+        :raise: (OSError) If the snapshot can not be written.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        prefix = "{}-".format(quote(city, safe=""))
+        file_name = "{}{}-{}.snapshot".format(prefix, version, time_ns())
+
+        with NamedTemporaryFile(dir=self.directory, prefix=prefix, suffix=".tmp", delete=False) as snapshot_file:
+            try:
+                write_snapshot(snapshot_file, version, neighbourhoods, revision)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+
+            except BaseException:
+                snapshot_file.close()
+                os.remove(snapshot_file.name)
+                raise
+
+        os.replace(snapshot_file.name, os.path.join(self.directory, file_name))
+        self.set_pointer(city, file_name)
+
+        for other in os.listdir(self.directory):
+            if other.startswith(prefix) and other.endswith(".snapshot") and other != file_name:
+                try:
+                    os.remove(os.path.join(self.directory, other))
+                except OSError:
+                    pass
+
+        # This process sees it right away
+        self.checked_at[city] = self.clock()
+        self.reload(city)
+
+    def set_pointer(self, city, file_name):
+        """
+            Atomically replaces the pointer file of the specified city.
+
+        :param city: (str) City name.
+        :param file_name: (str) Name of the snapshot file.
+        :return: None
+        """
+        pointer_path = self.get_pointer_path(city)
+
+        with NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as pointer_file:
+            pointer_file.write(file_name)
+
+        os.replace(pointer_file.name, pointer_path)
+
+    def unpublish(self, city):
+        """
+            Removes the pointer file of the specified city, so every process goes back to the data base for its
+            lookups (e.g., when its new snapshot could not be written).
+
+        :param city: (str) City name.
+        :return: None
+        """
+        try:
+            os.remove(self.get_pointer_path(city))
+
+        except FileNotFoundError:
+            pass
+
+        self.checked_at[city] = self.clock()
+        self.reload(city)
+
+
+snapshot_store = SnapshotStore()
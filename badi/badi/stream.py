@@ -0,0 +1,138 @@
+#!/bin/python3
+
+"""
+    Tools to parse JSON documents incrementally, while they are being read.
+"""
+
+from codecs import getincrementaldecoder
+from json import JSONDecodeError, JSONDecoder
+
+from .constants import STREAM_CHUNK_SIZE
+
+
+class NotAJSONArrayError(ValueError):
+    pass
+
+
+WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(stream, chunk_size=STREAM_CHUNK_SIZE, encoding="utf-8"):
+    """
+        Iterates over the elements of the JSON array contained in the specified stream, reading it in chunks. Only one
+        element is decoded at a time, so the memory used is bounded by the size of the largest element (not by the size
+        of the whole array).
+
+    :param stream: (file-like object) Stream that contains a JSON array (e.g., an HTTP request). Only its read(size)
+        method is used.
+    :param chunk_size: (int) Minimum number of bytes read at a time.
+    :param encoding: (str) Encoding of the stream.
+    :return: (generator) Each element of the array, already decoded.
+    :raises json.JSONDecodeError: If the stream does not contain a valid JSON document.
+    :raises NotAJSONArrayError: If the stream contains a valid JSON value that is not an array.
+    """
+    decoder = JSONDecoder()
+    text_decoder = getincrementaldecoder(encoding)()
+
+    buffer = ""
+    position = 0
+    exhausted = False
+
+    def read(size):
+        nonlocal buffer, position, exhausted
+
+        data = stream.read(size)
+        if not data:
+            exhausted = True
+            data = b""
+
+        # Drop the already parsed text
+        buffer = buffer[position:] + text_decoder.decode(data, final=exhausted)
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+
+            if position < len(buffer) or exhausted:
+                return
+
+            read(chunk_size)
+
+    #
+    # OPENING BRACKET
+    #
+
+    skip_whitespace()
+    if position == len(buffer):
+        raise JSONDecodeError("Expecting value", buffer, position)
+
+    if buffer[position] != "[":
+        # Tell a valid JSON value that is not an array from an invalid document
+        while not exhausted:
+            read(chunk_size)
+        decoder.decode(buffer)
+        raise NotAJSONArrayError("Expecting a JSON array")
+
+    position += 1
+
+    #
+    # ELEMENTS
+    #
+
+    expecting_element = True
+    first = True
+
+    while True:
+        skip_whitespace()
+        if position == len(buffer):
+            raise JSONDecodeError("Expecting ',' delimiter or ']'", buffer, position)
+
+        if buffer[position] == "]" and (first or not expecting_element):
+            break
+
+        if not expecting_element:
+            if buffer[position] != ",":
+                raise JSONDecodeError("Expecting ',' delimiter", buffer, position)
+
+            position += 1
+            expecting_element = True
+            continue
+
+        # Decode the next element, reading more data while it is incomplete
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+
+                # A number at the end of the buffer could continue in the next chunk
+                if end < len(buffer) or exhausted:
+                    break
+
+            except JSONDecodeError:
+                if exhausted:
+                    raise
+
+            # Read at least as much as already buffered, so each element is decoded an amortized constant number of
+            # times
+            read(max(chunk_size, len(buffer) - position))
+
+        position = end
+        expecting_element = False
+        first = False
+
+        yield element
+
+        # Release the element before decoding the next one
+        del element
+
+    #
+    # TRAILING DATA
+    #
+
+    position += 1
+    skip_whitespace()
+    if position != len(buffer):
+        raise JSONDecodeError("Extra data", buffer, position)
@@ -4,7 +4,23 @@
     Module that gathers tools to compute sunlight hours.
 """
 
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappop, heappush, nsmallest
+from itertools import accumulate
+from logging import getLogger
 from math import atan, degrees
+from sys import byteorder
+
+from .clock import MINUTES_PER_HOUR, MINUTES_PER_DAY, parse_time, format_time, get_shadow_minutes, get_seconds_per_grade
+from .constants import PYTHON_BACKEND, NUMPY_BACKEND
+from .horizon import WestHorizon
+from . import vectorized
+
+# Get an instance of a logger
+logger = getLogger(__name__)
 
 
 def get_apartment_dawn(angle, city_seconds_per_grade, city_dawn):
@@ -29,27 +45,7 @@ def get_apartment_dawn(angle, city_seconds_per_grade, city_dawn):
 
     :return: (str) The local time when starts the sunlight in the apartment. Follows the same format as city_dawn.
     """
-    elapsed_seconds_from_dawn = int(angle * city_seconds_per_grade)
-    elapsed_hours_from_dawn = 0
-    elapsed_minutes_from_dawn = int(elapsed_seconds_from_dawn/60)
-
-    while elapsed_minutes_from_dawn > 59:
-        elapsed_hours_from_dawn = int(elapsed_minutes_from_dawn/60)
-        elapsed_minutes_from_dawn -= elapsed_hours_from_dawn * 60
-
-    city_dawn_hour_int = int(city_dawn.split(':')[0])
-    city_dawn_minute_int = int(city_dawn.split(':')[1])
-
-    apartment_dawn_hour_int = city_dawn_hour_int + elapsed_hours_from_dawn
-    apartment_dawn_minute_int = city_dawn_minute_int + elapsed_minutes_from_dawn
-
-    while apartment_dawn_minute_int > 59:
-        apartment_dawn_minute_int = apartment_dawn_minute_int - 60
-        apartment_dawn_hour_int += 1
-
-    result = "{}:{}".format(str(apartment_dawn_hour_int).rjust(2, '0'), str(apartment_dawn_minute_int).rjust(2, '0'))
-
-    return result
+    return format_time(parse_time(city_dawn) + get_shadow_minutes(angle, city_seconds_per_grade))
 
 
 def get_apartment_sunset(angle, city_seconds_per_grade, city_sunset):
@@ -74,28 +70,7 @@ def get_apartment_sunset(angle, city_seconds_per_grade, city_sunset):
 
     :return: (str) The local time when starts the sunlight in the apartment. Follows the same format as city_sunset.
     """
-    remaining_seconds_until_sunset = int(angle * city_seconds_per_grade)
-    remaining_hours_until_sunset = 0
-    remaining_minutes_until_sunset = int(remaining_seconds_until_sunset/60)
-
-    while remaining_minutes_until_sunset > 59:
-        remaining_hours_until_sunset = int(remaining_minutes_until_sunset/60)
-        remaining_minutes_until_sunset -= remaining_hours_until_sunset * 60
-
-    city_sunset_hour_int = int(city_sunset.split(':')[0])
-    city_sunset_minute_int = int(city_sunset.split(':')[1])
-
-    apartment_sunset_hour_int = city_sunset_hour_int - remaining_hours_until_sunset
-    apartment_sunset_minute_int = city_sunset_minute_int - remaining_minutes_until_sunset
-
-    while apartment_sunset_minute_int < 0:
-        apartment_sunset_minute_int = apartment_sunset_minute_int + 60
-        apartment_sunset_hour_int -= 1
-
-    result = "{}:{}".format(str(apartment_sunset_hour_int).rjust(2, '0'),
-                            str(apartment_sunset_minute_int).rjust(2, '0'))
-
-    return result
+    return format_time(parse_time(city_sunset) - get_shadow_minutes(angle, city_seconds_per_grade))
 
 
 def elapsed_time(start_time, end_time):
@@ -118,20 +93,7 @@ def elapsed_time(start_time, end_time):
                         <hours>: (int) Number of hours elapsed
                         <minutes>: (int) Number of minutes elapsed
     """
-    start_time_hour_int = int(start_time.split(':')[0])
-    start_time_minute_int = int(start_time.split(':')[1])
-
-    end_time_hour_int = int(end_time.split(':')[0])
-    end_time_minute_int = int(end_time.split(':')[1])
-
-    elapsed_minutes = end_time_minute_int - start_time_minute_int
-    elapsed_hours = end_time_hour_int - start_time_hour_int
-
-    if elapsed_minutes < 0:
-        elapsed_minutes += 60
-        elapsed_hours -= 1
-
-    return elapsed_hours, elapsed_minutes
+    return divmod(parse_time(end_time) - parse_time(start_time), MINUTES_PER_HOUR)
 
 
 def get_max_west_shadow_details(index, building_list, floor):
@@ -142,6 +104,10 @@ def get_max_west_shadow_details(index, building_list, floor):
         IMPLEMENTATION NOTE: Since this function does not return angles, and the inner usage of angles is restricted to
         angle comparison, I will simplify angle = atan(angle), since both have the same comparison (performance reason).
 
+        IMPLEMENTATION NOTE: This function walks every building on the west, so it is O(N) per floor. It is kept as the
+        reference implementation; get_neighbourhood_sunlight_hours uses .horizon.WestHorizon instead, which answers
+        every floor of the neighbourhood in a single sweep.
+
     :param index: (int) Position of the building in the list of buildings (0 to N-1).
     :param building_list: (list of dict) Follows the same format as the field "buildings" within each
         neighbourhood specified in the init API endpoint described in the Code Challenge. That is:
@@ -229,12 +195,79 @@ def get_neighbourhood_sunlight_hours(building_list, city_dawn, city_sunset, apar
     :param apartment_height: (int) The height of the apartments.
     :return: None
     """
-    # Compute the number of elapsed seconds for each grade of the sunlight, assuming (as said in the Code Challenge)
-    # that the sun rises in the east and travels at a constant radial speed until setting
-    city_sunlight_hours, city_sunlight_minutes = elapsed_time(city_dawn, city_sunset)
+    compute_neighbourhood_sunlight_hours(building_list, parse_time(city_dawn), parse_time(city_sunset),
+                                         apartment_height)
+
+    for building in building_list:
+        building["dawn"] = [format_time(minutes) for minutes in building["dawn"]]
+        building["sunset"] = [format_time(minutes) for minutes in building["sunset"]]
+
+
+def compute_neighbourhood_sunlight_hours(building_list, city_dawn_minutes, city_sunset_minutes, apartment_height):
+    """
+        Same as get_neighbourhood_sunlight_hours, but receiving the city dawn and sunset already parsed, and adding the
+        dawn and sunset of each apartment as the number of minutes since midnight, so they are only formatted where
+        HH:MM is needed (see .clock.format_time). The angles of the shadows on each apartment are added to each
+        building too, as east_angles and west_angles (see get_neighbourhood_shadow_angles), so they can be stored and
+        rescaled to other dawn and sunset times.
+
+    :param building_list: (list of dict) Buildings of the neighbourhood (see get_neighbourhood_sunlight_hours).
+    :param city_dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+    :param city_sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+    :param apartment_height: (int) The height of the apartments.
+    :return: None
+    """
+    east_angles, west_angles = get_neighbourhood_shadow_angles(building_list, apartment_height)
+    dawn, sunset = rescale_neighbourhood_minutes(east_angles, west_angles, city_dawn_minutes, city_sunset_minutes)
+
+    for building, building_dawn, building_sunset, building_east_angles, building_west_angles in zip(
+            building_list, dawn, sunset, east_angles, west_angles):
+        building["dawn"] = building_dawn
+        building["sunset"] = building_sunset
+        building["east_angles"] = building_east_angles
+        building["west_angles"] = building_west_angles
+
+
+def get_neighbourhood_sunlight_minutes(building_list, city_dawn_minutes, city_sunset_minutes, apartment_height):
+    """
+        Computes the dawn and sunset of every apartment of the specified neighbourhood, as the number of minutes since
+        midnight (see get_neighbourhood_sunlight_hours).
 
-    city_sunlight_seconds = city_sunlight_hours * 3600 + city_sunlight_minutes * 60
-    city_seconds_per_grade = float(city_sunlight_seconds)/float(180)
+    :param building_list: (list of dict) Buildings of the neighbourhood (see get_neighbourhood_sunlight_hours).
+    :param city_dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+    :param city_sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+    :param apartment_height: (int) The height of the apartments.
+    :return: (tuple) Follows the format:
+
+                    (<dawn>, <sunset>)
+
+                with
+                    <dawn>: (list of list of int) For each building (sorted from east to west), the dawn of each
+                        apartment (sorted from the lowest to the highest floor), in minutes since midnight.
+                    <sunset>: (list of list of int) Same as dawn, but with the sunset of each apartment.
+    """
+    east_angles, west_angles = get_neighbourhood_shadow_angles(building_list, apartment_height)
+
+    return rescale_neighbourhood_minutes(east_angles, west_angles, city_dawn_minutes, city_sunset_minutes)
+
+
+def get_east_shadow_details(building_list):
+    """
+        Returns the building on the east that creates the highest shadow from the east on each building of the
+        specified neighbourhood, in a single sweep from east to west.
+
+    :param building_list: (list of dict) Buildings of the neighbourhood (see get_neighbourhood_sunlight_hours).
+    :return: (list of tuple) For each building (sorted from east to west), follows the format:
+
+                    (<max_east_shadow_index>, <max_east_shadow_distance>)
+
+                with:
+
+                    <max_east_shadow_index> : (int) Position of the building that creates the highest shadow on the
+                        east in the list of buildings (0 to N-1). -1 if there is no shadow.
+                    <max_east_shadow_distance> : (int) Distance used to measure the shadow. 0 if there is no shadow.
+    """
+    result = []
 
     # Maximum shadow angle from the obstacles on the east.
     max_east_shadow_angle = 0
@@ -246,8 +279,88 @@ def get_neighbourhood_sunlight_hours(building_list, city_dawn, city_sunset, apar
     max_east_shadow_index = -1
 
     for index, building in enumerate(building_list):
-        dawn = []
-        sunset = []
+        result.append((max_east_shadow_index, max_east_shadow_distance))
+
+        # Update distance
+        acc_east_distance += building["distance"]
+
+        # Before proceeding with the next building on the west, update the max east shadow with the current building
+        # (if proceeds)
+        angle = float(building["apartments_count"]) / float(building["distance"])
+        if angle > max_east_shadow_angle:
+            max_east_shadow_angle = angle
+            max_east_shadow_index = index
+            max_east_shadow_distance = acc_east_distance
+
+    return result
+
+
+def get_shadow_angle(obstacle_floors, floor, distance, apartment_height):
+    """
+        Returns the angle of the shadow that an obstacle projects on the specified floor. Notice that the higher the
+        floor the lower the shadow.
+
+    :param obstacle_floors: (int) Number of floors of the obstacle.
+    :param floor: (int) Floor of the apartment (0 to N-1).
+    :param distance: (int) Distance to the obstacle. 0 means that there is no obstacle.
+    :param apartment_height: (int) The height of the apartments.
+    :return: (float) Angle (in degrees).
+    """
+    try:
+        return degrees(atan(((float(obstacle_floors) - float(floor))*apartment_height)/float(distance)))
+
+    except ZeroDivisionError:
+        # There are no obstacles
+        return 0
+
+
+def get_neighbourhood_shadow_angles(building_list, apartment_height):
+    """
+        Returns the angles of the highest shadows on every apartment of the specified neighbourhood. They only depend
+        on the buildings, not on the city dawn and sunset, so they are the same for any dawn and sunset (see
+        rescale_neighbourhood_minutes) and on every day of the year (see .yearly).
+
+    :param building_list: (list of dict) Buildings of the neighbourhood (see get_neighbourhood_sunlight_hours).
+    :param apartment_height: (int) The height of the apartments.
+    :return: (tuple) Follows the format:
+
+                    (<east_angles>, <west_angles>)
+
+                with
+                    <east_angles>: (list of list of float) For each building (sorted from east to west), the angle of
+                        the highest shadow from the east on each apartment (sorted from the lowest to the highest
+                        floor), in grades. 0 if there is no shadow.
+                    <west_angles>: (list of list of float) Same as east_angles, but with the shadows from the west.
+    """
+    return get_buildings_shadow_angles(building_list, apartment_height, range(len(building_list)))
+
+
+def get_buildings_shadow_angles(building_list, apartment_height, indexes):
+    """
+        Same as get_neighbourhood_shadow_angles, but only for the specified buildings of the neighbourhood (e.g., the
+        ones whose shadows may have changed, see get_changed_buildings).
+
+    :param building_list: (list of dict) Buildings of the neighbourhood (see get_neighbourhood_sunlight_hours).
+    :param apartment_height: (int) The height of the apartments.
+    :param indexes: (iterable of int) Positions of the buildings (from east to west).
+    :return: (tuple) (<east_angles>, <west_angles>), as returned by get_neighbourhood_shadow_angles, but only with the
+        specified buildings (in the same order).
+    """
+    # Highest shadow from the east of every building, and west horizon of the neighbourhood, computed in a single sweep
+    # each
+    east_shadow_details = get_east_shadow_details(building_list)
+    west_horizon = WestHorizon(building_list)
+
+    east_angles = []
+    west_angles = []
+
+    for index in indexes:
+        building = building_list[index]
+        building_east_angles = []
+        building_west_angles = []
+        west_shadow_details = west_horizon.get_building_west_shadow_details(index)
+
+        max_east_shadow_index, max_east_shadow_distance = east_shadow_details[index]
 
         for floor in range(building["apartments_count"]):
 
@@ -255,53 +368,182 @@ def get_neighbourhood_sunlight_hours(building_list, city_dawn, city_sunset, apar
             # EAST SIDE
             #
 
-            # Get angle of the highest shadow on the east. Notice that the higher the floor the lower the shadow from
-            # other obstacles.
+            # Get angle of the highest shadow on the east (inlined get_shadow_angle, as this is the hot loop of
+            # /init)
             try:
                 angle = degrees(atan(((float(building_list[max_east_shadow_index]["apartments_count"]) -
                                       float(floor))*apartment_height)/float(max_east_shadow_distance)))
 
-            except (ZeroDivisionError, IndexError):
+            except ZeroDivisionError:
                 # The first building has no obstacles on the east
                 angle = 0
 
-            dawn.append(get_apartment_dawn(angle, city_seconds_per_grade, city_dawn))
+            building_east_angles.append(angle)
 
             #
             # WEST SIDE
             #
 
-            max_west_shadow_index, max_west_shadow_distance = get_max_west_shadow_details(index, building_list, floor)
+            max_west_shadow_index, max_west_shadow_distance = west_shadow_details[floor]
 
-            # Get angle of the highest shadow on the west. Notice that the higher the floor the lower the shadow from
-            # other obstacles.
+            # Get angle of the highest shadow on the west (see get_shadow_angle)
             try:
                 angle = degrees(atan(((float(building_list[max_west_shadow_index]["apartments_count"]) -
                                       float(floor))*apartment_height)/float(max_west_shadow_distance)))
 
-            except (ZeroDivisionError, IndexError):
+            except ZeroDivisionError:
                 # The last building has no obstacles on the west
                 angle = 0
 
-            sunset.append(get_apartment_sunset(angle, city_seconds_per_grade, city_sunset))
+            building_west_angles.append(angle)
 
-        # Update building info
-        building["dawn"] = dawn
-        building["sunset"] = sunset
+        east_angles.append(building_east_angles)
+        west_angles.append(building_west_angles)
 
-        # Update distance
-        acc_east_distance += building["distance"]
+    return east_angles, west_angles
 
-        # Before proceeding with the next building on the west, update the max east shadow with the current building
-        # (if proceeds)
-        angle = float(building["apartments_count"]) / float(building["distance"])
-        if angle > max_east_shadow_angle:
-            max_east_shadow_angle = angle
-            max_east_shadow_index = index
-            max_east_shadow_distance = acc_east_distance
 
+def get_changed_buildings(prior_building_list, building_list):
+    """
+        Returns the buildings of a neighbourhood whose shadows may have changed after some of its buildings were
+        inserted, changed or removed (see .controller.Controller.update_neighbourhood). The shadows of the other ones
+        are the same as before, so they do not need to be computed again.
+
+        Both lists share a prefix and a suffix of buildings that did not change (nor did the distances among them), with
+        the changed ones in between. Then:
+
+            - A building keeps its shadow from the east as long as the building that projects it keeps its height and
+              distance (see get_east_shadow_details), which is checked on every building, in O(N).
+            - The buildings of the suffix keep their shadows from the west, since the buildings on their west did not
+              move.
+            - The shadow from the west on a building of the prefix can only come from the changed buildings (or from
+              the suffix, if it moved) if no building in between is, at least, as tall as all of those: a nearer
+              building that is as tall projects a higher shadow (see .horizon.WestHorizon). So the prefix is only
+              affected from its end up to the first building on the east that is that tall.
+
+        Buildings are told apart by their name. If any distance is not positive (so positions do not grow from east to
+        west), every building is returned.
+
+    :param prior_building_list: (list of dict) Buildings of the neighbourhood before the change (see
+        get_neighbourhood_sunlight_hours).
+    :param building_list: (list of dict) Buildings of the neighbourhood after the change.
+    :return: (list of int) Positions of the buildings in building_list (from east to west).
+    """
+    size = len(building_list)
+    prior_size = len(prior_building_list)
+
+    if any(building["distance"] < 1
+           for buildings in (prior_building_list, building_list) for building in buildings[:-1]):
+        return list(range(size))
+
+    def is_same(prior_building, building):
+        return (prior_building["name"], prior_building["apartments_count"]) == (building["name"],
+                                                                                building["apartments_count"])
+
+    # Same buildings on the east, with the same distances among them (the distance of the last one may change)
+    prefix = 0
+    while prefix < min(prior_size, size) and is_same(prior_building_list[prefix], building_list[prefix]) and \
+            (prefix == 0 or prior_building_list[prefix - 1]["distance"] == building_list[prefix - 1]["distance"]):
+        prefix += 1
+
+    # Same buildings on the west, with the same distances among them
+    suffix = 0
+    while suffix < min(prior_size, size) - prefix and \
+            is_same(prior_building_list[prior_size - 1 - suffix], building_list[size - 1 - suffix]) and \
+            (suffix == 0 or prior_building_list[prior_size - 1 - suffix]["distance"] ==
+             building_list[size - 1 - suffix]["distance"]):
+        suffix += 1
+
+    # Buildings that may project a different shadow from the west on the prefix
+    obstacles = prior_building_list[prefix:prior_size - suffix] + building_list[prefix:size - suffix]
+    if prefix > 0 and suffix > 0 and \
+            sum(building["distance"] for building in prior_building_list[prefix - 1:prior_size - suffix]) != \
+            sum(building["distance"] for building in building_list[prefix - 1:size - suffix]):
+        # The suffix moved
+        obstacles += building_list[size - suffix:]
+
+    result = set(range(prefix, size - suffix))
+
+    if obstacles:
+        max_floors = max(building["apartments_count"] for building in obstacles)
+
+        for index in range(prefix - 1, -1, -1):
+            result.add(index)
+
+            if building_list[index]["apartments_count"] >= max_floors:
+                # It hides the obstacles from any building on its east
+                break
+
+    def get_east_obstacles(buildings):
+        return {building["name"]: None if obstacle_index == -1 else
+                (buildings[obstacle_index]["name"], buildings[obstacle_index]["apartments_count"], obstacle_distance)
+                for building, (obstacle_index, obstacle_distance) in zip(buildings, get_east_shadow_details(buildings))}
+
+    prior_east_obstacles = get_east_obstacles(prior_building_list)
+    east_obstacles = get_east_obstacles(building_list)
+    result.update(index for index, building in enumerate(building_list)
+                  if building["name"] not in prior_east_obstacles or
+                  prior_east_obstacles[building["name"]] != east_obstacles[building["name"]])
+
+    return sorted(result)
+
+
+def rescale_neighbourhood_minutes(east_angles, west_angles, city_dawn_minutes, city_sunset_minutes):
+    """
+        Computes the dawn and sunset of every apartment of a neighbourhood from the angles of its shadows (see
+        get_neighbourhood_shadow_angles). It is a linear rescale of the angles by the seconds per grade of the city,
+        so any other dawn and sunset (e.g., another day) is computed without searching the horizon again.
+
+    :param east_angles: (list of list of float) Angles of the shadows from the east (see
+        get_neighbourhood_shadow_angles).
+    :param west_angles: (list of list of float) Angles of the shadows from the west.
+    :param city_dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+    :param city_sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+    :return: (tuple) (<dawn>, <sunset>), as returned by get_neighbourhood_sunlight_minutes.
+    """
+    # Compute the number of elapsed seconds for each grade of the sunlight, assuming (as said in the Code Challenge)
+    # that the sun rises in the east and travels at a constant radial speed until setting
+    city_seconds_per_grade = get_seconds_per_grade(city_dawn_minutes, city_sunset_minutes)
 
-def compute_city_sunlight_hours(city_info, city_dawn, city_sunset):
+    dawn = [[city_dawn_minutes + get_shadow_minutes(angle, city_seconds_per_grade) for angle in building_angles]
+            for building_angles in east_angles]
+    sunset = [[city_sunset_minutes - get_shadow_minutes(angle, city_seconds_per_grade) for angle in building_angles]
+              for building_angles in west_angles]
+
+    return dawn, sunset
+
+
+def pack_angles(angles):
+    """
+        Packs the specified angles as an array of little-endian 64-bit floats, so they are stored as they were
+        computed (to the last bit) and the rescaled local times match the ones of a full computation.
+
+    :param angles: (iterable of float) Angles (in grades).
+    :return: (bytes) Packed angles.
+    """
+    values = array("d", angles)
+    if byteorder != "little":
+        values.byteswap()
+
+    return values.tobytes()
+
+
+def unpack_angles(data):
+    """
+        Unpacks the angles packed with pack_angles.
+
+    :param data: (bytes) Packed angles.
+    :return: (list of float) Angles (in grades).
+    """
+    values = array("d")
+    values.frombytes(bytes(data))
+    if byteorder != "little":
+        values.byteswap()
+
+    return values.tolist()
+
+
+def compute_city_sunlight_hours(city_info, city_dawn, city_sunset, backend=PYTHON_BACKEND, workers=1):
     """
         Given the info of a city updates this info computing, for each apartment, both the dawn and sunset hour. That
         is, it is computed both the time the sunlight starts and the time the sunlight ends for each apartment of the
@@ -329,20 +571,19 @@ def compute_city_sunlight_hours(city_info, city_dawn, city_sunset):
             { neighborhood: <name_string>, apartments_height: <number>,
               buildings: [{name:<name_string>, apartments_count: <number>, distance: <number>,
                           dawn: [<floor_0_dawn>, <floor_1_dawn> ... <floor_N-1_dawn>],
-                          sunset: [<floor_0_sunset>, <floor_1_sunset> ... <floor_N-1_sunset>]
+                          sunset: [<floor_0_sunset>, <floor_1_sunset> ... <floor_N-1_sunset>],
+                          east_angles: [<floor_0_east_angle>, ... <floor_N-1_east_angle>],
+                          west_angles: [<floor_0_west_angle>, ... <floor_N-1_west_angle>]
                           }]
             }
         ]
 
             with:
-                    <floor_N_dawn> and <floor_N_sunset> following the format
-
-                                                        HH:MM
-                            with
-                                    HH: Hour   (from '00' to '23')
-                                    MM: Minute (from '00' to '59')
+                    <floor_N_dawn> and <floor_N_sunset> being local times, as the number of minutes since midnight
+                    (e.g., 494 for '08:14'; see .clock.format_time).
 
-                            Examples: '08:14', '17:25'
+                    <floor_N_east_angle> and <floor_N_west_angle> being the angles of the highest shadows on the
+                    apartment (see get_neighbourhood_shadow_angles).
 
     :param city_dawn: (str) The local time when starts the sunlight in the city. Follows the format:
 
@@ -354,16 +595,493 @@ def compute_city_sunlight_hours(city_info, city_dawn, city_sunset):
                 Examples: '08:14', '17:25'
 
     :param city_sunset: (str) The local time when ends the sunlight in the city. Follows the same format as city_dawn.
+    :param backend: (str) The backend used to compute the sunlight hours. One of:
+
+                PYTHON_BACKEND: Pure Python. Each apartment is computed on its own.
+                NUMPY_BACKEND: NumPy. All the apartments of each neighbourhood are computed at once (see
+                    .vectorized). If NumPy is not installed, the pure Python backend is used instead.
+
+    :param workers: (int) Number of processes used to compute the city. If greater than 1, neighbourhoods are shared
+        out among a process pool (see compute_city_sunlight_hours_in_parallel). Results are the same in any case.
+    :return: (bool) True is successfully computed; False otherwise.
+    """
+    backend = get_backend(backend)
+    compute_neighbourhood = get_neighbourhood_function(backend)
+
+    result = True
+
+    try:
+        # Parse the city times only once
+        city_dawn_minutes = parse_time(city_dawn)
+        city_sunset_minutes = parse_time(city_sunset)
+
+        if workers > 1 and len(city_info) > 1:
+            result = compute_city_sunlight_hours_in_parallel(city_info, city_dawn_minutes, city_sunset_minutes,
+                                                             backend, workers)
+        else:
+            for neighbourhood in city_info:
+                compute_neighbourhood(neighbourhood["buildings"], city_dawn_minutes, city_sunset_minutes,
+                                      neighbourhood["apartments_height"])
+
+    except (TypeError, KeyError, ValueError):
+        result = False
+
+    return result
+
+
+def get_backend(backend):
+    """
+        Returns the backend that must be used to compute sunlight hours.
+
+    :param backend: (str) Requested backend (see compute_city_sunlight_hours).
+    :return: (str) The requested backend, or PYTHON_BACKEND if the requested one is not installed.
+    :raises ValueError: If the backend is not known.
+    """
+    if backend not in (PYTHON_BACKEND, NUMPY_BACKEND):
+        raise ValueError("Unknown sunlight hours backend: {}".format(backend))
+
+    if backend == NUMPY_BACKEND and not vectorized.is_available():
+        logger.warning("NumPy is not installed. Using {} backend instead.".format(PYTHON_BACKEND))
+        backend = PYTHON_BACKEND
+
+    return backend
+
+
+def get_neighbourhood_function(backend):
+    """
+        Returns the function that computes a neighbourhood with the specified backend.
+
+    :param backend: (str) An available backend (see get_backend).
+    :return: (callable) Follows the signature of compute_neighbourhood_sunlight_hours.
+    """
+    if backend == NUMPY_BACKEND:
+        return vectorized.compute_neighbourhood_sunlight_hours
+
+    return compute_neighbourhood_sunlight_hours
+
+
+#
+# PARALLEL EXECUTION
+#
+
+def get_neighbourhood_cost(neighbourhood):
+    """
+        Returns the estimated cost of computing the specified neighbourhood: the number of apartments (i.e., buildings
+        times floors) plus the number of buildings.
+
+    :param neighbourhood: (dict) Neighbourhood info (as described in the Code Challenge).
+    :return: (int) Estimated cost.
+    """
+    buildings = neighbourhood["buildings"]
+
+    return len(buildings) + sum(building["apartments_count"] for building in buildings)
+
+
+def get_balanced_shards(costs, shard_count):
+    """
+        Shares out the items among the specified number of shards, so that all of them have a similar total cost. Uses
+        the longest processing time first rule: items are taken from the most to the least expensive, and each one is
+        assigned to the shard with the lowest total cost so far. Ties are broken by position, so the result is
+        deterministic.
+
+    :param costs: (list of int) Estimated cost of each item.
+    :param shard_count: (int) Maximum number of shards.
+    :return: (list of list of int) Positions of the items assigned to each shard (sorted in ascending order). There
+        are no empty shards.
+    """
+    shards = [[] for _ in range(min(shard_count, len(costs)))]
+    loads = [(0, shard) for shard in range(len(shards))]
+
+    for index in sorted(range(len(costs)), key=lambda position: (-costs[position], position)):
+        load, shard = heappop(loads)
+        shards[shard].append(index)
+        heappush(loads, (load + costs[index], shard))
+
+    for shard in shards:
+        shard.sort()
+
+    return shards
+
+
+def compute_neighbourhood_shard(shard, city_dawn_minutes, city_sunset_minutes, backend):
+    """
+        Computes the dawn and sunset of every apartment of the specified neighbourhoods. It is run by the workers of
+        the process pool, so it only receives (and returns) the data that is really needed.
+
+    :param shard: (list of tuple) For each neighbourhood: (<building_list>, <apartments_height>).
+    :param city_dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+    :param city_sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+    :param backend: (str) An available backend (see get_backend).
+    :return: (list) For each neighbourhood, None if it is not valid; otherwise a list with the (<dawn>, <sunset>,
+        <east_angles>, <west_angles>) lists of each building (see compute_neighbourhood_sunlight_hours).
+    """
+    compute_neighbourhood = get_neighbourhood_function(backend)
+    results = []
+
+    for building_list, apartments_height in shard:
+        try:
+            compute_neighbourhood(building_list, city_dawn_minutes, city_sunset_minutes, apartments_height)
+            results.append([(building["dawn"], building["sunset"], building["east_angles"], building["west_angles"])
+                            for building in building_list])
+
+        except (TypeError, KeyError, ValueError):
+            results.append(None)
+
+    return results
+
+
+def set_neighbourhood_result(neighbourhood, result):
+    """
+        Adds the dawn, sunset and angles lists computed by compute_neighbourhood_shard to the specified neighbourhood.
+
+    :param neighbourhood: (dict) Neighbourhood info (as described in the Code Challenge).
+    :param result: (list) Result of the neighbourhood (see compute_neighbourhood_shard).
+    :return: (bool) True if the neighbourhood was successfully computed; False otherwise.
+    """
+    if result is None:
+        return False
+
+    for building, (dawn, sunset, east_angles, west_angles) in zip(neighbourhood["buildings"], result):
+        building["dawn"] = dawn
+        building["sunset"] = sunset
+        building["east_angles"] = east_angles
+        building["west_angles"] = west_angles
+
+    return True
+
+
+def compute_city_sunlight_hours_in_parallel(city_info, city_dawn_minutes, city_sunset_minutes, backend, workers):
+    """
+        Same as compute_city_sunlight_hours, but sharing out the neighbourhoods among a process pool. It can be done
+        since neighbourhoods are independent (see ASSUMPTION in get_neighbourhood_sunlight_hours).
+
+        There is one shard per worker, balanced by the estimated cost of each neighbourhood (see get_balanced_shards).
+        Results are written back to city_info by position, so they do not depend on the order in which shards end.
+
+    :param city_info: (list of dicts) City info (see compute_city_sunlight_hours). IT IS AN INPUT/OUTPUT PARAMETER.
+    :param city_dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+    :param city_sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+    :param backend: (str) An available backend (see get_backend).
+    :param workers: (int) Number of processes.
     :return: (bool) True is successfully computed; False otherwise.
     """
+    shards = get_balanced_shards([get_neighbourhood_cost(neighbourhood) for neighbourhood in city_info], workers)
     result = True
 
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        futures = [executor.submit(compute_neighbourhood_shard,
+                                   [(city_info[index]["buildings"], city_info[index]["apartments_height"])
+                                    for index in shard],
+                                   city_dawn_minutes, city_sunset_minutes, backend)
+                   for shard in shards]
+
+        for shard, future in zip(shards, futures):
+            for index, neighbourhood_result in zip(shard, future.result()):
+                result = set_neighbourhood_result(city_info[index], neighbourhood_result) and result
+
+    return result
+
+
+def iter_city_sunlight_hours(neighbourhoods, city_dawn, city_sunset, backend=PYTHON_BACKEND, workers=1, skip=None):
+    """
+        Computes the sunlight hours of each neighbourhood of the specified iterable (e.g., neighbourhoods that are
+        being parsed from a stream), yielding them in the same order.
+
+        If workers is greater than 1, neighbourhoods are computed by a process pool while the next ones are read. At
+        most two neighbourhoods per worker are in flight at once, so memory is still bounded by the largest
+        neighbourhoods, not by the whole city.
+
+    :param neighbourhoods: (iterable of dict) Neighbourhoods info (as described in the Code Challenge).
+    :param city_dawn: (str) The local time when starts the sunlight in the city (HH:MM).
+    :param city_sunset: (str) The local time when ends the sunlight in the city (HH:MM).
+    :param backend: (str) The backend used to compute the sunlight hours (see compute_city_sunlight_hours).
+    :param workers: (int) Number of processes used to compute the neighbourhoods.
+    :param skip: (callable) If specified, the neighbourhoods for which skip(<neighbourhood>) is True are yielded as
+        they are, without computing them (e.g., the ones whose sunlight hours are already stored).
+    :return: (generator) Follows the format:
+
+                    (<neighbourhood>, <computed>)
+
+                with
+                    <neighbourhood>: (dict) Neighbourhood info, including the dawn and sunset of each apartment
+                        (see compute_city_sunlight_hours).
+                    <computed>: (bool) True if successfully computed; False otherwise. None if skipped.
+    """
+    backend = get_backend(backend)
+
+    if workers <= 1:
+        for neighbourhood in neighbourhoods:
+            if skip is not None and skip(neighbourhood):
+                yield neighbourhood, None
+                continue
+
+            yield neighbourhood, compute_city_sunlight_hours([neighbourhood], city_dawn, city_sunset, backend)
+        return
+
+    city_dawn_minutes = parse_time(city_dawn)
+    city_sunset_minutes = parse_time(city_sunset)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def get_result(neighbourhood, future):
+            if future is None:
+                # Skipped
+                return None
+
+            return set_neighbourhood_result(neighbourhood, (future.result() or [None])[0])
+
+        for neighbourhood in neighbourhoods:
+            if skip is not None and skip(neighbourhood):
+                # Still queued, so the neighbourhoods are yielded in order
+                pending.append((neighbourhood, None))
+
+            else:
+                try:
+                    shard = [(neighbourhood["buildings"], neighbourhood["apartments_height"])]
+                except (TypeError, KeyError):
+                    shard = []
+
+                pending.append((neighbourhood, executor.submit(compute_neighbourhood_shard, shard, city_dawn_minutes,
+                                                               city_sunset_minutes, backend)))
+
+            while len(pending) > 2 * workers or (pending and (pending[0][1] is None or pending[0][1].done())):
+                neighbourhood, future = pending.popleft()
+                yield neighbourhood, get_result(neighbourhood, future)
+
+        while pending:
+            neighbourhood, future = pending.popleft()
+            yield neighbourhood, get_result(neighbourhood, future)
+
+
+#
+# ON DEMAND EXECUTION
+#
+
+def check_neighbourhood_geometry(neighbourhood):
+    """
+        Checks that the specified neighbourhood can be stored without computing its sunlight hours (see
+        NeighbourhoodHorizon): the values that the computation uses must be integers, as they are stored.
+
+    :param neighbourhood: (dict) Neighbourhood info (as described in the Code Challenge).
+    :return: (bool) True if it is valid; False otherwise.
+    """
     try:
-        for neighbourhood in city_info:
-            get_neighbourhood_sunlight_hours(neighbourhood["buildings"], city_dawn, city_sunset,
-                                             neighbourhood["apartments_height"])
+        if type(neighbourhood["apartments_height"]) is not int:
+            return False
+
+        for building in neighbourhood["buildings"]:
+            if not isinstance(building["name"], str) or type(building["apartments_count"]) is not int or \
+                    building["apartments_count"] < 0 or type(building["distance"]) is not int:
+                return False
+
+            # Same error as when computing the sunlight hours
+            if building["distance"] == 0:
+                return False
 
     except (TypeError, KeyError):
-        result = False
+        return False
+
+    return True
+
+
+class NeighbourhoodHorizon():
+    """
+        Sunlight hours of a neighbourhood, computed one apartment at a time (e.g., when the apartments are looked up).
+        Results are the same as get_neighbourhood_sunlight_minutes.
+
+        IMPLEMENTATION NOTE: The shadows from the east are computed for every building at once, in O(N), and the west
+        horizon is built in O(N log N) (see .horizon.WestHorizon). Then each apartment is answered in O(log N).
+    """
+
+    def __init__(self, building_list, city_dawn_minutes, city_sunset_minutes, apartment_height):
+        """
+            Builds the horizon of the specified neighbourhood.
+
+        :param building_list: (list of dict) Buildings of the neighbourhood (see get_neighbourhood_sunlight_hours).
+        :param city_dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+        :param city_sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+        :param apartment_height: (int) The height of the apartments.
+        """
+        self.building_list = building_list
+        self.city_dawn_minutes = city_dawn_minutes
+        self.city_sunset_minutes = city_sunset_minutes
+        self.apartment_height = apartment_height
+        self.city_seconds_per_grade = get_seconds_per_grade(city_dawn_minutes, city_sunset_minutes)
+
+        self.east_shadow_details = get_east_shadow_details(building_list)
+        self.west_horizon = WestHorizon(building_list)
+
+    def get_apartment_minutes(self, index, floor):
+        """
+            Computes the dawn and sunset of the specified apartment.
+
+        :param index: (int) Position of the building in the list of buildings (0 to N-1).
+        :param floor: (int) Floor of the apartment (0 to N-1).
+        :return: (tuple) (<dawn_minutes>, <sunset_minutes>), in minutes since midnight.
+        """
+        east_angle, west_angle = self.get_apartment_angles(index, floor)
+        dawn = self.city_dawn_minutes + get_shadow_minutes(east_angle, self.city_seconds_per_grade)
+        sunset = self.city_sunset_minutes - get_shadow_minutes(west_angle, self.city_seconds_per_grade)
+
+        return dawn, sunset
+
+    def get_apartment_angles(self, index, floor):
+        """
+            Computes the angles of the highest shadows on the specified apartment (see
+            get_neighbourhood_shadow_angles).
+
+        :param index: (int) Position of the building in the list of buildings (0 to N-1).
+        :param floor: (int) Floor of the apartment (0 to N-1).
+        :return: (tuple) (<east_angle>, <west_angle>), in grades.
+        """
+        building_list = self.building_list
+
+        max_east_shadow_index, max_east_shadow_distance = self.east_shadow_details[index]
+        east_angle = get_shadow_angle(building_list[max_east_shadow_index]["apartments_count"], floor,
+                                      max_east_shadow_distance, self.apartment_height)
+
+        max_west_shadow_index, max_west_shadow_distance = self.west_horizon.get_max_west_shadow_details(index, floor)
+        west_angle = get_shadow_angle(building_list[max_west_shadow_index]["apartments_count"], floor,
+                                      max_west_shadow_distance, self.apartment_height)
+
+        return east_angle, west_angle
+
+
+#
+# FLOOR RANGES
+#
+
+def get_floor_ranges(dawn, sunset):
+    """
+        Compresses the sunlight hours of the floors of a building into runs of consecutive floors with the same ones.
+        Floors above the highest obstacle on each side all get the same dawn (or sunset), so tall buildings compress
+        into a few runs.
+
+    :param dawn: (list) Dawn of each floor (from 0 to N-1), in any format (e.g., "HH:MM" or minutes since midnight).
+    :param sunset: (list) Sunset of each floor, in the same format.
+    :return: (list of tuple) Runs, from lower to higher floor. Follows the format:
+
+                [(<floor_from>, <floor_to>, <dawn>, <sunset>)]
+
+    """
+    result = []
+
+    for floor, hours in enumerate(zip(dawn, sunset)):
+        if result and result[-1][2:] == hours:
+            result[-1] = result[-1][:1] + (floor,) + hours
+        else:
+            result.append((floor, floor) + hours)
 
     return result
+
+
+def find_floor_range(floor_ranges, floor):
+    """
+        Finds the run that contains the specified floor, with a binary search.
+
+    :param floor_ranges: (list of tuple) Runs, sorted by floor (see get_floor_ranges).
+    :param floor: (int) Floor.
+    :return: (tuple) The run. None if no run contains the floor.
+    """
+    # Runs that start at or below the floor come before (floor, inf)
+    index = bisect_right(floor_ranges, (floor, float("inf")))
+
+    if index == 0 or floor_ranges[index - 1][1] < floor:
+        return None
+
+    return floor_ranges[index - 1]
+
+
+#
+# RANKING
+#
+
+def get_ranking(items, size):
+    """
+        Ranks the apartments of a neighbourhood from the most to the least sunlight. Ties are broken by the position
+        of the building (from east to west) and then by the floor (from lower to higher), so the ranking does not
+        depend on the order in which the rows were stored.
+
+        IMPLEMENTATION NOTE: Only the first size positions are ranked, with a bounded heap (in O(N log size)).
+
+    :param items: (iterable of tuple) Runs of consecutive floors with the same sunlight (a single apartment is a run of
+        one floor). Follows the format:
+
+                (<sunlight_minutes>, <building_index>, <floor_from>, <floor_count>)
+
+    :param size: (int) Number of ranked positions.
+    :return: (dict) Rank (from 1 to size) of the first floor of each ranked run, keyed by (<building_index>,
+        <floor_from>). The floors of a run take consecutive positions.
+    """
+    result = {}
+    position = 1
+
+    for sunlight_minutes, building_index, floor_from, floor_count in nsmallest(
+            size, items, key=lambda item: (-item[0], item[1], item[2])):
+        if position > size:
+            break
+
+        result[(building_index, floor_from)] = position
+        position += floor_count
+
+    return result
+
+
+def get_sunlit_counts(items):
+    """
+        Counts the apartments of a neighbourhood that are sunlit at each minute of the day: from their dawn to their
+        sunset, both included (same as the sunlit_from and sunlit_until filters of .controller.Controller
+        .find_apartments).
+
+        IMPLEMENTATION NOTE: It is a sweep line. Each run of floors adds its count at its dawn and subtracts it right
+        after its sunset, and the running sum of those events is the count at each minute. So it costs O(N + M), with M
+        being the minutes of a day, and then the count at any time is a single read.
+
+    :param items: (iterable of tuple) Runs of consecutive floors with the same sunlight (a single apartment is a run of
+        one floor). Follows the format:
+
+                (<dawn_minutes>, <sunset_minutes>, <floor_count>)
+
+    :return: (list of int) Number of sunlit apartments at each minute of the day (MINUTES_PER_DAY items).
+    """
+    events = [0] * (MINUTES_PER_DAY + 1)
+
+    for dawn_minutes, sunset_minutes, floor_count in items:
+        dawn_minutes = max(dawn_minutes, 0)
+        sunset_minutes = min(sunset_minutes, MINUTES_PER_DAY - 1)
+
+        if dawn_minutes <= sunset_minutes:
+            events[dawn_minutes] += floor_count
+            events[sunset_minutes + 1] -= floor_count
+
+    return list(accumulate(events[:MINUTES_PER_DAY]))
+
+
+def pack_counts(counts):
+    """
+        Packs the specified counts as an array of little-endian unsigned 32-bit integers.
+
+    :param counts: (iterable of int) Counts (see get_sunlit_counts).
+    :return: (bytes) Packed counts.
+    """
+    values = array("I", counts)
+    if byteorder != "little":
+        values.byteswap()
+
+    return values.tobytes()
+
+
+def unpack_counts(data):
+    """
+        Unpacks the counts packed with pack_counts.
+
+    :param data: (bytes) Packed counts.
+    :return: (list of int) Counts.
+    """
+    values = array("I")
+    values.frombytes(bytes(data))
+    if byteorder != "little":
+        values.byteswap()
+
+    return values.tolist()
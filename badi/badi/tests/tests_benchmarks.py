@@ -0,0 +1,71 @@
+#!/bin/python3
+
+
+from django.test import TestCase
+
+from ..benchmarks.generator import generate_city, KINDS, LONG_STREET, MONOTONE_UP
+from ..benchmarks.suite import run_benchmarks, compare_results
+
+
+class BenchmarksTestCase(TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        pass
+
+    def test__generate_city__ok(self):
+        for kind in KINDS:
+            # Test main
+            city_info = generate_city(kind, neighbourhoods=3, buildings=50, max_floors=20, seed=7)
+
+            # Check results
+            self.assertEqual(city_info, generate_city(kind, neighbourhoods=3, buildings=50, max_floors=20, seed=7))
+            self.assertNotEqual(city_info, generate_city(kind, neighbourhoods=3, buildings=50, max_floors=20, seed=8))
+            self.assertEqual(len(city_info), 1 if kind == LONG_STREET else 3)
+
+            for neighbourhood in city_info:
+                self.assertEqual(len(neighbourhood["buildings"]), 150 if kind == LONG_STREET else 50)
+                self.assertEqual(neighbourhood["buildings"][-1]["distance"], -1)
+                self.assertTrue(all(1 <= building["apartments_count"] <= 20
+                                    for building in neighbourhood["buildings"]))
+
+        floors = [building["apartments_count"] for building in generate_city(MONOTONE_UP)[0]["buildings"]]
+        self.assertEqual(floors, sorted(floors))
+
+    def test__run_benchmarks__ok(self):
+        # Test main
+        results = run_benchmarks("tiny", repeat=1)
+
+        # Check results
+        self.assertEqual(results["meta"]["scale"], "tiny")
+        for prefix in ("compute.", "persist.", "lookup.", "http."):
+            self.assertTrue(any(name.startswith(prefix) for name in results["results"]), prefix)
+
+        for result in results["results"].values():
+            self.assertEqual(result["repeat"], 1)
+            self.assertGreater(result["items"], 0)
+            self.assertLessEqual(result["min"], result["median"])
+
+        # Only the selected ones
+        self.assertEqual(set(run_benchmarks("tiny", repeat=1, only="lookup.")["results"]),
+                         {"lookup.get_apartment_info.cold", "lookup.get_apartment_info.warm",
+                          "lookup.get_apartments_info.cold", "lookup.snapshot", "lookup.get_apartment_info.lazy.cold",
+                          "lookup.get_apartment_info.compressed.cold", "lookup.find_apartments",
+                          "lookup.get_top_apartments", "lookup.count_sunlit_apartments.cold"})
+        self.assertEqual(set(run_benchmarks("tiny", repeat=1, only=".cached.")["results"]),
+                         {"persist.save_city.cached.realistic", "http.init.cached.realistic"})
+
+    def test__compare_results__ok(self):
+        baseline = {"results": {"a": {"median": 1.0}, "b": {"median": 1.0}, "c": {"median": 1.0},
+                                "old": {"median": 1.0}}}
+        results = {"results": {"a": {"median": 1.5}, "b": {"median": 0.5}, "c": {"median": 1.1},
+                               "new": {"median": 1.0}}}
+
+        # Test main
+        comparison = compare_results(results, baseline, threshold=0.2)
+
+        # Check results
+        self.assertEqual([(item["name"], item["status"]) for item in comparison],
+                         [("a", "regression"), ("b", "improvement"), ("c", "same")])
+        self.assertAlmostEqual(comparison[0]["ratio"], 1.5)
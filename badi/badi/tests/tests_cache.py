@@ -0,0 +1,108 @@
+#!/bin/python3
+
+
+from threading import Thread
+from django.test import TestCase
+
+from ..cache import ApartmentCache
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ApartmentCacheTestCase(TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ApartmentCache(max_size=2, ttl=60, clock=self.clock)
+
+    def test__get__miss_and_hit__ok(self):
+        key = ("Barcelona", "RAVAL", "CCCB", 0)
+
+        # Test main
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, "apartment", self.cache.get_version())
+
+        # Check results
+        self.assertEqual(self.cache.get(key), "apartment")
+        self.assertEqual(self.cache.get_stats(), {"size": 1, "max_size": 2, "version": 0, "hits": 1, "misses": 1,
+                                                  "evictions": 0})
+
+    def test__put__evicts_least_recently_used__ok(self):
+        version = self.cache.get_version()
+        self.cache.put("a", 1, version)
+        self.cache.put("b", 2, version)
+
+        # Test main
+        self.cache.get("a")
+        self.cache.put("c", 3, version)
+
+        # Check results
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.get("c"), 3)
+        self.assertEqual(self.cache.get_stats()["evictions"], 1)
+
+    def test__invalidate__ok(self):
+        version = self.cache.get_version()
+        self.cache.put("a", 1, version)
+
+        # Test main
+        self.cache.invalidate()
+        # A value read before the invalidation must not be cached
+        self.cache.put("b", 2, version)
+
+        # Check results
+        self.assertIsNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get_stats()["size"], 0)
+
+    def test__get__expired__ok(self):
+        self.cache.put("a", 1, self.cache.get_version())
+
+        # Test main
+        self.clock.now = 61
+
+        # Check results
+        self.assertIsNone(self.cache.get("a"))
+
+    def test__get__tagged__ok(self):
+        self.cache.put("a", 1, self.cache.get_version(), (1, 0))
+
+        # Test main & Check results
+        self.assertEqual(self.cache.get("a", (1, 0)), 1)
+        self.assertIsNone(self.cache.get("a", (1, 1)))
+        # A mismatch drops the entry
+        self.assertIsNone(self.cache.get("a", (1, 0)))
+        self.assertEqual(self.cache.get_stats()["size"], 0)
+
+    def test__get__concurrent__ok(self):
+        cache = ApartmentCache(max_size=50, ttl=None)
+
+        def worker(offset):
+            for index in range(2000):
+                key = (index + offset) % 100
+                if cache.get(key) is None:
+                    cache.put(key, key, cache.get_version())
+
+        # Test main
+        threads = [Thread(target=worker, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Check results
+        stats = cache.get_stats()
+        self.assertEqual(stats["hits"] + stats["misses"], 8 * 2000)
+        self.assertLessEqual(stats["size"], 50)
+        for key in range(100):
+            self.assertIn(cache.get(key), (None, key))
@@ -2,13 +2,23 @@
 
 
 import os
+from copy import deepcopy
+from io import BytesIO
 from json import dumps
-from django.test import TestCase
+from random import Random
+from unittest import mock
+from django.db.models import F
+from django.test import TestCase, override_settings
 
 from ..settings import FIXTURE_DIRS
-from ..city import City
-from ..constants import DEFAULT_CITY, DEFAULT_CITY_VALUES
-from ..controller import Controller
+from ..city import City, CityInitializationError, ingest_city
+from ..clock import format_time, parse_time
+from ..constants import DAYS_PER_YEAR, DEFAULT_CITY, DEFAULT_CITY_VALUES, EAGER_MODE, LAZY_MODE, COMPRESSED_MODE
+from ..cache import apartment_cache
+from ..controller import Controller, CityWriter
+from ..metrics import apartments_computed
+from ..models import Apartment, Building, FloorRange, Neighbourhood, YearlySunlight, IdBlock, City as CityModel
+from .tests_yearly import get_test_calendar
 
 
 class CityTestCase(TestCase):
@@ -104,6 +114,14 @@ class CityTestCase(TestCase):
         self.assertEqual(new_city.name, DEFAULT_CITY)  # Default name
         self.assertEqual(new_city.dawn, DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"])  # Default dawn time
         self.assertEqual(new_city.sunset, DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"])  # Default sunset time
+        # The angles of the shadows on each apartment are added too (see tests_sunlight_hours), and the sunlight hours
+        # are minutes since midnight
+        for neighbourhood in new_city.info:
+            for building in neighbourhood["buildings"]:
+                building["dawn"] = [format_time(minutes) for minutes in building["dawn"]]
+                building["sunset"] = [format_time(minutes) for minutes in building["sunset"]]
+                self.assertEqual(len(building.pop("east_angles")), building["apartments_count"])
+                self.assertEqual(len(building.pop("west_angles")), building["apartments_count"])
         self.assertEqual(new_city.info, expected_city_info)  # City info with per apartment sunlight info
 
     def test__city_save__ok(self):
@@ -195,4 +213,1198 @@ class CityTestCase(TestCase):
                     self.assertEqual(apartment.building.name, building["name"])
                     self.assertEqual(apartment.floor, floor)
 
+    def test__city_save__twice__ok(self):
+        city_info = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             }
+        ]
+        new_city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "La Capella", "apartments_count": 2, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+
+        # Test main
+        self.assertTrue(Controller.save_city(City(city_info).info, batch_size=3))
+        self.assertTrue(Controller.save_city(City(new_city_info).info, batch_size=3))
+
+        # Check results
+        self.assertEqual(Neighbourhood.objects.count(), 1)
+        self.assertEqual(Building.objects.count(), 3)
+        self.assertEqual(Apartment.objects.count(), 9)
+        self.assertEqual(Controller.save_stats["rows"], 13)
+
+        self.assertIsNone(Controller.get_apartment_info({"neighbourhood": "POBLENOU", "building": "Aticco",
+                                                         "apartment": 0}))
+
+        apartment = Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 2})
+        self.assertEqual((apartment.dawn, apartment.sunset), ("11:28", "17:25"))
+        self.assertEqual((apartment.dawn_minutes, apartment.sunset_minutes), (688, 1045))
+
+    def test__get_apartment_info__single_query__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "La Capella", "apartments_count": 2, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        City(city_info).save()
+
+        # Test main
+        with self.assertNumQueries(1):
+            apartment = Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "La Capella",
+                                                       "apartment": 1})
+
+            # Check results
+            self.assertEqual(apartment.building.neighbourhood.name, "RAVAL")
+            self.assertEqual(apartment.building.name, "La Capella")
+            self.assertEqual((apartment.floor, apartment.dawn, apartment.sunset), (1, "12:06", "13:19"))
+
+    def test__get_apartment_info__cached__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        new_city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        apartment_info = {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 0}
+        City(city_info).save()
+
+        # Test main
+        apartment = Controller.get_apartment_info(apartment_info)
+        with self.assertNumQueries(0):
+            cached_apartment = Controller.get_apartment_info(apartment_info)
+
+        # Check results
+        self.assertIs(cached_apartment, apartment)
+        self.assertEqual(cached_apartment.dawn, "12:20")
+
+        # A new city invalidates the cached apartments
+        City(new_city_info).save()
+        self.assertEqual(Controller.get_apartment_info(apartment_info).dawn, "08:14")
+
+    def test__get_apartment_info__published_by_other_process__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        new_city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        apartment_info = {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 0}
+        now = [0]
+
+        with mock.patch.object(apartment_cache, "clock", lambda: now[0]):
+            City(city_info).save()
+            # The state of the city is cached when it is saved, and the apartment some time later
+            now[0] = 50
+            tag = Controller.get_city_tag()
+            Controller.get_apartment_info(apartment_info)
+
+            # Test main: another process publishes a new city, so the cache of this one is not invalidated
+            with mock.patch.object(apartment_cache, "invalidate"):
+                City(new_city_info).save()
+            prior = (Controller.get_city_tag(), Controller.get_apartment_info(apartment_info).dawn,
+                     Controller.get_apartments_info([apartment_info])[0].dawn)
+
+            # The state of the city expires before the apartment does
+            now[0] = 70
+            current = (Controller.get_city_tag(), Controller.get_apartment_info(apartment_info).dawn,
+                       Controller.get_apartments_info([apartment_info])[0].dawn)
+
+        # Check results: the body of a lookup is never older than its tag
+        self.assertEqual(prior, (tag, "12:20", "12:20"))
+        self.assertNotEqual(current[0], tag)
+        self.assertEqual(current[1:], ("08:14", "08:14"))
+
+    def test__get_apartments_info__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "La Capella", "apartments_count": 2, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        City(city_info).save()
+
+        apartment_info_list = [{"neighbourhood": "RAVAL", "building": building, "apartment": floor}
+                               for building, floors in (("Santa Monica", 3), ("La Capella", 2), ("CCCB", 5))
+                               for floor in range(floors)]
+
+        # Test main
+        with self.assertNumQueries(2):
+            apartments = Controller.get_apartments_info(apartment_info_list)
+
+        # Check results
+        self.assertEqual(len(apartments), 10)
+        self.assertIsNone(apartments[-1])
+        for apartment_info, apartment in zip(apartment_info_list[:-1], apartments):
+            self.assertEqual(apartment.building.name, apartment_info["building"])
+            self.assertEqual(apartment.floor, apartment_info["apartment"])
+
+        # All of them are cached now
+        with self.assertNumQueries(0):
+            Controller.get_apartments_info(apartment_info_list[:-1])
+
+    def test__ingest_city__ok(self):
+        city_info = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "La Capella", "apartments_count": 2, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        stream = BytesIO(dumps(city_info).encode("utf-8"))
+
+        # Test main
+        result = ingest_city(stream, chunk_size=16)
+
+        # Check results
+        self.assertTrue(result)
+        self.assertEqual(Neighbourhood.objects.count(), 2)
+        self.assertEqual(Building.objects.count(), 7)
+        self.assertEqual(Apartment.objects.count(), 29)
+
+        # Same result as loading the whole city at once
+        expected_city_info = City(city_info).info
+        for neighbourhood in expected_city_info:
+            for building in neighbourhood["buildings"]:
+                for floor in range(building["apartments_count"]):
+                    apartment = Controller.get_apartment_info({"neighbourhood": neighbourhood["neighborhood"],
+                                                               "building": building["name"], "apartment": floor})
+                    self.assertEqual((apartment.dawn, apartment.sunset),
+                                     (format_time(building["dawn"][floor]), format_time(building["sunset"][floor])))
+
+    def test__ingest_city__invalid_neighbourhood__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        new_city_info = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "GRACIA", "apartments_height": 1, "buildings": [{"name": "Verdi"}]}
+        ]
+        self.assertTrue(ingest_city(BytesIO(dumps(city_info).encode("utf-8"))))
+
+        # Test main
+        with self.assertRaises(CityInitializationError):
+            ingest_city(BytesIO(dumps(new_city_info).encode("utf-8")), chunk_size=16)
+
+        # Check results: the prior city is untouched
+        self.assertEqual(list(Neighbourhood.objects.values_list("name", flat=True)), ["RAVAL"])
+        self.assertEqual(Apartment.objects.count(), 4)
+
+    def check_city_info(self, city_info):
+        for neighbourhood in City(deepcopy(city_info)).info:
+            for building in neighbourhood["buildings"]:
+                for floor in range(building["apartments_count"]):
+                    apartment = Controller.get_apartment_info({"neighbourhood": neighbourhood["neighborhood"],
+                                                               "building": building["name"], "apartment": floor})
+                    self.assertEqual((apartment.dawn, apartment.sunset),
+                                     (format_time(building["dawn"][floor]), format_time(building["sunset"][floor])))
+
+    def test__ingest_city__result_cache__ok(self):
+        city_info = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "GRACIA", "apartments_height": 1, "buildings":
+                [{"name": "Verdi", "apartments_count": 2, "distance": -1}
+                 ]
+             }
+        ]
+        new_city_info = deepcopy(city_info)
+        new_city_info[1]["buildings"][0]["apartments_count"] = 5
+        self.assertTrue(ingest_city(BytesIO(dumps(city_info).encode("utf-8"))))
+        neighbourhood_ids = dict(Neighbourhood.objects.values_list("name", "id"))
+        computed = apartments_computed.get()
+
+        # Test main
+        result = ingest_city(BytesIO(dumps(new_city_info).encode("utf-8")))
+
+        # Check results: only the changed neighbourhood is computed and written
+        self.assertTrue(result)
+        self.assertEqual(apartments_computed.get() - computed, 9)
+        self.assertEqual((Controller.save_stats["rows"], Controller.save_stats["reused"],
+                          Controller.save_stats["neighbourhoods"]), (1 + 2 + 9, 2, 3))
+
+        new_neighbourhood_ids = dict(Neighbourhood.objects.values_list("name", "id"))
+        self.assertEqual(new_neighbourhood_ids["POBLENOU"], neighbourhood_ids["POBLENOU"])
+        self.assertEqual(new_neighbourhood_ids["GRACIA"], neighbourhood_ids["GRACIA"])
+        self.assertNotEqual(new_neighbourhood_ids["RAVAL"], neighbourhood_ids["RAVAL"])
+        self.assertEqual(Apartment.objects.count(), 9 + 9 + 2)
+        self.check_city_info(new_city_info)
+
+        # Nothing changed: the published version is kept as it is
+        city = CityModel.objects.get(name=DEFAULT_CITY)
+        self.assertTrue(ingest_city(BytesIO(dumps(new_city_info).encode("utf-8"))))
+        self.assertTrue(City(deepcopy(new_city_info)).save())
+
+        self.assertEqual(CityModel.objects.values_list("version", "revision").get(), (city.version, city.revision))
+        self.assertEqual((Controller.save_stats["rows"], Controller.save_stats["reused"]), (0, 3))
+        self.assertEqual(dict(Neighbourhood.objects.values_list("name", "id")), new_neighbourhood_ids)
+        self.check_city_info(new_city_info)
+
+    def test__ingest_city__result_cache__changed__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.assertTrue(ingest_city(BytesIO(dumps(city_info).encode("utf-8"))))
+        Controller.update_building("RAVAL", "CCCB", apartments_count=6)
+        city_info[0]["buildings"][1]["apartments_count"] = 6
+
+        # Test main & Check results: the stored content hash follows the building changes
+        self.assertTrue(ingest_city(BytesIO(dumps(city_info).encode("utf-8"))))
+        self.assertEqual((Controller.save_stats["rows"], Controller.save_stats["reused"]), (0, 1))
+
+        # And the daylight changes
+        Controller.update_city_daylight("07:00", "19:30")
+        self.assertTrue(ingest_city(BytesIO(dumps(city_info).encode("utf-8"))))
+        self.assertEqual(Controller.save_stats["reused"], 0)
+        self.check_city_info(city_info)
+
+        self.assertTrue(ingest_city(BytesIO(dumps(city_info).encode("utf-8")), dawn="07:00", sunset="19:30"))
+        self.assertEqual(Controller.save_stats["reused"], 0)
+        self.assertEqual(CityModel.objects.values_list("dawn", "sunset").get(), ("07:00", "19:30"))
+
+    def test__ingest_city__result_cache__ko(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        body = dumps(city_info).encode("utf-8")
+        self.assertTrue(ingest_city(BytesIO(body)))
+
+        # Test main & Check results: not reused if disabled
+        with self.settings(RESULT_CACHE=False):
+            self.assertTrue(ingest_city(BytesIO(body)))
+        self.assertEqual((Controller.save_stats["reused"], Controller.save_stats["neighbourhoods"]), (0, 0))
+
+        # Nor in another mode
+        self.assertTrue(ingest_city(BytesIO(body), mode=COMPRESSED_MODE))
+        self.assertEqual((Controller.save_stats["reused"], Controller.save_stats["neighbourhoods"]), (0, 1))
+        self.assertTrue(ingest_city(BytesIO(body)))
+        self.assertEqual(Controller.save_stats["reused"], 0)
+
+        # Duplicated neighbourhoods are rejected, as if they were not stored
+        city = CityModel.objects.get(name=DEFAULT_CITY)
+        self.assertFalse(ingest_city(BytesIO(dumps(city_info + city_info).encode("utf-8"))))
+        self.assertEqual(CityModel.objects.get(name=DEFAULT_CITY).version, city.version)
+        self.check_city_info(city_info)
+
+    @staticmethod
+    def get_stored_neighbourhood(neighbourhood_name):
+        building_list = []
+
+        for building in Building.objects.filter(neighbourhood__name=neighbourhood_name).order_by("east_position"):
+            apartments = Apartment.objects.filter(building=building).order_by("floor")
+            building_list.append({"name": building.name, "apartments_count": building.floors,
+                                  "distance": building.next_distance, "prev_distance": building.prev_distance,
+                                  "dawn": [apartment.dawn for apartment in apartments],
+                                  "sunset": [apartment.sunset for apartment in apartments]})
+
+        return building_list
+
+    def check_stored_neighbourhood(self, neighbourhood_name, apartments_height):
+        stored = self.get_stored_neighbourhood(neighbourhood_name)
+        building_list = [{"name": building["name"], "apartments_count": building["apartments_count"],
+                          "distance": building["distance"]} for building in stored]
+        expected = City([{"neighborhood": neighbourhood_name, "apartments_height": apartments_height,
+                          "buildings": building_list}]).info[0]["buildings"]
+
+        acc_building_east_distance = 0
+        for building, expected_building in zip(stored, expected):
+            self.assertEqual(building["prev_distance"], acc_building_east_distance)
+            self.assertEqual((building["dawn"], building["sunset"]),
+                             ([format_time(minutes) for minutes in expected_building["dawn"]],
+                              [format_time(minutes) for minutes in expected_building["sunset"]]))
+            acc_building_east_distance += building["distance"]
+
+        return stored
+
+    def test__update_building__ok(self):
+        city_info = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        City(city_info).save()
+        raval = Apartment.objects.get(building__name="CCCB", floor=0)
+
+        # Test main
+        result = Controller.update_building("POBLENOU", "30", apartments_count=3)
+
+        # Check results: only a few floors of the buildings on the east are shadowed by the taller building (and a few
+        # more move in the sunlight ranking of the neighbourhood). The building on its east stores the new angles
+        self.assertEqual(result, {"buildings": {"created": 0, "updated": 2, "deleted": 0},
+                                  "apartments": {"created": 2, "updated": 6, "deleted": 0},
+                                  "floor_ranges": {"created": 0, "updated": 0, "deleted": 0},
+                                  "yearly": {"created": 0, "updated": 0, "deleted": 0}})
+        stored = self.check_stored_neighbourhood("POBLENOU", 1)
+        self.assertEqual(stored[3]["apartments_count"], 3)
+
+        # Other neighbourhoods are untouched
+        self.assertEqual(Apartment.objects.get(building__name="CCCB", floor=0).id, raval.id)
+
+        # Shrink it back
+        Controller.update_building("POBLENOU", "30", apartments_count=1)
+        Controller.update_building("POBLENOU", "CEM", distance=7)
+        self.assertEqual(Controller.update_building("POBLENOU", "01", distance=2)["apartments"]["updated"], 0)
+        self.check_stored_neighbourhood("POBLENOU", 1)
+        self.assertEqual(Apartment.objects.filter(building__name="30").count(), 1)
+
+    def test__insert_delete_building__ok(self):
+        city_info = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             }
+        ]
+        City(city_info).save()
+
+        # Test main
+        Controller.insert_building("POBLENOU", "Glories", 12, distance=1, position=1, east_distance=2)
+        Controller.insert_building("POBLENOU", "Mar", 2, east_distance=3)
+        Controller.insert_building("POBLENOU", "Bogatell", 5, distance=4, position=0)
+
+        # Check results
+        stored = self.check_stored_neighbourhood("POBLENOU", 1)
+        self.assertEqual([(building["name"], building["distance"]) for building in stored],
+                         [("Bogatell", 4), ("Aticco", 2), ("Glories", 1), ("01", 2), ("CEM", 1), ("30", 3),
+                          ("Mar", -1)])
+
+        # Test main
+        result = Controller.delete_building("POBLENOU", "Glories")
+        Controller.delete_building("POBLENOU", "Mar")
+
+        # Check results
+        self.assertEqual(result["buildings"]["deleted"], 1)
+        self.assertEqual(result["apartments"]["deleted"], 12)
+        stored = self.check_stored_neighbourhood("POBLENOU", 1)
+        self.assertEqual([(building["name"], building["distance"]) for building in stored],
+                         [("Bogatell", 4), ("Aticco", 3), ("01", 2), ("CEM", 1), ("30", -1)])
+        self.assertFalse(Building.objects.filter(name__in=["Glories", "Mar"]).exists())
+
+    def test__update_building__no_floors__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "Plaça", "apartments_count": 0, "distance": 2},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        City(city_info).save()
+
+        # Test main: as in /init, buildings with no floors are kept, and can be changed or added
+        Controller.update_building("RAVAL", "Santa Monica", apartments_count=5)
+        Controller.update_building("RAVAL", "CCCB", apartments_count=0)
+        Controller.insert_building("RAVAL", "MACBA", 0, distance=1, position=0)
+
+        # Check results
+        stored = self.check_stored_neighbourhood("RAVAL", 2)
+        self.assertEqual([building["apartments_count"] for building in stored], [0, 5, 0, 0])
+        self.assertFalse(Apartment.objects.filter(building__name="CCCB").exists())
+
+    def test__update_building__random__ok(self):
+        rnd = Random(2019)
+        buildings = [{"name": str(index), "apartments_count": rnd.randint(1, 12), "distance": rnd.randint(1, 4)}
+                     for index in range(20)]
+        buildings[-1]["distance"] = -1
+        City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings": buildings}]).save()
+        names = [str(index) for index in range(20)]
+
+        for step in range(30):
+            # Test main
+            action = rnd.choice(["insert", "update", "delete"] if len(names) > 1 else ["insert"])
+
+            if action == "insert":
+                position = rnd.randint(0, len(names) - 1)
+                name = "new{}".format(step)
+                Controller.insert_building("RAVAL", name, rnd.randint(1, 12), distance=rnd.randint(1, 4),
+                                           position=position, east_distance=rnd.randint(1, 4))
+                names.insert(position, name)
+            elif action == "update":
+                Controller.update_building("RAVAL", rnd.choice(names[:-1]), apartments_count=rnd.randint(1, 12),
+                                           distance=rnd.randint(1, 4))
+            else:
+                name = rnd.choice(names)
+                Controller.delete_building("RAVAL", name)
+                names.remove(name)
+
+            # Check results
+            stored = self.check_stored_neighbourhood("RAVAL", 2)
+            self.assertEqual([building["name"] for building in stored], names)
+
+    @staticmethod
+    def get_stored_content(neighbourhood_name):
+        def get_bytes(value):
+            return None if value is None else bytes(value)
+
+        neighbourhood = Neighbourhood.objects.get(name=neighbourhood_name, version=F("city__version"))
+        buildings = Building.objects.filter(neighbourhood=neighbourhood)
+
+        return {
+            "neighbourhood": (neighbourhood.content_hash, get_bytes(neighbourhood.sunlit_counts)),
+            "buildings": sorted((building.name, building.floors, building.east_position, building.prev_distance,
+                                 building.next_distance, get_bytes(building.east_angles),
+                                 get_bytes(building.west_angles)) for building in buildings),
+            "apartments": sorted(Apartment.objects.filter(building__in=buildings).values_list(
+                "building__name", "floor", "dawn", "sunset", "dawn_minutes", "sunset_minutes", "sunlight_minutes",
+                "neighbourhood_rank")),
+            "floor_ranges": sorted(FloorRange.objects.filter(building__in=buildings).values_list(
+                "building__name", "floor_from", "floor_to", "dawn_minutes", "sunset_minutes", "sunlight_minutes",
+                "neighbourhood_rank")),
+            "yearly": sorted((name, floor, bytes(dawn), bytes(sunset)) for name, floor, dawn, sunset in
+                             YearlySunlight.objects.filter(building__in=buildings).values_list(
+                                 "building__name", "floor", "dawn", "sunset"))
+        }
+
+    @override_settings(RESULT_CACHE=False, RANKING_SIZE=25)
+    def test__update_building__same_as_init__ok(self):
+        rnd = Random(2030)
+        calendar = get_test_calendar()
+
+        for mode in (EAGER_MODE, COMPRESSED_MODE, LAZY_MODE):
+            buildings = [{"name": str(index), "apartments_count": rnd.choice([0, 1, 2, 3, 5, 8, 13]),
+                          "distance": rnd.randint(1, 4)} for index in range(25)]
+            buildings[-1]["distance"] = -1
+            City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings": deepcopy(buildings)}], mode=mode,
+                 calendar=calendar).save()
+
+            for step in range(40):
+                # Test main
+                action = rnd.choice(["insert", "height", "distance", "delete"] if len(buildings) > 2 else ["insert"])
+                position = rnd.randrange(len(buildings))
+                name = buildings[position]["name"]
+
+                if action == "insert":
+                    building = {"name": "new{}".format(step), "apartments_count": rnd.choice([0, 2, 4, 9, 14]),
+                                "distance": rnd.randint(1, 4)}
+                    east_distance = rnd.randint(1, 4)
+                    Controller.insert_building("RAVAL", building["name"], building["apartments_count"],
+                                               distance=building["distance"], position=position,
+                                               east_distance=east_distance)
+                    if position > 0:
+                        buildings[position - 1]["distance"] = east_distance
+                    buildings.insert(position, building)
+                elif action == "height":
+                    buildings[position]["apartments_count"] = rnd.choice([0, 1, 3, 6, 10, 15])
+                    Controller.update_building("RAVAL", name, apartments_count=buildings[position]["apartments_count"])
+                elif action == "distance" and position < len(buildings) - 1:
+                    buildings[position]["distance"] = rnd.randint(1, 5)
+                    Controller.update_building("RAVAL", name, distance=buildings[position]["distance"])
+                elif action == "delete":
+                    Controller.delete_building("RAVAL", name)
+                    deleted = buildings.pop(position)
+                    if position == len(buildings):
+                        buildings[-1]["distance"] = -1
+                    elif position > 0:
+                        buildings[position - 1]["distance"] += deleted["distance"]
+
+                # Check results: the stored street is the same as the one stored by /init
+                content = self.get_stored_content("RAVAL")
+                City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings": deepcopy(buildings)}],
+                     mode=mode, calendar=calendar).save()
+                self.assertEqual(content, self.get_stored_content("RAVAL"), (mode, step, action, name))
+
+    def test__update_building__changed_buildings__ok(self):
+        buildings = [{"name": str(index), "apartments_count": apartments_count, "distance": 1}
+                     for index, apartments_count in enumerate([3, 3, 3, 9, 2, 2, 2, 9, 3, 3])]
+        buildings[-1]["distance"] = -1
+        City([{"neighborhood": "RAVAL", "apartments_height": 1, "buildings": buildings}]).save()
+        computed = apartments_computed.get()
+
+        # Test main
+        Controller.update_building("RAVAL", "5", apartments_count=4)
+
+        # Check results: only the buildings up to the next taller one on the east are computed (and nothing on the
+        # west, since the shadow from the east comes from the taller one)
+        self.assertEqual(apartments_computed.get() - computed, 9 + 2 + 4)
+        self.check_stored_neighbourhood("RAVAL", 1)
+
+        # Test main
+        computed = apartments_computed.get()
+        Controller.update_building("RAVAL", "8", distance=3)
+
+        # Check results: the building on the west keeps the same obstacle on the east
+        self.assertEqual(apartments_computed.get() - computed, 3)
+        self.check_stored_neighbourhood("RAVAL", 1)
+
+    def test__update_building__ko(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        City(city_info).save()
+
+        # Test main & Check results
+        with self.assertRaises(Neighbourhood.DoesNotExist):
+            Controller.update_building("GRACIA", "CCCB", apartments_count=1)
+        with self.assertRaises(Building.DoesNotExist):
+            Controller.delete_building("RAVAL", "MACBA")
+        with self.assertRaises(ValueError):
+            Controller.insert_building("RAVAL", "CCCB", 3)
+        with self.assertRaises(ValueError):
+            Controller.insert_building("RAVAL", "MACBA", 3, position=1)
+        with self.assertRaises(ValueError):
+            Controller.update_building("RAVAL", "CCCB", apartments_count=-1)
+        with self.assertRaises(ValueError):
+            Controller.update_building("RAVAL", "CCCB", distance=2)
+        for distance in (0, -5):
+            with self.assertRaises(ValueError):
+                Controller.update_building("RAVAL", "Santa Monica", distance=distance)
+            with self.assertRaises(ValueError):
+                Controller.insert_building("RAVAL", "MACBA", 3, distance=distance, position=0)
+            with self.assertRaises(ValueError):
+                Controller.insert_building("RAVAL", "MACBA", 3, position=2, east_distance=distance)
+
+        self.assertEqual(Apartment.objects.count(), 7)
+
+    def test__save_city__versions__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        new_city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        apartment_info = {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 0}
+        self.assertTrue(Controller.save_city(City(city_info).info))
+        version = CityModel.objects.get(name=DEFAULT_CITY).version
+        seen = []
+
+        def get_neighbourhoods():
+            for neighbourhood in City(new_city_info).info:
+                yield neighbourhood
+
+                # While the new version is being built, readers keep seeing the published one
+                seen.append(Controller.get_apartment_info(apartment_info).dawn)
+
+        # Test main
+        result = Controller.save_city(get_neighbourhoods(), batch_size=1)
+
+        # Check results
+        self.assertTrue(result)
+        self.assertEqual(seen, ["12:20"])
+        self.assertEqual(Controller.get_apartment_info(apartment_info).dawn, "08:14")
+        self.assertEqual(CityModel.objects.get(name=DEFAULT_CITY).version, version + 1)
+
+        # Prior versions are removed
+        self.assertEqual(list(Neighbourhood.objects.values_list("version", flat=True)), [version + 1])
+        self.assertEqual(Apartment.objects.count(), 4)
+
+    def test__save_city__discarded__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.assertTrue(Controller.save_city(City(city_info).info))
+        city = CityModel.objects.get(name=DEFAULT_CITY)
+
+        def get_neighbourhoods():
+            yield from City(city_info).info
+            raise CityInitializationError()
+
+        # Test main
+        with self.assertRaises(CityInitializationError):
+            Controller.save_city(get_neighbourhoods(), batch_size=1)
+
+        # Check results: the published version is untouched, and the new one was discarded
+        self.assertEqual(CityModel.objects.get(name=DEFAULT_CITY).version, city.version)
+        self.assertEqual(CityModel.objects.get(name=DEFAULT_CITY).last_version, city.last_version + 1)
+        self.assertEqual(list(Neighbourhood.objects.values_list("version", flat=True)), [city.version])
+        self.assertEqual(Apartment.objects.count(), 4)
+
+    def test__reserve_ids__ok(self):
+        City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+               [{"name": "CCCB", "apartments_count": 4, "distance": -1}]}]).save()
+        IdBlock.objects.filter(table=Apartment._meta.db_table).delete()
+        max_id = max(Apartment.objects.values_list("id", flat=True))
+
+        # Test main & Check results: blocks start after the keys in use, and never overlap
+        self.assertEqual(CityWriter.reserve_ids(Apartment, 10), max_id + 1)
+        self.assertEqual(CityWriter.reserve_ids(Apartment, 1), max_id + 11)
+        self.assertEqual(CityWriter.reserve_ids(Apartment, 5), max_id + 12)
+        self.assertEqual(IdBlock.objects.get(table=Apartment._meta.db_table).next_id, max_id + 17)
+
+    @override_settings(ID_BLOCK_SIZE=3)
+    def test__city_writer__concurrent__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "GRACIA", "apartments_height": 2, "buildings":
+                [{"name": "Fontana", "apartments_count": 2, "distance": -1}
+                 ]
+             }
+        ]
+        City(deepcopy(city_info)).save()
+        computed = City(deepcopy(city_info)).info
+
+        # Two builds at once, as if they were run by different processes (so they are not serialized by build_lock)
+        writers = []
+        for _ in range(2):
+            city, version = Controller.allocate_city_version(DEFAULT_CITY, "08:14", "17:25")
+            writers.append(CityWriter(city, 2, version))
+
+        # Test main
+        for neighbourhood_info in computed:
+            for writer in writers:
+                writer.add_neighbourhood(deepcopy(neighbourhood_info))
+                writer.flush()
+
+            # Along with a building change
+            Controller.update_building("RAVAL", "CCCB", apartments_count=len(writers[0].apartments) + 5)
+
+        # Check results: no primary key was given twice
+        self.assertEqual([writer.rows for writer in writers], [2 + 3 + 7 + 2] * 2)
+        self.assertEqual(Neighbourhood.objects.count(), 2 * 3)
+
+    def test__city_save__lazy__ok(self):
+        rnd = Random(2022)
+        city_info = []
+        for index in range(4):
+            buildings = [{"name": str(b_index), "apartments_count": rnd.randint(0, 10), "distance": rnd.randint(1, 4)}
+                         for b_index in range(rnd.randint(1, 15))]
+            buildings[-1]["distance"] = -1
+            city_info.append({"neighborhood": str(index), "apartments_height": rnd.randint(1, 3),
+                              "buildings": buildings})
+        apartment_info_list = [{"neighbourhood": neighbourhood["neighborhood"], "building": building["name"],
+                                "apartment": floor}
+                               for neighbourhood in city_info for building in neighbourhood["buildings"]
+                               for floor in range(building["apartments_count"] + 1)]
+        City(deepcopy(city_info)).save()
+        expected = [None if apartment is None else (apartment.dawn, apartment.sunset)
+                    for apartment in Controller.get_apartments_info(apartment_info_list)]
+
+        # Test main
+        City(deepcopy(city_info), mode=LAZY_MODE).save()
+
+        # Check results: only the buildings are stored, and the apartments are computed on lookup
+        self.assertEqual(CityModel.objects.get(name=DEFAULT_CITY).mode, LAZY_MODE)
+        self.assertFalse(Apartment.objects.filter(building__neighbourhood__version=F(
+            "building__neighbourhood__city__version")).exists())
+        self.assertEqual([None if apartment is None else (apartment.dawn, apartment.sunset)
+                          for apartment in Controller.get_apartments_info(apartment_info_list)], expected)
+        apartment_cache.invalidate()
+        self.assertEqual([None if apartment is None else (apartment.dawn, apartment.sunset)
+                          for apartment in map(Controller.get_apartment_info, apartment_info_list)], expected)
+
+    def test__get_apartment_info__lazy__ok(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "La Capella", "apartments_count": 2, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        City(city_info, mode=LAZY_MODE).save()
+
+        # Test main: the horizon of the neighbourhood is built once, then each apartment costs a single query
+        with self.assertNumQueries(2):
+            apartment = Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "La Capella",
+                                                       "apartment": 1})
+        with self.assertNumQueries(1):
+            other_apartment = Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "CCCB",
+                                                             "apartment": 0})
+
+        # Check results
+        self.assertEqual(apartment.building.neighbourhood.name, "RAVAL")
+        self.assertEqual((apartment.floor, apartment.dawn, apartment.sunset), (1, "12:06", "13:19"))
+        self.assertEqual((other_apartment.dawn, other_apartment.sunset), ("12:20", "17:25"))
+        self.assertIsNone(Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "CCCB",
+                                                         "apartment": 4}))
+
+        # Building changes are seen right away
+        Controller.delete_building("RAVAL", "Santa Monica")
+        self.assertEqual(Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "La Capella",
+                                                        "apartment": 1}).dawn, "08:14")
+        self.assertFalse(Apartment.objects.exists())
+
+    def test__city_save__lazy__ko(self):
+        city_info = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": "3", "distance": 1}]
+             }
+        ]
+
+        # Test main & Check results
+        with self.assertRaises(CityInitializationError):
+            City(city_info, mode=LAZY_MODE)
+
+        with self.assertRaises(CityInitializationError):
+            ingest_city(BytesIO(dumps(city_info).encode()), mode=LAZY_MODE)
+
+    def get_sunlight_hours(self, city_info):
+        apartment_info_list = [{"neighbourhood": neighbourhood["neighborhood"], "building": building["name"],
+                                "apartment": floor}
+                               for neighbourhood in city_info for building in neighbourhood["buildings"]
+                               for floor in range(building["apartments_count"] + 1)]
+        apartment_cache.invalidate()
+        single = [None if apartment is None else (apartment.dawn, apartment.sunset)
+                  for apartment in map(Controller.get_apartment_info, apartment_info_list)]
+        apartment_cache.invalidate()
+        batch = [None if apartment is None else (apartment.dawn, apartment.sunset)
+                 for apartment in Controller.get_apartments_info(apartment_info_list)]
+        self.assertEqual(single, batch)
+
+        return single
+
+    def test__city_save__compressed__ok(self):
+        rnd = Random(2023)
+        city_info = []
+        for index in range(4):
+            buildings = [{"name": str(b_index), "apartments_count": rnd.randint(1, 60), "distance": rnd.randint(1, 4)}
+                         for b_index in range(rnd.randint(1, 15))]
+            buildings[-1]["distance"] = -1
+            city_info.append({"neighborhood": str(index), "apartments_height": rnd.randint(1, 3),
+                              "buildings": buildings})
+        city_info.append({"neighborhood": "SKYLINE", "apartments_height": 1, "buildings":
+                          [{"name": "Low", "apartments_count": 3, "distance": 2},
+                           {"name": "Tower", "apartments_count": 100, "distance": 2},
+                           {"name": "Lower", "apartments_count": 2, "distance": -1}]})
+        City(deepcopy(city_info)).save()
+        expected = self.get_sunlight_hours(city_info)
+
+        # Test main
+        City(deepcopy(city_info), mode=COMPRESSED_MODE).save()
+
+        # Check results: runs of floors are stored instead of apartments, with the same results
+        self.assertEqual(CityModel.objects.get(name=DEFAULT_CITY).mode, COMPRESSED_MODE)
+        self.assertFalse(Apartment.objects.filter(building__neighbourhood__version=F(
+            "building__neighbourhood__city__version")).exists())
+        floor_ranges = FloorRange.objects.filter(building__neighbourhood__version=F(
+            "building__neighbourhood__city__version")).count()
+        self.assertLess(floor_ranges, len([hours for hours in expected if hours is not None]))
+        # High above the obstacles, the sunlight hours of consecutive floors are the same to the minute
+        self.assertLess(FloorRange.objects.filter(building__name="Tower", building__neighbourhood__version=F(
+            "building__neighbourhood__city__version")).count(), 50)
+        self.assertEqual(self.get_sunlight_hours(city_info), expected)
+
+        apartment_cache.invalidate()
+        Controller.warm_city_state(DEFAULT_CITY)
+        with self.assertNumQueries(1):
+            Controller.get_apartment_info({"neighbourhood": "0", "building": "0", "apartment": 0})
+
+    def test__update_building__compressed__ok(self):
+        rnd = Random(2024)
+        buildings = [{"name": str(index), "apartments_count": rnd.randint(1, 30), "distance": rnd.randint(1, 4)}
+                     for index in range(10)]
+        buildings[-1]["distance"] = -1
+        city_info = [{"neighborhood": "RAVAL", "apartments_height": 2, "buildings": buildings}]
+        City(deepcopy(city_info), mode=COMPRESSED_MODE).save()
+
+        # Test main
+        result = Controller.update_building("RAVAL", "5", apartments_count=40)
+        Controller.delete_building("RAVAL", "2")
+
+        # Check results
+        self.assertEqual(result["apartments"], {"created": 0, "updated": 0, "deleted": 0})
+        self.assertGreater(result["floor_ranges"]["created"] + result["floor_ranges"]["updated"], 0)
+        self.assertFalse(Apartment.objects.exists())
+
+        buildings[5]["apartments_count"] = 40
+        buildings[1]["distance"] += buildings.pop(2)["distance"]
+        expected = City(deepcopy(city_info), mode=COMPRESSED_MODE)
+        self.assertEqual(self.get_sunlight_hours(city_info),
+                         [None if floor == building["apartments_count"] else
+                          (format_time(building["dawn"][floor]), format_time(building["sunset"][floor]))
+                          for building in expected.info[0]["buildings"]
+                          for floor in range(building["apartments_count"] + 1)])
+
+    def find_all_apartments(self, limit, **kwargs):
+        apartments = []
+        cursor = None
+        while True:
+            page, cursor = Controller.find_apartments(limit=limit, after=cursor, **kwargs)
+            self.assertLessEqual(len(page), limit)
+            apartments.extend((apartment.building.neighbourhood.name, apartment.building.name, apartment.floor,
+                               apartment.sunlight_minutes) for apartment in page)
+            if cursor is None:
+                break
+
+        self.assertEqual([apartment[3] for apartment in apartments],
+                         sorted((apartment[3] for apartment in apartments), reverse=True))
+
+        return sorted(apartments)
+
+    def test__find_apartments__ok(self):
+        rnd = Random(2025)
+        city_info = []
+        for index in range(3):
+            buildings = [{"name": str(b_index), "apartments_count": rnd.randint(1, 40), "distance": rnd.randint(1, 4)}
+                         for b_index in range(rnd.randint(1, 10))]
+            buildings[-1]["distance"] = -1
+            city_info.append({"neighborhood": str(index), "apartments_height": rnd.randint(1, 3),
+                              "buildings": buildings})
+        computed = City(deepcopy(city_info)).info
+        filters = [{}, {"min_minutes": 400}, {"max_minutes": 300, "neighbourhood_name": "1"},
+                   {"sunlit_from": 600, "sunlit_until": 900}, {"neighbourhood_name": "0", "building_name": "0"}]
+
+        for mode in (COMPRESSED_MODE, EAGER_MODE):
+            City(deepcopy(city_info), mode=mode).save()
+
+            for kwargs in filters:
+                expected = sorted(
+                    (neighbourhood["neighborhood"], building["name"], floor, max(sunset - dawn, 0))
+                    for neighbourhood in computed for building in neighbourhood["buildings"]
+                    for floor, (dawn, sunset) in enumerate(zip(building["dawn"], building["sunset"]))
+                    if kwargs.get("min_minutes", 0) <= sunset - dawn <= kwargs.get("max_minutes", 24 * 60) and
+                    dawn <= kwargs.get("sunlit_from", dawn) and sunset >= kwargs.get("sunlit_until", sunset) and
+                    kwargs.get("neighbourhood_name", neighbourhood["neighborhood"]) == neighbourhood["neighborhood"]
+                    and kwargs.get("building_name", building["name"]) == building["name"])
+
+                # Test main & Check results
+                self.assertEqual(self.find_all_apartments(7, **kwargs), expected, (mode, kwargs))
+                self.assertEqual(self.find_all_apartments(1000, **kwargs), expected, (mode, kwargs))
+
+    def test__find_apartments__lazy__ko(self):
+        City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+               [{"name": "CCCB", "apartments_count": 4, "distance": -1}]}], mode=LAZY_MODE).save()
+
+        # Test main & Check results
+        with self.assertRaises(ValueError):
+            Controller.find_apartments(min_minutes=60)
+
+    def get_top_expected(self, rows, k, neighbourhood_name=None, building_name=None):
+        # rows: (<neighbourhood_name>, <building_east_position>, <building_name>, <floor>, <sunlight_minutes>)
+        return [(neighbourhood, building, floor, -minutes) for minutes, neighbourhood, _, floor, building in sorted(
+            (-minutes, neighbourhood, position, floor, building)
+            for neighbourhood, position, building, floor, minutes in rows
+            if neighbourhood_name in (None, neighbourhood) and building_name in (None, building))][:k]
+
+    def check_top_apartments(self, rows, neighbourhoods):
+        def summary(apartments):
+            return [(apartment.building.neighbourhood.name, apartment.building.name, apartment.floor,
+                     apartment.sunlight_minutes) for apartment in apartments]
+
+        for k in (1, 3, 5):
+            for neighbourhood_name in [None] + neighbourhoods:
+                # Test main & Check results
+                self.assertEqual(summary(Controller.get_top_apartments(k=k, neighbourhood_name=neighbourhood_name)),
+                                 self.get_top_expected(rows, k, neighbourhood_name), (k, neighbourhood_name))
+
+            self.assertEqual({name: summary(apartments)
+                              for name, apartments in Controller.get_neighbourhood_rankings(k=k).items()},
+                             {name: self.get_top_expected(rows, k, name) for name in neighbourhoods
+                              if self.get_top_expected(rows, k, name)})
+            self.assertEqual(summary(Controller.get_top_apartments(k=k, neighbourhood_name=neighbourhoods[0],
+                                                                   building_name="1")),
+                             self.get_top_expected(rows, k, neighbourhoods[0], "1"))
+
+    def test__get_top_apartments__ok(self):
+        rnd = Random(2026)
+        city_info = []
+        for index in range(3):
+            buildings = [{"name": str(b_index), "apartments_count": rnd.randint(1, 12), "distance": rnd.randint(1, 4)}
+                         for b_index in range(rnd.randint(2, 8))]
+            buildings[-1]["distance"] = -1
+            city_info.append({"neighborhood": str(index), "apartments_height": rnd.randint(1, 3),
+                              "buildings": buildings})
+        rows = [(neighbourhood["neighborhood"], position, building["name"], floor, max(sunset - dawn, 0))
+                for neighbourhood in City(deepcopy(city_info)).info
+                for position, building in enumerate(neighbourhood["buildings"])
+                for floor, (dawn, sunset) in enumerate(zip(building["dawn"], building["sunset"]))]
+
+        with self.settings(RANKING_SIZE=5):
+            for mode in (COMPRESSED_MODE, EAGER_MODE):
+                City(deepcopy(city_info), mode=mode).save()
+
+                # Test main & Check results
+                self.check_top_apartments(rows, ["0", "1", "2"])
+
+            # Ranks stay right after building changes
+            for step in range(15):
+                action = rnd.choice(["insert", "update", "delete"])
+                names = [building.name for building in Building.objects.filter(
+                    neighbourhood__name="0", neighbourhood__version=F("neighbourhood__city__version")).order_by(
+                    "east_position")]
+
+                if action == "insert":
+                    Controller.insert_building("0", "new{}".format(step), rnd.randint(1, 12),
+                                               distance=rnd.randint(1, 4), position=rnd.randint(0, len(names) - 1),
+                                               east_distance=rnd.randint(1, 4))
+                elif action == "update":
+                    Controller.update_building("0", rnd.choice(names[:-1]), apartments_count=rnd.randint(1, 12))
+                elif len(names) > 2:
+                    Controller.delete_building("0", rnd.choice(names[2:]))
+
+                rows = list(Apartment.objects.filter(
+                    building__neighbourhood__version=F("building__neighbourhood__city__version")).values_list(
+                    "building__neighbourhood__name", "building__east_position", "building__name", "floor",
+                    "sunlight_minutes"))
+                self.check_top_apartments(rows, ["0", "1", "2"])
+
+    def test__get_top_apartments__lazy__ko(self):
+        City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+               [{"name": "CCCB", "apartments_count": 4, "distance": -1}]}], mode=LAZY_MODE).save()
+
+        # Test main & Check results
+        with self.assertRaises(ValueError):
+            Controller.get_top_apartments(k=3)
+        with self.assertRaises(ValueError):
+            Controller.get_top_apartments(k=3, building_name="CCCB")
+
+    def check_sunlit_counts(self, neighbourhoods, mode):
+        for minutes in (0, 493, 494, 600, 720, 1045, 1046, 1439):
+            expected = {name: len(self.find_all_apartments(1000, sunlit_from=minutes, sunlit_until=minutes,
+                                                           neighbourhood_name=name)) for name in neighbourhoods}
+
+            # Test main & Check results: same as querying them
+            self.assertEqual(Controller.count_sunlit_apartments(minutes), sum(expected.values()), (mode, minutes))
+            self.assertEqual(Controller.count_neighbourhood_sunlit_apartments(minutes), expected, (mode, minutes))
+            for name in neighbourhoods:
+                self.assertEqual(Controller.count_sunlit_apartments(minutes, neighbourhood_name=name), expected[name],
+                                 (mode, minutes, name))
+
+    def test__count_sunlit_apartments__ok(self):
+        rnd = Random(2027)
+        city_info = []
+        for index in range(3):
+            buildings = [{"name": str(b_index), "apartments_count": rnd.randint(1, 12), "distance": rnd.randint(1, 4)}
+                         for b_index in range(rnd.randint(2, 8))]
+            buildings[-1]["distance"] = -1
+            city_info.append({"neighborhood": str(index), "apartments_height": rnd.randint(1, 3),
+                              "buildings": buildings})
+
+        for mode in (COMPRESSED_MODE, EAGER_MODE):
+            City(deepcopy(city_info), mode=mode).save()
+            self.check_sunlit_counts(["0", "1", "2"], mode)
+
+            # Counts stay right after building and daylight changes
+            Controller.update_building("0", "0", apartments_count=20)
+            self.check_sunlit_counts(["0", "1", "2"], mode)
+            Controller.insert_building("1", "new", 15, distance=2, position=0)
+            self.check_sunlit_counts(["0", "1", "2"], mode)
+            Controller.update_city_daylight("06:45", "20:10")
+            self.check_sunlit_counts(["0", "1", "2"], mode)
+            Controller.update_city_daylight("08:14", "17:25")
+
+        # Unknown neighbourhoods (and cities) have no sunlit apartments
+        self.assertEqual(Controller.count_sunlit_apartments(600, neighbourhood_name="GRACIA"), 0)
+        self.assertEqual(Controller.count_sunlit_apartments(600, city="MADRID"), 0)
+        self.assertEqual(Controller.count_neighbourhood_sunlit_apartments(600, city="MADRID"), {})
+
+    def test__count_sunlit_apartments__lazy__ko(self):
+        City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+               [{"name": "CCCB", "apartments_count": 4, "distance": -1}]}], mode=LAZY_MODE).save()
+
+        # Test main & Check results
+        with self.assertRaises(ValueError):
+            Controller.count_sunlit_apartments(600)
+        with self.assertRaises(ValueError):
+            Controller.count_neighbourhood_sunlit_apartments(600)
+
+    def test__get_yearly_sunlight__ok(self):
+        calendar = get_test_calendar()
+        rnd = Random(2027)
+        buildings = [{"name": str(index), "apartments_count": rnd.randint(1, 12), "distance": rnd.randint(1, 4)}
+                     for index in range(8)]
+        buildings[-1]["distance"] = -1
+        city_info = [{"neighborhood": "RAVAL", "apartments_height": 2, "buildings": buildings}]
+        days = [0, 100, 171, 364]
+
+        def get_expected():
+            expected = {}
+            for day in days:
+                computed = City(deepcopy(city_info), dawn=calendar[day][0], sunset=calendar[day][1])
+                for building in computed.info[0]["buildings"]:
+                    for floor, (dawn, sunset) in enumerate(zip(building["dawn"], building["sunset"])):
+                        expected[(building["name"], floor, day)] = (dawn, sunset)
+            return expected
+
+        def get_yearly():
+            result = {}
+            for building in city_info[0]["buildings"]:
+                for floor in range(building["apartments_count"]):
+                    dawn, sunset = Controller.get_yearly_sunlight("RAVAL", building["name"], floor)
+                    for day in days:
+                        result[(building["name"], floor, day)] = (dawn[day], sunset[day])
+            return result
+
+        for mode in (EAGER_MODE, COMPRESSED_MODE, LAZY_MODE):
+            # Test main
+            City(deepcopy(city_info), mode=mode, calendar=calendar).save()
+
+            # Check results: same as computing the city with the dawn and sunset of each day
+            self.assertEqual(get_yearly(), get_expected(), mode)
+            self.assertIsNone(Controller.get_yearly_sunlight("RAVAL", "0", buildings[0]["apartments_count"]))
+            self.assertIsNone(Controller.get_yearly_sunlight("RAVAL", "missing", 0))
+            self.assertEqual(YearlySunlight.objects.filter(building__neighbourhood__version=F(
+                "building__neighbourhood__city__version")).count(),
+                0 if mode == LAZY_MODE else sum(building["apartments_count"] for building in buildings))
+
+        # Building changes update them
+        City(deepcopy(city_info), calendar=calendar).save()
+        result = Controller.update_building("RAVAL", "3", apartments_count=buildings[3]["apartments_count"] + 2)
+        buildings[3]["apartments_count"] += 2
+        self.assertEqual(result["yearly"]["created"], 2)
+        self.assertEqual(get_yearly(), get_expected())
+
+        Controller.delete_building("RAVAL", "3")
+        self.assertIsNone(Controller.get_yearly_sunlight("RAVAL", "3", 0))
+
+    def test__get_yearly_sunlight__summer__ok(self):
+        calendar = [["08:15", "17:25"]] * 100 + [["06:18", "21:29"]] * (DAYS_PER_YEAR - 100)
+        city_info = [{"neighborhood": "RAVAL", "apartments_height": 1, "buildings":
+                      [{"name": "Low", "apartments_count": 1, "distance": 1},
+                       {"name": "High", "apartments_count": 10, "distance": -1}]}]
+
+        for mode in (EAGER_MODE, COMPRESSED_MODE, LAZY_MODE):
+            # Test main
+            City(deepcopy(city_info), mode=mode, calendar=calendar).save()
+
+            # Check results: the floors above the building on the east get the dawn of each day
+            dawn, sunset = Controller.get_yearly_sunlight("RAVAL", "High", 5)
+            self.assertEqual((format_time(dawn[0]), format_time(sunset[0])), ("08:15", "17:25"), mode)
+            self.assertEqual((format_time(dawn[200]), format_time(sunset[200])), ("06:18", "21:29"), mode)
+
+    def test__get_yearly_sunlight__ko(self):
+        City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+               [{"name": "CCCB", "apartments_count": 4, "distance": -1}]}]).save()
+
+        # Test main & Check results: the city has no calendar
+        with self.assertRaises(ValueError):
+            Controller.get_yearly_sunlight("RAVAL", "CCCB", 0)
+
+        with self.assertRaises(CityInitializationError):
+            City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                   [{"name": "CCCB", "apartments_count": 4, "distance": -1}]}], calendar=[["08:00", "18:00"]])
+
+    def test__update_city_daylight__ok(self):
+        rnd = Random(2023)
+        city_info = []
+        for index in range(3):
+            buildings = [{"name": str(b_index), "apartments_count": rnd.randint(1, 12), "distance": rnd.randint(1, 4)}
+                         for b_index in range(rnd.randint(2, 8))]
+            buildings[-1]["distance"] = -1
+            city_info.append({"neighborhood": str(index), "apartments_height": rnd.randint(1, 3),
+                              "buildings": buildings})
+        expected = {(neighbourhood["neighborhood"], building["name"], floor): (format_time(dawn), format_time(sunset))
+                    for neighbourhood in City(deepcopy(city_info), dawn="06:45", sunset="20:10").info
+                    for building in neighbourhood["buildings"]
+                    for floor, (dawn, sunset) in enumerate(zip(building["dawn"], building["sunset"]))}
+
+        for mode in (EAGER_MODE, COMPRESSED_MODE, LAZY_MODE):
+            City(deepcopy(city_info), mode=mode).save()
+
+            # Test main: the shadows are not computed again
+            with mock.patch("badi.controller.get_buildings_shadow_angles", side_effect=AssertionError()):
+                result = Controller.update_city_daylight("06:45", "20:10")
+
+            # Check results: same as computing the city with the new dawn and sunset
+            apartments = {key: Controller.get_apartment_info({"neighbourhood": key[0], "building": key[1],
+                                                              "apartment": key[2]}) for key in expected}
+            self.assertEqual({key: (apartment.dawn, apartment.sunset) for key, apartment in apartments.items()},
+                             expected, mode)
+            self.assertEqual(CityModel.objects.values_list("dawn", "sunset").get(), ("06:45", "20:10"))
+            self.assertEqual(result["buildings"], {"created": 0, "updated": 0, "deleted": 0})
+            self.assertEqual(result["apartments"]["updated"] > 0, mode == EAGER_MODE)
+            self.assertEqual(result["floor_ranges"]["updated"] > 0, mode == COMPRESSED_MODE)
+
+        # Rankings are rescaled too
+        City(deepcopy(city_info)).save()
+        Controller.update_city_daylight("06:45", "20:10")
+        top = Controller.get_top_apartments(k=5)
+        self.assertEqual([apartment.sunlight_minutes for apartment in top],
+                         sorted((parse_time(sunset) - parse_time(dawn) for dawn, sunset in expected.values()),
+                                reverse=True)[:5])
+
+        # Apartments are only sunlit within the daylight of the city, no matter how long it is
+        Controller.update_city_daylight("04:00", "21:59")
+        self.assertTrue(all("04:00" <= apartment.dawn and apartment.sunset <= "21:59"
+                            for apartment in Apartment.objects.filter(
+                                building__neighbourhood__version=F("building__neighbourhood__city__version"))))
+        self.assertTrue(Apartment.objects.filter(dawn="04:00").exists())
+
+    def test__update_city_daylight__ko(self):
+        City([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+               [{"name": "CCCB", "apartments_count": 4, "distance": -1}]}]).save()
+
+        for dawn, sunset in (("18:00", "08:00"), ("08:00", "08:00"), ("08:00", "24:30")):
+            # Test main & Check results
+            with self.assertRaises(ValueError):
+                Controller.update_city_daylight(dawn, sunset)
+
+        self.assertEqual(CityModel.objects.values_list("dawn", "sunset").get(), ("08:14", "17:25"))
 
+        CityModel.objects.all().delete()
+        with self.assertRaises(CityModel.DoesNotExist):
+            Controller.update_city_daylight("08:00", "18:00")
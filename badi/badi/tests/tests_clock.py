@@ -0,0 +1,82 @@
+#!/bin/python3
+
+
+from django.test import TestCase
+
+from ..clock import parse_time, format_time, get_shadow_minutes, get_seconds_per_grade, get_sunlight_minutes
+
+
+class ClockTestCase(TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        pass
+
+    def test__parse_time__ok(self):
+        values = [
+            ("00:00", 0),
+            ("08:14", 494),
+            ("9:59", 599),
+            ("17:25", 1045),
+        ]
+
+        # Test main
+        for value in values:
+            minutes = parse_time(value[0])
+
+            # Check results
+            self.assertEqual(minutes, value[1])
+
+    def test__format_time__ok(self):
+        values = [
+            (0, "00:00"),
+            (494, "08:14"),
+            (599, "09:59"),
+            (1045, "17:25"),
+        ]
+
+        # Test main
+        for value in values:
+            local_time = format_time(value[0])
+
+            # Check results
+            self.assertEqual(local_time, value[1])
+
+    def test__get_shadow_minutes__ok(self):
+        # (<angle>, <city_seconds_per_grade>, <expected_minutes>)
+        values = [
+            (0, 180, 0),
+            (22.25, 180, 66),
+            (170, 180, 510),
+            (-45.0, 180, 0),  # A lower obstacle casts no shadow
+        ]
+
+        # Test main
+        for value in values:
+            minutes = get_shadow_minutes(value[0], value[1])
+
+            # Check results
+            self.assertEqual(minutes, value[2])
+
+    def test__get_seconds_per_grade__ok(self):
+        # Test main
+        seconds_per_grade = get_seconds_per_grade(parse_time("08:00"), parse_time("17:00"))
+
+        # Check results
+        self.assertEqual(seconds_per_grade, 180.0)
+
+    def test__get_sunlight_minutes__ok(self):
+        values = [
+            ("08:14", "17:25", 551),
+            ("12:20", "13:19", 59),
+            ("12:20", "12:20", 0),
+            ("13:00", "12:00", 0),
+        ]
+
+        # Test main
+        for value in values:
+            minutes = get_sunlight_minutes(parse_time(value[0]), parse_time(value[1]))
+
+            # Check results
+            self.assertEqual(minutes, value[2])
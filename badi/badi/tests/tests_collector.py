@@ -0,0 +1,43 @@
+#!/bin/python3
+
+
+from threading import Event, current_thread, main_thread
+from django.test import SimpleTestCase
+
+from ..collector import CityVersionCollector
+
+
+class CityVersionCollectorTestCase(SimpleTestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        pass
+
+    def test__schedule__in_background__ok(self):
+        collected = []
+        done = Event()
+
+        def collect(city_name):
+            collected.append((city_name, current_thread() is main_thread()))
+            done.set()
+
+        collector = CityVersionCollector(collect, in_background=True)
+
+        # Test main
+        collector.schedule("Barcelona")
+
+        # Check results
+        self.assertTrue(done.wait(5))
+        self.assertEqual(collected, [("Barcelona", False)])
+
+    def test__schedule__in_foreground__ok(self):
+        collected = []
+        collector = CityVersionCollector(collected.append, in_background=False)
+
+        # Test main
+        collector.schedule("Barcelona")
+
+        # Check results
+        self.assertEqual(collected, ["Barcelona"])
+        self.assertIsNone(collector.thread)
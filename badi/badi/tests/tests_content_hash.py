@@ -0,0 +1,70 @@
+#!/bin/python3
+
+
+from django.test import TestCase
+
+from ..constants import EAGER_MODE, LAZY_MODE
+from ..content_hash import get_city_hash, get_neighbourhood_hash, find_stored_neighbourhood
+
+
+class ContentHashTestCase(TestCase):
+
+    maxDiff = None
+
+    neighbourhood_info = {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                          [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                           {"name": "CCCB", "apartments_count": 4, "distance": -1}]}
+
+    def setUp(self):
+        pass
+
+    def test__get_neighbourhood_hash__ok(self):
+        city_hash = get_city_hash(494, 1045, EAGER_MODE)
+        computed = {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                    [{"name": "Santa Monica", "apartments_count": 3, "distance": 1, "dawn": ["08:14"] * 3},
+                     {"name": "CCCB", "apartments_count": 4, "distance": -1, "dawn": ["08:14"] * 4}],
+                    "unknown": True}
+
+        # Test main
+        result = get_neighbourhood_hash(self.neighbourhood_info, city_hash)
+
+        # Check results: other values are ignored
+        self.assertEqual(len(result), 64)
+        self.assertEqual(get_neighbourhood_hash(computed, city_hash), result)
+
+        # Any value the stored rows depend on changes it
+        changed = [dict(self.neighbourhood_info, neighborhood="GRACIA"),
+                   dict(self.neighbourhood_info, apartments_height=3),
+                   dict(self.neighbourhood_info, buildings=self.neighbourhood_info["buildings"][::-1]),
+                   dict(self.neighbourhood_info, buildings=[dict(self.neighbourhood_info["buildings"][0], distance=2),
+                                                            self.neighbourhood_info["buildings"][1]]),
+                   dict(self.neighbourhood_info, apartments_height=2.0)]
+        for neighbourhood_info in changed:
+            self.assertNotEqual(get_neighbourhood_hash(neighbourhood_info, city_hash), result)
+
+        for other_city_hash in (get_city_hash(495, 1045, EAGER_MODE), get_city_hash(494, 1044, EAGER_MODE),
+                                get_city_hash(494, 1045, LAZY_MODE),
+                                get_city_hash(494, 1045, EAGER_MODE, ([494] * 365, [1045] * 365))):
+            self.assertNotEqual(get_neighbourhood_hash(self.neighbourhood_info, other_city_hash), result)
+
+    def test__get_neighbourhood_hash__ko(self):
+        city_hash = get_city_hash(494, 1045, EAGER_MODE)
+
+        for neighbourhood_info in (None, {}, {"neighborhood": "RAVAL", "apartments_height": 2},
+                                   {"neighborhood": "RAVAL", "apartments_height": 2, "buildings": [{"name": "CCCB"}]},
+                                   {"neighborhood": {1}, "apartments_height": 2, "buildings": []}):
+            # Test main & Check results
+            self.assertIsNone(get_neighbourhood_hash(neighbourhood_info, city_hash))
+
+    def test__find_stored_neighbourhood__ok(self):
+        content_hash = get_neighbourhood_hash(self.neighbourhood_info, get_city_hash(494, 1045, EAGER_MODE))
+        stored_hashes = {"RAVAL": (7, content_hash), "GRACIA": (8, None)}
+
+        # Test main & Check results
+        self.assertEqual(find_stored_neighbourhood(stored_hashes, self.neighbourhood_info, content_hash), 7)
+        self.assertIsNone(find_stored_neighbourhood(stored_hashes, self.neighbourhood_info, content_hash[::-1]))
+        self.assertIsNone(find_stored_neighbourhood(stored_hashes, self.neighbourhood_info, None))
+        self.assertIsNone(find_stored_neighbourhood(stored_hashes, dict(self.neighbourhood_info,
+                                                                        neighborhood="GRACIA"), None))
+        self.assertIsNone(find_stored_neighbourhood({}, self.neighbourhood_info, content_hash))
+        self.assertIsNone(find_stored_neighbourhood(stored_hashes, {"neighborhood": ["RAVAL"]}, content_hash))
@@ -0,0 +1,135 @@
+#!/bin/python3
+
+
+from unittest import mock
+from django.db import OperationalError
+from django.test import TestCase
+
+from ..controller import Controller
+from ..health import DatabaseHealth, CLOSED, OPEN, HALF_OPEN, probe_db
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DatabaseHealthTestCase(TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.probe_result = True
+        self.clock = FakeClock()
+        self.health = DatabaseHealth(probe=lambda: self.probe_result, interval=1, failure_threshold=3, cooldown=10,
+                                     clock=self.clock)
+
+    def test__record_failure__trips__ok(self):
+        # Test main
+        self.health.record_failure()
+        self.health.record_failure()
+        self.assertTrue(self.health.available)
+        self.health.record_failure()
+
+        # Check results
+        self.assertFalse(self.health.available)
+        self.assertEqual(self.health.get_state()["state"], OPEN)
+        self.assertEqual(self.health.get_state()["trips"], 1)
+
+    def test__record_success__resets_failures__ok(self):
+        # Test main
+        self.health.record_failure()
+        self.health.record_failure()
+        self.health.record_success()
+        self.health.record_failure()
+
+        # Check results
+        self.assertTrue(self.health.available)
+        self.assertEqual(self.health.get_state()["consecutive_failures"], 1)
+
+    def test__record_error__locked__ok(self):
+        # Test main: a locked data base is busy, not failing
+        for _ in range(3):
+            self.health.record_error(OperationalError("database is locked"))
+        self.assertTrue(self.health.available)
+        self.assertEqual(self.health.get_state()["consecutive_failures"], 0)
+
+        for _ in range(3):
+            self.health.record_error(OperationalError("unable to open database"))
+
+        # Check results
+        self.assertFalse(self.health.available)
+
+    def test__get_apartment_info__locked__ok(self):
+        apartment_info = {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 0}
+
+        with mock.patch("badi.controller.database_health", self.health):
+            # Test main
+            for _ in range(3):
+                with mock.patch("badi.controller.Controller.get_city_state",
+                                side_effect=OperationalError("database is locked")):
+                    with self.assertRaises(OperationalError):
+                        Controller.get_apartment_info(apartment_info)
+
+            # Check results
+            self.assertTrue(self.health.available)
+
+            for _ in range(3):
+                with mock.patch("badi.controller.Controller.get_city_state",
+                                side_effect=OperationalError("disk I/O error")):
+                    with self.assertRaises(OperationalError):
+                        Controller.get_apartment_info(apartment_info)
+
+            self.assertFalse(self.health.available)
+
+    def test__check__half_opens_after_cooldown__ok(self):
+        for _ in range(3):
+            self.health.record_failure()
+
+        # Test main
+        self.clock.now = 5
+        self.health.check()
+        self.assertEqual(self.health.state, OPEN)
+
+        self.clock.now = 11
+        self.health.check()
+        self.assertEqual(self.health.state, HALF_OPEN)
+        self.assertTrue(self.health.available)
+
+        # A failure while half-open opens the circuit again
+        self.health.record_failure()
+        self.assertEqual(self.health.state, OPEN)
+
+        self.clock.now = 22
+        self.health.check()
+        self.health.record_success()
+
+        # Check results
+        self.assertEqual(self.health.state, CLOSED)
+        self.assertTrue(self.health.available)
+        self.assertEqual(self.health.get_state()["trips"], 2)
+
+    def test__check__probe_fails__ok(self):
+        self.probe_result = False
+
+        # Test main
+        self.health.check()
+
+        # Check results
+        self.assertFalse(self.health.available)
+        self.assertEqual(self.health.get_state()["last_check_ok"], False)
+
+    @mock.patch("badi.health.connection")
+    def test__probe_db__locked__ok(self, _):
+
+        # Test main & Check results: a locked table is being written, so the data base is up
+        with mock.patch("badi.health.City.objects.exists",
+                        side_effect=OperationalError("database table is locked: badi_city")):
+            self.assertTrue(probe_db())
+
+        with mock.patch("badi.health.City.objects.exists", side_effect=OperationalError("unable to open database")):
+            self.assertFalse(probe_db())
@@ -0,0 +1,82 @@
+#!/bin/python3
+
+
+from random import Random
+from django.test import TestCase
+
+from ..horizon import WestHorizon
+from ..sunlight_hours import get_max_west_shadow_details
+
+
+class WestHorizonTestCase(TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        pass
+
+    @staticmethod
+    def get_random_building_list(rnd, size, max_floors, max_distance):
+        building_list = [{"name": str(index), "apartments_count": rnd.randint(1, max_floors),
+                          "distance": rnd.randint(1, max_distance)} for index in range(size)]
+        building_list[-1]["distance"] = -1
+
+        return building_list
+
+    def test__get_west_shadow_details__ok(self):
+        building_list = [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                         {"name": "01", "apartments_count": 4, "distance": 2},
+                         {"name": "CEM", "apartments_count": 7, "distance": 1},
+                         {"name": "30", "apartments_count": 1, "distance": -1}]
+
+        expected_details = [
+            [(1, 1), (1, 1), (1, 1), (1, 1), (2, 3), (2, 3), (2, 3), (-1, 0)],
+            [(2, 2), (2, 2), (2, 2), (2, 2)],
+            [(3, 1), (-1, 0), (-1, 0), (-1, 0), (-1, 0), (-1, 0), (-1, 0)],
+            [(-1, 0)],
+        ]
+
+        # Test main
+        details = WestHorizon(building_list).get_west_shadow_details()
+
+        # Check results
+        self.assertEqual(details, expected_details)
+
+    def test__get_west_shadow_details__same_as_reference__ok(self):
+        rnd = Random(2019)
+
+        for _ in range(200):
+            building_list = self.get_random_building_list(rnd, rnd.randint(1, 25), rnd.randint(1, 20),
+                                                          rnd.randint(1, 6))
+
+            # Test main
+            horizon = WestHorizon(building_list)
+            details = horizon.get_west_shadow_details()
+
+            # Check results
+            for index, building in enumerate(building_list):
+                for floor in range(building["apartments_count"]):
+                    expected = get_max_west_shadow_details(index, building_list, floor)
+
+                    self.assertEqual(details[index][floor], expected)
+                    self.assertEqual(horizon.get_max_west_shadow_details(index, floor), expected)
+
+    def test__get_west_shadow_details__monotone_skyline__ok(self):
+        # Heights growing to the west: every building on the west is a candidate
+        building_list = [{"name": str(index), "apartments_count": index + 1, "distance": 1} for index in range(60)]
+        building_list[-1]["distance"] = -1
+
+        # Test main
+        details = WestHorizon(building_list).get_west_shadow_details()
+
+        # Check results
+        for index, building in enumerate(building_list):
+            for floor in range(building["apartments_count"]):
+                self.assertEqual(details[index][floor], get_max_west_shadow_details(index, building_list, floor))
+
+    def test__get_west_shadow_details__empty__ok(self):
+        # Test main
+        details = WestHorizon([]).get_west_shadow_details()
+
+        # Check results
+        self.assertEqual(details, [])
@@ -0,0 +1,87 @@
+#!/bin/python3
+
+
+import os
+from json import dumps
+from django.test import TestCase
+
+from ..settings import FIXTURE_DIRS
+from ..controller import Controller
+from ..jobs import InitJob, InitJobQueue, QUEUED, SUCCEEDED, FAILED
+
+
+class InitJobTestCase(TestCase):
+
+    maxDiff = None
+    fixtures = [os.path.join(FIXTURE_DIRS[0], 'initial_state.json'), ]
+
+    def setUp(self):
+        pass
+
+    def test__run__ok(self):
+        body = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        job = InitJob(dumps(body).encode())
+        self.assertEqual(job.get_status()["phase"], QUEUED)
+
+        # Test main
+        job.run()
+
+        # Check results
+        status = job.get_status()
+        self.assertTrue(job.wait(0))
+        self.assertEqual(status["phase"], SUCCEEDED)
+        self.assertEqual((status["result"], status["message"]), (True, "Barcelona city updated"))
+        self.assertEqual(status["progress"], {"body_bytes": len(dumps(body)), "parsed_neighbourhoods": 2,
+                                              "computed_neighbourhoods": 2, "persisted_neighbourhoods": 2,
+                                              "persisted_apartments": 13})
+        self.assertGreaterEqual(status["timing"]["finished_at"], status["timing"]["started_at"])
+        self.assertGreaterEqual(status["timing"]["elapsed_seconds"], 0)
+        self.assertIsNone(job.body)
+
+        self.assertEqual(Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "CCCB",
+                                                        "apartment": 3}).dawn, "08:14")
+
+    def test__run__invalid__ko(self):
+        body = '[{"neighborhood": "RAVAL", "apartments_height": 2, "buildings": []}, {"neighborhood": "GRACIA"}]'
+        job = InitJob(body.encode())
+
+        # Test main
+        job.run()
+
+        # Check results
+        status = job.get_status()
+        self.assertEqual(status["phase"], FAILED)
+        self.assertEqual((status["result"], status["message"]), (False, "Invalid city description"))
+        self.assertEqual(status["progress"]["parsed_neighbourhoods"], 2)
+        self.assertEqual(status["progress"]["computed_neighbourhoods"], 1)
+
+    def test__submit__ok(self):
+        jobs = InitJobQueue(max_queued=2, max_kept=2, autostart=False)
+
+        # Test main
+        first = jobs.submit(b"[]")
+        second = jobs.submit(b"[]")
+        third = jobs.submit(b"[]")
+
+        # Check results
+        self.assertIsNone(third)  # The queue is full
+        self.assertIs(jobs.get(first.id), first)
+        self.assertIs(jobs.get(second.id), second)
+        self.assertIsNone(jobs.get("unknown"))
+
+        # Jobs are run in arrival order
+        self.assertIs(jobs.queue.get_nowait(), first)
+        self.assertIsNotNone(jobs.submit(b"[]"))
+
+        # Only the last ones are kept
+        self.assertIsNone(jobs.get(first.id))
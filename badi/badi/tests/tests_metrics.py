@@ -0,0 +1,89 @@
+#!/bin/python3
+
+
+from django.test import SimpleTestCase
+
+from ..metrics import Counter, Histogram, Registry, Timer, iter_timed
+
+
+class MetricsTestCase(SimpleTestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        pass
+
+    def test__counter__ok(self):
+        counter = Counter("requests_total", "Requests.", ("method",))
+
+        # Test main
+        counter.inc(1, "GET")
+        counter.inc(2, "GET")
+        counter.inc(1, "PUT")
+
+        # Check results
+        self.assertEqual(counter.get("GET"), 3)
+        self.assertEqual(counter.get("POST"), 0)
+        self.assertEqual(counter.get_samples(), [("requests_total", (("method", "GET"),), 3),
+                                                 ("requests_total", (("method", "PUT"),), 1)])
+
+    def test__histogram__ok(self):
+        histogram = Histogram("seconds", "Seconds.", ("phase",), buckets=(1, 5))
+
+        # Test main
+        histogram.observe(0.5, "parse")
+        histogram.observe(1, "parse")
+        histogram.observe(3, "parse")
+        histogram.observe(10, "parse")
+
+        # Check results
+        self.assertEqual(histogram.get_count("parse"), 4)
+        self.assertEqual(histogram.get_samples(), [
+            ("seconds_bucket", (("phase", "parse"), ("le", "1")), 2),
+            ("seconds_bucket", (("phase", "parse"), ("le", "5")), 3),
+            ("seconds_bucket", (("phase", "parse"), ("le", "+Inf")), 4),
+            ("seconds_sum", (("phase", "parse"),), 14.5),
+            ("seconds_count", (("phase", "parse"),), 4),
+        ])
+
+    def test__render__ok(self):
+        registry = Registry()
+        counter = registry.register(Counter("rows_total", "Rows.", ("operation",)))
+        registry.register_collector(lambda: [("cache_entries", "gauge", "Entries.", [((), 7)])])
+        counter.inc(5, 'in"sert')
+
+        # Test main
+        result = registry.render()
+
+        # Check results
+        self.assertEqual(result, "# HELP rows_total Rows.\n"
+                                 "# TYPE rows_total counter\n"
+                                 'rows_total{operation="in\\"sert"} 5\n'
+                                 "# HELP cache_entries Entries.\n"
+                                 "# TYPE cache_entries gauge\n"
+                                 "cache_entries 7\n")
+
+    def test__timer__ok(self):
+        histogram = Histogram("seconds", "Seconds.", ("view", "phase"))
+        timer = Timer(histogram, "init")
+
+        # Test main
+        timer.lap("parse")
+        timer.lap("persist")
+        timer.finish()
+
+        # Check results
+        self.assertEqual(histogram.get_count("init", "parse"), 1)
+        self.assertEqual(histogram.get_count("init", "persist"), 1)
+        self.assertEqual(histogram.get_count("init", "total"), 1)
+
+    def test__iter_timed__ok(self):
+        times = {}
+
+        # Test main
+        result = list(iter_timed(iter_timed(range(3), times, "inner"), times, "outer"))
+
+        # Check results
+        self.assertEqual(result, [0, 1, 2])
+        self.assertEqual(sorted(times), ["inner", "outer"])
+        self.assertGreaterEqual(times["outer"], times["inner"])
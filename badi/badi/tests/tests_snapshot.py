@@ -0,0 +1,291 @@
+#!/bin/python3
+
+
+import os
+import struct
+from tempfile import TemporaryDirectory, TemporaryFile
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+
+from ..settings import FIXTURE_DIRS
+from ..city import City
+from ..constants import COMPRESSED_MODE
+from ..controller import Controller
+from ..models import Apartment
+from ..snapshot import CitySnapshot, SnapshotStore, write_snapshot
+
+
+class SnapshotTestCase(SimpleTestCase):
+
+    maxDiff = None
+
+    neighbourhoods = [
+        ("RAVAL", [("Santa Monica", [(494, 1045), (559, 1045), (633, 1045)]),
+                   ("CCCB", [(494, 1045), None])]),
+        ("POBLENOU", [("Aticco", [(500, 900)]),
+                      ("01", [])]),
+        ("ÀNIMA", [("Ñ", [(1, 2)])]),
+    ]
+
+    def setUp(self):
+        pass
+
+    def write(self, directory, neighbourhoods, version=1, file_name="city.snapshot"):
+        path = os.path.join(directory, file_name)
+
+        with open(path, "wb") as snapshot_file:
+            write_snapshot(snapshot_file, version, neighbourhoods)
+
+        return path
+
+    def test__write_snapshot__ok(self):
+        with TemporaryDirectory() as directory:
+
+            # Test main
+            snapshot = CitySnapshot(self.write(directory, self.neighbourhoods, version=7))
+
+            # Check results
+            self.assertEqual(snapshot.version, 7)
+            self.assertEqual((snapshot.neighbourhood_count, snapshot.building_count, snapshot.floor_count), (3, 5, 7))
+
+            for neighbourhood_name, building_list in self.neighbourhoods:
+                for building_name, floors in building_list:
+                    for floor, minutes in enumerate(floors):
+                        self.assertEqual(snapshot.get_minutes(neighbourhood_name, building_name, floor), minutes)
+
+            apartment = snapshot.get_apartment("RAVAL", "Santa Monica", 2)
+            self.assertIsInstance(apartment, Apartment)
+            self.assertEqual((apartment.floor, apartment.dawn, apartment.sunset), (2, "10:33", "17:25"))
+
+            snapshot.close()
+
+    def test__write_snapshot__not_found__ok(self):
+        with TemporaryDirectory() as directory:
+            snapshot = CitySnapshot(self.write(directory, self.neighbourhoods))
+
+            # Test main & Check results
+            self.assertIsNone(snapshot.get_apartment("GRACIA", "CCCB", 0))
+            self.assertIsNone(snapshot.get_apartment("RAVAL", "Aticco", 0))
+            self.assertIsNone(snapshot.get_apartment("RAVAL", "CCCB", 1))
+            self.assertIsNone(snapshot.get_apartment("RAVAL", "CCCB", 2))
+            self.assertIsNone(snapshot.get_apartment("RAVAL", "CCCB", -1))
+            self.assertIsNone(snapshot.get_apartment("POBLENOU", "01", 0))
+
+            snapshot.close()
+
+    def test__write_snapshot__empty__ok(self):
+        with TemporaryDirectory() as directory:
+
+            # Test main
+            snapshot = CitySnapshot(self.write(directory, []))
+
+            # Check results
+            self.assertIsNone(snapshot.get_apartment("RAVAL", "CCCB", 0))
+
+            snapshot.close()
+
+    def test__city_snapshot__ko(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "city.snapshot")
+
+            for content in (b"", b"NOTASNAPSHOT" * 10):
+                with open(path, "wb") as snapshot_file:
+                    snapshot_file.write(content)
+
+                # Test main & Check results
+                with self.assertRaises(ValueError):
+                    CitySnapshot(path)
+
+            # Truncated
+            with TemporaryFile() as snapshot_file:
+                write_snapshot(snapshot_file, 1, self.neighbourhoods)
+                snapshot_file.seek(0)
+                content = snapshot_file.read()
+
+            with open(path, "wb") as snapshot_file:
+                snapshot_file.write(content[:-1])
+
+            with self.assertRaises(ValueError):
+                CitySnapshot(path)
+
+    def test__city_snapshot__iter_neighbourhoods__ok(self):
+        with TemporaryDirectory() as directory:
+            snapshot = CitySnapshot(self.write(directory, self.neighbourhoods, version=7))
+
+            # Test main
+            neighbourhoods = list(snapshot.iter_neighbourhoods(skip={"POBLENOU"}))
+
+            # Check results: packed floors are written again as they are
+            self.assertEqual(sorted(name for name, _ in neighbourhoods), ["RAVAL", "ÀNIMA"])
+            copy = CitySnapshot(self.write(directory, neighbourhoods, file_name="copy.snapshot"))
+            self.assertEqual(copy.floor_count, 6)
+            for neighbourhood_name, building_list in self.neighbourhoods:
+                for building_name, floors in building_list:
+                    for floor, minutes in enumerate(floors):
+                        self.assertEqual(copy.get_minutes(neighbourhood_name, building_name, floor),
+                                         None if neighbourhood_name == "POBLENOU" else minutes)
+
+            copy.close()
+            snapshot.close()
+
+    def test__snapshot_store__ok(self):
+        now = [0.0]
+
+        with TemporaryDirectory() as directory:
+            writer = SnapshotStore(directory=directory, reload_interval=1, clock=lambda: now[0])
+            reader = SnapshotStore(directory=directory, reload_interval=1, clock=lambda: now[0])
+
+            # Test main
+            self.assertIsNone(reader.get("Barcelona"))
+            writer.publish("Barcelona", 1, self.neighbourhoods)
+
+            # Check results: the writer sees it right away, other processes once the reload interval has elapsed
+            self.assertEqual(writer.get("Barcelona").version, 1)
+            self.assertIsNone(reader.get("Barcelona"))
+            now[0] += 1
+            self.assertEqual(reader.get("Barcelona").get_minutes("RAVAL", "CCCB", 0), (494, 1045))
+
+            # A new version replaces it (and removes the prior file)
+            writer.publish("Barcelona", 2, [("RAVAL", [("CCCB", [(600, 1000)])])], revision=3)
+            self.assertEqual(reader.get("Barcelona").version, 1)
+            now[0] += 1
+            self.assertEqual((reader.get("Barcelona").version, reader.get("Barcelona").revision), (2, 3))
+            self.assertEqual(reader.get("Barcelona").get_minutes("RAVAL", "CCCB", 0), (600, 1000))
+            self.assertEqual(len([name for name in os.listdir(directory) if name.endswith(".snapshot")]), 1)
+
+            # Other cities are not affected
+            self.assertIsNone(reader.get("Madrid"))
+
+            # Withdrawn
+            writer.unpublish("Barcelona")
+            self.assertIsNone(writer.get("Barcelona"))
+            now[0] += 1
+            self.assertIsNone(reader.get("Barcelona"))
+
+    def test__snapshot_store__disabled__ok(self):
+        store = SnapshotStore(directory=None)
+
+        # Test main & Check results
+        self.assertFalse(store.is_enabled())
+        self.assertIsNone(store.get("Barcelona"))
+
+
+class CitySnapshotTestCase(TestCase):
+
+    maxDiff = None
+    fixtures = [os.path.join(FIXTURE_DIRS[0], 'initial_state.json'), ]
+
+    city_info = [
+        {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+            [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+             {"name": "01", "apartments_count": 4, "distance": 2},
+             {"name": "CEM", "apartments_count": 7, "distance": 1},
+             {"name": "30", "apartments_count": 1, "distance": -1}
+             ]
+         },
+        {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+            [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+             {"name": "CCCB", "apartments_count": 4, "distance": -1}
+             ]
+         }
+    ]
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.store = SnapshotStore(directory=self.directory.name, reload_interval=1)
+        patcher = mock.patch("badi.controller.snapshot_store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def check_snapshot(self):
+        snapshot = self.store.get("Barcelona")
+        apartments = Apartment.objects.select_related("building__neighbourhood").filter(
+            building__neighbourhood__city_id="Barcelona")
+
+        self.assertEqual(snapshot.floor_count, len(apartments))
+        for apartment in apartments:
+            self.assertEqual(snapshot.get_minutes(apartment.building.neighbourhood.name, apartment.building.name,
+                                                  apartment.floor),
+                             (apartment.dawn_minutes, apartment.sunset_minutes))
+
+    def test__save_city__snapshot__ok(self):
+
+        # Test main
+        City(self.city_info).save()
+
+        # Check results: lookups are answered without querying the data base
+        self.check_snapshot()
+        with self.assertNumQueries(0):
+            apartment = Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 0})
+            apartments = Controller.get_apartments_info([{"neighbourhood": "RAVAL", "building": "CCCB",
+                                                          "apartment": 4},
+                                                         {"neighbourhood": "POBLENOU", "building": "Aticco",
+                                                          "apartment": 7}])
+        self.assertEqual(apartment.dawn, "12:20")
+        self.assertIsNone(apartments[0])
+        self.assertEqual(apartments[1].floor, 7)
+
+        # Building changes rewrite it, only reading the changed neighbourhood from the data base
+        with mock.patch.object(Controller, "iter_snapshot_neighbourhoods",
+                               wraps=Controller.iter_snapshot_neighbourhoods) as iter_snapshot_neighbourhoods:
+            Controller.update_building("POBLENOU", "30", apartments_count=3)
+            Controller.delete_building("RAVAL", "Santa Monica")
+            Controller.insert_building("RAVAL", "La Capella", 2, distance=1, position=0)
+        self.assertEqual([call[0][3] for call in iter_snapshot_neighbourhoods.call_args_list],
+                         [["POBLENOU"], ["RAVAL"], ["RAVAL"]])
+        self.check_snapshot()
+        self.assertIsNone(Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "Santa Monica",
+                                                         "apartment": 0}))
+
+    def test__save_city__snapshot__compressed__ok(self):
+        City(self.city_info).save()
+        expected = self.store.get("Barcelona")
+        expected = {(neighbourhood["neighborhood"], building["name"], floor): expected.get_minutes(
+            neighbourhood["neighborhood"], building["name"], floor) for neighbourhood in self.city_info
+            for building in neighbourhood["buildings"] for floor in range(building["apartments_count"])}
+
+        # Test main
+        City(self.city_info, mode=COMPRESSED_MODE).save()
+
+        # Check results: floor ranges are expanded into floors
+        snapshot = self.store.get("Barcelona")
+        self.assertEqual(snapshot.floor_count, len(expected))
+        for key, minutes in expected.items():
+            self.assertEqual(snapshot.get_minutes(*key), minutes)
+
+    def test__save_city__snapshot__ko(self):
+
+        # Test main
+        with mock.patch("badi.snapshot.write_snapshot", side_effect=OSError("No space left on device")):
+            City(self.city_info).save()
+
+        # Check results: the city is saved anyway, and lookups go to the data base
+        self.assertIsNone(self.store.get("Barcelona"))
+        self.assertEqual(Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "CCCB",
+                                                        "apartment": 0}).dawn, "12:20")
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test__save_city__snapshot__struct_error__ko(self):
+        City(self.city_info).save()
+
+        # Test main: minutes that do not fit in the snapshot
+        with mock.patch("badi.snapshot.write_snapshot", side_effect=struct.error("ushort format requires 0 <= number")):
+            Controller.update_city_daylight("07:00", "19:00")
+
+        # Check results: the prior snapshot is withdrawn, so lookups see the new daylight in the data base
+        self.assertIsNone(self.store.get("Barcelona"))
+        self.assertEqual(Controller.get_apartment_info({"neighbourhood": "RAVAL", "building": "CCCB",
+                                                        "apartment": 3}).dawn, "07:00")
+
+    def test__sunlight_hours__db_unavailable__ok(self):
+        City(self.city_info).save()
+
+        # Test main
+        with mock.patch("badi.controller.database_health.is_available", return_value=False):
+            response = self.client.put('/sunlight_hours', '{"neighbourhood": "RAVAL", "building": "CCCB", '
+                                                          '"apartment": 0}', content_type="application/json")
+
+        # Check results
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode(), "12:20 - 17:25")
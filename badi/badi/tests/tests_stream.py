@@ -0,0 +1,60 @@
+#!/bin/python3
+
+
+from io import BytesIO
+from json import JSONDecodeError, dumps
+from django.test import TestCase
+
+from ..stream import iter_json_array, NotAJSONArrayError
+
+
+class StreamTestCase(TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        pass
+
+    def test__iter_json_array__ok(self):
+        values = [{"neighborhood": "RAVAL", "apartments_height": 2, "buildings": [
+                    {"name": "Ça Monica", "apartments_count": 3, "distance": 1}]},
+                  12345, -1.5e3, "a, b]", [], {}, None, True]
+        body = dumps(values, ensure_ascii=False, indent=2).encode("utf-8")
+
+        for chunk_size in (1, 2, 7, 64, len(body)):
+            # Test main
+            result = list(iter_json_array(BytesIO(body), chunk_size))
+
+            # Check results
+            self.assertEqual(result, values)
+
+    def test__iter_json_array__empty__ok(self):
+        # Test main
+        result = list(iter_json_array(BytesIO(b"  [ ]\n"), 1))
+
+        # Check results
+        self.assertEqual(result, [])
+
+    def test__iter_json_array__lazy__ok(self):
+        stream = BytesIO(b'[{"a": 1}, {"b": 2}, ' + b' ' * 1000 + b'{"c": 3}]')
+
+        # Test main
+        elements = iter_json_array(stream, 16)
+        first = next(elements)
+
+        # Check results
+        self.assertEqual(first, {"a": 1})
+        self.assertLess(stream.tell(), 100)
+        self.assertEqual(list(elements), [{"b": 2}, {"c": 3}])
+
+    def test__iter_json_array__invalid__ok(self):
+        for body in (b"", b"   ", b"[", b"[1,", b"[1,]", b"[,1]", b"[1 2]", b"[1] 2", b"[{\"a\": }]", b"nope"):
+            # Test main & Check results
+            with self.assertRaises(JSONDecodeError, msg=body):
+                list(iter_json_array(BytesIO(body), 2))
+
+    def test__iter_json_array__not_an_array__ok(self):
+        for body in (b'{"a": [1]}', b'"abc"', b"12"):
+            # Test main & Check results
+            with self.assertRaises(NotAJSONArrayError, msg=body):
+                list(iter_json_array(BytesIO(body), 2))
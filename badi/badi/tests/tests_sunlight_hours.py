@@ -1,11 +1,18 @@
 #!/bin/python3
 
 
+from copy import deepcopy
+from math import atan, degrees
+from random import Random
 from django.test import TestCase
 
+from ..clock import MINUTES_PER_DAY, parse_time
 from ..constants import DEFAULT_CITY, DEFAULT_CITY_VALUES
 from ..sunlight_hours import get_apartment_dawn, get_apartment_sunset, elapsed_time, get_max_west_shadow_details, \
-    get_neighbourhood_sunlight_hours
+    get_neighbourhood_sunlight_hours, compute_city_sunlight_hours, get_balanced_shards, iter_city_sunlight_hours, \
+    get_neighbourhood_sunlight_minutes, check_neighbourhood_geometry, NeighbourhoodHorizon, get_floor_ranges, \
+    find_floor_range, get_ranking, get_neighbourhood_shadow_angles, rescale_neighbourhood_minutes, pack_angles, \
+    unpack_angles, get_sunlit_counts, pack_counts, unpack_counts, get_buildings_shadow_angles, get_changed_buildings
 
 
 class SunlightHoursTestCase(TestCase):
@@ -20,6 +27,7 @@ class SunlightHoursTestCase(TestCase):
         values = [
             (22.25, 180, "09:20"),
             (76.0, 180, "12:02"),
+            (-45.0, 180, "08:14"),  # A lower obstacle casts no shadow
         ]
 
         # Test main
@@ -125,4 +133,305 @@ class SunlightHoursTestCase(TestCase):
              }
         ]
 
+        # The angles of the shadows are added too: e.g., the ones from the east on 01 are cast by Aticco (1 unit away)
+        east_angles = [building.pop("east_angles") for building in building_list]
+        west_angles = [building.pop("west_angles") for building in building_list]
         self.assertEqual(building_list, expected_building_list)
+        self.assertEqual((east_angles, west_angles), get_neighbourhood_shadow_angles(building_list, apartments_height))
+        self.assertEqual(east_angles[1], [degrees(atan(8 - floor)) for floor in range(4)])
+
+    @staticmethod
+    def get_random_city_info(rnd, size):
+        city_info = []
+
+        for index in range(size):
+            buildings = [{"name": str(b_index), "apartments_count": rnd.randint(1, 15),
+                          "distance": rnd.randint(1, 5)} for b_index in range(rnd.randint(1, 30))]
+            buildings[-1]["distance"] = -1
+            city_info.append({"neighborhood": str(index), "apartments_height": rnd.randint(1, 3),
+                              "buildings": buildings})
+
+        return city_info
+
+    def test__get_balanced_shards__ok(self):
+        costs = [7, 3, 5, 5, 2, 8]
+
+        # Test main
+        shards = get_balanced_shards(costs, 3)
+
+        # Check results
+        self.assertEqual(shards, [[4, 5], [0, 1], [2, 3]])
+        self.assertEqual(sorted(index for shard in shards for index in shard), list(range(len(costs))))
+        self.assertEqual(sorted(sum(costs[index] for index in shard) for shard in shards), [10, 10, 10])
+        self.assertEqual(shards, get_balanced_shards(costs, 3))
+
+        # Never more shards than items
+        self.assertEqual(get_balanced_shards([1, 2], 8), [[1], [0]])
+        self.assertEqual(get_balanced_shards([], 8), [])
+
+    def test__compute_city_sunlight_hours__parallel__ok(self):
+        city_info = self.get_random_city_info(Random(2019), 9)
+        expected_city_info = deepcopy(city_info)
+        self.assertTrue(compute_city_sunlight_hours(expected_city_info, DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                                                    DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"]))
+
+        # Test main
+        result = compute_city_sunlight_hours(city_info, DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                                             DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], workers=3)
+
+        # Check results
+        self.assertTrue(result)
+        self.assertEqual(city_info, expected_city_info)
+
+    def test__compute_city_sunlight_hours__parallel__invalid__ok(self):
+        city_info = self.get_random_city_info(Random(2019), 3)
+        city_info[1]["buildings"][0]["apartments_count"] = "3"
+
+        # Test main
+        result = compute_city_sunlight_hours(city_info, DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                                             DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], workers=2)
+
+        # Check results
+        self.assertFalse(result)
+
+    def test__iter_city_sunlight_hours__parallel__ok(self):
+        city_info = self.get_random_city_info(Random(2020), 7)
+        city_info[4]["buildings"] = None
+        expected_city_info = deepcopy(city_info)
+        expected = [computed for _, computed in iter_city_sunlight_hours(
+            iter(expected_city_info), DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+            DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"])]
+
+        # Test main
+        result = list(iter_city_sunlight_hours(iter(city_info), DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                                               DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], workers=2))
+
+        # Check results
+        self.assertEqual(expected, [True, True, True, True, False, True, True])
+        self.assertEqual([computed for _, computed in result], expected)
+        self.assertEqual([neighbourhood for neighbourhood, _ in result], expected_city_info)
+        self.assertTrue(all(neighbourhood is expected for (neighbourhood, _), expected in zip(result, city_info)))
+
+    def test__iter_city_sunlight_hours__skip__ok(self):
+        city_info = self.get_random_city_info(Random(2021), 7)
+        skipped = {1, 2, 5}
+
+        for workers in (1, 2):
+            neighbourhoods = deepcopy(city_info)
+
+            # Test main
+            result = list(iter_city_sunlight_hours(
+                iter(neighbourhoods), DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], workers=workers,
+                skip=lambda neighbourhood: any(neighbourhood is neighbourhoods[index] for index in skipped)))
+
+            # Check results: skipped ones are yielded in order, as they are
+            self.assertEqual([computed for _, computed in result],
+                             [None if index in skipped else True for index in range(len(city_info))])
+            self.assertTrue(all(neighbourhood is expected for (neighbourhood, _), expected in zip(result,
+                                                                                                 neighbourhoods)))
+            self.assertEqual([neighbourhood for index, neighbourhood in enumerate(neighbourhoods) if index in skipped],
+                             [neighbourhood for index, neighbourhood in enumerate(city_info) if index in skipped])
+
+
+    def test__get_neighbourhood_sunlight_minutes__lower_east__ok(self):
+        dawn_minutes = parse_time(DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"])
+        sunset_minutes = parse_time(DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"])
+        building_list = [{"name": "Low", "apartments_count": 1, "distance": 1},
+                         {"name": "High", "apartments_count": 10, "distance": -1}]
+
+        # Test main
+        dawn, sunset = get_neighbourhood_sunlight_minutes(building_list, dawn_minutes, sunset_minutes, 1)
+
+        # Check results: the floors above the building on the east get the city dawn (not an earlier one)
+        self.assertGreater(dawn[1][0], dawn_minutes)
+        self.assertEqual(dawn[1][1:], [dawn_minutes] * 9)
+
+        for neighbourhood in self.get_random_city_info(Random(2028), 10):
+            dawn, sunset = get_neighbourhood_sunlight_minutes(neighbourhood["buildings"], dawn_minutes,
+                                                              sunset_minutes, neighbourhood["apartments_height"])
+            self.assertTrue(all(dawn_minutes <= minutes <= sunset_minutes
+                                for building_minutes in dawn + sunset for minutes in building_minutes))
+
+    def test__neighbourhood_horizon__ok(self):
+        dawn_minutes = parse_time(DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"])
+        sunset_minutes = parse_time(DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"])
+
+        for neighbourhood in self.get_random_city_info(Random(2021), 10):
+            building_list = neighbourhood["buildings"]
+            expected_dawn, expected_sunset = get_neighbourhood_sunlight_minutes(
+                building_list, dawn_minutes, sunset_minutes, neighbourhood["apartments_height"])
+
+            # Test main
+            horizon = NeighbourhoodHorizon(building_list, dawn_minutes, sunset_minutes,
+                                           neighbourhood["apartments_height"])
+
+            # Check results
+            for index, building in enumerate(building_list):
+                self.assertEqual([horizon.get_apartment_minutes(index, floor)
+                                  for floor in range(building["apartments_count"])],
+                                 list(zip(expected_dawn[index], expected_sunset[index])))
+
+    def test__check_neighbourhood_geometry__ok(self):
+        neighbourhood = {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                         [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                          {"name": "CCCB", "apartments_count": 0, "distance": -1}]}
+
+        # Test main & Check results
+        self.assertTrue(check_neighbourhood_geometry(neighbourhood))
+
+    def test__check_neighbourhood_geometry__ko(self):
+        invalid_values = [("apartments_height", "2"), ("buildings", None), ("buildings", [{"name": "CCCB"}]),
+                          ("buildings", [{"name": 1, "apartments_count": 3, "distance": 1}]),
+                          ("buildings", [{"name": "CCCB", "apartments_count": -1, "distance": 1}]),
+                          ("buildings", [{"name": "CCCB", "apartments_count": 3.0, "distance": 1}]),
+                          ("buildings", [{"name": "CCCB", "apartments_count": 3, "distance": 0}])]
+
+        for key, value in invalid_values:
+            neighbourhood = {"neighborhood": "RAVAL", "apartments_height": 2, "buildings": []}
+            neighbourhood[key] = value
+
+            # Test main & Check results
+            self.assertFalse(check_neighbourhood_geometry(neighbourhood))
+
+    def test__get_floor_ranges__ok(self):
+        dawn = ["12:20", "12:20", "12:20", "08:14", "08:14"]
+        sunset = ["13:19", "17:25", "17:25", "17:25", "17:25"]
+
+        # Test main
+        result = get_floor_ranges(dawn, sunset)
+
+        # Check results
+        self.assertEqual(result, [(0, 0, "12:20", "13:19"), (1, 2, "12:20", "17:25"), (3, 4, "08:14", "17:25")])
+        self.assertEqual(get_floor_ranges([], []), [])
+
+    def test__find_floor_range__ok(self):
+        floor_ranges = [(0, 0, 740, 799), (1, 2, 740, 1045), (3, 4, 494, 1045)]
+
+        # Test main & Check results
+        self.assertEqual([find_floor_range(floor_ranges, floor) for floor in range(5)],
+                         [floor_ranges[0], floor_ranges[1], floor_ranges[1], floor_ranges[2], floor_ranges[2]])
+        self.assertIsNone(find_floor_range(floor_ranges, 5))
+        self.assertIsNone(find_floor_range(floor_ranges, -1))
+        self.assertIsNone(find_floor_range([(2, 3, 740, 799)], 1))
+        self.assertIsNone(find_floor_range([], 0))
+
+    def test__get_ranking__ok(self):
+        items = [(300, 0, 0, 1), (500, 0, 1, 3), (500, 1, 0, 1), (300, 1, 1, 2), (600, 2, 0, 1)]
+
+        # Test main & Check results: ties are broken by building and then by floor
+        self.assertEqual(get_ranking(items, 100), {(2, 0): 1, (0, 1): 2, (1, 0): 5, (0, 0): 6, (1, 1): 7})
+        self.assertEqual(get_ranking(reversed(items), 100), get_ranking(items, 100))
+        # Only the first positions (a run could go beyond them)
+        self.assertEqual(get_ranking(items, 3), {(2, 0): 1, (0, 1): 2})
+        self.assertEqual(get_ranking(items, 5), {(2, 0): 1, (0, 1): 2, (1, 0): 5})
+        self.assertEqual(get_ranking([], 5), {})
+
+    def test__rescale_neighbourhood_minutes__ok(self):
+        rnd = Random(2023)
+
+        for _ in range(20):
+            building_list = [{"name": str(index), "apartments_count": rnd.randint(0, 30),
+                              "distance": rnd.randint(1, 6)} for index in range(rnd.randint(1, 15))]
+            building_list[-1]["distance"] = -1
+            apartment_height = rnd.randint(1, 3)
+            east_angles, west_angles = get_neighbourhood_shadow_angles(building_list, apartment_height)
+
+            # Stored angles are the same ones
+            east_angles = [unpack_angles(pack_angles(building_angles)) for building_angles in east_angles]
+            west_angles = [unpack_angles(pack_angles(building_angles)) for building_angles in west_angles]
+
+            for _ in range(5):
+                city_dawn = rnd.randint(0, 720)
+                city_sunset = rnd.randint(city_dawn + 1, 1439)
+
+                # Test main
+                result = rescale_neighbourhood_minutes(east_angles, west_angles, city_dawn, city_sunset)
+
+                # Check results: same as computing the neighbourhood again
+                self.assertEqual(result, get_neighbourhood_sunlight_minutes(building_list, city_dawn, city_sunset,
+                                                                            apartment_height))
+
+    def test__get_buildings_shadow_angles__ok(self):
+        rnd = Random(2025)
+        building_list = [{"name": str(index), "apartments_count": rnd.randint(0, 20), "distance": rnd.randint(1, 6)}
+                         for index in range(12)]
+        building_list[-1]["distance"] = -1
+        east_angles, west_angles = get_neighbourhood_shadow_angles(building_list, 2)
+
+        # Test main & Check results: same as the angles of the whole neighbourhood
+        self.assertEqual(get_buildings_shadow_angles(building_list, 2, [7, 0, 11]),
+                         ([east_angles[7], east_angles[0], east_angles[11]],
+                          [west_angles[7], west_angles[0], west_angles[11]]))
+        self.assertEqual(get_buildings_shadow_angles(building_list, 2, []), ([], []))
+
+    def test__get_changed_buildings__ok(self):
+        rnd = Random(2026)
+
+        for _ in range(300):
+            prior_building_list = [{"name": str(index), "apartments_count": rnd.randint(0, 12),
+                                    "distance": rnd.randint(1, 4)} for index in range(rnd.randint(2, 15))]
+            prior_building_list[-1]["distance"] = -1
+            building_list = deepcopy(prior_building_list)
+            position = rnd.randrange(len(building_list) - 1)
+
+            action = rnd.choice(["insert", "height", "distance", "delete"])
+            if action == "insert":
+                building_list.insert(position, {"name": "new", "apartments_count": rnd.randint(0, 12),
+                                                "distance": rnd.randint(1, 4)})
+                if position > 0 and rnd.random() < 0.5:
+                    building_list[position - 1]["distance"] = rnd.randint(1, 4)
+            elif action == "height":
+                building_list[position]["apartments_count"] = rnd.randint(0, 12)
+            elif action == "distance":
+                building_list[position]["distance"] = rnd.randint(1, 4)
+            else:
+                deleted = building_list.pop(position)
+                if position > 0:
+                    building_list[position - 1]["distance"] += deleted["distance"]
+
+            # Test main
+            result = get_changed_buildings(prior_building_list, building_list)
+
+            # Check results: the shadows on the other buildings are the same ones
+            prior_angles = dict(zip((building["name"] for building in prior_building_list),
+                                    zip(*get_neighbourhood_shadow_angles(prior_building_list, 1))))
+            angles = list(zip(*get_neighbourhood_shadow_angles(building_list, 1)))
+            self.assertEqual(result, sorted(set(result)))
+            for index, building in enumerate(building_list):
+                if index not in result:
+                    self.assertEqual(angles[index], prior_angles[building["name"]], (action, position, index))
+
+            # Every building if the distances are not valid
+            if len(building_list) > 1:
+                building_list[0]["distance"] = 0
+                self.assertEqual(get_changed_buildings(prior_building_list, building_list),
+                                 list(range(len(building_list))))
+
+        # Nothing changed
+        self.assertEqual(get_changed_buildings(prior_building_list, deepcopy(prior_building_list)), [])
+
+    def test__get_sunlit_counts__ok(self):
+        rnd = Random(2024)
+        items = [(rnd.randint(-30, 1439), rnd.randint(0, 1470), rnd.randint(1, 5)) for _ in range(200)]
+        items += [(600, 600, 2), (700, 650, 3), (0, 1439, 1)]
+
+        # Test main
+        result = get_sunlit_counts(items)
+
+        # Check results: same as checking every run at every minute (both ends included)
+        self.assertEqual(len(result), MINUTES_PER_DAY)
+        self.assertEqual(result, [sum(count for dawn, sunset, count in items if dawn <= minutes <= sunset)
+                                  for minutes in range(MINUTES_PER_DAY)])
+        self.assertEqual(get_sunlit_counts([]), [0] * MINUTES_PER_DAY)
+
+    def test__pack_counts__ok(self):
+        counts = [0, 1, 300, 70000]
+
+        # Test main
+        result = pack_counts(counts)
+
+        # Check results: little-endian unsigned 32-bit integers
+        self.assertEqual(result, b"\x00\x00\x00\x00\x01\x00\x00\x00\x2c\x01\x00\x00\x70\x11\x01\x00")
+        self.assertEqual(unpack_counts(result), counts)
+        self.assertEqual(unpack_counts(memoryview(result)), counts)
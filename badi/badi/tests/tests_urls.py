@@ -2,10 +2,16 @@
 
 
 import os
+import tempfile
 from json import dumps
+from unittest import mock
 from django.test import TestCase
 
 from ..settings import FIXTURE_DIRS
+from ..city import City
+from ..constants import DAYS_PER_YEAR, LAZY_MODE
+from ..jobs import InitJobQueue
+from ..models import City as CityModel
 
 
 class InitViewTestCase(TestCase):
@@ -54,6 +60,186 @@ class InitViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content.decode(), "Barcelona city updated")
 
+    def test__init__duplicated_building__ko(self):
+        body = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+
+        # Test main
+        response = self.client.post('/init',
+                                    dumps(body),
+                                    content_type="application/json")
+
+        # Check results
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content.decode(), "Impossible to update Barcelona city")
+
+    def test__init__async__ok(self):
+        body = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        jobs = InitJobQueue(autostart=False)
+
+        with mock.patch("badi.views.init.init_jobs", jobs):
+            # Test main
+            response = self.client.post('/init?async=true',
+                                        dumps(body),
+                                        content_type="application/json")
+
+            # Check results
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()["phase"], "queued")
+            self.assertEqual(response["Location"], "/init/{}".format(response.json()["id"]))
+
+            # Run the job in the foreground
+            jobs.queue.get_nowait().run()
+
+            response = self.client.get(response["Location"])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["phase"], "succeeded")
+            self.assertEqual(response.json()["message"], "Barcelona city updated")
+            self.assertEqual(response.json()["progress"]["persisted_apartments"], 4)
+
+            self.assertEqual(self.client.get('/init/unknown').status_code, 404)
+
+    def test__building__ok(self):
+        body = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.client.post('/init', dumps(body), content_type="application/json")
+
+        # Test main
+        response = self.client.post('/building',
+                                    dumps({"neighbourhood": "RAVAL", "building": "La Capella", "apartments_count": 2,
+                                           "distance": 1, "position": 1}),
+                                    content_type="application/json")
+
+        # Check results
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["apartments"]["created"], 2)
+
+        response = self.client.put('/sunlight_hours',
+                                   dumps({"neighbourhood": "RAVAL", "building": "La Capella", "apartment": 1}),
+                                   content_type="application/json")
+        self.assertEqual(response.content.decode(), "12:06 - 13:19")
+
+        response = self.client.put('/building',
+                                   dumps({"neighbourhood": "RAVAL", "building": "CCCB", "apartments_count": 1}),
+                                   content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["apartments"]["deleted"], 3)
+
+        response = self.client.delete('/building',
+                                      dumps({"neighbourhood": "RAVAL", "building": "La Capella"}),
+                                      content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["buildings"]["deleted"], 1)
+
+    def test__building__ko(self):
+        # Test main & Check results
+        response = self.client.delete('/building', dumps({"neighbourhood": "RAVAL", "building": "CCCB"}),
+                                      content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.put('/building', dumps({"neighbourhood": "RAVAL"}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.put('/building', dumps({"neighbourhood": "RAVAL", "building": "CCCB",
+                                                       "apartments_count": "3"}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/building', dumps({"neighbourhood": "RAVAL", "building": "CCCB"}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        body = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.client.post('/init', dumps(body), content_type="application/json")
+        for distance in (0, -5):
+            response = self.client.put('/building', dumps({"neighbourhood": "RAVAL", "building": "Santa Monica",
+                                                           "distance": distance}), content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+        response = self.client.put('/building', dumps({"neighbourhood": "RAVAL", "building": "CCCB",
+                                                       "apartments_count": -1}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test__building__no_floors__ok(self):
+        body = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "Plaça", "apartments_count": 0, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.assertEqual(self.client.post('/init', dumps(body), content_type="application/json").status_code, 200)
+
+        # Test main: only the changed building is checked, so the street can still be changed
+        response = self.client.put('/building', dumps({"neighbourhood": "RAVAL", "building": "CCCB",
+                                                       "apartments_count": 2}), content_type="application/json")
+
+        # Check results
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["apartments"]["deleted"], 2)
+
+    def test__city__ok(self):
+        # /init accepts buildings with no floors, so their daylight can be changed too
+        body = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "Plaça", "apartments_count": 0, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.client.post('/init', dumps(body), content_type="application/json")
+
+        # Test main
+        response = self.client.put('/city', dumps({"dawn": "07:00", "sunset": "19:30"}),
+                                   content_type="application/json")
+
+        # Check results
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["buildings"], {"created": 0, "updated": 0, "deleted": 0})
+
+        response = self.client.put('/sunlight_hours',
+                                   dumps({"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 3}),
+                                   content_type="application/json")
+        self.assertEqual(response.content.decode(), "07:00 - 19:30")
+
+    def test__city__ko(self):
+        self.client.post('/init', dumps([]), content_type="application/json")
+
+        # Test main & Check results
+        for body in ([], {"dawn": "07:00"}, {"dawn": "07:00", "sunset": 19}, {"dawn": "7:00", "sunset": "19:30"},
+                     {"dawn": "19:30", "sunset": "07:00"}):
+            response = self.client.put('/city', dumps(body), content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.put('/city', "{", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        CityModel.objects.all().delete()
+        response = self.client.put('/city', dumps({"dawn": "07:00", "sunset": "19:30"}),
+                                   content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
     def test__get_sunlight_hours__ok(self):
 
         body = [
@@ -138,3 +324,404 @@ class InitViewTestCase(TestCase):
                     self.assertEqual(response.status_code, 200)
                     self.assertEqual(response.content.decode(), "{} - {}".format(building["dawn"][floor],
                                                                                  building["sunset"][floor]))
+
+    def test__get_sunlight_hours__http_get__ok(self):
+        body = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.client.post('/init', dumps(body), content_type="application/json")
+
+        # Test main
+        response = self.client.get('/sunlight_hours/RAVAL/CCCB/0')
+        query_response = self.client.get('/getSunlightHours', {"neighbourhood": "RAVAL", "building": "CCCB",
+                                                               "apartment": 0})
+
+        # Check results
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode(), "12:20 - 17:25")
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+        etag = response["ETag"]
+        self.assertEqual((query_response.content, query_response["ETag"]), (response.content, etag))
+
+        # Not modified, without querying the data base
+        with self.assertNumQueries(0):
+            response = self.client.get('/sunlight_hours/RAVAL/CCCB/0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+        # Unknown apartments are cacheable too
+        response = self.client.get('/sunlight_hours/RAVAL/CCCB/4')
+        self.assertEqual((response.status_code, response["ETag"]), (404, etag))
+
+        # A building change makes it stale
+        self.client.put('/building', dumps({"neighbourhood": "RAVAL", "building": "Santa Monica",
+                                            "apartments_count": 6}), content_type="application/json")
+        response = self.client.get('/sunlight_hours/RAVAL/CCCB/0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode(), "12:34 - 17:25")
+        self.assertNotEqual(response["ETag"], etag)
+
+        # And so does a new city
+        etag = response["ETag"]
+        self.client.post('/init', dumps(body), content_type="application/json")
+        response = self.client.get('/sunlight_hours/RAVAL/CCCB/0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode(), "12:20 - 17:25")
+
+    def test__get_sunlight_hours__http_get__ko(self):
+
+        # Test main
+        missing_response = self.client.get('/sunlight_hours', {"neighbourhood": "RAVAL", "building": "CCCB"})
+        invalid_response = self.client.get('/sunlight_hours', {"neighbourhood": "RAVAL", "building": "CCCB",
+                                                               "apartment": "first"})
+
+        # Check results
+        self.assertEqual(missing_response.status_code, 400)
+        self.assertEqual(invalid_response.status_code, 400)
+        self.assertFalse(missing_response.has_header("ETag"))
+
+    def test__health__ok(self):
+        # Test main
+        response = self.client.get('/health')
+
+        # Check results
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["state"], "closed")
+
+    def test__metrics__ok(self):
+        body = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             }
+        ]
+        self.client.post('/init', dumps(body), content_type="application/json")
+        self.client.post('/init', dumps(body), content_type="application/json")
+        self.client.put('/sunlight_hours', dumps({"neighbourhood": "POBLENOU", "building": "Aticco", "apartment": 0}),
+                        content_type="application/json")
+
+        # Test main
+        response = self.client.get('/metrics')
+
+        # Check results
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        content = response.content.decode()
+        for expected in ('badi_requests_total{route="init",method="POST",status="200"}',
+                         'badi_requests_total{route="sunlight_hours",method="PUT",status="200"}',
+                         'badi_request_db_queries_count{route="sunlight_hours"}',
+                         'badi_phase_duration_seconds_count{view="init",phase="persist"}',
+                         'badi_phase_duration_seconds_count{view="sunlight_hours",phase="lookup"}',
+                         'badi_apartments_computed_total ',
+                         'badi_db_rows_written_total{operation="insert"}',
+                         'badi_apartment_cache_misses_total ',
+                         'badi_result_cache_lookups_total{result="hit"}',
+                         'badi_last_save_reused_neighbourhoods 1',
+                         'badi_db_available 1'):
+            self.assertIn(expected, content)
+
+    def test__get_sunlight_hours_batch__ok(self):
+
+        body = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "La Capella", "apartments_count": 2, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+
+        # Initialize data base
+        response = self.client.post('/init',
+                                    dumps(body),
+                                    content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+
+        body = [
+            {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 2},
+            {"neighbourhood": "POBLENOU", "building": "Aticco", "apartment": 0},
+            {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 9},
+            {"neighbourhood": "RAVAL", "building": "CCCB"},
+            {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": "first"},
+            {"neighbourhood": "POBLENOU", "building": "CEM", "apartment": 1},
+            {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 2},
+        ]
+
+        expected_results = [
+            {"status": 200, "sunlight_hours": "11:28 - 17:25"},
+            {"status": 200, "sunlight_hours": "08:14 - 13:33"},
+            {"status": 404, "error": "Unknown apartment."},
+            {"status": 400, "error": "Bad item. It must contain neighbourhood, building and apartment"},
+            {"status": 400, "error": "Bad item. Apartment must be an integer value (from 0 to N-1) that specifies the "
+                                     "floor"},
+            {"status": 200, "sunlight_hours": "12:24 - 17:25"},
+            {"status": 200, "sunlight_hours": "11:28 - 17:25"},
+        ]
+
+        # Test main
+        response = self.client.put('/sunlight_hours/batch',
+                                   dumps(body),
+                                   content_type="application/json")
+
+        # Check results
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected_results)
+
+    def test__get_sunlight_hours_batch__bad_body__ko(self):
+        # Test main
+        response = self.client.put('/sunlight_hours/batch',
+                                   dumps({"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 2}),
+                                   content_type="application/json")
+
+        # Check results
+        self.assertEqual(response.status_code, 400)
+
+    def test__apartments__ok(self):
+        body = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.client.post('/init', dumps(body), content_type="application/json")
+
+        # Test main
+        response = self.client.get('/apartments', {"neighbourhood": "RAVAL", "min_hours": 5.5})
+        query = {"min_hours": 5, "sunlit_from": "12:20", "limit": 2}
+        pages = []
+        while True:
+            page = self.client.get('/apartments', query).json()
+            pages.append(page["apartments"])
+            if page["next"] is None:
+                break
+            query["cursor"] = page["next"]
+
+        # Check results: from the most to the least sunlight
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"apartments": [
+            {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 3, "sunlight_hours": "08:14 - 17:25",
+             "sunlight_minutes": 551},
+            {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 2, "sunlight_hours": "11:28 - 17:25",
+             "sunlight_minutes": 357}], "next": None})
+
+        # Pages follow each other, and match the whole result
+        expected = self.client.get('/apartments', {"min_hours": 5, "sunlit_from": "12:20"}).json()["apartments"]
+        self.assertEqual([apartment for page in pages for apartment in page], expected)
+        self.assertEqual(len(pages), 10)
+        self.assertEqual(len(expected), 19)
+        self.assertTrue(all(apartment["sunlight_minutes"] >= 300 and apartment["sunlight_hours"][:5] <= "12:20"
+                            for apartment in expected))
+
+    def test__apartments__ko(self):
+        invalid_queries = [{"min_hours": "many"}, {"max_hours": 25}, {"sunlit_from": "8am"}, {"limit": 0},
+                           {"limit": 100000}, {"cursor": "1.2"}, {"cursor": "a.b.c"}]
+
+        for query in invalid_queries:
+            # Test main
+            response = self.client.get('/apartments', query)
+
+            # Check results
+            self.assertEqual(response.status_code, 400, query)
+
+    def test__apartments_top__ok(self):
+        body = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.client.post('/init', dumps(body), content_type="application/json")
+
+        # Test main
+        response = self.client.get('/apartments/top', {"k": 3})
+        per_neighbourhood = self.client.get('/apartments/top', {"k": 2, "per": "neighbourhood"})
+        building = self.client.get('/apartments/top', {"k": 2, "neighbourhood": "RAVAL", "building": "Santa Monica"})
+
+        # Check results: from the most to the least sunlight, and ties by neighbourhood name
+        aticco_7 = {"neighbourhood": "POBLENOU", "building": "Aticco", "apartment": 7,
+                    "sunlight_hours": "08:14 - 17:25", "sunlight_minutes": 551}
+        aticco_6 = {"neighbourhood": "POBLENOU", "building": "Aticco", "apartment": 6,
+                    "sunlight_hours": "08:14 - 16:29", "sunlight_minutes": 495}
+        cccb_3 = {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 3, "sunlight_hours": "08:14 - 17:25",
+                  "sunlight_minutes": 551}
+        cccb_2 = {"neighbourhood": "RAVAL", "building": "CCCB", "apartment": 2, "sunlight_hours": "11:28 - 17:25",
+                  "sunlight_minutes": 357}
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"apartments": [aticco_7, cccb_3, aticco_6]})
+        self.assertEqual(per_neighbourhood.json(), {"neighbourhoods": {"POBLENOU": [aticco_7, aticco_6],
+                                                                       "RAVAL": [cccb_3, cccb_2]}})
+        self.assertEqual(building.json(), {"apartments": [
+            {"neighbourhood": "RAVAL", "building": "Santa Monica", "apartment": 2, "sunlight_hours": "08:14 - 13:33",
+             "sunlight_minutes": 319},
+            {"neighbourhood": "RAVAL", "building": "Santa Monica", "apartment": 1, "sunlight_hours": "08:14 - 13:19",
+             "sunlight_minutes": 305}]})
+
+        # Same as the first apartments of the query by sunlight
+        self.assertEqual(self.client.get('/apartments/top', {"k": 2, "neighbourhood": "RAVAL"}).json()["apartments"],
+                         self.client.get('/apartments', {"limit": 2, "neighbourhood": "RAVAL"}).json()["apartments"])
+
+    def test__apartments_sunlit__ok(self):
+        body = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        self.client.post('/init', dumps(body), content_type="application/json")
+
+        # Test main
+        response = self.client.get('/apartments/sunlit', {"time": "12:20"})
+        per_neighbourhood = self.client.get('/apartments/sunlit', {"time": "12:20", "per": "neighbourhood"})
+        query = {"time": "12:20", "neighbourhood": "RAVAL", "list": "true", "limit": 2}
+        pages = []
+        while True:
+            page = self.client.get('/apartments/sunlit', query).json()
+            pages.append(page["apartments"])
+            if page["next"] is None:
+                break
+            query["cursor"] = page["next"]
+        night = self.client.get('/apartments/sunlit', {"time": "23:00", "list": "true"})
+
+        # Check results: same apartments as the query by sunlight
+        expected = self.client.get('/apartments', {"sunlit_from": "12:20", "sunlit_until": "12:20",
+                                                   "neighbourhood": "RAVAL", "limit": 100}).json()["apartments"]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"time": "12:20", "count": 22})
+        self.assertEqual(per_neighbourhood.json(), {"time": "12:20", "count": 22,
+                                                    "neighbourhoods": {"POBLENOU": 15, "RAVAL": 7}})
+        self.assertEqual(page["count"], 7)
+        self.assertEqual([apartment for page in pages for apartment in page], expected)
+        self.assertEqual(len(expected), 7)
+        self.assertEqual(night.json(), {"time": "23:00", "count": 0, "apartments": [], "next": None})
+
+    def test__get_sunlight_calendar__ok(self):
+        body = [
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             }
+        ]
+        # Same dawn and sunset as the default ones, but on the summer solstice (June 21st)
+        calendar = [["08:14", "17:25"]] * DAYS_PER_YEAR
+        calendar[171] = ["06:00", "21:00"]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "calendar.json")
+            with open(path, "w") as calendar_file:
+                calendar_file.write(dumps(calendar))
+
+            with self.settings(SUNLIGHT_CALENDAR=path):
+                self.client.post('/init', dumps(body), content_type="application/json")
+
+        # Test main
+        response = self.client.get('/sunlight_hours/RAVAL/CCCB/0/calendar', {"date": "2019-01-01"})
+        range_response = self.client.get('/sunlight_hours/RAVAL/CCCB/3/calendar', {"from": "2020-06-20",
+                                                                                  "until": "2020-06-22"})
+
+        # Check results: the same as the single day lookup on the default dawn and sunset
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"days": [{"date": "2019-01-01", "sunlight_hours": "12:20 - 17:25",
+                                                     "sunlight_minutes": 305}]})
+        self.assertEqual(range_response.json(), {"days": [
+            {"date": "2020-06-20", "sunlight_hours": "08:14 - 17:25", "sunlight_minutes": 551},
+            {"date": "2020-06-21", "sunlight_hours": "06:00 - 21:00", "sunlight_minutes": 900},
+            {"date": "2020-06-22", "sunlight_hours": "08:14 - 17:25", "sunlight_minutes": 551}]})
+
+        # Not modified, as the single day lookup
+        etag = response["ETag"]
+        response = self.client.get('/sunlight_hours/RAVAL/CCCB/0/calendar', {"date": "2019-01-01"},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test__get_sunlight_calendar__ko(self):
+        body = [{"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                 [{"name": "CCCB", "apartments_count": 4, "distance": -1}]}]
+        self.client.post('/init', dumps(body), content_type="application/json")
+        invalid_queries = [{}, {"date": "2019-13-01"}, {"from": "2019-01-01"},
+                           {"from": "2019-01-02", "until": "2019-01-01"}, {"from": "2019-01-01", "until": "2020-01-02"}]
+
+        for query in invalid_queries:
+            # Test main
+            response = self.client.get('/sunlight_hours/RAVAL/CCCB/0/calendar', query)
+
+            # Check results
+            self.assertEqual(response.status_code, 400, query)
+
+        # The city has no calendar
+        response = self.client.get('/sunlight_hours/RAVAL/CCCB/0/calendar', {"date": "2019-01-01"})
+        self.assertEqual(response.status_code, 409)
+
+        # Unknown apartment
+        calendar = [["08:14", "17:25"]] * DAYS_PER_YEAR
+        City(body, calendar=calendar).save()
+        response = self.client.get('/sunlight_hours/RAVAL/CCCB/4/calendar', {"date": "2019-01-01"})
+        self.assertEqual(response.status_code, 404)
+
+    def test__apartments_top__ko(self):
+        invalid_queries = [{"k": 0}, {"k": "many"}, {"k": 100000}, {"per": "building"},
+                           {"per": "neighbourhood", "building": "CCCB"}]
+
+        for query in invalid_queries:
+            # Test main
+            response = self.client.get('/apartments/top', query)
+
+            # Check results
+            self.assertEqual(response.status_code, 400, query)
+
+    def test__apartments_sunlit__ko(self):
+        invalid_queries = [{}, {"time": "8am"}, {"time": "24:00"}, {"time": "12:00", "per": "building"},
+                           {"time": "12:00", "per": "neighbourhood", "neighbourhood": "RAVAL"},
+                           {"time": "12:00", "list": "yes"}, {"time": "12:00", "list": "true", "limit": 0},
+                           {"time": "12:00", "list": "true", "cursor": "1.2"}]
+
+        for query in invalid_queries:
+            # Test main
+            response = self.client.get('/apartments/sunlit', query)
+
+            # Check results
+            self.assertEqual(response.status_code, 400, query)
+
+        # Cities stored in lazy mode can not be counted
+        with self.settings(SUNLIGHT_MODE=LAZY_MODE):
+            self.client.post('/init', dumps([{"neighborhood": "RAVAL", "apartments_height": 2, "buildings": [
+                {"name": "CCCB", "apartments_count": 4, "distance": -1}]}]), content_type="application/json")
+        self.assertEqual(self.client.get('/apartments/sunlit', {"time": "12:00"}).status_code, 409)
@@ -0,0 +1,94 @@
+#!/bin/python3
+
+
+from copy import deepcopy
+from random import Random
+from unittest import skipUnless
+from django.test import TestCase
+
+from ..constants import DEFAULT_CITY, DEFAULT_CITY_VALUES, PYTHON_BACKEND, NUMPY_BACKEND
+from ..sunlight_hours import compute_city_sunlight_hours
+from .. import vectorized
+
+
+@skipUnless(vectorized.is_available(), "NumPy is not installed")
+class VectorizedTestCase(TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        pass
+
+    @staticmethod
+    def get_random_city_info(rnd, size):
+        city_info = []
+        for n_index in range(size):
+            building_list = [{"name": str(index), "apartments_count": rnd.randint(1, 40),
+                              "distance": rnd.randint(1, 8)} for index in range(rnd.randint(1, 60))]
+            building_list[-1]["distance"] = -1
+            city_info.append({"neighborhood": str(n_index), "apartments_height": rnd.randint(1, 4),
+                              "buildings": building_list})
+
+        return city_info
+
+    def test__compute_city_sunlight_hours__ok(self):
+        city_info = [
+            {"neighborhood": "POBLENOU", "apartments_height": 1, "buildings":
+                [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                 {"name": "01", "apartments_count": 4, "distance": 2},
+                 {"name": "CEM", "apartments_count": 7, "distance": 1},
+                 {"name": "30", "apartments_count": 1, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "RAVAL", "apartments_height": 2, "buildings":
+                [{"name": "Santa Monica", "apartments_count": 3, "distance": 1},
+                 {"name": "La Capella", "apartments_count": 2, "distance": 1},
+                 {"name": "CCCB", "apartments_count": 4, "distance": -1}
+                 ]
+             },
+            {"neighborhood": "EMPTY", "apartments_height": 1, "buildings": []}
+        ]
+        expected_city_info = deepcopy(city_info)
+
+        # Test main
+        result = compute_city_sunlight_hours(city_info, DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                                             DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], NUMPY_BACKEND)
+
+        # Check results
+        compute_city_sunlight_hours(expected_city_info, DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                                    DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], PYTHON_BACKEND)
+
+        self.assertTrue(result)
+        self.assertEqual(city_info, expected_city_info)
+
+    def test__compute_city_sunlight_hours__same_as_python__ok(self):
+        rnd = Random(2019)
+        # (<city_dawn>, <city_sunset>)
+        values = [
+            (DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"], DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"]),
+            ("07:00", "16:00"),
+            ("06:31", "21:02"),
+        ]
+
+        for value in values:
+            city_info = self.get_random_city_info(rnd, 10)
+            expected_city_info = deepcopy(city_info)
+
+            # Test main
+            result = compute_city_sunlight_hours(city_info, value[0], value[1], NUMPY_BACKEND)
+
+            # Check results
+            compute_city_sunlight_hours(expected_city_info, value[0], value[1], PYTHON_BACKEND)
+
+            self.assertTrue(result)
+            self.assertEqual(city_info, expected_city_info)
+
+    def test__compute_city_sunlight_hours__bad_city__ko(self):
+        city_info = [{"neighborhood": "POBLENOU", "buildings": []}]
+
+        # Test main
+        result = compute_city_sunlight_hours(city_info, DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"],
+                                             DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"], NUMPY_BACKEND)
+
+        # Check results
+        self.assertFalse(result)
@@ -0,0 +1,160 @@
+#!/bin/python3
+
+
+from datetime import date
+from math import cos, pi
+from random import Random
+from unittest import skipUnless
+from django.test import TestCase
+
+from ..clock import format_time
+from ..constants import DAYS_PER_YEAR, DEFAULT_CITY, DEFAULT_CITY_VALUES, NUMPY_BACKEND, PYTHON_BACKEND
+from ..sunlight_hours import get_neighbourhood_sunlight_minutes, NeighbourhoodHorizon
+from ..yearly import parse_calendar, pack_minutes, unpack_minutes, get_day_of_year, get_yearly_minutes, \
+    get_neighbourhood_yearly_minutes
+from .. import vectorized
+
+
+def get_test_calendar():
+    """
+        Returns a calendar whose days are longer in summer (as in the northern hemisphere).
+    """
+    return [[format_time(480 + round(75 * cos(2 * pi * (day + 10) / DAYS_PER_YEAR))),
+             format_time(1080 - round(105 * cos(2 * pi * (day + 10) / DAYS_PER_YEAR)))]
+            for day in range(DAYS_PER_YEAR)]
+
+
+class YearlyTestCase(TestCase):
+
+    maxDiff = None
+
+    building_list = [{"name": "Aticco", "apartments_count": 8, "distance": 1},
+                     {"name": "01", "apartments_count": 4, "distance": 2},
+                     {"name": "CEM", "apartments_count": 7, "distance": 1},
+                     {"name": "30", "apartments_count": 1, "distance": -1}]
+
+    def setUp(self):
+        pass
+
+    def test__parse_calendar__ok(self):
+
+        # Test main
+        dawn, sunset = parse_calendar(get_test_calendar())
+
+        # Check results
+        self.assertEqual((len(dawn), len(sunset)), (DAYS_PER_YEAR, DAYS_PER_YEAR))
+        self.assertEqual((format_time(dawn[0]), format_time(sunset[0])), ("09:14", "16:17"))
+        self.assertLess(dawn[171], dawn[0])
+        self.assertGreater(sunset[171], sunset[0])
+
+    def test__parse_calendar__ko(self):
+        calendar = get_test_calendar()
+        invalid_calendars = [None, {}, calendar[:-1], calendar + calendar[:1], [["08:00"]] + calendar[1:],
+                             [[8, 17]] + calendar[1:], [["18:00", "08:00"]] + calendar[1:],
+                             [["-1:30", "08:00"]] + calendar[1:], [["08:00", "24:30"]] + calendar[1:]]
+
+        for invalid_calendar in invalid_calendars:
+            # Test main & Check results
+            with self.assertRaises(ValueError):
+                parse_calendar(invalid_calendar)
+
+    def test__pack_minutes__ok(self):
+        minutes = [0, 494, 1045, 1439]
+
+        # Test main
+        result = pack_minutes(minutes)
+
+        # Check results: little-endian unsigned 16-bit integers
+        self.assertEqual(result, b"\x00\x00\xee\x01\x15\x04\x9f\x05")
+        self.assertEqual(unpack_minutes(result), minutes)
+        self.assertEqual(unpack_minutes(memoryview(result)), minutes)
+
+    def test__get_day_of_year__ok(self):
+
+        # Test main & Check results
+        self.assertEqual(get_day_of_year(date(2019, 1, 1)), 0)
+        self.assertEqual(get_day_of_year(date(2024, 2, 28)), 58)
+        self.assertEqual(get_day_of_year(date(2024, 2, 29)), 58)
+        self.assertEqual(get_day_of_year(date(2024, 3, 1)), 59)
+        self.assertEqual(get_day_of_year(date(2024, 12, 31)), DAYS_PER_YEAR - 1)
+
+    def test__get_neighbourhood_yearly_minutes__ok(self):
+        city_dawn = DEFAULT_CITY_VALUES[DEFAULT_CITY]["dawn"]
+        city_sunset = DEFAULT_CITY_VALUES[DEFAULT_CITY]["sunset"]
+        calendar = parse_calendar([[city_dawn, city_sunset]] * DAYS_PER_YEAR)
+        dawn, sunset = get_neighbourhood_sunlight_minutes(self.building_list, calendar[0][0], calendar[1][0], 1)
+
+        # Test main
+        result = get_neighbourhood_yearly_minutes(self.building_list, calendar, 1)
+
+        # Check results: same as the single day computation on every day
+        self.assertEqual([[(unpack_minutes(floor_dawn), unpack_minutes(floor_sunset))
+                           for floor_dawn, floor_sunset in building] for building in result],
+                         [[([floor_dawn] * DAYS_PER_YEAR, [floor_sunset] * DAYS_PER_YEAR)
+                           for floor_dawn, floor_sunset in zip(building_dawn, building_sunset)]
+                          for building_dawn, building_sunset in zip(dawn, sunset)])
+
+    def test__get_neighbourhood_yearly_minutes__random__ok(self):
+        rnd = Random(2022)
+        calendar = parse_calendar(get_test_calendar())
+        backends = [PYTHON_BACKEND] + ([NUMPY_BACKEND] if vectorized.is_available() else [])
+
+        for _ in range(10):
+            building_list = [{"name": str(index), "apartments_count": rnd.randint(0, 30),
+                              "distance": rnd.randint(1, 6)} for index in range(rnd.randint(1, 15))]
+            building_list[-1]["distance"] = -1
+            apartment_height = rnd.randint(1, 3)
+            horizon = NeighbourhoodHorizon(building_list, calendar[0][0], calendar[1][0], apartment_height)
+
+            # Test main
+            results = [get_neighbourhood_yearly_minutes(building_list, calendar, apartment_height, backend)
+                       for backend in backends]
+
+            # Check results: same as each apartment on each day, in every backend
+            for result in results:
+                for index, building in enumerate(result):
+                    for floor, (floor_dawn, floor_sunset) in enumerate(building):
+                        expected = get_yearly_minutes(*horizon.get_apartment_angles(index, floor), calendar)
+                        self.assertEqual((unpack_minutes(floor_dawn), unpack_minutes(floor_sunset)), expected)
+
+                        day = rnd.randrange(DAYS_PER_YEAR)
+                        day_horizon = NeighbourhoodHorizon(building_list, calendar[0][day], calendar[1][day],
+                                                           apartment_height)
+                        self.assertEqual((expected[0][day], expected[1][day]),
+                                         day_horizon.get_apartment_minutes(index, floor))
+
+    def test__get_neighbourhood_yearly_minutes__summer__ok(self):
+        # Longer days in summer, and a lower building on the east of a taller one
+        calendar = parse_calendar([["08:15", "17:25"]] * 100 + [["06:18", "21:29"]] * (DAYS_PER_YEAR - 100))
+        building_list = [{"name": "Low", "apartments_count": 1, "distance": 1},
+                         {"name": "High", "apartments_count": 10, "distance": -1}]
+        backends = [PYTHON_BACKEND] + ([NUMPY_BACKEND] if vectorized.is_available() else [])
+
+        for backend in backends:
+            # Test main
+            result = get_neighbourhood_yearly_minutes(building_list, calendar, 1, backend)
+
+            # Check results: every apartment is only sunlit within the daylight of each day
+            for building in result:
+                for floor_dawn, floor_sunset in building:
+                    for dawn, sunset, city_dawn, city_sunset in zip(unpack_minutes(floor_dawn),
+                                                                    unpack_minutes(floor_sunset), *calendar):
+                        self.assertTrue(city_dawn <= dawn and sunset <= city_sunset, backend)
+
+            # The floors above the building on the east get the dawn of the day
+            self.assertEqual([unpack_minutes(floor_dawn) for floor_dawn, _ in result[1][1:]],
+                             [calendar[0]] * 9, backend)
+
+    @skipUnless(vectorized.is_available(), "NumPy is not installed")
+    def test__get_yearly_minutes__vectorized__ok(self):
+        calendar = parse_calendar(get_test_calendar())
+        angles = [0, 11.309932474020213, 45.0, 63.43494882292201, 89.9]
+
+        # Test main
+        dawn = vectorized.get_yearly_minutes(angles, calendar, east=True)
+        sunset = vectorized.get_yearly_minutes(angles, calendar, east=False)
+
+        # Check results
+        for angle, angle_dawn, angle_sunset in zip(angles, dawn, sunset):
+            self.assertEqual((unpack_minutes(angle_dawn), unpack_minutes(angle_sunset)),
+                             get_yearly_minutes(angle, angle, calendar))
@@ -19,16 +19,35 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
-from .views.init import InitView
+from .views.apartments import ApartmentsView, TopApartmentsView, SunlitApartmentsView
+from .views.calendar import SunlightCalendarView
+from .views.init import InitView, InitJobView
 from .views.sunlight_hours import SunlightHoursView
+from .views.sunlight_hours_batch import SunlightHoursBatchView
+from .views.building import BuildingView
+from .views.city import CityView
+from .views.health import HealthView
+from .views.metrics import MetricsView
 from .views.default import handler404, handler500
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('init', InitView.as_view()),
+    path('init/<str:job_id>', InitJobView.as_view()),
     path('sunlight_hours', SunlightHoursView.as_view()),
+    path('sunlight_hours/<str:neighbourhood>/<str:building>/<int:apartment>', SunlightHoursView.as_view()),
+    path('sunlight_hours/<str:neighbourhood>/<str:building>/<int:apartment>/calendar',
+         SunlightCalendarView.as_view()),
     path('get_sunlight_hours', SunlightHoursView.as_view()),
     path('getSunlightHours', SunlightHoursView.as_view()),
+    path('sunlight_hours/batch', SunlightHoursBatchView.as_view()),
+    path('apartments', ApartmentsView.as_view()),
+    path('apartments/top', TopApartmentsView.as_view()),
+    path('apartments/sunlit', SunlitApartmentsView.as_view()),
+    path('building', BuildingView.as_view()),
+    path('city', CityView.as_view()),
+    path('health', HealthView.as_view()),
+    path('metrics', MetricsView.as_view()),
 
 ]
 
@@ -0,0 +1,268 @@
+#!/bin/python3
+
+"""
+    NumPy backend to compute sunlight hours. Computes every apartment of a neighbourhood at once, using array
+    operations, and gives the same results as the pure Python functions in .sunlight_hours.
+
+    NumPy is an optional dependency. If it is not installed, is_available() returns False and the pure Python backend
+    must be used instead.
+"""
+
+from math import atan, degrees
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .clock import SECONDS_PER_MINUTE, get_seconds_per_grade
+from .horizon import WestHorizon
+
+
+def is_available():
+    """
+        Tells if this backend can be used (i.e., if NumPy is installed).
+
+    :return: (bool) True if NumPy is installed; False otherwise.
+    """
+    return np is not None
+
+
+def get_shadow_angles(ratios):
+    """
+        Returns the angle of the shadow of each obstacle. Same computation as the one made in
+        .sunlight_hours.get_shadow_angle, but for an array of obstacles.
+
+        IMPLEMENTATION NOTE: NumPy's arctan may differ in the last bit from math.atan, and that would change the
+        truncated minutes when the number of seconds is (almost) an integer value. So the angles are computed with
+        math.atan, once per distinct ratio (many apartments share them, e.g., 0 for the ones with no obstacle).
+
+    :param ratios: (numpy.ndarray of float) Tangent of the angle of the shadow of each obstacle (i.e., height of the
+        obstacle over the apartment divided by the distance to the obstacle).
+    :return: (numpy.ndarray of float) Angle of the shadow of each obstacle (in grades).
+    """
+    values, inverse = np.unique(ratios, return_inverse=True)
+    angles = np.array([degrees(atan(value)) for value in values.tolist()], dtype=np.float64)
+
+    return angles[inverse.ravel()]
+
+
+def get_shadow_minutes(angles, city_seconds_per_grade):
+    """
+        Returns the number of minutes that the shadow of each obstacle takes from the city sunlight. Same computation
+        as .clock.get_shadow_minutes, but for an array of angles.
+
+    :param angles: (numpy.ndarray of float) Angle of the shadow of each obstacle (in grades).
+    :param city_seconds_per_grade: (float) The number of elapsed seconds for each unitary increment in the angle that
+        between the sunlight and the soil.
+    :return: (numpy.ndarray of int) Minutes taken from the city sunlight by each obstacle (0 for negative angles).
+    """
+    return np.trunc(np.trunc(np.maximum(angles, 0) * city_seconds_per_grade) / SECONDS_PER_MINUTE).astype(np.int64)
+
+
+def get_neighbourhood_sunlight_minutes(building_list, city_dawn_minutes, city_sunset_minutes, apartment_height):
+    """
+        Computes the dawn and sunset of every apartment of the specified neighbourhood. Same computation as the one
+        made in .sunlight_hours.get_neighbourhood_sunlight_minutes.
+
+    :param building_list: (list of dict) Buildings of the neighbourhood (as described in the Code Challenge), sorted
+        from east to west.
+    :param city_dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+    :param city_sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+    :param apartment_height: (int) The height of the apartments.
+    :return: (tuple) Follows the format:
+
+                    (<floors>, <dawn>, <sunset>)
+
+                with
+                    <floors>: (numpy.ndarray of int) Number of floors of each building.
+                    <dawn>: (numpy.ndarray of int) Dawn of every apartment (minutes since midnight), sorted by building
+                        (from east to west) and floor (from 0 to N-1).
+                    <sunset>: (numpy.ndarray of int) Sunset of every apartment, sorted as dawn.
+    """
+    heights, east_angles, west_angles = get_neighbourhood_shadow_angles(building_list, apartment_height)
+    city_seconds_per_grade = get_seconds_per_grade(city_dawn_minutes, city_sunset_minutes)
+
+    dawn = city_dawn_minutes + get_shadow_minutes(east_angles, city_seconds_per_grade)
+    sunset = city_sunset_minutes - get_shadow_minutes(west_angles, city_seconds_per_grade)
+
+    return heights, dawn, sunset
+
+
+def get_neighbourhood_shadow_angles(building_list, apartment_height):
+    """
+        Computes the angles of the highest shadows on every apartment of the specified neighbourhood. Same results as
+        .sunlight_hours.get_neighbourhood_shadow_angles.
+
+    :param building_list: (list of dict) Buildings of the neighbourhood (as described in the Code Challenge), sorted
+        from east to west.
+    :param apartment_height: (int) The height of the apartments.
+    :return: (tuple) Follows the format:
+
+                    (<floors>, <east_angles>, <west_angles>)
+
+                with
+                    <floors>: (numpy.ndarray of int) Number of floors of each building.
+                    <east_angles>: (numpy.ndarray of float) Angle of the highest shadow from the east on every
+                        apartment (in grades), sorted by building (from east to west) and floor (from 0 to N-1).
+                    <west_angles>: (numpy.ndarray of float) Same as east_angles, but with the shadows from the west.
+    """
+    horizon = WestHorizon(building_list)
+    size = len(building_list)
+
+    heights = np.array(horizon.heights, dtype=np.int64)
+    positions = np.array(horizon.positions)
+    distances = np.array([building["distance"] for building in building_list], dtype=np.float64)
+
+    # One element per apartment: the building where it is located and its floor
+    buildings = np.repeat(np.arange(size), heights)
+    starts = np.cumsum(heights) - heights
+    floors = np.arange(len(buildings)) - np.repeat(starts, heights)
+
+    #
+    # EAST SIDE
+    #
+
+    # The obstacle on the east is the last building that improved the maximum ratio floors/distance on its east
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = heights / distances
+    prior_max = np.concatenate(([0.0], np.maximum.accumulate(np.maximum(ratios, 0))[:-1]))
+    improved = np.where(ratios > prior_max, np.arange(size), -1)
+    east = np.concatenate(([-1], np.maximum.accumulate(improved)[:-1]))
+
+    east_index = east[buildings]
+    with_east = east_index != -1
+    # Distance from the first building on the east to the building next to the obstacle
+    east_distance = positions[east_index + 1]
+
+    east_ratios = np.zeros(len(buildings))
+    east_ratios[with_east] = ((heights[east_index[with_east]].astype(np.float64) - floors[with_east]) *
+                              apartment_height) / east_distance[with_east]
+
+    #
+    # WEST SIDE
+    #
+
+    west_index = get_west_shadow_index(horizon, buildings, floors)
+    with_west = west_index != -1
+
+    west_ratios = np.zeros(len(buildings))
+    west_ratios[with_west] = ((heights[west_index[with_west]].astype(np.float64) - floors[with_west]) *
+                              apartment_height) / (positions[west_index[with_west]] - positions[buildings[with_west]])
+
+    return heights, get_shadow_angles(east_ratios), get_shadow_angles(west_ratios)
+
+
+def get_west_shadow_index(horizon, buildings, floors):
+    """
+        Returns, for each apartment, the building that creates the highest shadow from the west. Same queries as
+        .horizon.WestHorizon.get_max_west_shadow_details, but made for every apartment at once.
+
+    :param horizon: (.horizon.WestHorizon) West horizon of the neighbourhood.
+    :param buildings: (numpy.ndarray of int) Building of each apartment.
+    :param floors: (numpy.ndarray of int) Floor of each apartment.
+    :return: (numpy.ndarray of int) Position of the building that creates the highest shadow from the west on each
+        apartment. -1 if there is no shadow.
+    """
+    size = len(horizon.heights)
+    none = size
+
+    # Add a sentinel building (higher than any floor) at position "size", that stands for "no building"
+    heights = np.array(horizon.heights + [np.iinfo(np.int64).max // 4], dtype=np.int64)
+    positions = np.array(horizon.positions + [0])
+    next_taller = np.array([level + [-1] for level in horizon.next_taller], dtype=np.int64)
+    next_taller[next_taller == -1] = none
+    next_vertex = np.array([level + [-1] for level in horizon.next_vertex], dtype=np.int64)
+    next_vertex[next_vertex == -1] = none
+
+    # First building on the west that reaches each floor (heights grow along the chain of next taller buildings)
+    first = np.minimum(buildings + 1, none)
+    lower = heights[first] < floors + 1
+    for level in range(horizon.levels - 1, -1, -1):
+        candidate = next_taller[level][first]
+        move = lower & (heights[candidate] < floors + 1)
+        first = np.where(move, candidate, first)
+    first = np.where(heights[first] < floors + 1, next_taller[0][first], first)
+
+    # Tangent vertex from each apartment to the upper envelope that starts on that building
+    x = positions[buildings]
+    y = floors - 1
+
+    def is_steeper(mask, index, other_index):
+        index = index[mask]
+        other_index = other_index[mask]
+        return (heights[other_index] - y[mask]) * (positions[index] - x[mask]) > \
+            (heights[index] - y[mask]) * (positions[other_index] - x[mask])
+
+    vertex = next_vertex[0][first]
+    active = (first != none) & (vertex != none)
+    active[active] = is_steeper(active, first, vertex)
+
+    current = first
+    for level in range(horizon.levels - 1, -1, -1):
+        candidate = next_vertex[level][current]
+        vertex = next_vertex[0][candidate]
+        move = active & (candidate != none) & (vertex != none)
+        move[move] = is_steeper(move, candidate, vertex)
+        current = np.where(move, candidate, current)
+
+    result = np.where(active, next_vertex[0][current], first)
+    result[result == none] = -1
+
+    return result
+
+
+def compute_neighbourhood_sunlight_hours(building_list, city_dawn_minutes, city_sunset_minutes, apartment_height):
+    """
+        Adds per apartment dawn and sunset info (and the angles of the shadows) to the specified neighbourhood. Same
+        result as .sunlight_hours.compute_neighbourhood_sunlight_hours.
+
+    :param building_list: (list of dict) Buildings of the neighbourhood (as described in the Code Challenge), sorted
+        from east to west.
+    :param city_dawn_minutes: (int) The local time when starts the sunlight in the city (minutes since midnight).
+    :param city_sunset_minutes: (int) The local time when ends the sunlight in the city (minutes since midnight).
+    :param apartment_height: (int) The height of the apartments.
+    :return: None
+    """
+    heights, east_angles, west_angles = get_neighbourhood_shadow_angles(building_list, apartment_height)
+    city_seconds_per_grade = get_seconds_per_grade(city_dawn_minutes, city_sunset_minutes)
+
+    dawn = (city_dawn_minutes + get_shadow_minutes(east_angles, city_seconds_per_grade)).tolist()
+    sunset = (city_sunset_minutes - get_shadow_minutes(west_angles, city_seconds_per_grade)).tolist()
+    east_angles = east_angles.tolist()
+    west_angles = west_angles.tolist()
+
+    start = 0
+    for building, floors in zip(building_list, heights.tolist()):
+        building["dawn"] = dawn[start:start + floors]
+        building["sunset"] = sunset[start:start + floors]
+        building["east_angles"] = east_angles[start:start + floors]
+        building["west_angles"] = west_angles[start:start + floors]
+        start += floors
+
+
+def get_yearly_minutes(angles, calendar, east):
+    """
+        Computes the yearly dawn (or sunset) of the apartments whose shadow from the east (or west) has each one of the
+        specified angles, as a single angles x days array operation. Same results as
+        .yearly.get_distinct_yearly_minutes, but packed (see .yearly.pack_minutes).
+
+        The angles are computed with the math module (see .sunlight_hours.get_neighbourhood_shadow_angles), and the
+        products with the seconds per grade are exact IEEE operations in both backends, so results match to the
+        minute.
+
+    :param angles: (list of float) Angles of the shadows (in grades).
+    :param calendar: (tuple) Calendar of the city (see .yearly.parse_calendar).
+    :param east: (bool) True for the dawn (shadows from the east); False for the sunset (shadows from the west).
+    :return: (list of bytes) For each angle, the packed local time on each day.
+    """
+    city_dawn = np.array(calendar[0], dtype=np.int64)
+    city_sunset = np.array(calendar[1], dtype=np.int64)
+    city_seconds_per_grade = ((city_sunset - city_dawn) * SECONDS_PER_MINUTE).astype(np.float64) / 180.0
+
+    # Obstacles lower than the apartment cast no shadow on it (see .clock.get_shadow_minutes)
+    angles = np.maximum(np.array(angles, dtype=np.float64), 0)
+    shadow_minutes = np.trunc(np.trunc(np.outer(angles, city_seconds_per_grade)) / SECONDS_PER_MINUTE).astype(np.int64)
+    minutes = city_dawn + shadow_minutes if east else city_sunset - shadow_minutes
+
+    return [row.tobytes() for row in minutes.astype("<u2")]
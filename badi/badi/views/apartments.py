@@ -0,0 +1,373 @@
+from django.conf import settings
+from django.db import DatabaseError
+from django.views import View
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+
+from ..clock import MINUTES_PER_HOUR, MINUTES_PER_DAY, parse_time
+from ..constants import QUERY_PAGE_SIZE, QUERY_MAX_PAGE_SIZE, TOP_SIZE, RANKING_SIZE
+from ..controller import Controller
+from .sunlight_hours import SunlightHoursView
+
+
+class ApartmentsView(View):
+    """
+        View that finds the apartments of the city by their sunlight hours
+    """
+
+    @staticmethod
+    def check_valid_params(params):
+        """
+            Checks the filters of the query string. All of them are optional:
+
+             - min_hours, max_hours: (float) Minimum and maximum hours of sunlight (e.g., 6 or 6.5).
+             - sunlit_from, sunlit_until: (str) Time window (HH:MM) during which the apartment must be sunlit.
+             - neighbourhood, building: (str) Names (case sensitive).
+             - limit: (int) Maximum number of apartments per page (from 1 to QUERY_MAX_PAGE_SIZE).
+             - cursor: (str) The "next" value of the prior page.
+
+        :param params: (dict) Query string parameters.
+        :return: (tuple) Follows the format:
+
+                    (<query_info>, <message>)
+
+                with
+                    <query_info>: (dict/None) Keyword arguments of ..controller.Controller.find_apartments; None if any
+                        parameter is not valid.
+                    <message>: (str) Error message if any parameter is not valid.
+        """
+        max_page_size = getattr(settings, "QUERY_MAX_PAGE_SIZE", QUERY_MAX_PAGE_SIZE)
+        result = {"neighbourhood_name": params.get("neighbourhood"), "building_name": params.get("building")}
+
+        try:
+            for name in ("min_hours", "max_hours"):
+                hours = float(params[name]) if name in params else None
+                if hours is not None and not 0 <= hours <= 24:
+                    raise ValueError()
+                result[name.replace("hours", "minutes")] = None if hours is None else round(hours * MINUTES_PER_HOUR)
+
+        except ValueError:
+            return None, "Bad Request. min_hours and max_hours must be numbers of hours (from 0 to 24)"
+
+        try:
+            for name in ("sunlit_from", "sunlit_until"):
+                result[name] = parse_time(params[name]) if name in params else None
+
+        except ValueError:
+            return None, "Bad Request. sunlit_from and sunlit_until must be local times (HH:MM)"
+
+        try:
+            result["limit"] = int(params.get("limit", getattr(settings, "QUERY_PAGE_SIZE", QUERY_PAGE_SIZE)))
+            if not 1 <= result["limit"] <= max_page_size:
+                raise ValueError()
+
+        except ValueError:
+            return None, "Bad Request. limit must be an integer value (from 1 to {})".format(max_page_size)
+
+        try:
+            result["after"] = ApartmentsView.parse_cursor(params["cursor"]) if "cursor" in params else None
+
+        except ValueError:
+            return None, "Bad Request. Invalid cursor"
+
+        return result, ""
+
+    @staticmethod
+    def format_cursor(cursor):
+        """
+            Returns the specified cursor as an opaque string (see ..controller.Controller.find_apartments).
+
+        :param cursor: (tuple) Cursor.
+        :return: (str) Cursor. None if cursor is None.
+        """
+        return None if cursor is None else ".".join(str(value) for value in cursor)
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """
+            Parses a cursor formatted with format_cursor.
+
+        :param cursor: (str) Cursor.
+        :return: (tuple) Cursor.
+        :raises ValueError: If it is not a valid cursor.
+        """
+        values = tuple(int(value) for value in cursor.split("."))
+        if len(values) != 3:
+            raise ValueError()
+
+        return values
+
+    def get(self, request):
+        """
+            Finds the apartments that match the filters of the query string (see check_valid_params), from the most to
+            the least sunlight. E.g., the apartments of GRACIA with at least 6 hours of sunlight:
+
+                /apartments?neighbourhood=GRACIA&min_hours=6
+
+        :param request: HTTP request
+        :return: HTTP response with a JSON that follows the format:
+
+                {"apartments": [{"neighbourhood": <neighbourhood>, "building": <building>, "apartment": <apartment>,
+                                 "sunlight_hours": <sunlight_hours>, "sunlight_minutes": <sunlight_minutes>}, ...],
+                 "next": <cursor>}
+
+            with <sunlight_hours> following the same format as SunlightHoursView.get_sunlight_hours_str, and <cursor>
+            being the value of the cursor parameter to get the next page (null if there are no more apartments).
+        """
+        query_info, message = ApartmentsView.check_valid_params(request.GET)
+
+        if not query_info:
+            return HttpResponseBadRequest(message)
+
+        if not Controller.is_running_db():
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        try:
+            apartments, cursor = Controller.find_apartments(**query_info)
+
+        except ValueError:
+            message = "Conflict. The apartments of a city stored in lazy mode can not be queried"
+            status = 409  # CONFLICT
+            return HttpResponse(message, status=status)
+
+        except DatabaseError:
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        return JsonResponse({"apartments": [ApartmentsView.format_apartment(apartment) for apartment in apartments],
+                             "next": ApartmentsView.format_cursor(cursor)})
+
+    @staticmethod
+    def format_apartment(apartment):
+        """
+            Returns the specified apartment as a dict, to be returned as JSON.
+
+        :param apartment: (..models.Apartment) Apartment, with its building and neighbourhood.
+        :return: (dict) Follows the format:
+
+                {"neighbourhood": <neighbourhood>, "building": <building>, "apartment": <apartment>,
+                 "sunlight_hours": <sunlight_hours>, "sunlight_minutes": <sunlight_minutes>}
+
+            with <sunlight_hours> following the same format as SunlightHoursView.get_sunlight_hours_str.
+        """
+        return {"neighbourhood": apartment.building.neighbourhood.name,
+                "building": apartment.building.name,
+                "apartment": apartment.floor,
+                "sunlight_hours": SunlightHoursView.get_sunlight_hours_str(apartment),
+                "sunlight_minutes": apartment.sunlight_minutes}
+
+
+class TopApartmentsView(View):
+    """
+        View that returns the apartments with the most sunlight of the city, a neighbourhood or a building
+    """
+
+    @staticmethod
+    def check_valid_params(params):
+        """
+            Checks the parameters of the query string. All of them are optional:
+
+             - k: (int) Number of apartments (from 1 to RANKING_SIZE).
+             - neighbourhood, building: (str) Names (case sensitive). The whole city if none of them is given.
+             - per: (str) "neighbourhood" to return the k apartments of each neighbourhood (not along with building).
+
+        :param params: (dict) Query string parameters.
+        :return: (tuple) Follows the format:
+
+                    (<query_info>, <message>)
+
+                with
+                    <query_info>: (dict/None) Keyword arguments of ..controller.Controller.get_top_apartments (or
+                        get_neighbourhood_rankings if "per" is given); None if any parameter is not valid.
+                    <message>: (str) Error message if any parameter is not valid.
+        """
+        ranking_size = getattr(settings, "RANKING_SIZE", RANKING_SIZE)
+        result = {"neighbourhood_name": params.get("neighbourhood")}
+
+        try:
+            result["k"] = int(params.get("k", getattr(settings, "TOP_SIZE", TOP_SIZE)))
+            if not 1 <= result["k"] <= ranking_size:
+                raise ValueError()
+
+        except ValueError:
+            return None, "Bad Request. k must be an integer value (from 1 to {})".format(ranking_size)
+
+        if "per" in params:
+            if params["per"] != "neighbourhood" or "building" in params:
+                return None, "Bad Request. per must be neighbourhood (and building can not be given along with it)"
+
+        else:
+            result["building_name"] = params.get("building")
+
+        return result, ""
+
+    def get(self, request):
+        """
+            Returns the k apartments with the most sunlight (see check_valid_params), from the most to the least
+            sunlight. E.g., the 5 apartments with the most sunlight of GRACIA:
+
+                /apartments/top?neighbourhood=GRACIA&k=5
+
+        :param request: HTTP request
+        :return: HTTP response with a JSON that follows the format:
+
+                {"apartments": [<apartment>, ...]}
+
+            or, if "per" is given:
+
+                {"neighbourhoods": {<neighbourhood>: [<apartment>, ...], ...}}
+
+            with each <apartment> following the same format as ApartmentsView.format_apartment.
+        """
+        query_info, message = TopApartmentsView.check_valid_params(request.GET)
+
+        if not query_info:
+            return HttpResponseBadRequest(message)
+
+        if not Controller.is_running_db():
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        try:
+            if "building_name" in query_info:
+                apartments = Controller.get_top_apartments(**query_info)
+            else:
+                rankings = Controller.get_neighbourhood_rankings(**query_info)
+
+        except ValueError:
+            message = "Conflict. The apartments of a city stored in lazy mode can not be ranked"
+            status = 409  # CONFLICT
+            return HttpResponse(message, status=status)
+
+        except DatabaseError:
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        if "building_name" in query_info:
+            return JsonResponse({"apartments": [ApartmentsView.format_apartment(apartment)
+                                                for apartment in apartments]})
+
+        return JsonResponse({"neighbourhoods": {name: [ApartmentsView.format_apartment(apartment)
+                                                       for apartment in apartments]
+                                                for name, apartments in rankings.items()}})
+
+
+class SunlitApartmentsView(View):
+    """
+        View that counts (and lists) the apartments of the city that are sunlit at a time
+    """
+
+    @staticmethod
+    def check_valid_params(params):
+        """
+            Checks the parameters of the query string:
+
+             - time: (str) Local time (HH:MM). Mandatory.
+             - neighbourhood: (str) Name (case sensitive). The whole city if not given.
+             - per: (str) "neighbourhood" to return the count of each neighbourhood too (not along with neighbourhood).
+             - list: (str) "true" to list the sunlit apartments too, one page at a time (see ApartmentsView). Then,
+               limit and cursor are checked as in ApartmentsView.check_valid_params.
+
+        :param params: (dict) Query string parameters.
+        :return: (tuple) Follows the format:
+
+                    (<query_info>, <message>)
+
+                with
+                    <query_info>: (dict/None) Follows the format:
+
+                            {"minutes": <minutes>, "neighbourhood_name": <neighbourhood>, "per_neighbourhood": <per>,
+                             "list": <list_info>}
+
+                        with <list_info> being the keyword arguments of ..controller.Controller.find_apartments (None if
+                        the apartments are not listed). None if any parameter is not valid.
+                    <message>: (str) Error message if any parameter is not valid.
+        """
+        try:
+            minutes = parse_time(params["time"])
+            if not 0 <= minutes < MINUTES_PER_DAY:
+                raise ValueError()
+
+        except (KeyError, ValueError):
+            return None, "Bad Request. It must contain a time (HH:MM)"
+
+        result = {"minutes": minutes, "neighbourhood_name": params.get("neighbourhood"), "per_neighbourhood": False,
+                  "list": None}
+
+        if "per" in params:
+            if params["per"] != "neighbourhood" or "neighbourhood" in params:
+                return None, "Bad Request. per must be neighbourhood (and neighbourhood can not be given along with it)"
+
+            result["per_neighbourhood"] = True
+
+        if params.get("list", "false") not in ("true", "false"):
+            return None, "Bad Request. list must be true or false"
+
+        if params.get("list") == "true":
+            list_params = {name: params[name] for name in ("neighbourhood", "limit", "cursor") if name in params}
+            list_params["sunlit_from"] = list_params["sunlit_until"] = params["time"]
+            result["list"], message = ApartmentsView.check_valid_params(list_params)
+
+            if not result["list"]:
+                return None, message
+
+        return result, ""
+
+    def get(self, request):
+        """
+            Counts the apartments that are sunlit at the requested time (see check_valid_params): from their dawn to
+            their sunset, both included. E.g., the apartments of GRACIA sunlit at 09:30, along with the first page of
+            them:
+
+                /apartments/sunlit?time=09:30&neighbourhood=GRACIA&list=true
+
+        :param request: HTTP request
+        :return: HTTP response with a JSON that follows the format:
+
+                {"time": <time>, "count": <count>}
+
+            plus, if "per" is given:
+
+                "neighbourhoods": {<neighbourhood>: <count>, ...}
+
+            and, if "list" is true, the same "apartments" and "next" as ApartmentsView.get.
+        """
+        query_info, message = SunlitApartmentsView.check_valid_params(request.GET)
+
+        if not query_info:
+            return HttpResponseBadRequest(message)
+
+        if not Controller.is_running_db():
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        try:
+            result = {"time": request.GET["time"],
+                      "count": Controller.count_sunlit_apartments(query_info["minutes"],
+                                                                  neighbourhood_name=query_info["neighbourhood_name"])}
+
+            if query_info["per_neighbourhood"]:
+                result["neighbourhoods"] = Controller.count_neighbourhood_sunlit_apartments(query_info["minutes"])
+
+            if query_info["list"] is not None:
+                # No need to query when none of them is sunlit
+                apartments, cursor = Controller.find_apartments(**query_info["list"]) if result["count"] else ([], None)
+                result["apartments"] = [ApartmentsView.format_apartment(apartment) for apartment in apartments]
+                result["next"] = ApartmentsView.format_cursor(cursor)
+
+        except ValueError:
+            message = "Conflict. The apartments of a city stored in lazy mode can not be counted"
+            status = 409  # CONFLICT
+            return HttpResponse(message, status=status)
+
+        except DatabaseError:
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        return JsonResponse(result)
@@ -0,0 +1,153 @@
+import json
+from django.db import DatabaseError
+from django.views import View
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseBadRequest, JsonResponse
+
+from ..controller import Controller
+from ..models import Building, Neighbourhood
+
+# For the sake of simplicity, in this test I will deactivate the CSRF protection for this test. In real production
+# Cross Site Request Forgery Protection should be used.
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class BuildingView(View):
+    """
+        View that adds, changes or removes a single building of a neighbourhood, updating only the affected apartments
+    """
+
+    @staticmethod
+    def check_valid_body(body, optional=()):
+        """
+            Checks that the input body contains the specified format. That is, a JSON object with:
+
+             - "neighbourhood": (str) Neighbourhood name (case sensitive). Required.
+             - "building": (str) Building name (case sensitive). Required.
+             - "apartments_count", "distance", "position", "east_distance": (int) Building values. Only the ones in
+               optional are accepted, and all of them can be omitted.
+
+        :param body: (bytes) Request body.
+        :param optional: (tuple of str) Accepted building values.
+        :return: (tuple) Follows the format:
+
+                    (<body>, <message>)
+
+                with
+                    <body>: (dict/None) The properly specified body (only with the specified values); None otherwise.
+                    <message>: (str) Error message if the body is not properly specified.
+        """
+        result = None
+        message = ""
+
+        try:
+            body = json.loads(body)
+            result = {"neighbourhood": str(body["neighbourhood"]), "building": str(body["building"])}
+
+            for name in optional:
+                if body.get(name) is not None:
+                    if type(body[name]) is not int:
+                        raise ValueError()
+                    result[name] = body[name]
+
+        except json.decoder.JSONDecodeError:
+            message = "Bad Body. It must be a JSON"
+
+        except (KeyError, TypeError, AttributeError):
+            result = None
+            message = "Bad Body. It must contain neighbourhood and building"
+
+        except ValueError:
+            result = None
+            message = "Bad Body. {} must be integer values".format(", ".join(optional))
+
+        return result, message
+
+    def change(self, request, change, optional=()):
+        """
+            Applies the specified building change.
+
+        :param request: HTTP request
+        :param change: (callable) Controller method that applies the change.
+        :param optional: (tuple of str) Accepted building values (see check_valid_body).
+        :return: HTTP response with the number of changed rows as a JSON (see ..controller.Controller
+            .update_neighbourhood).
+        """
+        body, message = self.check_valid_body(request.body, optional)
+
+        if not body:
+            return HttpResponseBadRequest(message)
+
+        if not Controller.is_running_db():
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        try:
+            result = change(body.pop("neighbourhood"), body.pop("building"), **body)
+
+        except (Neighbourhood.DoesNotExist, Building.DoesNotExist):
+            return HttpResponseNotFound("Unknown building.")
+
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        except DatabaseError:
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        return JsonResponse(result)
+
+    def post(self, request):
+        """
+            Adds a new building. Body:
+
+                {"neighbourhood": <neighbourhood_name>, "building": <building_name>, "apartments_count": <number>,
+                 "distance": <number>, "position": <number>, "east_distance": <number>}
+
+            See ..controller.Controller.insert_building.
+
+        :param request: HTTP request
+        :return: HTTP response
+        """
+        return self.change(request, self.insert_building, ("apartments_count", "distance", "position",
+                                                           "east_distance"))
+
+    def put(self, request):
+        """
+            Changes the height and/or the distance to the next building of a building. Body:
+
+                {"neighbourhood": <neighbourhood_name>, "building": <building_name>, "apartments_count": <number>,
+                 "distance": <number>}
+
+            See ..controller.Controller.update_building.
+
+        :param request: HTTP request
+        :return: HTTP response
+        """
+        return self.change(request, Controller.update_building, ("apartments_count", "distance"))
+
+    def delete(self, request):
+        """
+            Removes a building. Body:
+
+                {"neighbourhood": <neighbourhood_name>, "building": <building_name>}
+
+            See ..controller.Controller.delete_building.
+
+        :param request: HTTP request
+        :return: HTTP response
+        """
+        return self.change(request, Controller.delete_building)
+
+    @staticmethod
+    def insert_building(neighbourhood_name, building_name, apartments_count=None, **kwargs):
+        """
+            Same as ..controller.Controller.insert_building, but apartments_count is checked here.
+        """
+        if apartments_count is None:
+            raise ValueError("Bad Body. apartments_count is required")
+
+        return Controller.insert_building(neighbourhood_name, building_name, apartments_count, **kwargs)
@@ -0,0 +1,126 @@
+from datetime import date, timedelta
+
+from django.db import DatabaseError
+from django.views import View
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseBadRequest, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from ..clock import format_time, get_sunlight_minutes
+from ..constants import CALENDAR_MAX_DAYS
+from ..controller import Controller
+from ..yearly import get_day_of_year
+from .sunlight_hours import SunlightHoursView
+
+
+class SunlightCalendarView(View):
+    """
+        View that displays the sunlight hours of an apartment on a day, or on each day of a date range
+    """
+
+    @staticmethod
+    def check_valid_params(params):
+        """
+            Checks the dates of the query string. Either:
+
+             - date: (str) A single date (YYYY-MM-DD).
+             - from, until: (str) The first and last dates (YYYY-MM-DD) of a range of up to CALENDAR_MAX_DAYS days.
+
+        :param params: (dict) Query string parameters.
+        :return: (tuple) Follows the format:
+
+                    (<dates>, <message>)
+
+                with
+                    <dates>: (list of datetime.date/None) The requested dates; None if they are not valid.
+                    <message>: (str) Error message if they are not valid.
+        """
+        try:
+            if "date" in params:
+                first = last = date.fromisoformat(params["date"])
+            else:
+                first = date.fromisoformat(params["from"])
+                last = date.fromisoformat(params["until"])
+
+        except (KeyError, ValueError):
+            return None, "Bad Request. It must contain a date, or a from and until dates (YYYY-MM-DD)"
+
+        if not 0 <= (last - first).days < CALENDAR_MAX_DAYS:
+            return None, "Bad Request. until must not be before from, nor more than {} days after it".format(
+                CALENDAR_MAX_DAYS - 1)
+
+        return [first + timedelta(days=days) for days in range((last - first).days + 1)], ""
+
+    def get(self, request, neighbourhood, building, apartment):
+        """
+            Gets the sunlight hours of the specified apartment on each requested day (see check_valid_params). E.g.,
+            from June 20th to June 22nd:
+
+                /sunlight_hours/RAVAL/CCCB/3/calendar?from=2019-06-20&until=2019-06-22
+
+            Responses are cached as the ones of SunlightHoursView.get.
+
+        :param request: HTTP request
+        :param neighbourhood: (str) Neighbourhood name.
+        :param building: (str) Building name.
+        :param apartment: (int) Apartment number (from 0 to N-1).
+        :return: HTTP response with a JSON that follows the format:
+
+                {"days": [{"date": <date>, "sunlight_hours": <sunlight_hours>, "sunlight_minutes": <minutes>}, ...]}
+
+            with <sunlight_hours> following the same format as SunlightHoursView.get_sunlight_hours_str.
+        """
+        dates, message = SunlightCalendarView.check_valid_params(request.GET)
+
+        if not dates:
+            return HttpResponseBadRequest(message)
+
+        if not Controller.is_running_db():
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        try:
+            tag = Controller.get_city_tag()
+            etag = quote_etag(tag) if tag is not None else None
+
+            if etag is not None:
+                response = get_conditional_response(request, etag=etag)
+
+                if response is not None:
+                    # Not modified
+                    SunlightHoursView.set_cache_headers(response, etag)
+                    return response
+
+            yearly = Controller.get_yearly_sunlight(neighbourhood, building, apartment)
+
+        except ValueError:
+            message = "Conflict. The city has no calendar"
+            status = 409  # CONFLICT
+            return HttpResponse(message, status=status)
+
+        except DatabaseError:
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        if yearly is None:
+            # The apartment does not exists
+            response = HttpResponseNotFound("Unknown apartment.")
+
+        else:
+            days = []
+
+            for day in dates:
+                dawn = yearly[0][get_day_of_year(day)]
+                sunset = yearly[1][get_day_of_year(day)]
+                days.append({"date": day.isoformat(),
+                             "sunlight_hours": "{} - {}".format(format_time(dawn), format_time(sunset)),
+                             "sunlight_minutes": get_sunlight_minutes(dawn, sunset)})
+
+            response = JsonResponse({"days": days})
+
+        if etag is not None:
+            SunlightHoursView.set_cache_headers(response, etag)
+
+        return response
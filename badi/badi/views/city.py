@@ -0,0 +1,99 @@
+import json
+from django.db import DatabaseError
+from django.views import View
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseBadRequest, JsonResponse
+
+from ..controller import Controller
+from ..models import City
+
+# For the sake of simplicity, in this test I will deactivate the CSRF protection for this test. In real production
+# Cross Site Request Forgery Protection should be used.
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class CityView(View):
+    """
+        View that changes the dawn and sunset of the city, rescaling the sunlight hours of every apartment
+    """
+
+    @staticmethod
+    def check_valid_body(body):
+        """
+            Checks that the input body contains the specified format. That is, a JSON object with:
+
+             - "dawn": (str) The time when the sunlight starts in the city (HH:MM). Required.
+             - "sunset": (str) The time when the sunlight ends in the city (HH:MM). Required.
+
+        :param body: (bytes) Request body.
+        :return: (tuple) Follows the format:
+
+                    (<body>, <message>)
+
+                with
+                    <body>: (dict/None) The properly specified body; None otherwise.
+                    <message>: (str) Error message if the body is not properly specified.
+        """
+        result = None
+        message = ""
+
+        try:
+            body = json.loads(body)
+            result = {"dawn": body["dawn"], "sunset": body["sunset"]}
+
+            for name in ("dawn", "sunset"):
+                if not isinstance(result[name], str) or len(result[name]) != 5 or result[name][2] != ":" or \
+                        not (result[name][:2] + result[name][3:]).isdigit():
+                    raise ValueError()
+
+        except json.decoder.JSONDecodeError:
+            message = "Bad Body. It must be a JSON"
+
+        except (KeyError, TypeError):
+            result = None
+            message = "Bad Body. It must contain dawn and sunset"
+
+        except ValueError:
+            result = None
+            message = "Bad Body. dawn and sunset must be local times (HH:MM)"
+
+        return result, message
+
+    def put(self, request):
+        """
+            Changes the dawn and sunset of the city. Body:
+
+                {"dawn": <dawn>, "sunset": <sunset>}
+
+            See ..controller.Controller.update_city_daylight.
+
+        :param request: HTTP request
+        :return: HTTP response with the number of changed rows as a JSON (see ..controller.Controller
+            .update_neighbourhood).
+        """
+        body, message = CityView.check_valid_body(request.body)
+
+        if not body:
+            return HttpResponseBadRequest(message)
+
+        if not Controller.is_running_db():
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        try:
+            result = Controller.update_city_daylight(body["dawn"], body["sunset"])
+
+        except City.DoesNotExist:
+            return HttpResponseNotFound("Unknown city.")
+
+        except ValueError as e:
+            return HttpResponseBadRequest("Bad Body. {}".format(e))
+
+        except DatabaseError:
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        return JsonResponse(result)
@@ -0,0 +1,23 @@
+from django.views import View
+from django.http import JsonResponse
+
+from ..health import database_health
+
+
+class HealthView(View):
+    """
+        View that displays the health of the underlying data base system
+    """
+
+    def get(self, request):
+        """
+            Returns the current health state (see .health.DatabaseHealth.get_state).
+
+        :param request: HTTP request
+        :return: HTTP response with the health state as a JSON. Status 200 if the data base is available; 503
+            otherwise.
+        """
+        state = database_health.get_state()
+        status = 200 if state["available"] else 503
+
+        return JsonResponse(state, status=status)
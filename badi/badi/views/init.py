@@ -1,9 +1,9 @@
-import json
-
+from django.conf import settings
 from django.views import View
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 
-from ..city import City, CityInitializationError
+from ..city import init_city
+from ..jobs import init_jobs
 
 # For the sake of simplicity, in this test I will deactivate the CSRF protection for this test. In real production
 # Cross Site Request Forgery Protection should be used.
@@ -16,33 +16,74 @@ class InitView(View):
     """
         View that displays the initialization of a city
     """
+
+    @staticmethod
+    def is_async(request):
+        """
+            Tells if the city must be initialized asynchronously: either requested with the "async" query parameter or,
+            if not specified, as set by the INIT_ASYNC setting.
+
+        :param request: HTTP request
+        :return: (bool) True if it must be initialized asynchronously; False otherwise.
+        """
+        value = request.GET.get("async")
+
+        if value is None:
+            return getattr(settings, "INIT_ASYNC", False)
+
+        return value.lower() in ("1", "true", "yes")
+
     def post(self, request):
         """
             Initializes a city with the values received in the string JSON contained in the body (as described in the
             Code Challenge description).
 
+            The body is not loaded at once: it is parsed, computed and saved one neighbourhood at a time (see
+            ..city.ingest_city).
+
+            If requested asynchronously (see is_async), the city is handed to a background worker and the response is
+            sent right away, with the status of the job (see ..jobs.InitJob.get_status). Its status can be followed at
+            /init/<job_id>.
+
         :param request: HTTP request
-        :return: HTTP response
+        :return: HTTP response. Status 202 if the job was queued; 503 if there are too many pending jobs.
         """
-        result = True
-        try:
-            body = json.loads(request.body)
+        if self.is_async(request):
+            job = init_jobs.submit(request.body)
+
+            if job is None:
+                return HttpResponse("Too many pending initializations. Try again later", status=503)
 
-            try:
-                new_city = City(body)
-                new_city.save()
-                message = "{} city updated".format(new_city.name)
+            response = JsonResponse(job.get_status(), status=202)
+            response["Location"] = "/init/{}".format(job.id)
 
-            except CityInitializationError:
-                result = False
-                message = "Invalid city description"
+            return response
 
-        except json.decoder.JSONDecodeError:
-            result = False
-            message = "Bad Body. It must be a JSON"
+        result, message = init_city(request)
 
         status = 200
         if not result:
             status = 400
 
         return HttpResponse(message, status=status)
+
+
+class InitJobView(View):
+    """
+        View that displays the status of an asynchronous initialization of a city
+    """
+
+    def get(self, request, job_id):
+        """
+            Returns the status of the specified job (see ..jobs.InitJob.get_status).
+
+        :param request: HTTP request
+        :param job_id: (str) Job id.
+        :return: HTTP response with the status of the job as a JSON. Status 404 if the job is not known.
+        """
+        job = init_jobs.get(job_id)
+
+        if job is None:
+            return HttpResponse("Unknown job.", status=404)
+
+        return JsonResponse(job.get_status())
@@ -0,0 +1,81 @@
+from django.views import View
+from django.http import HttpResponse
+
+from ..cache import apartment_cache
+from ..controller import Controller
+from ..health import database_health
+from ..metrics import registry
+
+# Content type of the Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@registry.register_collector
+def collect_cache_metrics():
+    """
+        Returns the current values of the apartment cache (see ..cache.ApartmentCache.get_stats).
+
+    :return: (list of tuple) See ..metrics.Registry.register_collector.
+    """
+    stats = apartment_cache.get_stats()
+
+    return [
+        ("badi_apartment_cache_entries", "gauge", "Number of apartments in the cache.", [((), stats["size"])]),
+        ("badi_apartment_cache_max_entries", "gauge", "Maximum number of apartments in the cache.",
+         [((), stats["max_size"])]),
+        ("badi_apartment_cache_version", "gauge", "Current cache version (bumped on each invalidation).",
+         [((), stats["version"])]),
+        ("badi_apartment_cache_hits_total", "counter", "Number of cache hits.", [((), stats["hits"])]),
+        ("badi_apartment_cache_misses_total", "counter", "Number of cache misses.", [((), stats["misses"])]),
+        ("badi_apartment_cache_evictions_total", "counter", "Number of cache evictions.", [((), stats["evictions"])]),
+    ]
+
+
+@registry.register_collector
+def collect_save_metrics():
+    """
+        Returns the stats of the last saved city (see ..controller.Controller.report_save_stats).
+
+    :return: (list of tuple) See ..metrics.Registry.register_collector.
+    """
+    stats = Controller.save_stats
+
+    if stats is None:
+        return []
+
+    return [
+        ("badi_last_save_rows", "gauge", "Number of rows written by the last city save.", [((), stats["rows"])]),
+        ("badi_last_save_seconds", "gauge", "Time spent by the last city save.", [((), stats["seconds"])]),
+        ("badi_last_save_reused_neighbourhoods", "gauge",
+         "Number of neighbourhoods reused, instead of written, by the last city save.", [((), stats["reused"])]),
+    ]
+
+
+@registry.register_collector
+def collect_health_metrics():
+    """
+        Returns the current health of the data base (see ..health.DatabaseHealth).
+
+    :return: (list of tuple) See ..metrics.Registry.register_collector.
+    """
+    return [
+        ("badi_db_available", "gauge", "Whether the data base is available (1) or not (0).",
+         [((), 1 if database_health.available else 0)]),
+        ("badi_db_circuit_trips_total", "counter", "Number of times the data base circuit breaker opened.",
+         [((), database_health.trips)]),
+    ]
+
+
+class MetricsView(View):
+    """
+        View that displays the metrics of this process, following the Prometheus text format
+    """
+
+    def get(self, request):
+        """
+            Returns the metrics (see ..metrics.registry).
+
+        :param request: HTTP request
+        :return: HTTP response with the metrics as plain text.
+        """
+        return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -1,9 +1,15 @@
 
 import json
+from django.conf import settings
+from django.db import DatabaseError
 from django.views import View
 from django.http import HttpResponse, HttpResponseNotFound, HttpResponseBadRequest
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 
+from ..constants import SUNLIGHT_HOURS_MAX_AGE
 from ..controller import Controller
+from ..metrics import Timer, phase_seconds
 
 # For the sake of simplicity, in this test I will deactivate the CSRF protection for this test. In real production
 # Cross Site Request Forgery Protection should be used.
@@ -87,6 +93,102 @@ class SunlightHoursView(View):
         """
         return "{} - {}".format(apartment.dawn, apartment.sunset)
 
+    @staticmethod
+    def check_valid_params(params):
+        """
+            Checks that the input parameters (of the path or the query string) contain the same values as the body of a
+            PUT request (see check_valid_body).
+
+        :param params: (dict) Parameters.
+        :return: (tuple) Follows the format:
+
+                    (<request_info>, <message>)
+
+                with
+                    <request_info>: (dict/None) The info of the properly specified apartment; None otherwise.
+                    <message>: (str) Error message if the apartment is not properly specified.
+        """
+        result = None
+        message = ""
+
+        try:
+            result = {"neighbourhood": str(params["neighbourhood"]),
+                      "building": str(params["building"]),
+                      "apartment": int(params["apartment"])
+                      }
+
+        except KeyError:
+            message = "Bad Request. It must contain neighbourhood, building and apartment"
+
+        except ValueError:
+            message = "Bad Request. Apartment must be an integer value (from 0 to N-1) that specifies the floor"
+
+        return result, message
+
+    def get(self, request, **kwargs):
+        """
+            Gets the number of sunlight hours of the specified apartment, addressed by path
+            (/sunlight_hours/<neighbourhood>/<building>/<apartment>) or by query string
+            (?neighbourhood=<neighbourhood>&building=<building>&apartment=<apartment>).
+
+            Unlike PUT, responses can be cached by any HTTP cache: they carry an ETag, that changes whenever the city
+            does (see ..controller.Controller.get_city_tag), and a Cache-Control header. A request whose If-None-Match
+            header matches the current ETag is answered with 304 Not Modified, without looking up the apartment.
+
+            IMPLEMENTATION NOTE: The ETag is read before looking up the apartment, so a response is never older than its
+            ETag. Both are read from the same cached state of the city: cached apartments of any other state are not
+            used (see ..controller.Controller.get_city_state).
+
+        :param request: HTTP request
+        :param kwargs: Path parameters.
+        :return: HTTP response with the number of sunlight hours of the specified apartment (as specified in the Code
+            Challenge)
+        """
+        timer = Timer(phase_seconds, "sunlight_hours")
+
+        try:
+            params = dict(request.GET.items())
+            params.update(kwargs)
+            request_info, message = SunlightHoursView.check_valid_params(params)
+            timer.lap("parse")
+
+            etag = None
+            if request_info:
+                tag = Controller.get_city_tag()
+                timer.lap("etag")
+
+                if tag is not None:
+                    etag = quote_etag(tag)
+                    response = get_conditional_response(request, etag=etag)
+
+                    if response is not None:
+                        # Not modified
+                        self.set_cache_headers(response, etag)
+                        return response
+
+            response = self.get_response(request_info, message, timer)
+
+            if etag is not None and response.status_code in (200, 404):
+                self.set_cache_headers(response, etag)
+
+            return response
+
+        finally:
+            timer.finish()
+
+    @staticmethod
+    def set_cache_headers(response, etag):
+        """
+            Sets the HTTP caching headers of a GET response.
+
+        :param response: HTTP response
+        :param etag: (str) Quoted ETag.
+        :return: None
+        """
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=getattr(settings, "SUNLIGHT_HOURS_MAX_AGE",
+                                                                   SUNLIGHT_HOURS_MAX_AGE))
+
     def put(self, request):
         """
             Gets the number of sunlight hours of the specified apartment.
@@ -95,15 +197,45 @@ class SunlightHoursView(View):
         :return: HTTP response with the number of sunlight hours of the specified apartment (as specified in the Code
             Challenge)
         """
-        request_info, message = SunlightHoursView.check_valid_body(request.body.decode())
+        timer = Timer(phase_seconds, "sunlight_hours")
+
+        try:
+            request_info, message = SunlightHoursView.check_valid_body(request.body.decode())
+            timer.lap("parse")
+
+            return self.get_response(request_info, message, timer)
+
+        finally:
+            timer.finish()
+
+    def get_response(self, request_info, message, timer):
+        """
+            Gets the number of sunlight hours of the specified apartment (see put), timing each phase.
 
+        :param request_info: (dict/None) The info of the properly specified apartment (see check_valid_body); None if
+            it is not properly specified.
+        :param message: (str) Error message if the apartment is not properly specified.
+        :param timer: (..metrics.Timer) Timer of the request phases.
+        :return: HTTP response
+        """
         if request_info:
-            if not Controller.is_running_db():
+            # Lookups answered from the city snapshot do not need the data base
+            if not (Controller.has_snapshot() or Controller.is_running_db()):
                 message = "Service Unavailable."
                 status = 503  # SERVICE UNAVAILABLE
                 return HttpResponse(message, status=status)
             else:
-                apartment = Controller.get_apartment_info(request_info)
+                timer.lap("db_check")
+
+                try:
+                    apartment = Controller.get_apartment_info(request_info)
+
+                except DatabaseError:
+                    message = "Service Unavailable."
+                    status = 503  # SERVICE UNAVAILABLE
+                    return HttpResponse(message, status=status)
+
+                timer.lap("lookup")
 
                 if apartment is None:
                     # The apartment does not exists
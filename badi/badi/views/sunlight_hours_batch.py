@@ -0,0 +1,123 @@
+import json
+from django.conf import settings
+from django.db import DatabaseError
+from django.views import View
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+
+from ..constants import BATCH_MAX_SIZE
+from ..controller import Controller
+from .sunlight_hours import SunlightHoursView
+
+# For the sake of simplicity, in this test I will deactivate the CSRF protection for this test. In real production
+# Cross Site Request Forgery Protection should be used.
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class SunlightHoursBatchView(View):
+    """
+        View that displays the sunlight hours of several apartments at once
+    """
+
+    @staticmethod
+    def check_valid_item(item):
+        """
+            Checks that a requested apartment contains the same format as the body of a single request (see
+            SunlightHoursView.check_valid_body).
+
+        :param item: (dict) Requested apartment.
+        :return: (tuple) Follows the format:
+
+                    (<apartment_info>, <message>)
+
+                with
+                    <apartment_info>: (dict/None) The info of the properly specified apartment; None otherwise.
+                    <message>: (str) Error message if the apartment is not properly specified.
+        """
+        result = None
+        message = ""
+
+        try:
+            result = {"neighbourhood": str(item["neighbourhood"]),
+                      "building": str(item["building"]),
+                      "apartment": int(item["apartment"])
+                      }
+
+        except (KeyError, TypeError):
+            message = "Bad item. It must contain neighbourhood, building and apartment"
+
+        except ValueError:
+            message = "Bad item. Apartment must be an integer value (from 0 to N-1) that specifies the floor"
+
+        return result, message
+
+    def put(self, request):
+        """
+            Gets the sunlight hours of several apartments.
+
+            The body must be a JSON list of apartments, each one following the same format as the body of a single
+            request:
+
+                [{"neighbourhood": <neighbourhood_name>, "building": <building_name>, "apartment": <apartment>}, ...]
+
+        :param request: HTTP request
+        :return: HTTP response with a JSON list with the result of each apartment, in the same order as requested.
+            Each result follows one of the formats:
+
+                {"status": 200, "sunlight_hours": <sunlight_hours>}
+                {"status": 400, "error": <message>}    (Bad item)
+                {"status": 404, "error": "Unknown apartment."}
+
+            with <sunlight_hours> following the same format as a single request (see
+            SunlightHoursView.get_sunlight_hours_str).
+        """
+        try:
+            body = json.loads(request.body.decode())
+        except json.decoder.JSONDecodeError:
+            return HttpResponseBadRequest("Bad Body. It must be a JSON")
+
+        if not isinstance(body, list):
+            return HttpResponseBadRequest("Bad Body. It must be a list of apartments")
+
+        max_size = getattr(settings, "BATCH_MAX_SIZE", BATCH_MAX_SIZE)
+        if len(body) > max_size:
+            return HttpResponseBadRequest("Bad Body. At most {} apartments per request".format(max_size))
+
+        # Lookups answered from the city snapshot do not need the data base
+        if not (Controller.has_snapshot() or Controller.is_running_db()):
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        results = [None] * len(body)
+        positions = []
+        apartment_info_list = []
+
+        for position, item in enumerate(body):
+            apartment_info, message = SunlightHoursBatchView.check_valid_item(item)
+
+            if apartment_info:
+                positions.append(position)
+                apartment_info_list.append(apartment_info)
+            else:
+                results[position] = {"status": 400, "error": message}
+
+        try:
+            apartments = Controller.get_apartments_info(apartment_info_list)
+
+        except DatabaseError:
+            message = "Service Unavailable."
+            status = 503  # SERVICE UNAVAILABLE
+            return HttpResponse(message, status=status)
+
+        for position, apartment in zip(positions, apartments):
+            if apartment is None:
+                results[position] = {"status": 404, "error": "Unknown apartment."}
+            else:
+                results[position] = {"status": 200,
+                                     "sunlight_hours": SunlightHoursView.get_sunlight_hours_str(apartment)}
+
+        return JsonResponse(results, safe=False)
+
+    post = put
@@ -0,0 +1,223 @@
+#!/bin/python3
+
+"""
+    Sunlight hours of the apartments on each day of the year, given the dawn and sunset of the city on each day (its
+    calendar).
+
+    The angles of the shadows on an apartment only depend on the buildings, so they are computed once per apartment
+    (see .sunlight_hours.get_neighbourhood_shadow_angles). Then the dawn and sunset of every apartment on every day are
+    computed at once, as a table of distinct angles x days (see rescale_yearly_minutes).
+
+    The yearly dawn (or sunset) of an apartment is stored as a packed array of DAYS_PER_YEAR little-endian unsigned
+    16-bit integers (minutes since midnight), instead of one row per day (see pack_minutes). They always fit, as an
+    apartment is only sunlit within the daylight of the city on each day (see .clock.get_shadow_minutes).
+"""
+
+import json
+from array import array
+from datetime import date
+from sys import byteorder
+
+from .clock import MINUTES_PER_DAY, parse_time, get_seconds_per_grade, get_shadow_minutes
+from .constants import DAYS_PER_YEAR, NUMPY_BACKEND
+from .sunlight_hours import get_neighbourhood_shadow_angles
+from . import vectorized
+
+
+def parse_calendar(calendar):
+    """
+        Parses the specified calendar.
+
+    :param calendar: (list of list) Dawn and sunset of the city on each day of the year, from January 1st to December
+        31st (February 29th is not included). Follows the format:
+
+                [[<dawn>, <sunset>], ...]
+
+            with <dawn> and <sunset> being local times (HH:MM, from 00:00 to 23:59), and <dawn> before <sunset>.
+
+    :return: (tuple) Follows the format:
+
+                (<dawn_minutes>, <sunset_minutes>)
+
+            with
+                <dawn_minutes>: (list of int) Dawn of each day (minutes since midnight).
+                <sunset_minutes>: (list of int) Sunset of each day (minutes since midnight).
+    :raises ValueError: If it is not a valid calendar.
+    """
+    if not isinstance(calendar, list) or len(calendar) != DAYS_PER_YEAR:
+        raise ValueError("A calendar must have {} days".format(DAYS_PER_YEAR))
+
+    dawn_minutes = []
+    sunset_minutes = []
+
+    for day in calendar:
+        try:
+            dawn, sunset = day
+            dawn = parse_time(dawn)
+            sunset = parse_time(sunset)
+
+        except (TypeError, AttributeError):
+            raise ValueError("Invalid calendar day {}".format(day))
+
+        if not 0 <= dawn < sunset < MINUTES_PER_DAY:
+            raise ValueError("Invalid calendar day {}".format(day))
+
+        dawn_minutes.append(dawn)
+        sunset_minutes.append(sunset)
+
+    return dawn_minutes, sunset_minutes
+
+
+def load_calendar(path):
+    """
+        Loads a calendar from the specified JSON file (see parse_calendar).
+
+    :param path: (str) Path to the file.
+    :return: (tuple) See parse_calendar.
+    :raises ValueError: If it is not a valid calendar.
+    :raises OSError: If the file can not be read.
+    """
+    with open(path, encoding="utf-8") as calendar_file:
+        return parse_calendar(json.load(calendar_file))
+
+
+def pack_minutes(minutes):
+    """
+        Packs the specified local times (see module documentation).
+
+    :param minutes: (iterable of int) Local times (minutes since midnight).
+    :return: (bytes) Packed local times.
+    """
+    values = array("H", minutes)
+    if byteorder != "little":
+        values.byteswap()
+
+    return values.tobytes()
+
+
+def unpack_minutes(data):
+    """
+        Unpacks the local times packed with pack_minutes.
+
+    :param data: (bytes) Packed local times.
+    :return: (list of int) Local times (minutes since midnight).
+    """
+    values = array("H")
+    values.frombytes(bytes(data))
+    if byteorder != "little":
+        values.byteswap()
+
+    return values.tolist()
+
+
+def get_day_of_year(day):
+    """
+        Returns the position of the specified date in a calendar (see parse_calendar). February 29th is given the same
+        position as February 28th.
+
+    :param day: (datetime.date) Date.
+    :return: (int) Position (from 0 to DAYS_PER_YEAR - 1).
+    """
+    if day.month == 2 and day.day == 29:
+        day = day.replace(day=28)
+
+    return (date(2019, day.month, day.day) - date(2019, 1, 1)).days
+
+
+def get_yearly_minutes(east_angle, west_angle, calendar):
+    """
+        Computes the dawn and sunset of an apartment on each day of the year.
+
+    :param east_angle: (float) The angle of the highest shadow from the east on the apartment (in grades).
+    :param west_angle: (float) The angle of the highest shadow from the west on the apartment (in grades).
+    :param calendar: (tuple) Calendar of the city (see parse_calendar).
+    :return: (tuple) (<dawn_minutes>, <sunset_minutes>), each one a list with a local time per day.
+    """
+    dawn_minutes = []
+    sunset_minutes = []
+
+    for city_dawn, city_sunset in zip(*calendar):
+        city_seconds_per_grade = get_seconds_per_grade(city_dawn, city_sunset)
+        dawn_minutes.append(city_dawn + get_shadow_minutes(east_angle, city_seconds_per_grade))
+        sunset_minutes.append(city_sunset - get_shadow_minutes(west_angle, city_seconds_per_grade))
+
+    return dawn_minutes, sunset_minutes
+
+
+def get_neighbourhood_yearly_minutes(building_list, calendar, apartment_height, backend=None):
+    """
+        Computes the dawn and sunset of every apartment of the specified neighbourhood on each day of the year. Same
+        results as get_yearly_minutes for each apartment.
+
+    :param building_list: (list of dict) Buildings of the neighbourhood (as described in the Code Challenge), sorted
+        from east to west.
+    :param calendar: (tuple) Calendar of the city (see parse_calendar).
+    :param apartment_height: (int) The height of the apartments.
+    :param backend: (str) An available backend (see .sunlight_hours.get_backend). PYTHON_BACKEND if None.
+    :return: (list of list of tuple) For each building (sorted from east to west), the (<dawn>, <sunset>) of each
+        apartment (sorted from the lowest to the highest floor), packed (see pack_minutes).
+    """
+    east_angles, west_angles = get_neighbourhood_shadow_angles(building_list, apartment_height)
+
+    return rescale_yearly_minutes(east_angles, west_angles, calendar, backend)
+
+
+def rescale_yearly_minutes(east_angles, west_angles, calendar, backend=None):
+    """
+        Computes the dawn and sunset of every apartment of a neighbourhood on each day of the year from the angles of
+        its shadows (see .sunlight_hours.get_neighbourhood_shadow_angles), without searching its horizon.
+
+        IMPLEMENTATION NOTE: The yearly dawn of an apartment only depends on the angle of its shadow from the east (and
+        the sunset on the one from the west), and many apartments share the same angles (e.g., 0 for the ones with no
+        obstacle). So the yearly dawn and sunset are computed, and packed, once per distinct angle. With the NumPy
+        backend, they are computed as a single distinct angles x days array operation.
+
+    :param east_angles: (list of list of float) For each building, the angle of the shadow from the east on each
+        apartment (see .sunlight_hours.get_neighbourhood_shadow_angles).
+    :param west_angles: (list of list of float) Same as east_angles, but with the shadows from the west.
+    :param calendar: (tuple) Calendar of the city (see parse_calendar).
+    :param backend: (str) An available backend (see .sunlight_hours.get_backend). PYTHON_BACKEND if None.
+    :return: (list of list of tuple) See get_neighbourhood_yearly_minutes.
+    """
+    distinct_east_angles = sorted({angle for building_angles in east_angles for angle in building_angles})
+    distinct_west_angles = sorted({angle for building_angles in west_angles for angle in building_angles})
+
+    if backend == NUMPY_BACKEND:
+        dawn = vectorized.get_yearly_minutes(distinct_east_angles, calendar, east=True)
+        sunset = vectorized.get_yearly_minutes(distinct_west_angles, calendar, east=False)
+
+    else:
+        dawn = [pack_minutes(minutes) for minutes in get_distinct_yearly_minutes(distinct_east_angles, calendar,
+                                                                                 east=True)]
+        sunset = [pack_minutes(minutes) for minutes in get_distinct_yearly_minutes(distinct_west_angles, calendar,
+                                                                                   east=False)]
+
+    dawn = dict(zip(distinct_east_angles, dawn))
+    sunset = dict(zip(distinct_west_angles, sunset))
+
+    return [[(dawn[east_angle], sunset[west_angle])
+             for east_angle, west_angle in zip(building_east_angles, building_west_angles)]
+            for building_east_angles, building_west_angles in zip(east_angles, west_angles)]
+
+
+def get_distinct_yearly_minutes(angles, calendar, east):
+    """
+        Computes the yearly dawn (or sunset) of the apartments whose shadow from the east (or west) has each one of the
+        specified angles.
+
+    :param angles: (list of float) Angles of the shadows (in grades).
+    :param calendar: (tuple) Calendar of the city (see parse_calendar).
+    :param east: (bool) True for the dawn (shadows from the east); False for the sunset (shadows from the west).
+    :return: (list of list of int) For each angle, the local time on each day (minutes since midnight).
+    """
+    city_dawn, city_sunset = calendar
+    city_seconds_per_grade = [get_seconds_per_grade(dawn, sunset) for dawn, sunset in zip(city_dawn, city_sunset)]
+
+    if east:
+        return [[dawn + get_shadow_minutes(angle, seconds_per_grade)
+                 for dawn, seconds_per_grade in zip(city_dawn, city_seconds_per_grade)]
+                for angle in angles]
+
+    return [[sunset - get_shadow_minutes(angle, seconds_per_grade)
+             for sunset, seconds_per_grade in zip(city_sunset, city_seconds_per_grade)]
+            for angle in angles]